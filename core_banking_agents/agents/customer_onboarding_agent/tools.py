@@ -6,6 +6,10 @@ from typing import Optional, Dict, Any
 import random
 import re # For simple phone number formatting
 
+from weezy_cbs.customer_identity_management.verification_client import (
+    SERVICE_NIBSS_BVN, SERVICE_NIMC_NIN, IdentityVerificationClient, IdentityVerificationProvider,
+)
+
 # --- Mock Data (Simulating NIBSS/NIMC databases) ---
 MOCK_BVN_DB = {
     "12345678901": {"bvn": "12345678901", "firstName": "Adewale", "lastName": "Ogunseye", "dateOfBirth": "1990-01-15", "phoneNumber": "08012345678", "registrationDate": "2015-03-10"},
@@ -32,6 +36,21 @@ def normalize_phone(phone: Optional[str]) -> Optional[str]:
         phone = "0" + phone[3:]
     return re.sub(r'\D', '', phone) # Remove any non-digits just in case
 
+class MockRegistryIdentityProvider(IdentityVerificationProvider):
+    """Serves lookups from the mock NIBSS/NIMC registries above. Simulated outages raise, so they are never cached."""
+    def lookup(self, service_name: str, identifier: str, customer_phone: Optional[str] = None) -> Dict[str, Any]:
+        registry = MOCK_BVN_DB if service_name == SERVICE_NIBSS_BVN else MOCK_NIN_DB
+        label = "BVN" if service_name == SERVICE_NIBSS_BVN else "NIN"
+        record = registry.get(identifier)
+        if record is None:
+            return {"is_valid": False, "message": f"{label} not found in mock database.", "data": None}
+        if "error" in record:
+            raise ConnectionError(record["error"])
+        return {"is_valid": True, "message": f"{label} details successfully retrieved.", "data": record}
+
+# Repeated lookups of the same BVN/NIN (retries, re-runs of an onboarding) are served from the client's cache
+identity_verification_client = IdentityVerificationClient(provider=MockRegistryIdentityProvider())
+
 @tool("NINBVNVerificationTool")
 def nin_bvn_verification_tool(
     bvn: Optional[str] = None,
@@ -43,8 +62,8 @@ def nin_bvn_verification_tool(
 ) -> Dict[str, Any]:
     """
     Verifies BVN (Bank Verification Number) and/or NIN (National Identification Number)
-    against mock NIBSS/NIMC databases. It checks if the provided details (name, DOB, phone)
-    match the records associated with the BVN/NIN.
+    against mock NIBSS/NIMC databases, through the cached IdentityVerificationClient.
+    It checks if the provided details (name, DOB, phone) match the records associated with the BVN/NIN.
 
     Args:
         bvn (Optional[str]): The BVN to verify.
@@ -68,11 +87,14 @@ def nin_bvn_verification_tool(
 
     # --- BVN Verification ---
     if bvn:
-        if bvn == "ERROR_BVN_001": # Simulate service error
+        try:
+            bvn_lookup = identity_verification_client.verify_bvn(bvn, customer_phone=phone_number)
+        except Exception as e: # Provider unavailable
+            bvn_lookup = None
             results["bvn_status"] = "Error"
-            results["bvn_details"] = {"message": MOCK_BVN_DB[bvn]["error"]}
-        elif bvn in MOCK_BVN_DB:
-            bvn_record = MOCK_BVN_DB[bvn]
+            results["bvn_details"] = {"message": str(e)}
+        if bvn_lookup and bvn_lookup["is_valid"]:
+            bvn_record = bvn_lookup["data"]
             mismatches = []
             if first_name.lower() != bvn_record["firstName"].lower():
                 mismatches.append(f"First name mismatch (Expected: {bvn_record['firstName']}, Got: {first_name})")
@@ -100,17 +122,20 @@ def nin_bvn_verification_tool(
                     "mismatches": mismatches,
                     "bvn_record_summary": {k:v for k,v in bvn_record.items() if k not in ['error']}
                 }
-        else:
+        elif bvn_lookup:
             results["bvn_status"] = "NotFound"
-            results["bvn_details"] = {"message": "BVN not found in mock database."}
+            results["bvn_details"] = {"message": bvn_lookup["message"]}
 
     # --- NIN Verification ---
     if nin:
-        if nin == "ERROR_NIN_001": # Simulate service error
+        try:
+            nin_lookup = identity_verification_client.verify_nin(nin, customer_phone=phone_number)
+        except Exception as e: # Provider unavailable
+            nin_lookup = None
             results["nin_status"] = "Error"
-            results["nin_details"] = {"message": MOCK_NIN_DB[nin]["error"]}
-        elif nin in MOCK_NIN_DB:
-            nin_record = MOCK_NIN_DB[nin]
+            results["nin_details"] = {"message": str(e)}
+        if nin_lookup and nin_lookup["is_valid"]:
+            nin_record = nin_lookup["data"]
             mismatches = []
             if first_name.lower() != nin_record["firstname"].lower():
                 mismatches.append(f"First name mismatch (Expected: {nin_record['firstname']}, Got: {first_name})")
@@ -136,9 +161,9 @@ def nin_bvn_verification_tool(
                     "mismatches": mismatches,
                     "nin_record_summary": {k:v for k,v in nin_record.items() if k not in ['error']}
                 }
-        else:
+        elif nin_lookup:
             results["nin_status"] = "NotFound"
-            results["nin_details"] = {"message": "NIN not found in mock database."}
+            results["nin_details"] = {"message": nin_lookup["message"]}
 
     return results
 
@@ -0,0 +1,343 @@
+# Streaming bulk importer for migrating customers and accounts from a legacy core / acquired MFB
+#
+# Pipeline (constant memory regardless of file size):
+#   reader (CSV or JSON-lines, one row at a time)
+#     -> chunks of IMPORT_CHUNK_SIZE rows
+#     -> validation on a process pool with the existing Pydantic schemas (bounded in-flight chunks)
+#     -> per chunk: NUBANs from a block reserved under a row lock, bulk INSERT of customers, accounts,
+#        opening-balance ledger entries, KYC audit rows and duplicate-detection keys, one commit
+#     -> rejects streamed to a CSV reject file (line number, reason, original row)
+#
+# Input layout: one row per customer with at most one account. Columns are the CustomerCreate fields
+# plus `product_code`, `initial_deposit_amount` (opening balance) and optionally `legacy_reference`.
+# Rows without `product_code` create the customer only.
+import csv
+import decimal
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+from .models import AccountStatusEnum, AccountTypeEnum, CurrencyEnum, TransactionTypeEnum
+from .services import _get_mock_product_params, NotFoundException, MIGRATION_NUBAN_SERIAL_PREFIX
+from weezy_cbs.customer_identity_management import models as customer_models
+from weezy_cbs.customer_identity_management import schemas as customer_schemas
+from weezy_cbs.customer_identity_management.duplicate_detection import compute_blocking_keys, normalize_phone
+
+IMPORT_CHUNK_SIZE = int(os.getenv("BULK_IMPORT_CHUNK_SIZE", "2000"))
+IMPORT_MAX_PENDING_CHUNKS = 4 # Chunks queued on the validation pool at any one time
+NUBAN_BLOCK_SIZE = 10000
+CBN_BANK_CODE = os.getenv("CBN_BANK_CODE", "999")
+
+_ACCOUNT_FIELDS = ("product_code", "initial_deposit_amount", "fd_maturity_date", "fd_interest_rate_pa", "fd_principal_amount")
+_NON_CUSTOMER_FIELDS = set(_ACCOUNT_FIELDS) | {"legacy_reference"}
+
+
+# --- Readers ---
+def _clean_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """CSV gives '' for missing values; treat those as absent so schema defaults apply."""
+    return {k.strip(): (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k and v not in ("", None)}
+
+def iter_source_rows(source: TextIO, source_format: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Yields (line_number, row_dict) from a CSV or JSON-lines stream without loading it."""
+    if source_format == "csv":
+        reader = csv.DictReader(source)
+        for row in reader:
+            yield reader.line_num, _clean_row(row)
+    elif source_format == "jsonl":
+        for line_number, line in enumerate(source, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, _clean_row(json.loads(line))
+            except json.JSONDecodeError as e:
+                yield line_number, {"__parse_error__": f"Invalid JSON: {e.msg}", "__raw__": line.rstrip("\n")}
+    else:
+        raise ValueError(f"Unsupported import format '{source_format}'. Use 'csv' or 'jsonl'.")
+
+def _chunked(rows: Iterable[Tuple[int, Dict[str, Any]]], size: int) -> Iterator[List[Tuple[int, Dict[str, Any]]]]:
+    chunk = []
+    for item in rows:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# --- Validation (runs in worker processes) ---
+def _format_validation_error(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+
+def validate_import_rows(chunk: List[Tuple[int, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Validates rows with CustomerCreate / AccountCreateRequest. Returns one dict per row:
+    {"line", "raw", "customer", "account"} on success or {"line", "raw", "error"} on rejection.
+    """
+    results = []
+    for line_number, raw in chunk:
+        if "__parse_error__" in raw:
+            results.append({"line": line_number, "raw": raw.get("__raw__"), "error": raw["__parse_error__"]})
+            continue
+        try:
+            customer = customer_schemas.CustomerCreate(**{k: v for k, v in raw.items() if k not in _NON_CUSTOMER_FIELDS})
+            account = None
+            if raw.get("product_code"):
+                # customer_id is assigned after the customer row is inserted
+                account_in = schemas.AccountCreateRequest(customer_id=0, **{k: raw[k] for k in _ACCOUNT_FIELDS if k in raw})
+                params = _get_mock_product_params(account_in.product_code)
+                if account_in.initial_deposit_amount < decimal.Decimal(str(params.get("min_opening_balance", 0))):
+                    raise ValueError(f"Opening balance {account_in.initial_deposit_amount} is below the product minimum.")
+                account = {**account_in.dict(exclude={"customer_id"}), "account_type": params["account_type"], "currency": params["currency"]}
+            results.append({"line": line_number, "raw": raw, "customer": customer.dict(), "account": account})
+        except ValidationError as e:
+            results.append({"line": line_number, "raw": raw, "error": _format_validation_error(e)})
+        except (ValueError, NotFoundException) as e:
+            results.append({"line": line_number, "raw": raw, "error": str(e)})
+    return results
+
+def _validated_chunks(pool: ProcessPoolExecutor, chunks: Iterable[List[Tuple[int, Dict[str, Any]]]]) -> Iterator[List[Dict[str, Any]]]:
+    """Keeps at most IMPORT_MAX_PENDING_CHUNKS chunks on the pool and yields results in input order."""
+    pending = []
+    for chunk in chunks:
+        pending.append(pool.submit(validate_import_rows, chunk))
+        if len(pending) >= IMPORT_MAX_PENDING_CHUNKS:
+            yield pending.pop(0).result()
+    for future in pending:
+        yield future.result()
+
+
+# --- NUBAN allocation ---
+def nuban_check_digit(bank_code: str, serial: str) -> str:
+    """CBN NUBAN check digit: weights 3,7,3 repeated over bank code + 9-digit serial, then 10 - (sum mod 10)."""
+    digits = bank_code + serial
+    weighted_sum = sum(int(d) * (3, 7, 3)[i % 3] for i, d in enumerate(digits))
+    return str((10 - weighted_sum % 10) % 10)
+
+class NubanBlockAllocator:
+    """
+    Hands out NUBANs from blocks reserved in the migration serial range (MIGRATION_NUBAN_SERIAL_PREFIX),
+    so the importer never has to check numbers one by one. Blocks are taken from the range's
+    NubanSerialRange row under SELECT ... FOR UPDATE, in a short transaction of its own, so concurrent
+    importers get disjoint blocks; services._generate_nuban never draws from this range.
+    Serials left unused in a block (e.g. by a rolled-back chunk) are skipped.
+    """
+    def __init__(self, session_factory: Callable[[], Session], bank_code: str = CBN_BANK_CODE, serial_prefix: str = MIGRATION_NUBAN_SERIAL_PREFIX, block_size: int = NUBAN_BLOCK_SIZE):
+        self.session_factory = session_factory
+        self.bank_code = bank_code
+        self.serial_prefix = serial_prefix
+        self.block_size = block_size
+        self._next_serial: Optional[int] = None
+        self._block_end = 0
+
+    def _lock_range(self, db: Session) -> models.NubanSerialRange:
+        query = db.query(models.NubanSerialRange).filter(models.NubanSerialRange.serial_prefix == self.serial_prefix)
+        serial_range = query.with_for_update().first()
+        if serial_range is None:
+            # First use of the range: start after the highest account number already in it
+            highest = db.query(func.max(models.Account.account_number)).filter(
+                models.Account.account_number.like(f"{self.serial_prefix}%")
+            ).scalar()
+            first_free = int(highest[:9]) + 1 if highest else int(self.serial_prefix.ljust(9, "0"))
+            try:
+                with db.begin_nested():
+                    db.add(models.NubanSerialRange(serial_prefix=self.serial_prefix, next_serial=first_free))
+            except IntegrityError:
+                pass # Another importer created the row first
+            serial_range = query.with_for_update().first()
+        return serial_range
+
+    def _reserve_block(self, size: int) -> None:
+        db = self.session_factory()
+        try:
+            serial_range = self._lock_range(db)
+            block_start = serial_range.next_serial
+            block_end = block_start + size
+            if len(str(block_end - 1)) > 9 or not str(block_end - 1).startswith(self.serial_prefix):
+                raise ValueError(f"Migration NUBAN range '{self.serial_prefix}' is exhausted.")
+            serial_range.next_serial = block_end
+            db.commit()
+        finally:
+            db.close()
+        self._next_serial, self._block_end = block_start, block_end
+
+    def ensure_available(self, count: int) -> None:
+        """Reserves a new block unless `count` serials are left; called before a chunk starts writing."""
+        if self._next_serial is None or self._block_end - self._next_serial < count:
+            self._reserve_block(max(self.block_size, count))
+
+    def allocate(self) -> str:
+        if self._next_serial is None or self._next_serial >= self._block_end:
+            self._reserve_block(self.block_size)
+        serial = str(self._next_serial).zfill(9)
+        self._next_serial += 1
+        return serial + nuban_check_digit(self.bank_code, serial)
+
+
+# --- Writer ---
+class RejectWriter:
+    """Streams rejected rows to a CSV file as they are found."""
+    def __init__(self, path: str):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(["line_number", "legacy_reference", "reason", "row_json"])
+        self.count = 0
+
+    def write(self, line_number: int, raw: Any, reason: str) -> None:
+        legacy_reference = raw.get("legacy_reference") if isinstance(raw, dict) else None
+        self._writer.writerow([line_number, legacy_reference, reason, json.dumps(raw, default=str)])
+        self.count += 1
+
+    def close(self) -> None:
+        self._file.close()
+
+def _customer_insert_values(customer: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    values = dict(customer)
+    # Schema enums (str subclasses) -> model enums
+    values["customer_type"] = customer_models.CustomerTypeEnum(str(getattr(customer["customer_type"], "value", customer["customer_type"])))
+    values["gender"] = customer_models.GenderEnum(str(getattr(customer["gender"], "value", customer["gender"]))) if customer.get("gender") else None
+    # Same initial tier rule as customer_identity_management.services.create_customer
+    values["account_tier"] = customer_models.CBNSupportedAccountTier.TIER_2 if (customer.get("bvn") or customer.get("nin")) else customer_models.CBNSupportedAccountTier.TIER_1
+    values["phone_number_normalized"] = normalize_phone(customer["phone_number"])
+    values["created_at"] = now
+    values["updated_at"] = now
+    return values
+
+def _insert_chunk(db: Session, rows: List[Dict[str, Any]], nubans: NubanBlockAllocator, imported_by: str) -> None:
+    """Bulk-inserts one chunk of validated rows. Raises IntegrityError if any row conflicts."""
+    now = datetime.utcnow()
+    nubans.ensure_available(sum(1 for r in rows if r["account"]))
+    customer_ids = db.execute(
+        insert(customer_models.Customer).returning(customer_models.Customer.id, sort_by_parameter_order=True),
+        [_customer_insert_values(r["customer"], now) for r in rows]
+    ).scalars().all()
+
+    db.execute(insert(customer_models.KYCAuditLog), [
+        {"customer_id": cid, "event_type": "CUSTOMER_MIGRATED", "changed_by_user_id": imported_by,
+         "notes": f"Bulk import, source line {r['line']}" + (f", legacy ref {r['raw'].get('legacy_reference')}" if r["raw"].get("legacy_reference") else "")}
+        for cid, r in zip(customer_ids, rows)
+    ])
+    blocking_keys = []
+    for cid, r in zip(customer_ids, rows):
+        c = r["customer"]
+        for key_type, key_value in compute_blocking_keys(c.get("first_name"), c.get("last_name"), c.get("company_name"), c.get("date_of_birth") or c.get("date_of_incorporation"), c.get("phone_number")):
+            blocking_keys.append({"customer_id": cid, "key_type": key_type, "key_value": key_value})
+    if blocking_keys:
+        db.execute(insert(customer_models.CustomerDuplicateBlockingKey), blocking_keys)
+
+    account_rows, opening_balances = [], []
+    for cid, r in zip(customer_ids, rows):
+        account = r["account"]
+        if not account:
+            continue
+        opening_balance = account["initial_deposit_amount"] or decimal.Decimal("0.00")
+        account_type = AccountTypeEnum[account["account_type"]]
+        is_fd = account_type == AccountTypeEnum.FIXED_DEPOSIT
+        account_rows.append({
+            "customer_id": cid, "product_code": account["product_code"], "account_number": nubans.allocate(),
+            "account_type": account_type, "currency": CurrencyEnum[account["currency"]],
+            "ledger_balance": opening_balance, "available_balance": opening_balance,
+            "lien_amount": decimal.Decimal("0.00"), "uncleared_funds": decimal.Decimal("0.00"),
+            "status": AccountStatusEnum.ACTIVE, "is_post_no_debit": False, "opened_date": date.today(),
+            "last_customer_initiated_activity_date": now,
+            "fd_maturity_date": account.get("fd_maturity_date") if is_fd else None,
+            "fd_interest_rate_pa": account.get("fd_interest_rate_pa") if is_fd else None,
+            "fd_principal_amount": account.get("fd_principal_amount") if is_fd else None,
+        })
+        opening_balances.append(opening_balance)
+
+    if account_rows:
+        account_ids = db.execute(
+            insert(models.Account).returning(models.Account.id, sort_by_parameter_order=True), account_rows
+        ).scalars().all()
+        ledger_rows = [
+            {"financial_transaction_id": f"SYS_MIGR_{acc['account_number']}", "account_id": acc_id,
+             "entry_type": TransactionTypeEnum.CREDIT, "amount": amount, "currency": acc["currency"],
+             "narration": f"Migrated opening balance for {acc['account_number']}", "transaction_date": now, "value_date": now,
+             "balance_before": decimal.Decimal("0.00"), "balance_after": amount, "channel": "MIGRATION", "is_reversal_entry": False}
+            for acc_id, acc, amount in zip(account_ids, account_rows, opening_balances) if amount > 0
+        ]
+        if ledger_rows:
+            db.execute(insert(models.LedgerEntry), ledger_rows)
+
+def _write_chunk(db: Session, rows: List[Dict[str, Any]], nubans: NubanBlockAllocator, rejects: RejectWriter, imported_by: str) -> int:
+    """Writes a chunk in one transaction; on a conflict retries row by row to isolate the offending rows."""
+    try:
+        _insert_chunk(db, rows, nubans, imported_by)
+        db.commit()
+        return len(rows)
+    except IntegrityError:
+        db.rollback()
+
+    written = 0
+    for row in rows:
+        try:
+            _insert_chunk(db, [row], nubans, imported_by)
+            db.commit()
+            written += 1
+        except IntegrityError as e:
+            db.rollback()
+            rejects.write(row["line"], row["raw"], f"Database conflict (duplicate phone/email/BVN/NIN?): {str(e.orig)[:200]}")
+    return written
+
+
+# --- Entry point ---
+def run_bulk_import(
+    session_factory: Callable[[], Session], source: TextIO, source_format: str, reject_file_path: str,
+    imported_by: str = "SYSTEM_MIGRATION", chunk_size: int = IMPORT_CHUNK_SIZE, max_workers: Optional[int] = None,
+    progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """
+    Streams `source` (csv or jsonl) into the customers/accounts/ledger tables. Validation runs on a
+    process pool; inserts are chunked and committed per chunk, so a failure mid-file keeps the chunks
+    already committed and the reject file records every row that was not imported.
+    `progress_callback` receives the running totals after every chunk.
+    """
+    db = session_factory()
+    rejects = RejectWriter(reject_file_path)
+    stats = {"rows_read": 0, "rows_imported": 0, "rows_rejected": 0, "chunks": 0, "elapsed_seconds": 0.0, "rows_per_second": 0.0}
+    started = time.monotonic()
+    try:
+        nubans = NubanBlockAllocator(session_factory)
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            for results in _validated_chunks(pool, _chunked(iter_source_rows(source, source_format), chunk_size)):
+                valid_rows = []
+                for result in results:
+                    if "error" in result:
+                        rejects.write(result["line"], result["raw"], result["error"])
+                    else:
+                        valid_rows.append(result)
+                if valid_rows:
+                    stats["rows_imported"] += _write_chunk(db, valid_rows, nubans, rejects, imported_by)
+                stats["rows_read"] += len(results)
+                stats["rows_rejected"] = rejects.count
+                stats["chunks"] += 1
+                stats["elapsed_seconds"] = round(time.monotonic() - started, 2)
+                stats["rows_per_second"] = round(stats["rows_read"] / stats["elapsed_seconds"], 1) if stats["elapsed_seconds"] else 0.0
+                if progress_callback:
+                    progress_callback(dict(stats))
+    finally:
+        rejects.close()
+        db.close()
+    return stats
+
+
+if __name__ == "__main__":
+    # python -m weezy_cbs.accounts_ledger_management.bulk_import customers.csv rejects.csv
+    import sys
+    from weezy_cbs.database import SessionLocal
+
+    input_path, reject_path = sys.argv[1], sys.argv[2]
+    input_format = "jsonl" if input_path.endswith((".jsonl", ".ndjson")) else "csv"
+    with open(input_path, newline="", encoding="utf-8") as input_file:
+        summary = run_bulk_import(SessionLocal, input_file, input_format, reject_path, progress_callback=lambda s: print(f"Progress: {s}"))
+    print(f"Import finished: {summary}")
@@ -2,6 +2,7 @@
 from sqlalchemy import Column, Integer, String, DateTime, Boolean, Numeric, ForeignKey, Enum as SQLAlchemyEnum, Date, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from weezy_cbs.database import Base # Use the shared Base
 
 import enum
 
@@ -148,6 +149,13 @@ class InterestAccrualLog(Base): # Tracking daily accruals before posting
 
     account = relationship("Account") # Add backref if needed
 
+class NubanSerialRange(Base): # Next free serial of a reserved NUBAN range (e.g. migrated accounts)
+    __tablename__ = "nuban_serial_ranges"
+    id = Column(Integer, primary_key=True)
+    serial_prefix = Column(String(9), unique=True, nullable=False)
+    next_serial = Column(Integer, nullable=False) # 9-digit serial; blocks are taken under SELECT ... FOR UPDATE
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 # Note: For relationships to tables in other modules (e.g. Customer, ProductConfig),
 # ensure string foreign keys are used if Base is not shared, or use the shared Base.
 # Example: customer_id = Column(Integer, ForeignKey("customers.id"), ...)
@@ -7,11 +7,13 @@ import json # For audit logging if storing dicts as JSON strings
 
 from . import models, schemas
 from .models import AccountTypeEnum, AccountStatusEnum, CurrencyEnum, TransactionTypeEnum # Direct enum access
+from weezy_cbs.core_infrastructure_config_engine import event_bus
 # from ..customer_identity_management.services import get_customer # To verify customer exists - cross-module import
 # from ..core_infrastructure_config_engine.services import get_product_config # For product details
 # from ..core_infrastructure_config_engine.models import ProductConfig # For type hinting
 
 import decimal
+import os
 import random
 import string
 from datetime import datetime, timedelta, date
@@ -33,9 +35,15 @@ class InsufficientFundsException(InvalidOperationException):
         super().__init__(message)
 
 # NUBAN Generation Utility (Simplified - Real NUBAN has specific CBN algorithm)
+# Serial range reserved for migrated accounts (handed out in blocks by bulk_import.NubanBlockAllocator)
+MIGRATION_NUBAN_SERIAL_PREFIX = os.getenv("MIGRATION_NUBAN_SERIAL_PREFIX", "9")
+
 def _generate_nuban(bank_code: str = "999999", serial_length: int = 9) -> str:
     """Generates a NUBAN-like account number. Bank code is usually fixed for the institution."""
-    serial_number = ''.join(random.choices(string.digits, k=serial_length))
+    while True:
+        serial_number = ''.join(random.choices(string.digits, k=serial_length))
+        if not serial_number.startswith(MIGRATION_NUBAN_SERIAL_PREFIX): # Never draw from the migration range
+            break
     check_digit = random.choice(string.digits)
     return serial_number + check_digit
 
@@ -44,6 +52,17 @@ def _log_account_event(db: Session, account_id: int, event_type: str, details: O
     pass # Placeholder for actual audit logging
 
 
+def _get_mock_product_params(product_code: str) -> Dict[str, Any]:
+    """Mock product config fetching (stands in for core_infrastructure_config_engine's ProductConfig)."""
+    if "SAV" in product_code.upper():
+        return {"account_type": "SAVINGS", "currency": "NGN", "min_opening_balance": 0}
+    elif "CUR" in product_code.upper():
+        return {"account_type": "CURRENT", "currency": "NGN", "min_opening_balance": 1000}
+    elif "DOM" in product_code.upper():
+        return {"account_type": "DOMICILIARY", "currency": "USD", "min_opening_balance": 100}
+    raise NotFoundException(f"Mock Product Configuration for code '{product_code}' not found.")
+
+
 # --- Account Services (Part 1: Account Management) ---
 # (create_account, get_account_by_id_internal, get_account_by_number, get_accounts_by_customer_id, update_account_status, place_lien_on_account, release_lien_on_account - already implemented in previous step)
 # ... (previous Part 1 code from above) ...
@@ -66,16 +85,7 @@ def create_account(db: Session, account_in: schemas.AccountCreateRequest, create
     #     raise NotFoundException(f"Active Product Configuration with code '{account_in.product_code}' not found.")
     # product_params = json.loads(product_config_model.config_parameters_json)
 
-    # Mock product config fetching:
-    mock_product_params = {}
-    if "SAV" in account_in.product_code.upper():
-        mock_product_params = {"account_type": "SAVINGS", "currency": "NGN", "min_opening_balance": 0}
-    elif "CUR" in account_in.product_code.upper():
-        mock_product_params = {"account_type": "CURRENT", "currency": "NGN", "min_opening_balance": 1000}
-    elif "DOM" in account_in.product_code.upper():
-        mock_product_params = {"account_type": "DOMICILIARY", "currency": "USD", "min_opening_balance": 100}
-    else:
-        raise NotFoundException(f"Mock Product Configuration for code '{account_in.product_code}' not found.")
+    mock_product_params = _get_mock_product_params(account_in.product_code)
 
     account_type_from_product = AccountTypeEnum[mock_product_params["account_type"]]
     currency_from_product = CurrencyEnum[mock_product_params["currency"]]
@@ -289,6 +299,8 @@ def _create_ledger_entry_internal(
     )
     db.add(ledger_entry)
     db.flush() # Flush to assign ID to ledger_entry if needed by caller before commit
+    # Delivered when the caller commits (dropped on rollback); invalidates balance caches such as the dashboard snapshot
+    event_bus.publish_after_commit(db, event_bus.LEDGER_ENTRY_POSTED, customer_id=account.customer_id, account_id=account.id)
     # db.commit() # COMMIT IS HANDLED BY THE CALLING SERVICE WRAPPING THE TRANSACTION
     # db.refresh(account) # Caller should refresh if needed after its commit
     # db.refresh(ledger_entry) # Caller should refresh if needed after its commit
@@ -251,7 +251,7 @@ def transfer_between_wallets(
 # --- Cardless Withdrawal Endpoints ---
 @router.post("/cardless-withdrawal/generate-token", response_model=schemas.CardlessWithdrawalTokenResponse)
 def generate_cardless_token(
-    request_in: schemas.CardlessWithdrawalRequest,
+    request_in: schemas.CardlessWithdrawalGenerateRequest,
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
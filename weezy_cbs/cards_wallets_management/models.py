@@ -165,8 +165,9 @@ class CardlessWithdrawalToken(Base):
     amount = Column(Numeric(precision=18, scale=2), nullable=False)
     currency = Column(SQLAlchemyEnum(CurrencyEnum), nullable=False)
 
-    status = Column(String(20), default="ACTIVE", index=True)
+    status = Column(String(20), default="ACTIVE", index=True) # ACTIVE, USED, EXPIRED, LOCKED
     expiry_date = Column(DateTime(timezone=True), nullable=False)
+    failed_pin_attempts = Column(Integer, default=0, nullable=False)
 
     generated_at = Column(DateTime(timezone=True), server_default=func.now())
     used_at = Column(DateTime(timezone=True), nullable=True)
@@ -7,7 +7,9 @@ import decimal
 import random
 import string
 from datetime import datetime, timedelta
+from typing import List, Optional
 import hashlib # For hashing PAN if stored (ensure compliance)
+from weezy_cbs.digital_channels_modules.otp_store import get_otp_store # Shared TTL store for one-time codes
 
 # Placeholder for other service integrations
 # from weezy_cbs.customer_identity_management.services import get_customer
@@ -304,7 +306,14 @@ def p2p_wallet_transfer(db: Session, p2p_request: schemas.WalletP2PTransferReque
     return source_wallet, destination_wallet
 
 # --- Cardless Withdrawal Services ---
-def generate_cardless_withdrawal_token(db: Session, request: schemas.CardlessWithdrawalRequest, account_id: int) -> models.CardlessWithdrawalToken:
+CARDLESS_TOKEN_VALIDITY_HOURS = 24
+CARDLESS_PIN_LENGTH = 4
+CARDLESS_MAX_PIN_ATTEMPTS = 3 # Wrong PINs before the token is LOCKED
+
+def _cardless_pin_key(token: str) -> str:
+    return f"CARDLESS_WITHDRAWAL:{token}"
+
+def generate_cardless_withdrawal_token(db: Session, request: schemas.CardlessWithdrawalGenerateRequest, account_id: int) -> models.CardlessWithdrawalToken:
     # bank_account = get_bank_account(db, account_id)
     # if not bank_account: raise NotFoundException("Bank account not found.")
     # if bank_account.available_balance < request.amount: # Check available balance from ledger
@@ -316,7 +325,11 @@ def generate_cardless_withdrawal_token(db: Session, request: schemas.CardlessWit
     #     raise InvalidOperationException("Failed to place lien on account for cardless withdrawal.")
 
     token_str = "".join(random.choices(string.digits, k=12)) # Example token
-    expiry = datetime.utcnow() + timedelta(hours=24) # Token valid for 24 hours
+    expiry = datetime.utcnow() + timedelta(hours=CARDLESS_TOKEN_VALIDITY_HOURS)
+
+    # One-time PIN entered at the ATM together with the token; kept in the shared OTP store with the token's lifetime
+    one_time_pin = "".join(random.choices(string.digits, k=CARDLESS_PIN_LENGTH))
+    get_otp_store().put(_cardless_pin_key(token_str), one_time_pin, ttl_seconds=CARDLESS_TOKEN_VALIDITY_HOURS * 3600)
 
     db_token = models.CardlessWithdrawalToken(
         account_id=account_id,
@@ -331,7 +344,7 @@ def generate_cardless_withdrawal_token(db: Session, request: schemas.CardlessWit
     db.refresh(db_token)
 
     # Send token (and potentially a separate OTP) to user via SMS/Email
-    # notification_service.send_sms(user.phone, f"Your cardless withdrawal token is {token_str}. Amount: {request.amount} {request.currency}. Expires {expiry}.")
+    # notification_service.send_sms(user.phone, f"Your cardless withdrawal token is {token_str}, PIN {one_time_pin}. Amount: {request.amount} {request.currency}. Expires {expiry}.")
     return db_token
 
 def redeem_cardless_withdrawal_token(db: Session, redemption_req: schemas.CardlessWithdrawalRedemptionRequest) -> str:
@@ -346,11 +359,15 @@ def redeem_cardless_withdrawal_token(db: Session, redemption_req: schemas.Cardle
         db.commit()
         return "FAILED_EXPIRED_TOKEN"
 
-    # Validate OTP (e.g., redemption_req.one_time_pin against a stored hash or service)
-    # is_otp_valid = security_utils.verify_otp(token_record.account_id, redemption_req.one_time_pin)
-    # if not is_otp_valid:
-    #     # Increment failed attempts, potentially lock token
-    #     return "FAILED_INVALID_PIN"
+    # Validate the one-time PIN issued with the token (consumed on success, so it cannot be replayed)
+    if not get_otp_store().check_and_consume(_cardless_pin_key(token_record.token), redemption_req.one_time_pin):
+        # Counted on the (row-locked) token so concurrent guesses cannot exceed the limit
+        token_record.failed_pin_attempts = (token_record.failed_pin_attempts or 0) + 1
+        if token_record.failed_pin_attempts >= CARDLESS_MAX_PIN_ATTEMPTS:
+            token_record.status = "LOCKED"
+            get_otp_store().delete(_cardless_pin_key(token_record.token))
+        db.commit()
+        return "FAILED_TOKEN_LOCKED" if token_record.status == "LOCKED" else "FAILED_INVALID_PIN"
 
     # If all checks pass, proceed with dispensing cash (this is conceptual for ATM)
     # and debiting the linked account / releasing the lien and posting debit.
@@ -193,6 +193,79 @@ def list_sanction_screening_logs(
 
     return schemas.PaginatedSanctionScreeningLogResponse(items=logs, total=total, page=(skip//limit)+1, size=len(logs))
 
+@router.post("/sanction-screening/batch-runs", response_model=schemas.SanctionScreeningRunResponse, status_code=status.HTTP_202_ACCEPTED)
+def start_batch_sanction_screening(
+    run_request: schemas.SanctionBatchScreeningRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_co: dict = Depends(get_current_active_compliance_officer)
+):
+    """Screen the whole customer base against the loaded sanction lists. Runs in the background. (Compliance Officer operation)"""
+    if db is None: raise HTTPException(status_code=503, detail="Database not configured for API.")
+    try:
+        run = services.create_sanction_screening_run(db, run_request, user_id=current_co.get("id"))
+    except services.SanctionScreeningException as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    background_tasks.add_task(services.execute_sanction_screening_run, run.id)
+    return run
+
+@router.get("/sanction-screening/batch-runs/{run_id}", response_model=schemas.SanctionScreeningRunResponse)
+def get_batch_sanction_screening_run(
+    run_id: int,
+    db: Session = Depends(get_db),
+    current_co: dict = Depends(get_current_active_compliance_officer)
+):
+    """Progress and outcome of a batch sanction screening run. (Compliance Officer operation)"""
+    if db is None: raise HTTPException(status_code=503, detail="Database not configured for API.")
+    run = services.get_sanction_screening_run(db, run_id)
+    if not run:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Screening run not found.")
+    return run
+
+@router.get("/sanction-screening/list-versions", response_model=List[schemas.SanctionListVersionResponse])
+def list_sanction_list_versions(
+    list_name: Optional[str] = Query(None),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_co: dict = Depends(get_current_active_compliance_officer)
+):
+    """Loaded sanction list versions with their added/changed/removed counts. (Compliance Officer operation)"""
+    if db is None: raise HTTPException(status_code=503, detail="Database not configured for API.")
+    return services.get_sanction_list_versions(db, list_name, skip, limit)
+
+@router.post("/sanction-screening/list-versions/{version_id}/rescreen", response_model=schemas.SanctionScreeningRunResponse, status_code=status.HTTP_202_ACCEPTED)
+def rescreen_sanction_list_version(
+    version_id: int,
+    run_request: schemas.SanctionBatchScreeningRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_co: dict = Depends(get_current_active_compliance_officer)
+):
+    """Screen customers against the entries added or changed by a list version only; retires alerts on removed entries. (Compliance Officer operation)"""
+    if db is None: raise HTTPException(status_code=503, detail="Database not configured for API.")
+    try:
+        run = services.create_sanction_screening_run(db, run_request, user_id=current_co.get("id"), list_version_id=version_id)
+    except services.NotFoundException as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except services.SanctionScreeningException as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    background_tasks.add_task(services.execute_sanction_screening_run, run.id)
+    return run
+
+@router.get("/sanction-screening/alerts", response_model=List[schemas.SanctionAlertResponse])
+def list_sanction_alerts(
+    alert_status: Optional[str] = Query(None, alias="status"),
+    customer_id: Optional[int] = Query(None),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_co: dict = Depends(get_current_active_compliance_officer)
+):
+    """Sanction alerts (potential customer matches), e.g. status=OPEN for the review queue. (Compliance Officer operation)"""
+    if db is None: raise HTTPException(status_code=503, detail="Database not configured for API.")
+    return services.get_sanction_alerts(db, alert_status, customer_id, skip, limit)
+
 # Note: AML Transaction Monitoring and batch Sanction Screening are typically background processes,
 # not directly triggered via API by users, but their results (SuspiciousActivityLog, SanctionScreeningLog) are queryable.
 # Report submission to regulators might also be a mix of automated (if APIs exist) and manual processes.
@@ -0,0 +1,342 @@
+# CBN Credit Risk Management System (CRMS) return
+#
+# The return lists every credit facility on the book at the reporting date. LoanAccount is read in keyset
+# pages (id > last id ORDER BY id LIMIT n), never with OFFSET. For each page, the repayment schedule and
+# collateral are aggregated in SQL over the page's id range, so a page costs three queries however many
+# loans it holds. Exposure, days past due, prudential classification and required provision are then
+# computed column by column for the page. Records are streamed into the XML writer (return_writers.py).
+#
+# CBN caps the size of uploaded files. When the next record would take a file past CRMS_MAX_FILE_BYTES or
+# CRMS_MAX_RECORDS_PER_FILE, the file is closed and the return continues in a new part
+# ("<name>_part002.xml", ...). A return that fits in one file is named "<name>.xml". A split return gets a
+# "<name>.manifest.json" listing each part's row count and SHA-256 checksum.
+#
+#   python -m weezy_cbs.compliance_regulatory_reporting.crms_pipeline generate --start 2026-10-01 --end 2026-10-31
+import argparse
+import hashlib
+import json
+import os
+import re
+from bisect import bisect_right
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from .return_writers import AMOUNT_PATTERN, BVN_PATTERN, COUNT_PATTERN, DATE_PATTERN, RETURN_WRITE_CHUNK_BYTES, XmlReturnWriter
+
+CRMS_PAGE_SIZE = int(os.getenv("CRMS_PAGE_SIZE", "2000"))
+CRMS_MAX_FILE_BYTES = int(os.getenv("CRMS_MAX_FILE_BYTES", str(20 * 1024 * 1024))) # 0 = no size limit
+CRMS_MAX_RECORDS_PER_FILE = int(os.getenv("CRMS_MAX_RECORDS_PER_FILE", "0")) # 0 = no record limit
+CRMS_REPORTING_ENTITY = os.getenv("CRMS_REPORTING_ENTITY", "WEEZY_MFB")
+
+# (classification, from days past due, provision rate on unsecured exposure), per the CBN prudential guidelines
+CRMS_CLASSIFICATIONS = (
+    ("PERFORMING", 0, Decimal("0.01")),
+    ("WATCHLIST", 30, Decimal("0.05")),
+    ("SUBSTANDARD", 90, Decimal("0.10")),
+    ("DOUBTFUL", 180, Decimal("0.50")),
+    ("LOST", 360, Decimal("1.00")),
+)
+_CLASSIFICATION_FLOORS = [band[1] for band in CRMS_CLASSIFICATIONS]
+_CENT = Decimal("0.01")
+_ZERO = Decimal("0.00")
+
+_RATE_PATTERN = re.compile(r"\d{1,3}(\.\d{1,4})?")
+
+# (column, XML element, max length, required, pattern)
+CRMS_FIELDS = (
+    ("facility_reference", "FacilityReference", 20, True, None),
+    ("borrower_type", "BorrowerType", 20, True, None),
+    ("borrower_name", "BorrowerName", 255, True, None),
+    ("borrower_bvn", "BorrowerBVN", 11, False, BVN_PATTERN),
+    ("borrower_tin", "BorrowerTIN", 20, False, None),
+    ("borrower_rc_number", "BorrowerRCNumber", 20, False, None),
+    ("facility_type", "FacilityType", 10, False, None),
+    ("purpose_code", "PurposeCode", 10, False, None),
+    ("currency", "Currency", 3, True, re.compile(r"[A-Z]{3}")),
+    ("amount_granted", "AmountGranted", 21, True, AMOUNT_PATTERN),
+    ("interest_rate", "InterestRate", 8, True, _RATE_PATTERN),
+    ("tenor_months", "TenorMonths", 4, True, COUNT_PATTERN),
+    ("disbursement_date", "DisbursementDate", 10, True, DATE_PATTERN),
+    ("maturity_date", "MaturityDate", 10, True, DATE_PATTERN),
+    ("next_repayment_date", "NextRepaymentDate", 10, False, DATE_PATTERN),
+    ("principal_outstanding", "PrincipalOutstanding", 21, True, AMOUNT_PATTERN),
+    ("interest_outstanding", "InterestOutstanding", 21, True, AMOUNT_PATTERN),
+    ("total_exposure", "TotalExposure", 21, True, AMOUNT_PATTERN),
+    ("amount_overdue", "AmountOverdue", 21, True, AMOUNT_PATTERN),
+    ("days_past_due", "DaysPastDue", 6, True, COUNT_PATTERN),
+    ("installments_outstanding", "InstallmentsOutstanding", 4, True, COUNT_PATTERN),
+    ("collateral_type", "CollateralType", 100, False, None),
+    ("collateral_value", "CollateralValue", 21, True, AMOUNT_PATTERN),
+    ("classification", "Classification", 20, True, None),
+    ("provision_required", "ProvisionRequired", 21, True, AMOUNT_PATTERN),
+    ("facility_status", "FacilityStatus", 50, True, None),
+)
+
+
+def _money(value: Any) -> Decimal:
+    if value is None:
+        return _ZERO
+    return (value if isinstance(value, Decimal) else Decimal(str(value))).quantize(_CENT)
+
+def _as_date(value: Any) -> Optional[date]:
+    if isinstance(value, str): # SQLite returns aggregated dates as text
+        return date.fromisoformat(value[:10])
+    return value
+
+
+# --- Page queries ---
+def _loan_page_query(last_id: int, period_start: date, period_end: date, page_size: int):
+    """Facilities to report: disbursed by the period end and not paid off before the period began."""
+    from sqlalchemy import or_, select
+    from weezy_cbs.customer_identity_management.models import Customer
+    from weezy_cbs.loan_management_module.models import LoanAccount, LoanAccountStatusEnum, LoanApplication, LoanProduct
+    return (
+        select(
+            LoanAccount.id, LoanAccount.loan_account_number, LoanAccount.principal_disbursed, LoanAccount.currency,
+            LoanAccount.interest_rate_pa, LoanAccount.tenor_months, LoanAccount.principal_outstanding,
+            LoanAccount.interest_outstanding, LoanAccount.fees_outstanding, LoanAccount.penalties_outstanding,
+            LoanAccount.status, LoanAccount.crms_loan_status, LoanAccount.loan_purpose_code, LoanAccount.disbursement_date,
+            LoanAccount.maturity_date, LoanAccount.next_repayment_date, LoanProduct.crms_product_code,
+            Customer.customer_type, Customer.bvn, Customer.tin, Customer.rc_number, Customer.first_name,
+            Customer.middle_name, Customer.last_name, Customer.company_name,
+        )
+        .join(LoanApplication, LoanApplication.id == LoanAccount.application_id)
+        .join(LoanProduct, LoanProduct.id == LoanApplication.loan_product_id)
+        .join(Customer, Customer.id == LoanAccount.customer_id)
+        .where(
+            LoanAccount.id > last_id,
+            LoanAccount.disbursement_date <= period_end,
+            or_(LoanAccount.status != LoanAccountStatusEnum.PAID_OFF,
+                LoanAccount.last_repayment_date >= datetime.combine(period_start, time.min)),
+        )
+        .order_by(LoanAccount.id)
+        .limit(page_size)
+    )
+
+def _schedule_aggregates(db, first_id: int, last_id: int, as_of: date) -> Dict[int, Any]:
+    """Per loan in [first_id, last_id]: amount overdue, oldest unpaid due date and installments outstanding at `as_of`."""
+    from sqlalchemy import and_, case, func, select
+    from weezy_cbs.loan_management_module.models import LoanRepaymentSchedule as S
+    unpaid = S.is_paid.isnot(True)
+    overdue = and_(unpaid, S.due_date <= as_of)
+    outstanding = S.total_due - func.coalesce(S.principal_paid, 0) - func.coalesce(S.interest_paid, 0) - func.coalesce(S.fees_paid, 0)
+    stmt = (
+        select(
+            S.loan_account_id,
+            func.sum(case((overdue, outstanding), else_=0)).label("amount_overdue"),
+            func.min(case((overdue, S.due_date))).label("oldest_unpaid_due"),
+            func.sum(case((unpaid, 1), else_=0)).label("installments_outstanding"),
+        )
+        .where(S.loan_account_id.between(first_id, last_id))
+        .group_by(S.loan_account_id)
+    )
+    return {row.loan_account_id: row for row in db.execute(stmt)}
+
+def _collateral_aggregates(db, first_id: int, last_id: int) -> Dict[int, Any]:
+    """Per loan in [first_id, last_id]: total value and (alphabetically first) type of the collateral not yet released."""
+    from sqlalchemy import func, or_, select
+    from weezy_cbs.loan_management_module.models import Collateral, LoanAccount
+    stmt = (
+        select(
+            LoanAccount.id.label("loan_account_id"),
+            func.sum(Collateral.estimated_value).label("collateral_value"),
+            func.min(Collateral.type).label("collateral_type"),
+        )
+        .join(Collateral, Collateral.loan_application_id == LoanAccount.application_id)
+        .where(LoanAccount.id.between(first_id, last_id), or_(Collateral.status.is_(None), Collateral.status != "RELEASED"))
+        .group_by(LoanAccount.id)
+    )
+    return {row.loan_account_id: row for row in db.execute(stmt)}
+
+
+# --- Batch computation ---
+def crms_records(loans: Sequence[Any], schedules: Dict[int, Any], collateral: Dict[int, Any], as_of: date) -> List[Dict[str, Any]]:
+    """CRMS records for one page of loans, with exposure and classification fields computed per column."""
+    principal = [_money(loan.principal_outstanding) for loan in loans]
+    interest = [_money(loan.interest_outstanding) for loan in loans]
+    exposure = [p + i + _money(loan.fees_outstanding) + _money(loan.penalties_outstanding)
+                for p, i, loan in zip(principal, interest, loans)]
+
+    loan_schedules = [schedules.get(loan.id) for loan in loans]
+    overdue = [_money(s.amount_overdue) if s is not None else _ZERO for s in loan_schedules]
+    oldest_due = [_as_date(s.oldest_unpaid_due) if s is not None else None for s in loan_schedules]
+    days_past_due = [max((as_of - due).days, 0) if due is not None else 0 for due in oldest_due]
+    installments = [int(s.installments_outstanding or 0) if s is not None else 0 for s in loan_schedules]
+
+    band = [bisect_right(_CLASSIFICATION_FLOORS, dpd) - 1 for dpd in days_past_due]
+    band = [len(CRMS_CLASSIFICATIONS) - 1 if getattr(loan.status, "value", loan.status) == "WRITTEN_OFF" else b
+            for b, loan in zip(band, loans)]
+
+    loan_collateral = [collateral.get(loan.id) for loan in loans]
+    collateral_value = [_money(c.collateral_value) if c is not None else _ZERO for c in loan_collateral]
+    unsecured = [max(e - c, _ZERO) for e, c in zip(exposure, collateral_value)]
+    provision = [(u * CRMS_CLASSIFICATIONS[b][2]).quantize(_CENT) for u, b in zip(unsecured, band)]
+
+    records = []
+    for i, loan in enumerate(loans):
+        borrower_type = getattr(loan.customer_type, "value", loan.customer_type)
+        if borrower_type == "INDIVIDUAL":
+            name = " ".join(part for part in (loan.first_name, loan.middle_name, loan.last_name) if part)
+        else:
+            name = loan.company_name or ""
+        records.append({
+            "facility_reference": loan.loan_account_number,
+            "borrower_type": borrower_type,
+            "borrower_name": name,
+            "borrower_bvn": loan.bvn,
+            "borrower_tin": loan.tin,
+            "borrower_rc_number": loan.rc_number,
+            "facility_type": loan.crms_product_code,
+            "purpose_code": loan.loan_purpose_code,
+            "currency": loan.currency,
+            "amount_granted": _money(loan.principal_disbursed),
+            "interest_rate": format(Decimal(str(loan.interest_rate_pa)).normalize(), "f"),
+            "tenor_months": loan.tenor_months,
+            "disbursement_date": _as_date(loan.disbursement_date),
+            "maturity_date": _as_date(loan.maturity_date),
+            "next_repayment_date": _as_date(loan.next_repayment_date),
+            "principal_outstanding": principal[i],
+            "interest_outstanding": interest[i],
+            "total_exposure": exposure[i],
+            "amount_overdue": overdue[i],
+            "days_past_due": days_past_due[i],
+            "installments_outstanding": installments[i],
+            "collateral_type": loan_collateral[i].collateral_type if loan_collateral[i] is not None else None,
+            "collateral_value": collateral_value[i],
+            "classification": CRMS_CLASSIFICATIONS[band[i]][0],
+            "provision_required": provision[i],
+            "facility_status": loan.crms_loan_status or getattr(loan.status, "value", loan.status),
+        })
+    return records
+
+def iter_crms_records(db, period_start: date, period_end: date, page_size: int = CRMS_PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+    """CRMS records for all reportable facilities as at period_end, in loan id order, one page in memory at a time."""
+    last_id = 0
+    while True:
+        loans = db.execute(_loan_page_query(last_id, period_start, period_end, page_size)).all()
+        if not loans:
+            return
+        first_id, last_id = loans[0].id, loans[-1].id
+        schedules = _schedule_aggregates(db, first_id, last_id, period_end)
+        collateral = _collateral_aggregates(db, first_id, last_id)
+        yield from crms_records(loans, schedules, collateral, period_end)
+
+
+# --- Split output ---
+class CRMSReportResult:
+    __slots__ = ("file_name", "file_path", "file_format", "row_count", "bytes_written", "checksum", "parts")
+
+    def __init__(self, file_name: str, file_path: str, file_format: str, row_count: int, bytes_written: int, checksum: str,
+                 parts: List[Dict[str, Any]]):
+        self.file_name = file_name
+        self.file_path = file_path
+        self.file_format = file_format # XML, or MANIFEST for a split return (file_path is then the manifest)
+        self.row_count = row_count
+        self.bytes_written = bytes_written
+        self.checksum = checksum
+        self.parts = parts # [{"file_name", "row_count", "bytes_written", "sha256"}]
+
+
+def generate_crms_report(db, period_start: date, period_end: date, store=None, base_file_name: Optional[str] = None,
+                         max_file_bytes: int = CRMS_MAX_FILE_BYTES, max_records_per_file: int = CRMS_MAX_RECORDS_PER_FILE,
+                         page_size: int = CRMS_PAGE_SIZE) -> CRMSReportResult:
+    """
+    Writes the CRMS return as at period_end, split into parts when a file would exceed max_file_bytes or
+    max_records_per_file. Returns the file (or, for split returns, the manifest) with its SHA-256 checksum
+    and the total record count. On any error, every file of this run is removed.
+    """
+    from weezy_cbs.reports_analytics.report_streaming import LocalReportStore
+    store = store or LocalReportStore()
+    os.makedirs(store.base_dir, exist_ok=True)
+    base_file_name = base_file_name or f"CBN_CRMS_{period_end:%Y%m%d}"
+    attributes = {"reportingEntity": CRMS_REPORTING_ENTITY, "periodStart": period_start, "periodEnd": period_end,
+                  "generatedAt": datetime.utcnow().replace(microsecond=0).isoformat() + "Z"}
+    parts: List[Dict[str, Any]] = []
+    completed: List[str] = []
+    current: Dict[str, Any] = {}
+
+    def open_part() -> None:
+        file_name = f"{base_file_name}_part{len(parts) + 1:03d}.xml"
+        path = os.path.join(store.base_dir, file_name)
+        fh = open(path + ".part", "wb")
+        writer = XmlReturnWriter(fh, CRMS_FIELDS, "CRMSReturn", "CreditFacility", RETURN_WRITE_CHUNK_BYTES)
+        writer.begin({**attributes, "part": len(parts) + 1})
+        current.update(file_name=file_name, path=path, fh=fh, writer=writer)
+
+    def close_part() -> None:
+        writer = current["writer"]
+        writer.end()
+        current.pop("fh").close()
+        os.replace(current["path"] + ".part", current["path"])
+        completed.append(current["path"])
+        parts.append({"file_name": current["file_name"], "row_count": writer.rows_written,
+                      "bytes_written": writer.bytes_written, "sha256": writer.checksum})
+
+    try:
+        open_part()
+        for record in iter_crms_records(db, period_start, period_end, page_size):
+            writer = current["writer"]
+            data = writer.render_record(record, f"CRMS facility {record['facility_reference']}")
+            if writer.rows_written and (
+                    (max_records_per_file and writer.rows_written >= max_records_per_file)
+                    or (max_file_bytes and writer.size + len(data) + writer.footer_bytes() > max_file_bytes)):
+                close_part()
+                open_part()
+            current["writer"].write_rendered(data)
+        close_part()
+
+        row_count = sum(part["row_count"] for part in parts)
+        bytes_written = sum(part["bytes_written"] for part in parts)
+        if len(parts) == 1:
+            file_name = f"{base_file_name}.xml"
+            file_path = os.path.join(store.base_dir, file_name)
+            os.replace(completed[0], file_path)
+            completed[0] = file_path
+            parts[0]["file_name"] = file_name
+            checksum = parts[0]["sha256"]
+            file_format = "XML"
+        else:
+            manifest = json.dumps({
+                "report_name": "CBN_CRMS", "period_start": period_start.isoformat(), "period_end": period_end.isoformat(),
+                "row_count": row_count, "parts": parts,
+            }, indent=2).encode("utf-8")
+            stored = store.write(f"{base_file_name}.manifest.json", lambda fh: (fh.write(manifest), (row_count, len(manifest)))[1])
+            file_name, file_path = stored.file_name, stored.file_path
+            completed.append(file_path)
+            checksum = hashlib.sha256(manifest).hexdigest()
+            file_format = "MANIFEST"
+    except BaseException:
+        if "fh" in current:
+            current["fh"].close()
+            os.remove(current["path"] + ".part")
+        for path in completed:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
+    keep = {part["file_name"] for part in parts} | {file_name}
+    for stale in os.listdir(store.base_dir): # Parts or manifest left by an earlier run of the same return
+        if stale not in keep and (stale.startswith(f"{base_file_name}_part") or stale == f"{base_file_name}.manifest.json"
+                                  or (len(parts) > 1 and stale == f"{base_file_name}.xml")):
+            os.remove(os.path.join(store.base_dir, stale))
+    return CRMSReportResult(file_name, file_path, file_format, row_count, bytes_written, checksum, parts)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the CBN CRMS return.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate_cmd = commands.add_parser("generate")
+    generate_cmd.add_argument("--start", type=date.fromisoformat, required=True)
+    generate_cmd.add_argument("--end", type=date.fromisoformat, required=True)
+    generate_cmd.add_argument("--max-file-bytes", type=int, default=CRMS_MAX_FILE_BYTES)
+    generate_cmd.add_argument("--max-records-per-file", type=int, default=CRMS_MAX_RECORDS_PER_FILE)
+    args = parser.parse_args()
+
+    from weezy_cbs.database import SessionLocal
+    session = SessionLocal()
+    try:
+        report = generate_crms_report(session, args.start, args.end, max_file_bytes=args.max_file_bytes,
+                                      max_records_per_file=args.max_records_per_file)
+        print(f"{report.file_path}: {report.row_count} facilities in {len(report.parts)} file(s), sha256 {report.checksum}")
+    finally:
+        session.close()
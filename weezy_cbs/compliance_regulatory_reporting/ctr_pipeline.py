@@ -0,0 +1,207 @@
+# Currency Transaction Report (CTR) pipeline for NFIU returns
+#
+# Cash deposits and withdrawals are aggregated per customer, per day and per direction in one grouped
+# query; only groups at or above the customer's threshold (individual / corporate) come back. The rows are
+# read through a server-side cursor and written record by record into an XML (NFIU upload) or CSV file:
+# each record is validated as it is written, output is flushed to disk in fixed-size chunks, and the
+# SHA-256 checksum and row count are computed on the way (return_writers.py). No part of the report is
+# held in memory as a whole, and a failed validation leaves no file behind (LocalReportStore writes to
+# "<name>.part" first).
+#
+#   python -m weezy_cbs.compliance_regulatory_reporting.ctr_pipeline generate --start 2026-10-01 --end 2026-10-31 [--format CSV]
+import argparse
+import os
+import re
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from .aml_engine import CASH_TRANSACTION_TYPES
+from .return_writers import (
+    AMOUNT_PATTERN, BVN_PATTERN, DATE_PATTERN, RETURN_WRITE_CHUNK_BYTES, CsvReturnWriter, XmlReturnWriter,
+)
+
+CTR_INDIVIDUAL_THRESHOLD = Decimal(os.getenv("CTR_INDIVIDUAL_THRESHOLD", "5000000.00")) # NGN, per day
+CTR_CORPORATE_THRESHOLD = Decimal(os.getenv("CTR_CORPORATE_THRESHOLD", "10000000.00")) # NGN, per day (SME and corporate)
+CTR_CURRENCY = os.getenv("CTR_CURRENCY", "NGN")
+CTR_OUTPUT_FORMAT = os.getenv("CTR_OUTPUT_FORMAT", "XML") # 'XML' or 'CSV'
+CTR_WRITE_CHUNK_BYTES = int(os.getenv("CTR_WRITE_CHUNK_BYTES", str(RETURN_WRITE_CHUNK_BYTES)))
+CTR_REPORTING_ENTITY = os.getenv("CTR_REPORTING_ENTITY", "WEEZY_MFB")
+
+CTR_OUTPUT_FORMATS = ("XML", "CSV")
+
+# (column, XML element, max length, required, pattern)
+CTR_FIELDS = (
+    ("transaction_reference", "TransactionReference", 40, True, None),
+    ("transaction_date", "TransactionDate", 10, True, DATE_PATTERN),
+    ("transaction_type", "TransactionType", 50, True, None),
+    ("transaction_amount", "Amount", 21, True, AMOUNT_PATTERN),
+    ("transaction_currency", "Currency", 3, True, re.compile(r"[A-Z]{3}")),
+    ("transaction_count", "TransactionCount", 10, True, re.compile(r"[1-9]\d*")),
+    ("customer_type", "CustomerType", 20, True, None),
+    ("customer_name", "CustomerName", 255, True, None),
+    ("customer_bvn", "CustomerBVN", 11, False, BVN_PATTERN),
+    ("account_number", "AccountNumber", 20, True, None),
+    ("accounts_involved", "AccountsInvolved", 10, True, re.compile(r"[1-9]\d*")),
+)
+
+
+# --- Aggregation ---
+def ctr_aggregation_query(period_start: date, period_end: date,
+                          individual_threshold: Decimal = CTR_INDIVIDUAL_THRESHOLD,
+                          corporate_threshold: Decimal = CTR_CORPORATE_THRESHOLD,
+                          currency: str = CTR_CURRENCY):
+    """
+    Grouped query for the CTR return: successful cash transactions in the period, summed per customer,
+    per day and per direction (deposits credit the customer, withdrawals debit them). Groups below the
+    lower threshold are dropped by HAVING before the join to customers; the per-customer-type threshold
+    is applied after it.
+    """
+    from sqlalchemy import case, distinct, func, literal, select
+    from weezy_cbs.customer_identity_management.models import Customer, CustomerTypeEnum
+    from weezy_cbs.transaction_management.models import (
+        CurrencyEnum, FinancialTransaction as FT, TransactionStatusEnum, TransactionTypeCategoryEnum,
+    )
+    is_deposit = FT.transaction_type == TransactionTypeCategoryEnum.CASH_DEPOSIT
+    customer_id = case((is_deposit, FT.credit_customer_id), else_=FT.debit_customer_id)
+    account_number = case((is_deposit, FT.credit_account_number), else_=FT.debit_account_number)
+    transaction_day = func.date(FT.initiated_at)
+    total = func.sum(FT.amount)
+
+    cash = (
+        select(
+            customer_id.label("customer_id"),
+            transaction_day.label("transaction_day"),
+            FT.transaction_type.label("transaction_type"),
+            total.label("total_amount"),
+            func.count(FT.id).label("transaction_count"),
+            func.min(account_number).label("account_number"),
+            func.count(distinct(account_number)).label("accounts_involved"),
+        )
+        .where(
+            FT.transaction_type.in_([TransactionTypeCategoryEnum[t] for t in CASH_TRANSACTION_TYPES]),
+            FT.status == TransactionStatusEnum.SUCCESSFUL,
+            FT.currency == CurrencyEnum(currency),
+            FT.is_reversal.isnot(True),
+            FT.initiated_at >= datetime.combine(period_start, time.min), # Range on the indexed column
+            FT.initiated_at < datetime.combine(period_end + timedelta(days=1), time.min),
+            customer_id.isnot(None),
+        )
+        .group_by(customer_id, transaction_day, FT.transaction_type)
+        .having(total >= min(individual_threshold, corporate_threshold))
+        .subquery("cash_daily")
+    )
+    threshold = case((Customer.customer_type == CustomerTypeEnum.INDIVIDUAL, literal(individual_threshold)),
+                     else_=literal(corporate_threshold))
+    return (
+        select(
+            cash.c.customer_id, cash.c.transaction_day, cash.c.transaction_type, cash.c.total_amount,
+            cash.c.transaction_count, cash.c.account_number, cash.c.accounts_involved,
+            Customer.customer_type, Customer.bvn, Customer.first_name, Customer.middle_name, Customer.last_name,
+            Customer.company_name,
+        )
+        .join(Customer, Customer.id == cash.c.customer_id)
+        .where(cash.c.total_amount >= threshold)
+        .order_by(cash.c.transaction_day, cash.c.customer_id, cash.c.transaction_type)
+    )
+
+
+def _value(value: Any) -> Any:
+    return getattr(value, "value", value) # Enums come back as members on some dialects
+
+def ctr_record(row, currency: str = CTR_CURRENCY) -> Dict[str, Any]:
+    """One aggregated query row as a CTR record (column -> value, see CTR_FIELDS)."""
+    transaction_day = row.transaction_day
+    if isinstance(transaction_day, str): # SQLite's date() returns text
+        transaction_day = date.fromisoformat(transaction_day)
+    transaction_type = _value(row.transaction_type)
+    customer_type = _value(row.customer_type)
+    if customer_type == "INDIVIDUAL":
+        name = " ".join(part for part in (row.first_name, row.middle_name, row.last_name) if part)
+    else:
+        name = row.company_name or ""
+    return {
+        "transaction_reference": f"CTR-{transaction_day:%Y%m%d}-{row.customer_id}-{transaction_type[5]}", # D(eposit) / W(ithdrawal)
+        "transaction_date": transaction_day,
+        "transaction_type": transaction_type,
+        "transaction_amount": Decimal(str(row.total_amount)).quantize(Decimal("0.01")),
+        "transaction_currency": currency,
+        "transaction_count": row.transaction_count,
+        "customer_type": customer_type,
+        "customer_name": name,
+        "customer_bvn": row.bvn,
+        "account_number": row.account_number,
+        "accounts_involved": row.accounts_involved,
+    }
+
+
+def _ctr_writer(output_format: str, out_binary):
+    if output_format == "CSV":
+        return CsvReturnWriter(out_binary, CTR_FIELDS, CTR_WRITE_CHUNK_BYTES)
+    return XmlReturnWriter(out_binary, CTR_FIELDS, "CTRReport", "CTRRecord", CTR_WRITE_CHUNK_BYTES)
+
+
+# --- Report ---
+class CTRReportResult:
+    __slots__ = ("file_name", "file_path", "file_format", "row_count", "bytes_written", "checksum")
+
+    def __init__(self, file_name: str, file_path: str, file_format: str, row_count: int, bytes_written: int, checksum: str):
+        self.file_name = file_name
+        self.file_path = file_path
+        self.file_format = file_format
+        self.row_count = row_count
+        self.bytes_written = bytes_written
+        self.checksum = checksum
+
+
+def iter_ctr_records(db, period_start: date, period_end: date, **thresholds) -> Iterator[Dict[str, Any]]:
+    from weezy_cbs.reports_analytics.report_streaming import stream_statement_batches
+    _, batches = stream_statement_batches(db, ctr_aggregation_query(period_start, period_end, **thresholds), None)
+    for batch in batches:
+        for row in batch:
+            yield ctr_record(row)
+
+def generate_ctr_report(db, period_start: date, period_end: date, output_format: str = CTR_OUTPUT_FORMAT,
+                        store=None, base_file_name: Optional[str] = None) -> CTRReportResult:
+    """
+    Writes the CTR return for the period to the report store as XML or CSV and returns its path,
+    row count and SHA-256 checksum. Raises ReturnValidationError (and writes nothing) on an invalid record.
+    """
+    from weezy_cbs.reports_analytics.report_streaming import LocalReportStore
+    output_format = output_format.upper()
+    if output_format not in CTR_OUTPUT_FORMATS:
+        raise ValueError(f"CTR output format must be one of {', '.join(CTR_OUTPUT_FORMATS)}.")
+    store = store or LocalReportStore()
+    file_name = f"{base_file_name or f'NFIU_CTR_{period_start:%Y%m%d}_{period_end:%Y%m%d}'}.{output_format.lower()}"
+    writers = []
+
+    def render(fh) -> Tuple[int, int]:
+        writer = _ctr_writer(output_format, fh)
+        writers.append(writer)
+        writer.begin({"reportingEntity": CTR_REPORTING_ENTITY, "periodStart": period_start, "periodEnd": period_end,
+                      "generatedAt": datetime.utcnow().replace(microsecond=0).isoformat() + "Z"})
+        for record in iter_ctr_records(db, period_start, period_end):
+            writer.write_record(record, f"CTR record {record['transaction_reference']}")
+        writer.end()
+        return writer.rows_written, writer.bytes_written
+
+    stored = store.write(file_name, render)
+    return CTRReportResult(stored.file_name, stored.file_path, output_format, stored.rows_written,
+                           stored.bytes_written, writers[0].checksum)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the NFIU Currency Transaction Report.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate_cmd = commands.add_parser("generate")
+    generate_cmd.add_argument("--start", type=date.fromisoformat, required=True)
+    generate_cmd.add_argument("--end", type=date.fromisoformat, required=True)
+    generate_cmd.add_argument("--format", choices=CTR_OUTPUT_FORMATS, default=CTR_OUTPUT_FORMAT.upper())
+    args = parser.parse_args()
+
+    from weezy_cbs.database import SessionLocal
+    session = SessionLocal()
+    try:
+        report = generate_ctr_report(session, args.start, args.end, args.format)
+        print(f"{report.file_path}: {report.row_count} records, {report.bytes_written} bytes, sha256 {report.checksum}")
+    finally:
+        session.close()
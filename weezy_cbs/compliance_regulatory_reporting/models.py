@@ -1,5 +1,5 @@
 # Database models for Compliance & Regulatory Reporting Module
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, Enum as SQLAlchemyEnum, ForeignKey, Date, Index, Numeric
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, Enum as SQLAlchemyEnum, ForeignKey, Date, Index, Numeric, Float, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from weezy_cbs.database import Base # Use the shared Base
@@ -19,7 +19,7 @@ class ReportStatusEnum(enum.Enum):
     FAILED_GENERATION = "FAILED_GENERATION"; FAILED_SUBMISSION = "FAILED_SUBMISSION"
 
 class GeneratedReportLog(Base):
-    __tablename__ = "generated_report_logs"
+    __tablename__ = "regulatory_report_logs" # generated_report_logs belongs to reports_analytics
     id = Column(Integer, primary_key=True, index=True)
     report_name = Column(SQLAlchemyEnum(ReportNameEnum), nullable=False, index=True)
     reporting_period_start_date = Column(Date, nullable=False)
@@ -29,7 +29,8 @@ class GeneratedReportLog(Base):
     generated_by_user_id = Column(String(50), nullable=True)
     file_path_or_url = Column(String(512), nullable=True)
     file_format = Column(String(10), nullable=True)
-    checksum = Column(String(64), nullable=True)
+    checksum = Column(String(64), nullable=True) # SHA-256 of the generated file
+    row_count = Column(Integer, nullable=True) # Records in the generated file
     submitted_at = Column(DateTime(timezone=True), nullable=True)
     submission_reference = Column(String(100), nullable=True)
     validator_user_id = Column(String(50), nullable=True)
@@ -70,10 +71,10 @@ class SuspiciousActivityLog(Base):
     assigned_to_user_id = Column(String(50), nullable=True)
     investigation_notes = Column(Text, nullable=True)
     resolution_date = Column(DateTime(timezone=True), nullable=True)
-    str_report_log_id = Column(Integer, ForeignKey("generated_report_logs.id"), nullable=True)
+    str_report_log_id = Column(Integer, ForeignKey("regulatory_report_logs.id"), nullable=True)
 
     rule_triggered = relationship("AMLRule") # Add back_populates if needed
-    str_report = relationship("GeneratedReportLog") # Add back_populates if needed
+    str_report = relationship("weezy_cbs.compliance_regulatory_reporting.models.GeneratedReportLog") # Add back_populates if needed
     customer = relationship("Customer") # Add back_populates if needed
     account = relationship("Account") # Add back_populates if needed
     financial_transaction = relationship("FinancialTransaction") # Add back_populates if needed
@@ -93,6 +94,8 @@ class SanctionScreeningLog(Base):
     sanction_lists_checked = Column(Text, nullable=True) # JSON array of lists checked
     match_found = Column(Boolean, default=False, index=True)
     match_details_json = Column(Text, nullable=True)
+    best_match_score = Column(Float, nullable=True) # Highest Jaro-Winkler score among the matches
+    screening_run_id = Column(Integer, ForeignKey("sanction_screening_runs.id"), nullable=True, index=True) # Set for batch screening
 
     # decision = Column(String(50), nullable=True)
     # decision_by_user_id = Column(String(50), nullable=True)
@@ -102,6 +105,93 @@ class SanctionScreeningLog(Base):
 
     def __repr__(self): return f"<SanctionScreeningLog(id={self.id}, name='{self.name_screened}', match={self.match_found})>"
 
+class SanctionListEntry(Base):
+    __tablename__ = "sanction_list_entries"
+    id = Column(Integer, primary_key=True, index=True)
+    list_name = Column(String(50), nullable=False, index=True) # OFAC_SDN, UN_CONSOLIDATED, EU_CONSOLIDATED, ...
+    entry_uid = Column(String(50), nullable=False) # Provider's identifier for the entry (e.g. OFAC ent_num)
+    entity_type = Column(String(20), default="INDIVIDUAL", nullable=False) # INDIVIDUAL, ORGANIZATION, VESSEL, AIRCRAFT
+    primary_name = Column(String(512), nullable=False)
+    aliases_json = Column(Text, nullable=True) # JSON array of alias names (a.k.a., f.k.a.)
+    date_of_birth = Column(String(50), nullable=True) # As published; often only a year or a range
+    nationality = Column(String(100), nullable=True)
+    program = Column(String(255), nullable=True) # Sanctions programme / regime
+    remarks = Column(Text, nullable=True)
+    is_active = Column(Boolean, default=True, nullable=False, index=True)
+    content_hash = Column(String(40), nullable=True) # SHA-1 of the screened fields; detects changed entries between versions
+    last_version_id = Column(Integer, ForeignKey("sanction_list_versions.id"), nullable=True) # Version that last added/changed/removed it
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (UniqueConstraint("list_name", "entry_uid", name="uq_sanction_list_entry"),)
+
+    def __repr__(self): return f"<SanctionListEntry(list='{self.list_name}', uid='{self.entry_uid}', name='{self.primary_name}')>"
+
+class SanctionListVersion(Base): # One load of a published list; its diff against the previous load is in sanction_list_entry_changes
+    __tablename__ = "sanction_list_versions"
+    id = Column(Integer, primary_key=True, index=True)
+    list_name = Column(String(50), nullable=False, index=True)
+    source_reference = Column(String(255), nullable=True) # File name or publication id
+    published_at = Column(DateTime(timezone=True), nullable=True)
+    loaded_at = Column(DateTime(timezone=True), server_default=func.now())
+    entries_total = Column(Integer, default=0, nullable=False) # Active entries after this version
+    entries_added = Column(Integer, default=0, nullable=False)
+    entries_changed = Column(Integer, default=0, nullable=False)
+    entries_removed = Column(Integer, default=0, nullable=False)
+
+    def __repr__(self): return f"<SanctionListVersion(id={self.id}, list='{self.list_name}', +{self.entries_added} ~{self.entries_changed} -{self.entries_removed})>"
+
+class SanctionListEntryChange(Base):
+    __tablename__ = "sanction_list_entry_changes"
+    id = Column(Integer, primary_key=True, index=True)
+    version_id = Column(Integer, ForeignKey("sanction_list_versions.id"), nullable=False, index=True)
+    entry_uid = Column(String(50), nullable=False)
+    change_type = Column(String(10), nullable=False) # ADDED, CHANGED, REMOVED
+    previous_json = Column(Text, nullable=True) # Screened fields before the change (CHANGED, REMOVED), so earlier versions can be reconstructed
+
+class SanctionAlert(Base): # One potential match between a customer and a list entry, kept across screenings
+    __tablename__ = "sanction_alerts"
+    id = Column(Integer, primary_key=True, index=True)
+    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False, index=True)
+    list_name = Column(String(50), nullable=False)
+    entry_uid = Column(String(50), nullable=False)
+    matched_name = Column(String(512), nullable=False) # Name on the list that matched
+    match_score = Column(Float, nullable=False)
+    status = Column(String(20), default="OPEN", nullable=False, index=True) # OPEN, CLEARED, CONFIRMED, RETIRED
+    status_reason = Column(Text, nullable=True)
+    last_screening_run_id = Column(Integer, ForeignKey("sanction_screening_runs.id"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_matched_at = Column(DateTime(timezone=True), nullable=True)
+    retired_at = Column(DateTime(timezone=True), nullable=True)
+
+    customer = relationship("Customer") # Add back_populates if needed
+
+    __table_args__ = (
+        UniqueConstraint("customer_id", "list_name", "entry_uid", name="uq_sanction_alert_customer_entry"),
+        Index("ix_sanction_alert_entry", "list_name", "entry_uid"),
+    )
+
+    def __repr__(self): return f"<SanctionAlert(id={self.id}, customer={self.customer_id}, entry='{self.list_name}:{self.entry_uid}', status='{self.status}')>"
+
+class SanctionScreeningRun(Base): # One batch screening: the whole customer base (FULL) or a list version's changes (DELTA)
+    __tablename__ = "sanction_screening_runs"
+    id = Column(Integer, primary_key=True, index=True)
+    run_type = Column(String(10), default="FULL", nullable=False) # FULL, DELTA
+    list_version_id = Column(Integer, ForeignKey("sanction_list_versions.id"), nullable=True) # DELTA runs
+    status = Column(String(20), default="PENDING", nullable=False, index=True) # PENDING, RUNNING, COMPLETED, FAILED
+    match_threshold = Column(Float, nullable=False)
+    customers_screened = Column(Integer, default=0, nullable=False) # DELTA: customers with a potential match
+    entries_screened = Column(Integer, default=0, nullable=False) # DELTA: added and changed list entries
+    matches_found = Column(Integer, default=0, nullable=False)
+    alerts_opened = Column(Integer, default=0, nullable=False)
+    alerts_retired = Column(Integer, default=0, nullable=False)
+    requested_by_user_id = Column(String(50), nullable=True)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    error_message = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self): return f"<SanctionScreeningRun(id={self.id}, status='{self.status}', screened={self.customers_screened})>"
+
 class CTRLog(Base):
     __tablename__ = "ctr_logs"
     id = Column(Integer, primary_key=True, index=True)
@@ -116,7 +206,7 @@ class CTRLog(Base):
     account_number = Column(String(20), nullable=True, index=True)
     transaction_type = Column(String(50), nullable=False) # e.g. "CASH_DEPOSIT", "CASH_WITHDRAWAL", "AGGREGATED_CASH"
 
-    ctr_report_log_id = Column(Integer, ForeignKey("generated_report_logs.id"), nullable=True)
+    ctr_report_log_id = Column(Integer, ForeignKey("regulatory_report_logs.id"), nullable=True)
 
     # Relationships for clarity if needed, though denormalized fields are primary for CTR
     # financial_transaction = relationship("FinancialTransaction")
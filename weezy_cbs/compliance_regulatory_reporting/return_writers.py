@@ -0,0 +1,169 @@
+# Incremental writers for regulatory returns
+#
+# NFIU and CBN returns are written one record at a time. Each record is checked against the return's
+# field spec and rendered on its own. The rendered bytes are buffered and flushed to the file in
+# fixed-size chunks, and the SHA-256 checksum is computed as they are written. The whole document is
+# never built in memory. Used by ctr_pipeline.py (NFIU CTR) and crms_pipeline.py (CBN CRMS).
+import csv
+import hashlib
+import io
+import os
+import re
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Pattern, Sequence, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+RETURN_WRITE_CHUNK_BYTES = int(os.getenv("RETURN_WRITE_CHUNK_BYTES", str(256 * 1024)))
+
+FieldSpec = Tuple[str, str, int, bool, Optional[Pattern]] # (column, XML element, max length, required, pattern)
+
+AMOUNT_PATTERN = re.compile(r"\d{1,18}\.\d{2}")
+DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+COUNT_PATTERN = re.compile(r"\d+")
+BVN_PATTERN = re.compile(r"\d{11}")
+
+_XML_INVALID_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+
+class ReturnValidationError(ValueError):
+    pass
+
+
+def field_text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return _XML_INVALID_CHARS.sub("", str(getattr(value, "value", value))).strip()
+
+def validate_record(record: Dict[str, Any], fields: Sequence[FieldSpec], label: str) -> Tuple[str, ...]:
+    """Renders a record's fields as text, checking each against its spec. Raises ReturnValidationError."""
+    values = []
+    for column, _, max_length, required, pattern in fields:
+        text = field_text(record.get(column))
+        problem = None
+        if not text:
+            if required:
+                problem = "is required"
+        elif len(text) > max_length:
+            problem = f"exceeds {max_length} characters"
+        elif pattern is not None and not pattern.fullmatch(text):
+            problem = f"has an invalid format ({text!r})"
+        if problem:
+            raise ReturnValidationError(f"{label}: {column} {problem}.")
+        values.append(text)
+    return tuple(values)
+
+
+class ReturnFileWriter:
+    """
+    Writes validated records to a binary stream, flushing every `chunk_bytes`. Tracks the row count,
+    bytes written (`size` includes what is still buffered) and the SHA-256 of everything written.
+    """
+    file_extension = ""
+
+    def __init__(self, out_binary, fields: Sequence[FieldSpec], chunk_bytes: int = RETURN_WRITE_CHUNK_BYTES):
+        self._out = out_binary
+        self.fields = fields
+        self._chunk_bytes = chunk_bytes
+        self._pending: List[bytes] = []
+        self._pending_bytes = 0
+        self._sha256 = hashlib.sha256()
+        self.rows_written = 0
+        self.bytes_written = 0
+
+    @property
+    def checksum(self) -> str:
+        return self._sha256.hexdigest()
+
+    @property
+    def size(self) -> int:
+        return self.bytes_written + self._pending_bytes
+
+    def begin(self, attributes: Optional[Dict[str, Any]] = None) -> None:
+        pass
+
+    def render_record(self, record: Dict[str, Any], label: Optional[str] = None) -> bytes:
+        values = validate_record(record, self.fields, label or f"Record {self.rows_written + 1}")
+        return self._render(values).encode("utf-8")
+
+    def write_record(self, record: Dict[str, Any], label: Optional[str] = None) -> None:
+        self.write_rendered(self.render_record(record, label))
+
+    def write_rendered(self, data: bytes) -> None:
+        """Appends a record returned by render_record (lets callers check its size first)."""
+        self._write(data)
+        self.rows_written += 1
+
+    def footer_bytes(self) -> int:
+        return len(self._footer().encode("utf-8"))
+
+    def end(self) -> None:
+        self._write(self._footer().encode("utf-8"))
+        self.flush()
+
+    def flush(self) -> None:
+        if self._pending:
+            data = b"".join(self._pending)
+            self._out.write(data)
+            self._sha256.update(data)
+            self.bytes_written += len(data)
+            self._pending = []
+            self._pending_bytes = 0
+
+    def _write(self, data: bytes) -> None:
+        self._pending.append(data)
+        self._pending_bytes += len(data)
+        if self._pending_bytes >= self._chunk_bytes:
+            self.flush()
+
+    def _render(self, values: Sequence[str]) -> str:
+        raise NotImplementedError
+
+    def _footer(self) -> str:
+        return ""
+
+
+class XmlReturnWriter(ReturnFileWriter):
+    """<root attributes...><record><Element>text</Element>...</record>...</root>; empty optional fields are omitted."""
+    file_extension = "xml"
+
+    def __init__(self, out_binary, fields: Sequence[FieldSpec], root_element: str, record_element: str,
+                 chunk_bytes: int = RETURN_WRITE_CHUNK_BYTES):
+        super().__init__(out_binary, fields, chunk_bytes)
+        self.root_element = root_element
+        self.record_element = record_element
+
+    def begin(self, attributes: Optional[Dict[str, Any]] = None) -> None:
+        rendered = "".join(f" {name}={quoteattr(field_text(value))}" for name, value in (attributes or {}).items())
+        self._write(f'<?xml version="1.0" encoding="UTF-8"?>\n<{self.root_element}{rendered}>\n'.encode("utf-8"))
+
+    def _render(self, values: Sequence[str]) -> str:
+        parts = [f"  <{self.record_element}>"]
+        for (_, element, _, _, _), text in zip(self.fields, values):
+            if text:
+                parts.append(f"<{element}>{escape(text)}</{element}>")
+        parts.append(f"</{self.record_element}>\n")
+        return "".join(parts)
+
+    def _footer(self) -> str:
+        return f"</{self.root_element}>\n"
+
+
+class CsvReturnWriter(ReturnFileWriter):
+    """Header row of column names, then one row per record."""
+    file_extension = "csv"
+
+    def __init__(self, out_binary, fields: Sequence[FieldSpec], chunk_bytes: int = RETURN_WRITE_CHUNK_BYTES):
+        super().__init__(out_binary, fields, chunk_bytes)
+        self._line = io.StringIO()
+        self._csv = csv.writer(self._line)
+
+    def begin(self, attributes: Optional[Dict[str, Any]] = None) -> None:
+        self._write(self._render([field[0] for field in self.fields]).encode("utf-8"))
+
+    def _render(self, values: Sequence[str]) -> str:
+        self._line.seek(0)
+        self._line.truncate()
+        self._csv.writerow(values)
+        return self._line.getvalue()
@@ -0,0 +1,213 @@
+# Sanction list loading
+#
+# Parses published sanction lists into SanctionEntry records and stores them in sanction_list_entries,
+# which the screening index (sanctions_index.py) is built from. Every load is a SanctionListVersion with
+# its diff against the previous load; --rescreen then screens only that diff (sanction_rescreening.py).
+# Supported formats:
+#   ofac-csv   OFAC SDN sdn.csv, with aliases from alt.csv (--alt-file)
+#   un-xml     UN Security Council consolidated list XML
+#   jsonl      one JSON object per line: {"entry_uid", "entity_type", "primary_name", "aliases", "date_of_birth",
+#              "nationality", "program"} (for EU, local and vendor lists converted upstream)
+#
+#   python -m weezy_cbs.compliance_regulatory_reporting.sanction_lists load --list OFAC_SDN --format ofac-csv \
+#       --file sdn.csv --alt-file alt.csv [--rescreen]
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import xml.etree.ElementTree as ET
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .sanctions_index import ENTITY_INDIVIDUAL, ENTITY_ORGANIZATION, SanctionEntry
+
+_OFAC_NULL = "-0-"
+_OFAC_DOB = re.compile(r"DOB ([^;]+);")
+_OFAC_NATIONALITY = re.compile(r"nationality ([^;]+);", re.IGNORECASE)
+_OFAC_ENTITY_TYPES = {"individual": ENTITY_INDIVIDUAL, "vessel": "VESSEL", "aircraft": "AIRCRAFT"}
+
+
+def _ofac_value(value: Optional[str]) -> Optional[str]:
+    value = (value or "").strip()
+    return None if not value or value == _OFAC_NULL else value
+
+def parse_ofac_sdn_csv(sdn_path: str, alt_path: Optional[str] = None) -> Iterator[SanctionEntry]:
+    """OFAC SDN list: sdn.csv (no header) plus alias rows from alt.csv keyed by ent_num."""
+    aliases: Dict[str, List[str]] = {}
+    if alt_path:
+        with open(alt_path, newline="", encoding="utf-8", errors="replace") as fh:
+            for row in csv.reader(fh):
+                if len(row) >= 4 and _ofac_value(row[3]):
+                    aliases.setdefault(row[0].strip(), []).append(row[3].strip())
+    with open(sdn_path, newline="", encoding="utf-8", errors="replace") as fh:
+        for row in csv.reader(fh):
+            if len(row) < 12 or not _ofac_value(row[1]):
+                continue
+            uid = row[0].strip()
+            remarks = _ofac_value(row[11]) or ""
+            dob = _OFAC_DOB.search(remarks + ";")
+            nationality = _OFAC_NATIONALITY.search(remarks + ";")
+            yield SanctionEntry(
+                "OFAC_SDN", uid, _OFAC_ENTITY_TYPES.get((_ofac_value(row[2]) or "").lower(), ENTITY_ORGANIZATION),
+                row[1].strip(), aliases.get(uid, ()),
+                dob.group(1).strip() if dob else None, nationality.group(1).strip() if nationality else None,
+                _ofac_value(row[3]),
+            )
+
+
+def _un_text(element, path: str) -> Optional[str]:
+    value = element.findtext(path)
+    return value.strip() if value and value.strip() else None
+
+def parse_un_consolidated_xml(path: str) -> Iterator[SanctionEntry]:
+    """UN consolidated list XML; streamed with iterparse, one INDIVIDUAL/ENTITY element at a time."""
+    for _, element in ET.iterparse(path, events=("end",)):
+        if element.tag not in ("INDIVIDUAL", "ENTITY"):
+            continue
+        is_individual = element.tag == "INDIVIDUAL"
+        name_parts = [_un_text(element, tag) for tag in ("FIRST_NAME", "SECOND_NAME", "THIRD_NAME", "FOURTH_NAME")]
+        primary_name = " ".join(p for p in name_parts if p)
+        alias_tag = "INDIVIDUAL_ALIAS" if is_individual else "ENTITY_ALIAS"
+        aliases = [a for a in (_un_text(alias, "ALIAS_NAME") for alias in element.findall(alias_tag)) if a]
+        dob = None
+        if is_individual:
+            dobs = [_un_text(d, "DATE") or _un_text(d, "YEAR") for d in element.findall("INDIVIDUAL_DATE_OF_BIRTH")]
+            dob = "; ".join(d for d in dobs if d) or None
+        nationalities = [v.text.strip() for v in element.findall("NATIONALITY/VALUE") if v.text and v.text.strip()]
+        if primary_name:
+            yield SanctionEntry(
+                "UN_CONSOLIDATED", _un_text(element, "DATAID") or _un_text(element, "REFERENCE_NUMBER"),
+                ENTITY_INDIVIDUAL if is_individual else ENTITY_ORGANIZATION, primary_name, aliases, dob,
+                "; ".join(nationalities) or None, _un_text(element, "UN_LIST_TYPE"),
+            )
+        element.clear()
+
+def parse_jsonl(path: str, list_name: str) -> Iterator[SanctionEntry]:
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            yield SanctionEntry(list_name, str(item["entry_uid"]), item.get("entity_type"), item["primary_name"],
+                                item.get("aliases") or (), item.get("date_of_birth"), item.get("nationality"), item.get("program"))
+
+
+def _clip(value: Optional[str], length: int) -> Optional[str]:
+    return value[:length] if value else None
+
+def _entry_columns(entry: SanctionEntry) -> Dict[str, object]:
+    return {
+        "entity_type": _clip(entry.entity_type, 20) or ENTITY_INDIVIDUAL,
+        "primary_name": entry.primary_name[:512],
+        "aliases_json": json.dumps(entry.aliases) if entry.aliases else None,
+        "date_of_birth": _clip(entry.date_of_birth, 50),
+        "nationality": _clip(entry.nationality, 100),
+        "program": _clip(entry.program, 255),
+    }
+
+_SCREENED_COLUMNS = ("entity_type", "primary_name", "aliases_json", "date_of_birth", "nationality", "program")
+
+def _previous_json(row) -> str:
+    return json.dumps({column: getattr(row, column) for column in _SCREENED_COLUMNS})
+
+def _content_hash(columns: Dict[str, object]) -> str:
+    fields = dict(columns)
+    fields["aliases_json"] = sorted(json.loads(fields["aliases_json"])) if fields["aliases_json"] else [] # Alias order is not a change
+    return hashlib.sha1(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()
+
+def load_sanction_list(db, list_name: str, entries: Iterable[SanctionEntry], source_reference: Optional[str] = None,
+                       published_at: Optional[datetime] = None):
+    """
+    Stores a newly published copy of one list as a SanctionListVersion. The copy is diffed against the
+    active entries by content hash: new (or re-listed) entries are ADDED, entries whose screened fields
+    differ are CHANGED, entries no longer published are REMOVED (deactivated). Each change is recorded in
+    sanction_list_entry_changes with the previous field values. Returns the version.
+    """
+    from .models import SanctionListEntry, SanctionListEntryChange, SanctionListVersion
+    from .sanctions_index import invalidate_sanctions_index
+    version = SanctionListVersion(list_name=list_name, source_reference=source_reference, published_at=published_at)
+    db.add(version)
+    db.flush()
+
+    existing = {
+        row.entry_uid: row for row in db.query(
+            SanctionListEntry.id, SanctionListEntry.entry_uid, SanctionListEntry.is_active, SanctionListEntry.content_hash,
+            *(getattr(SanctionListEntry, column) for column in _SCREENED_COLUMNS),
+        ).filter(SanctionListEntry.list_name == list_name)
+    }
+    inserts, updates, changes = [], [], []
+    seen = set()
+    for entry in entries:
+        if not entry.entry_uid or entry.entry_uid in seen:
+            continue
+        seen.add(entry.entry_uid)
+        columns = _entry_columns(entry)
+        content_hash = _content_hash(columns)
+        row = existing.get(entry.entry_uid)
+        if row is None:
+            inserts.append({"list_name": list_name, "entry_uid": entry.entry_uid, "is_active": True,
+                            "content_hash": content_hash, "last_version_id": version.id, **columns})
+            changes.append({"version_id": version.id, "entry_uid": entry.entry_uid, "change_type": "ADDED"})
+        elif not row.is_active or row.content_hash != content_hash:
+            updates.append({"id": row.id, "is_active": True, "content_hash": content_hash, "last_version_id": version.id, **columns})
+            changes.append({"version_id": version.id, "entry_uid": entry.entry_uid,
+                            "change_type": "CHANGED" if row.is_active else "ADDED", # Re-listed entries are new again
+                            "previous_json": _previous_json(row) if row.is_active else None})
+    for uid, row in existing.items():
+        if uid not in seen and row.is_active:
+            updates.append({"id": row.id, "is_active": False, "last_version_id": version.id})
+            changes.append({"version_id": version.id, "entry_uid": uid, "change_type": "REMOVED", "previous_json": _previous_json(row)})
+
+    if inserts:
+        db.bulk_insert_mappings(SanctionListEntry, inserts)
+    if updates:
+        db.bulk_update_mappings(SanctionListEntry, updates)
+    if changes:
+        db.bulk_insert_mappings(SanctionListEntryChange, changes)
+    counts = Counter(change["change_type"] for change in changes)
+    version.entries_added = counts["ADDED"]
+    version.entries_changed = counts["CHANGED"]
+    version.entries_removed = counts["REMOVED"]
+    version.entries_total = len(seen)
+    db.commit()
+    invalidate_sanctions_index()
+    return version
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load a published sanction list.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    load_cmd = commands.add_parser("load")
+    load_cmd.add_argument("--list", dest="list_name", required=True, help="e.g. OFAC_SDN, UN_CONSOLIDATED, EU_CONSOLIDATED")
+    load_cmd.add_argument("--format", choices=("ofac-csv", "un-xml", "jsonl"), required=True)
+    load_cmd.add_argument("--file", required=True)
+    load_cmd.add_argument("--alt-file", help="OFAC alt.csv (aliases)")
+    load_cmd.add_argument("--rescreen", action="store_true", help="Screen customers against the added and changed entries")
+    args = parser.parse_args()
+
+    if args.format == "ofac-csv":
+        parsed = parse_ofac_sdn_csv(args.file, args.alt_file)
+    elif args.format == "un-xml":
+        parsed = parse_un_consolidated_xml(args.file)
+    else:
+        parsed = parse_jsonl(args.file, args.list_name)
+    if args.format != "jsonl":
+        parsed = (SanctionEntry(args.list_name, e.entry_uid, e.entity_type, e.primary_name, e.aliases, e.date_of_birth,
+                                e.nationality, e.program) for e in parsed)
+
+    from weezy_cbs.database import SessionLocal
+    session = SessionLocal()
+    try:
+        loaded = load_sanction_list(session, args.list_name, parsed, source_reference=os.path.basename(args.file))
+        print(f"{args.list_name} version {loaded.id}: {loaded.entries_total} entries, +{loaded.entries_added} "
+              f"~{loaded.entries_changed} -{loaded.entries_removed}")
+        if args.rescreen:
+            from .sanction_rescreening import rescreen_list_version
+            outcome = rescreen_list_version(session, loaded.id)
+            print(f"Re-screened {outcome.entries_screened} changed entries in {outcome.elapsed_seconds:.1f}s: "
+                  f"{outcome.customers_matched} customers matched, {outcome.alerts_opened} alerts opened, "
+                  f"{outcome.alerts_retired} retired")
+    finally:
+        session.close()
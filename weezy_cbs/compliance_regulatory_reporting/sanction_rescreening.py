@@ -0,0 +1,247 @@
+# Delta re-screening on sanction list updates
+#
+# A list update changes a few hundred entries out of hundreds of thousands, yet re-screening every
+# customer costs O(customers). Each load is stored as a SanctionListVersion with its diff
+# (sanction_list_entry_changes), and re-screening runs the other way round: only the ADDED and CHANGED
+# entries are matched against an index of customer names, the same SanctionsIndex used for the lists.
+# Screening work is O(changed entries). The customer index is built once and reused until customers are
+# added or updated.
+#
+# Alert lifecycle (sanction_alerts, one row per customer and list entry):
+#   OPEN      raised by a screening; re-raised if a RETIRED alert matches again, or if a CLEARED one's
+#             entry was changed
+#   CLEARED / CONFIRMED   set by a compliance officer
+#   RETIRED   set here for OPEN alerts whose entry was removed from the list, or whose changed entry no
+#             longer matches the customer. CONFIRMED alerts are never retired automatically.
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .sanctions_index import SANCTIONS_MATCH_THRESHOLD, SanctionEntry, SanctionsIndex, iter_customer_batches
+
+SANCTIONS_DELTA_MAX_CANDIDATES = int(os.getenv("SANCTIONS_DELTA_MAX_CANDIDATES", "5000")) # Customers scored per list name
+_IN_CHUNK = 900 # Stay under bind-parameter limits for IN lists
+
+ALERT_OPEN = "OPEN"
+ALERT_CLEARED = "CLEARED"
+ALERT_CONFIRMED = "CONFIRMED"
+ALERT_RETIRED = "RETIRED"
+CUSTOMER_INDEX_LIST = "CUSTOMERS"
+
+
+def _chunks(values: Sequence[Any], size: int = _IN_CHUNK) -> Iterable[Sequence[Any]]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+# --- Alerts ---
+def upsert_sanction_alerts(db, customer_matches: Dict[int, List[Dict[str, Any]]], run_id: Optional[int],
+                           reopen_entries: Set[Tuple[str, str]] = frozenset()) -> int:
+    """
+    Opens an alert for every new (customer, list entry) match and refreshes existing ones. RETIRED alerts
+    that match again are reopened, as are CLEARED alerts on entries in `reopen_entries` (changed since
+    they were cleared). Does not commit. Returns the number of alerts opened or reopened.
+    """
+    from .models import SanctionAlert
+    if not customer_matches:
+        return 0
+    now = datetime.utcnow()
+    existing: Dict[Tuple[int, str, str], Any] = {}
+    for ids in _chunks(list(customer_matches)):
+        for alert in db.query(SanctionAlert).filter(SanctionAlert.customer_id.in_(ids)):
+            existing[(alert.customer_id, alert.list_name, alert.entry_uid)] = alert
+
+    inserts = []
+    opened = 0
+    for customer_id, matches in customer_matches.items():
+        for match in matches:
+            key = (customer_id, match["list_name"], match["entry_uid"])
+            alert = existing.get(key)
+            if alert is None:
+                inserts.append({
+                    "customer_id": customer_id, "list_name": match["list_name"], "entry_uid": match["entry_uid"],
+                    "matched_name": match["matched_name"][:512], "match_score": match["score"], "status": ALERT_OPEN,
+                    "last_screening_run_id": run_id, "created_at": now, "last_matched_at": now,
+                })
+                existing[key] = True # Same entry matched twice for one customer in a batch
+                opened += 1
+                continue
+            if alert is True:
+                continue
+            alert.matched_name = match["matched_name"][:512]
+            alert.match_score = match["score"]
+            alert.last_screening_run_id = run_id
+            alert.last_matched_at = now
+            if alert.status == ALERT_RETIRED or (alert.status == ALERT_CLEARED and key[1:] in reopen_entries):
+                alert.status = ALERT_OPEN
+                alert.status_reason = "Matched again after a sanction list update"
+                alert.retired_at = None
+                opened += 1
+    if inserts:
+        db.bulk_insert_mappings(SanctionAlert, inserts)
+    return opened
+
+def retire_sanction_alerts(db, list_name: str, entry_uids: Sequence[str], reason: str,
+                           keep_customers: Optional[Dict[str, Set[int]]] = None) -> int:
+    """
+    Retires the OPEN alerts on the given entries, except for customers in keep_customers[entry_uid]
+    (they still match). Does not commit. Returns the number retired.
+    """
+    from .models import SanctionAlert
+    retired = 0
+    now = datetime.utcnow()
+    for uids in _chunks(list(entry_uids)):
+        alerts = db.query(SanctionAlert).filter(
+            SanctionAlert.list_name == list_name, SanctionAlert.entry_uid.in_(uids), SanctionAlert.status == ALERT_OPEN)
+        for alert in alerts:
+            if keep_customers and alert.customer_id in keep_customers.get(alert.entry_uid, ()):
+                continue
+            alert.status = ALERT_RETIRED
+            alert.status_reason = reason
+            alert.retired_at = now
+            retired += 1
+    return retired
+
+
+# --- Customer name index ---
+def _customer_index_signature(db) -> Tuple[Any, ...]:
+    from sqlalchemy import func
+    from weezy_cbs.customer_identity_management.models import Customer
+    count, last_id, last_update = db.query(func.count(Customer.id), func.max(Customer.id), func.max(Customer.updated_at)).one()
+    return (count, last_id, str(last_update))
+
+def build_customer_name_index(db) -> SanctionsIndex:
+    """SanctionsIndex whose entries are customers (entry_uid = customer id)."""
+    def entries():
+        for batch in iter_customer_batches(db):
+            for customer_id, name, entity_type, _, date_of_birth in batch:
+                yield SanctionEntry(CUSTOMER_INDEX_LIST, str(customer_id), entity_type, name,
+                                    date_of_birth=date_of_birth.isoformat() if date_of_birth else None)
+    index = SanctionsIndex(entries())
+    index.signature = _customer_index_signature(db)
+    return index
+
+_customer_index: Optional[SanctionsIndex] = None
+_customer_index_lock = threading.Lock()
+
+def get_customer_name_index(db) -> SanctionsIndex:
+    global _customer_index
+    with _customer_index_lock:
+        if _customer_index is None or _customer_index.signature != _customer_index_signature(db):
+            _customer_index = build_customer_name_index(db)
+        return _customer_index
+
+
+# --- Delta re-screening ---
+class DeltaScreeningResult:
+    __slots__ = ("entries_screened", "customers_matched", "matches_found", "alerts_opened", "alerts_retired", "elapsed_seconds")
+
+    def __init__(self):
+        self.entries_screened = 0
+        self.customers_matched = 0
+        self.matches_found = 0
+        self.alerts_opened = 0
+        self.alerts_retired = 0
+        self.elapsed_seconds = 0.0
+
+
+def _entry_match(entry: SanctionEntry, list_name_variant: str, score: float, version_id: int) -> Dict[str, Any]:
+    """A customer-to-entry match in the forward screening format (see SanctionsIndex.screen)."""
+    details = f"Name match on {entry.list_name}" + (f" ({entry.program})" if entry.program else "")
+    if list_name_variant != entry.primary_name:
+        details += f"; alias of {entry.primary_name}"
+    return {
+        "list_name": entry.list_name,
+        "entry_uid": entry.entry_uid,
+        "entity_type": entry.entity_type,
+        "matched_name": list_name_variant,
+        "primary_name": entry.primary_name,
+        "score": score,
+        "date_of_birth": entry.date_of_birth,
+        "nationality": entry.nationality,
+        "details": f"{details}; list update version {version_id}",
+    }
+
+def rescreen_list_version(db, version_id: int, threshold: float = SANCTIONS_MATCH_THRESHOLD, run_id: Optional[int] = None,
+                          customer_index: Optional[SanctionsIndex] = None, on_progress=None) -> DeltaScreeningResult:
+    """
+    Screens customers against the entries a list version added or changed, logs a SanctionScreeningLog for
+    each customer with a potential match, and maintains alerts: opens/reopens alerts for matches and
+    retires OPEN alerts on removed entries and on changed entries that no longer match.
+    """
+    from .models import SanctionListEntry, SanctionListEntryChange, SanctionListVersion, SanctionScreeningLog
+    from weezy_cbs.customer_identity_management.models import Customer
+    result = DeltaScreeningResult()
+    started = time.perf_counter()
+    version = db.query(SanctionListVersion).filter(SanctionListVersion.id == version_id).one()
+    list_name = version.list_name
+
+    changes: Dict[str, List[str]] = {"ADDED": [], "CHANGED": [], "REMOVED": []}
+    for entry_uid, change_type in db.query(SanctionListEntryChange.entry_uid, SanctionListEntryChange.change_type).filter(
+            SanctionListEntryChange.version_id == version_id):
+        changes[change_type].append(entry_uid)
+
+    if changes["REMOVED"]:
+        result.alerts_retired += retire_sanction_alerts(
+            db, list_name, changes["REMOVED"], f"Entry removed from {list_name} (list version {version_id})")
+
+    screened_uids = changes["ADDED"] + changes["CHANGED"]
+    entries: List[SanctionEntry] = []
+    for uids in _chunks(screened_uids):
+        entries.extend(SanctionEntry.from_model(row) for row in db.query(SanctionListEntry).filter(
+            SanctionListEntry.list_name == list_name, SanctionListEntry.entry_uid.in_(uids), SanctionListEntry.is_active == True))
+
+    customer_matches: Dict[int, Dict[str, Dict[str, Any]]] = {} # customer id -> entry uid -> best match
+    customer_names: Dict[int, str] = {}
+    if entries:
+        customer_index = customer_index or get_customer_name_index(db)
+        for entry in entries:
+            for name in [entry.primary_name, *entry.aliases]:
+                for hit in customer_index.screen(name, entry.entity_type, entry.date_of_birth, threshold=threshold,
+                                                 limit=None, max_candidates=SANCTIONS_DELTA_MAX_CANDIDATES):
+                    customer_id = int(hit["entry_uid"])
+                    customer_names[customer_id] = hit["primary_name"]
+                    best = customer_matches.setdefault(customer_id, {})
+                    if hit["score"] > best.get(entry.entry_uid, {}).get("score", 0.0):
+                        best[entry.entry_uid] = _entry_match(entry, name, hit["score"], version_id)
+            result.entries_screened += 1
+            if on_progress is not None and result.entries_screened % 100 == 0:
+                on_progress(result)
+
+    if changes["CHANGED"]:
+        still_matching: Dict[str, set] = {}
+        for customer_id, matches in customer_matches.items():
+            for entry_uid in matches:
+                still_matching.setdefault(entry_uid, set()).add(customer_id)
+        result.alerts_retired += retire_sanction_alerts(
+            db, list_name, changes["CHANGED"], f"No longer matches after {list_name} update (list version {version_id})",
+            keep_customers=still_matching)
+
+    if customer_matches:
+        bvns: Dict[int, Optional[str]] = {}
+        for ids in _chunks(list(customer_matches)):
+            bvns.update(db.query(Customer.id, Customer.bvn).filter(Customer.id.in_(ids)).all())
+        now = datetime.utcnow()
+        by_customer = {cid: sorted(m.values(), key=lambda match: -match["score"]) for cid, m in customer_matches.items()}
+        db.bulk_insert_mappings(SanctionScreeningLog, [{
+            "customer_id": customer_id,
+            "entity_type": "CUSTOMER",
+            "bvn_screened": bvns.get(customer_id),
+            "name_screened": customer_names[customer_id][:255],
+            "screening_date": now,
+            "sanction_lists_checked": json.dumps([list_name]),
+            "match_found": True,
+            "match_details_json": json.dumps(matches),
+            "best_match_score": matches[0]["score"],
+            "screening_run_id": run_id,
+        } for customer_id, matches in by_customer.items()])
+        result.alerts_opened += upsert_sanction_alerts(db, by_customer, run_id,
+                                                       reopen_entries={(list_name, uid) for uid in changes["CHANGED"]})
+        result.customers_matched = len(by_customer)
+        result.matches_found = sum(len(m) for m in by_customer.values())
+    db.commit()
+    result.elapsed_seconds = time.perf_counter() - started
+    return result
@@ -0,0 +1,561 @@
+# Fuzzy sanction-screening index
+#
+# OFAC, UN and EU lists carry hundreds of thousands of names and aliases, so comparing a customer name
+# against every one of them is too slow for on-demand checks and impossible for the whole customer base.
+# The index works in two steps:
+#   1. Candidate generation from inverted indexes (no full scan):
+#        - character trigrams of every name token ("ali" -> " al", "ali", "li ")
+#        - a phonetic key per token (consonant classes, so Muhammad/Mohammed and Gaddafi/Qaddafi collide)
+#      Trigrams that occur in more than SANCTIONS_MAX_POSTING_FRACTION of all names carry no signal and
+#      are skipped while generating candidates.
+#      Trigram candidates are ranked by Dice coefficient and phonetic ones by keys shared; the best
+#      SANCTIONS_MAX_CANDIDATES of each are kept.
+#   2. Scoring of the candidates by token-level Jaro-Winkler (see _score).
+#
+# Names are normalized before indexing and before matching: transliterated to ASCII (accents stripped;
+# other scripts via the optional 'unidecode' package), lower-cased, punctuation removed, titles and
+# legal-form words dropped, and tokens sorted so word order does not matter ("Petrova Elena" == "Elena Petrova").
+#
+# Batch screening of customers (screen_customers) fans batches out to a process pool. Each worker gets the
+# index once (inherited via fork where available) and returns its matches; the parent bulk-inserts the
+# SanctionScreeningLog rows.
+#   python -m weezy_cbs.compliance_regulatory_reporting.sanctions_index screen-customers [--workers 8] [--threshold 0.9]
+#   python -m weezy_cbs.compliance_regulatory_reporting.sanctions_index screen --name "Viktor Rostov"
+import argparse
+import heapq
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    from unidecode import unidecode as _unidecode # Optional: transliterates Cyrillic, Arabic, etc.
+except ImportError:
+    _unidecode = None
+
+try:
+    from rapidfuzz.distance import JaroWinkler as _RapidJaroWinkler # Optional: C implementation of Jaro-Winkler
+except ImportError:
+    _RapidJaroWinkler = None
+
+SANCTIONS_MATCH_THRESHOLD = float(os.getenv("SANCTIONS_MATCH_THRESHOLD", "0.88"))
+SANCTIONS_MAX_CANDIDATES = int(os.getenv("SANCTIONS_MAX_CANDIDATES", "50")) # Scored per query, per candidate source
+SANCTIONS_MIN_GRAM_DICE = float(os.getenv("SANCTIONS_MIN_GRAM_DICE", "0.3")) # Trigram Dice coefficient a candidate must reach
+SANCTIONS_MAX_POSTING_FRACTION = float(os.getenv("SANCTIONS_MAX_POSTING_FRACTION", "0.05"))
+SANCTIONS_PHONETIC_TOKEN_SCORE = float(os.getenv("SANCTIONS_PHONETIC_TOKEN_SCORE", "0.9")) # Floor for look-alike tokens that sound alike
+SANCTIONS_PHONETIC_MIN_SIMILARITY = 0.75 # Jaro-Winkler two tokens need before their phonetic keys count
+SANCTIONS_DOB_MISMATCH_PENALTY = float(os.getenv("SANCTIONS_DOB_MISMATCH_PENALTY", "0.1"))
+SANCTIONS_INDEX_REFRESH_SECONDS = float(os.getenv("SANCTIONS_INDEX_REFRESH_SECONDS", "60"))
+SANCTIONS_SCREENING_WORKERS = int(os.getenv("SANCTIONS_SCREENING_WORKERS", str(os.cpu_count() or 1)))
+SANCTIONS_SCREENING_BATCH_SIZE = int(os.getenv("SANCTIONS_SCREENING_BATCH_SIZE", "2000"))
+
+ENTITY_INDIVIDUAL = "INDIVIDUAL"
+ENTITY_ORGANIZATION = "ORGANIZATION"
+_ORGANIZATION_TYPES = {"ORGANIZATION", "ENTITY", "CORPORATE", "SME", "COMPANY"}
+
+# Titles, honorifics and legal forms: they say nothing about identity
+NAME_STOP_TOKENS = frozenset({
+    "mr", "mrs", "ms", "miss", "dr", "prof", "sir", "chief", "alhaji", "alhaja", "hajia", "engr", "barr", "pastor",
+    "ltd", "limited", "plc", "inc", "incorporated", "corp", "corporation", "llc", "llp", "co", "company", "gmbh",
+    "sa", "ag", "bv", "nv", "the",
+})
+
+_CHAR_MAP = str.maketrans({
+    "ß": "ss", "æ": "ae", "Æ": "ae", "œ": "oe", "Œ": "oe", "ø": "o", "Ø": "o", "đ": "d", "Đ": "d",
+    "ł": "l", "Ł": "l", "þ": "th", "Þ": "th", "ı": "i", "'": "", "’": "", "`": "",
+})
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_PHONETIC_CLASSES = str.maketrans("bfpvcgjkqsxzdtlmnr", "111122222222334556")
+_YEAR = re.compile(r"(?:19|20)\d\d")
+
+
+# --- Normalization ---
+def name_tokens(name: str) -> List[str]:
+    """Transliterated, lower-cased name tokens without titles or legal forms."""
+    text = unicodedata.normalize("NFKD", (name or "").translate(_CHAR_MAP))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    if _unidecode is not None and not text.isascii():
+        text = _unidecode(text)
+    tokens = _NON_ALNUM.sub(" ", text.lower()).split()
+    return [t for t in tokens if t not in NAME_STOP_TOKENS] or tokens # A name made only of stop words is kept as is
+
+def normalize_name(name: str) -> str:
+    return " ".join(sorted(name_tokens(name)))
+
+def token_grams(token: str) -> List[str]:
+    padded = f" {token} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+def phonetic_key(token: str) -> str:
+    """Consonant classes with vowels dropped and repeats collapsed, e.g. mohammed/muhammad -> '53'."""
+    codes = [c for c in token.translate(_PHONETIC_CLASSES) if c.isdigit()]
+    key = []
+    for c in codes:
+        if not key or key[-1] != c:
+            key.append(c)
+    return "".join(key[:4])
+
+
+# --- Scoring ---
+def _jaro_winkler_py(a: str, b: str) -> float:
+    if a == b:
+        return 1.0
+    la, lb = len(a), len(b)
+    if not la or not lb:
+        return 0.0
+    match_range = max(la, lb) // 2 - 1
+    a_matched = [False] * la
+    b_matched = [False] * lb
+    matches = 0
+    for i, ca in enumerate(a):
+        lo, hi = max(0, i - match_range), min(lb, i + match_range + 1)
+        for j in range(lo, hi):
+            if not b_matched[j] and b[j] == ca:
+                a_matched[i] = b_matched[j] = True
+                matches += 1
+                break
+    if not matches:
+        return 0.0
+    transpositions, j = 0, 0
+    for i in range(la):
+        if a_matched[i]:
+            while not b_matched[j]:
+                j += 1
+            if a[i] != b[j]:
+                transpositions += 1
+            j += 1
+    m = float(matches)
+    jaro = (m / la + m / lb + (m - transpositions / 2) / m) / 3
+    prefix = 0
+    for ca, cb in zip(a[:4], b[:4]):
+        if ca != cb:
+            break
+        prefix += 1
+    return jaro + prefix * 0.1 * (1 - jaro)
+
+jaro_winkler = _RapidJaroWinkler.similarity if _RapidJaroWinkler is not None else _jaro_winkler_py
+
+def _token_pair_score(a: str, b: str) -> float:
+    score = jaro_winkler(a, b)
+    if SANCTIONS_PHONETIC_MIN_SIMILARITY <= score < SANCTIONS_PHONETIC_TOKEN_SCORE:
+        key = phonetic_key(a)
+        if len(key) >= 2 and key == phonetic_key(b):
+            return SANCTIONS_PHONETIC_TOKEN_SCORE # Transliteration variants: Kadhafi/Qaddafi, Moamar/Muammar
+    return score
+
+def _token_alignment(source: Sequence[str], target: Sequence[str], pair_scores: Dict[Tuple[str, str], float]) -> float:
+    """Length-weighted mean of each source token's best pair score against the target tokens."""
+    total = weight = 0
+    for token in source:
+        best = 0.0
+        for other in target:
+            pair = (token, other) if token <= other else (other, token)
+            score = pair_scores.get(pair)
+            if score is None:
+                score = pair_scores[pair] = _token_pair_score(token, other)
+            if score > best:
+                best = score
+        total += best * len(token)
+        weight += len(token)
+    return total / weight if weight else 0.0
+
+def _score(query_tokens: Sequence[str], cand_tokens: Sequence[str], pair_scores: Dict[Tuple[str, str], float]) -> float:
+    """
+    Symmetric token alignment: each name's tokens are matched to their best counterpart in the other name,
+    and the two directions are averaged. Whole-string Jaro-Winkler is too lenient for names (a shared
+    surname alone scores ~0.9), and the symmetry keeps a one-word query ("Ali") from fully matching a long
+    name while still tolerating a missing middle name. When the token counts differ, the joined names are
+    compared too, for names written split or merged ("Abu Bakr" / "Abubakr").
+    Token pair scores are cached per query (`pair_scores`); common tokens recur across candidates.
+    """
+    if not query_tokens or not cand_tokens:
+        return 0.0
+    score = (_token_alignment(query_tokens, cand_tokens, pair_scores) + _token_alignment(cand_tokens, query_tokens, pair_scores)) / 2
+    if len(query_tokens) != len(cand_tokens):
+        score = max(score, jaro_winkler("".join(query_tokens), "".join(cand_tokens)))
+    return score
+
+def _birth_years(value: Any) -> List[int]:
+    if value is None:
+        return []
+    if isinstance(value, (date, datetime)):
+        return [value.year]
+    return [int(y) for y in _YEAR.findall(str(value))]
+
+def _entity_class(entity_type: Optional[str]) -> Optional[str]:
+    if not entity_type:
+        return None
+    entity_type = entity_type.upper()
+    if entity_type in _ORGANIZATION_TYPES:
+        return ENTITY_ORGANIZATION
+    if entity_type in (ENTITY_INDIVIDUAL, "PERSON", "CUSTOMER"):
+        return ENTITY_INDIVIDUAL
+    return entity_type # VESSEL, AIRCRAFT: only matched by untyped queries
+
+
+# --- Index ---
+class SanctionEntry:
+    __slots__ = ("list_name", "entry_uid", "entity_type", "primary_name", "aliases", "date_of_birth", "nationality", "program")
+
+    def __init__(self, list_name: str, entry_uid: str, entity_type: Optional[str], primary_name: str,
+                 aliases: Sequence[str] = (), date_of_birth: Optional[str] = None, nationality: Optional[str] = None,
+                 program: Optional[str] = None):
+        self.list_name = list_name
+        self.entry_uid = entry_uid
+        self.entity_type = entity_type
+        self.primary_name = primary_name
+        self.aliases = list(aliases or ())
+        self.date_of_birth = date_of_birth
+        self.nationality = nationality
+        self.program = program
+
+    @classmethod
+    def from_model(cls, row) -> "SanctionEntry":
+        return cls(row.list_name, row.entry_uid, row.entity_type, row.primary_name,
+                   json.loads(row.aliases_json) if row.aliases_json else (), row.date_of_birth, row.nationality, row.program)
+
+
+class SanctionsIndex:
+    """
+    In-memory index over the names and aliases of sanction-list entries. Every name variant gets an id;
+    the trigram and phonetic postings map to variant ids (compact arrays) and each variant points back to
+    its entry. Picklable, so it can be shipped to worker processes.
+    """
+    def __init__(self, entries: Iterable[SanctionEntry] = ()):
+        self.entries: List[SanctionEntry] = []
+        self.variant_entry = array("I")
+        self.variant_names: List[str] = []
+        self.variant_tokens: List[Tuple[str, ...]] = []
+        self.variant_gram_counts = array("H")
+        self.gram_postings: Dict[str, array] = {}
+        self.phonetic_postings: Dict[str, array] = {}
+        self.list_names: List[str] = []
+        self.built_at: Optional[datetime] = None
+        self.signature: Any = None # Source state the index was built from (see get_sanctions_index)
+        self._gram_cap = 0
+        self.build(entries)
+
+    def build(self, entries: Iterable[SanctionEntry]) -> "SanctionsIndex":
+        grams: Dict[str, List[int]] = {}
+        phonetics: Dict[str, List[int]] = {}
+        list_names = set()
+        for entry in entries:
+            entry_id = len(self.entries)
+            self.entries.append(entry)
+            list_names.add(entry.list_name)
+            seen = set()
+            for name in [entry.primary_name, *entry.aliases]:
+                tokens = tuple(sorted(name_tokens(name)))
+                if not tokens or tokens in seen:
+                    continue
+                seen.add(tokens)
+                variant_id = len(self.variant_names)
+                self.variant_entry.append(entry_id)
+                self.variant_names.append(name)
+                self.variant_tokens.append(tokens)
+                variant_grams = {g for t in tokens for g in token_grams(t)}
+                self.variant_gram_counts.append(min(len(variant_grams), 65535))
+                for gram in variant_grams:
+                    grams.setdefault(gram, []).append(variant_id)
+                for key in {phonetic_key(t) for t in tokens}:
+                    if len(key) >= 2: # One consonant class matches half the list
+                        phonetics.setdefault(key, []).append(variant_id)
+        self.gram_postings = {g: array("I", ids) for g, ids in grams.items()}
+        self.phonetic_postings = {k: array("I", ids) for k, ids in phonetics.items()}
+        self.list_names = sorted(list_names)
+        self._gram_cap = max(50, int(len(self.variant_names) * SANCTIONS_MAX_POSTING_FRACTION))
+        self.built_at = datetime.utcnow()
+        return self
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _candidates(self, tokens: Sequence[str], max_candidates: int) -> List[int]:
+        query_grams = {g for t in tokens for g in token_grams(t)}
+        counts: Counter = Counter()
+        for gram in query_grams:
+            posting = self.gram_postings.get(gram)
+            if posting is not None and len(posting) <= self._gram_cap:
+                counts.update(posting)
+        size = len(query_grams)
+        gram_counts = self.variant_gram_counts
+        ranked = heapq.nlargest(max_candidates, ((2.0 * shared / (size + gram_counts[v]), v) for v, shared in counts.items()))
+        candidates = [v for dice, v in ranked if dice >= SANCTIONS_MIN_GRAM_DICE]
+
+        keys = {phonetic_key(t) for t in tokens}
+        keys = [k for k in keys if len(k) >= 2]
+        if keys:
+            phonetic_counts: Counter = Counter()
+            for key in keys:
+                posting = self.phonetic_postings.get(key)
+                if posting is not None:
+                    phonetic_counts.update(posting)
+            needed = (len(keys) + 1) // 2
+            seen = set(candidates)
+            for v, shared in phonetic_counts.most_common(max_candidates):
+                if shared < needed:
+                    break
+                if v not in seen:
+                    candidates.append(v)
+        return candidates
+
+    def screen(self, name: str, entity_type: Optional[str] = None, date_of_birth: Any = None,
+               threshold: float = SANCTIONS_MATCH_THRESHOLD, limit: Optional[int] = 10,
+               max_candidates: int = SANCTIONS_MAX_CANDIDATES) -> List[Dict[str, Any]]:
+        """
+        Matches `name` against the index. Returns one match per list entry (its best-scoring name variant),
+        best first, in the SanctionScreeningLog.match_details_json format. `limit=None` returns all matches.
+        """
+        tokens = sorted(name_tokens(name))
+        if not tokens:
+            return []
+        query_class = _entity_class(entity_type)
+        query_years = _birth_years(date_of_birth)
+
+        best: Dict[int, Tuple[float, int, bool]] = {}
+        pair_scores: Dict[Tuple[str, str], float] = {}
+        for variant_id in self._candidates(tokens, max_candidates):
+            entry_id = self.variant_entry[variant_id]
+            entry = self.entries[entry_id]
+            entry_class = _entity_class(entry.entity_type)
+            if query_class and entry_class and entry_class != query_class:
+                continue
+            score = _score(tokens, self.variant_tokens[variant_id], pair_scores)
+            dob_conflict = False
+            if query_years and entry.date_of_birth:
+                entry_years = _birth_years(entry.date_of_birth)
+                if entry_years and all(abs(y - q) > 1 for y in entry_years for q in query_years):
+                    dob_conflict = True
+                    score -= SANCTIONS_DOB_MISMATCH_PENALTY
+            if score >= threshold and score > best.get(entry_id, (0.0,))[0]:
+                best[entry_id] = (score, variant_id, dob_conflict)
+
+        matches = []
+        for entry_id, (score, variant_id, dob_conflict) in sorted(best.items(), key=lambda kv: -kv[1][0])[:limit]:
+            entry = self.entries[entry_id]
+            matched_name = self.variant_names[variant_id]
+            details = f"Name match on {entry.list_name}" + (f" ({entry.program})" if entry.program else "")
+            if matched_name != entry.primary_name:
+                details += f"; alias of {entry.primary_name}"
+            if dob_conflict:
+                details += f"; listed date of birth {entry.date_of_birth} differs"
+            matches.append({
+                "list_name": entry.list_name,
+                "entry_uid": entry.entry_uid,
+                "entity_type": entry.entity_type,
+                "matched_name": matched_name,
+                "primary_name": entry.primary_name,
+                "score": round(score, 4),
+                "date_of_birth": entry.date_of_birth,
+                "nationality": entry.nationality,
+                "details": details,
+            })
+        return matches
+
+
+# --- Loading from the database ---
+def build_sanctions_index(db) -> SanctionsIndex:
+    """Builds an index over the active sanction_list_entries."""
+    from .models import SanctionListEntry
+    rows = db.query(SanctionListEntry).filter(SanctionListEntry.is_active == True).yield_per(5000)
+    index = SanctionsIndex(SanctionEntry.from_model(row) for row in rows)
+    index.signature = _list_signature(db)
+    return index
+
+def _list_signature(db) -> Tuple[Any, ...]:
+    from sqlalchemy import func
+    from .models import SanctionListEntry
+    count, last_update = db.query(func.count(SanctionListEntry.id), func.max(SanctionListEntry.updated_at)).filter(
+        SanctionListEntry.is_active == True).one()
+    return (count, str(last_update))
+
+
+_index: Optional[SanctionsIndex] = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+
+def get_sanctions_index(db) -> SanctionsIndex:
+    """Process-wide index; rebuilt when the list entries have changed (checked every SANCTIONS_INDEX_REFRESH_SECONDS)."""
+    global _index, _index_checked_at
+    with _index_lock:
+        now = time.monotonic()
+        if _index is not None and now - _index_checked_at < SANCTIONS_INDEX_REFRESH_SECONDS:
+            return _index
+        _index_checked_at = now
+        if _index is None or _index.signature != _list_signature(db):
+            _index = build_sanctions_index(db)
+        return _index
+
+def invalidate_sanctions_index() -> None:
+    """Forces a rebuild on next use (call after loading a list)."""
+    global _index_checked_at
+    with _index_lock:
+        _index_checked_at = 0.0
+
+
+# --- Batch screening ---
+CustomerRecord = Tuple[int, str, str, Optional[str], Optional[date]] # (id, name, entity type, bvn, date of birth)
+
+def _customer_record(row) -> Optional[CustomerRecord]:
+    customer_type = getattr(row.customer_type, "value", row.customer_type)
+    if row.company_name and customer_type != "INDIVIDUAL":
+        name, entity_type = row.company_name, ENTITY_ORGANIZATION
+    else:
+        name = " ".join(p for p in (row.first_name, row.middle_name, row.last_name) if p)
+        entity_type = ENTITY_INDIVIDUAL
+    if not name.strip():
+        return None
+    return (row.id, name, entity_type, row.bvn, row.date_of_birth)
+
+def iter_customer_batches(db, batch_size: int = SANCTIONS_SCREENING_BATCH_SIZE,
+                          customer_ids: Optional[Sequence[int]] = None) -> Iterator[List[CustomerRecord]]:
+    """Customers to screen, in id order, keyset-paginated so memory stays at one batch."""
+    from weezy_cbs.customer_identity_management.models import Customer
+    columns = (Customer.id, Customer.customer_type, Customer.first_name, Customer.middle_name, Customer.last_name,
+               Customer.company_name, Customer.bvn, Customer.date_of_birth)
+    last_id = 0
+    while True:
+        query = db.query(*columns).filter(Customer.id > last_id)
+        if customer_ids is not None:
+            query = query.filter(Customer.id.in_(customer_ids))
+        rows = query.order_by(Customer.id).limit(batch_size).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+        batch = [r for r in (_customer_record(row) for row in rows) if r is not None]
+        if batch:
+            yield batch
+
+
+_worker_index: Optional[SanctionsIndex] = None
+
+def _init_screening_worker(index: Optional[SanctionsIndex] = None) -> None:
+    global _worker_index
+    if index is not None: # Spawned workers receive the index pickled; forked workers already have it
+        _worker_index = index
+
+def screen_batch(batch: Sequence[CustomerRecord], threshold: float, index: Optional[SanctionsIndex] = None) -> List[Tuple[CustomerRecord, List[Dict[str, Any]]]]:
+    index = index or _worker_index
+    return [(record, index.screen(record[1], record[2], record[4], threshold=threshold)) for record in batch]
+
+
+class BatchScreeningResult:
+    __slots__ = ("customers_screened", "matches_found", "alerts_opened", "elapsed_seconds")
+
+    def __init__(self, customers_screened: int = 0, matches_found: int = 0, alerts_opened: int = 0, elapsed_seconds: float = 0.0):
+        self.customers_screened = customers_screened
+        self.matches_found = matches_found
+        self.alerts_opened = alerts_opened
+        self.elapsed_seconds = elapsed_seconds
+
+
+def _log_rows(results, list_names: str, run_id: Optional[int], screened_at: datetime) -> List[Dict[str, Any]]:
+    rows = []
+    for (customer_id, name, _, bvn, _), matches in results:
+        rows.append({
+            "customer_id": customer_id,
+            "entity_type": "CUSTOMER",
+            "bvn_screened": bvn,
+            "name_screened": name[:255],
+            "screening_date": screened_at,
+            "sanction_lists_checked": list_names,
+            "match_found": bool(matches),
+            "match_details_json": json.dumps(matches) if matches else None,
+            "best_match_score": matches[0]["score"] if matches else None,
+            "screening_run_id": run_id,
+        })
+    return rows
+
+def screen_customers(db, index: SanctionsIndex, threshold: float = SANCTIONS_MATCH_THRESHOLD, run_id: Optional[int] = None,
+                     workers: int = SANCTIONS_SCREENING_WORKERS, batch_size: int = SANCTIONS_SCREENING_BATCH_SIZE,
+                     customer_ids: Optional[Sequence[int]] = None, on_progress=None) -> BatchScreeningResult:
+    """
+    Screens customers against `index` and bulk-inserts one SanctionScreeningLog per customer, committing per
+    batch. Matches open (or refresh) SanctionAlerts. With workers > 1, batches are screened in a process pool with at most 2 batches per worker in
+    flight. `on_progress(result)` is called after each committed batch.
+    """
+    from .models import SanctionScreeningLog
+    from .sanction_rescreening import upsert_sanction_alerts
+    result = BatchScreeningResult()
+    started = time.perf_counter()
+    list_names = json.dumps(index.list_names)
+
+    def store(results) -> None:
+        rows = _log_rows(results, list_names, run_id, datetime.utcnow())
+        db.bulk_insert_mappings(SanctionScreeningLog, rows)
+        result.alerts_opened += upsert_sanction_alerts(db, {record[0]: matches for record, matches in results if matches}, run_id)
+        db.commit()
+        result.customers_screened += len(rows)
+        result.matches_found += sum(1 for r in rows if r["match_found"])
+        result.elapsed_seconds = time.perf_counter() - started
+        if on_progress is not None:
+            on_progress(result)
+
+    batches = iter_customer_batches(db, batch_size, customer_ids)
+    if workers <= 1:
+        for batch in batches:
+            store(screen_batch(batch, threshold, index))
+        return result
+
+    global _worker_index
+    methods = multiprocessing.get_all_start_methods()
+    if "fork" in methods:
+        _worker_index = index # Inherited by the forked workers without pickling
+        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"), initializer=_init_screening_worker)
+    else:
+        pool = ProcessPoolExecutor(workers, initializer=_init_screening_worker, initargs=(index,))
+    try:
+        pending = set()
+        for batch in batches:
+            pending.add(pool.submit(screen_batch, batch, threshold))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    store(future.result())
+        for future in pending:
+            store(future.result())
+    finally:
+        pool.shutdown(cancel_futures=True)
+        _worker_index = None
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sanction screening against the loaded sanction lists.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    screen_cmd = commands.add_parser("screen", help="Screen a single name.")
+    screen_cmd.add_argument("--name", required=True)
+    screen_cmd.add_argument("--entity-type")
+    screen_cmd.add_argument("--dob")
+    screen_cmd.add_argument("--threshold", type=float, default=SANCTIONS_MATCH_THRESHOLD)
+    customers_cmd = commands.add_parser("screen-customers", help="Screen all customers and log the results.")
+    customers_cmd.add_argument("--threshold", type=float, default=SANCTIONS_MATCH_THRESHOLD)
+    customers_cmd.add_argument("--workers", type=int, default=SANCTIONS_SCREENING_WORKERS)
+    customers_cmd.add_argument("--batch-size", type=int, default=SANCTIONS_SCREENING_BATCH_SIZE)
+    args = parser.parse_args()
+
+    from weezy_cbs.database import SessionLocal
+    session = SessionLocal()
+    try:
+        built = time.perf_counter()
+        sanctions_index = build_sanctions_index(session)
+        print(f"Indexed {len(sanctions_index)} entries / {len(sanctions_index.variant_names)} names "
+              f"from {', '.join(sanctions_index.list_names) or 'no lists'} in {time.perf_counter() - built:.1f}s")
+        if args.command == "screen":
+            for match in sanctions_index.screen(args.name, args.entity_type, args.dob, threshold=args.threshold):
+                print(f"  {match['score']:.3f}  {match['list_name']}  {match['matched_name']}  ({match['details']})")
+        else:
+            outcome = screen_customers(session, sanctions_index, threshold=args.threshold, workers=args.workers, batch_size=args.batch_size)
+            rate = outcome.customers_screened / outcome.elapsed_seconds if outcome.elapsed_seconds else 0.0
+            print(f"Screened {outcome.customers_screened} customers in {outcome.elapsed_seconds:.1f}s ({rate:,.0f}/s); "
+                  f"{outcome.matches_found} with potential matches")
+    finally:
+        session.close()
@@ -42,6 +42,7 @@ class GeneratedReportLogResponse(GeneratedReportLogBase):
     file_path_or_url: Optional[str] = Field(None, max_length=512)
     file_format: Optional[str] = Field(None, max_length=10)
     checksum: Optional[str] = Field(None, max_length=64)
+    row_count: Optional[int] = None
     submitted_at: Optional[datetime] = None
     submission_reference: Optional[str] = Field(None, max_length=100)
     validator_user_id: Optional[str] = Field(None, max_length=50)
@@ -128,6 +129,54 @@ class SanctionScreeningResult(BaseModel): # Response from the screening service
     match_details: Optional[List[Dict[str, Any]]] = None
     sanction_lists_checked: Optional[List[str]] = None # Changed from text to list
 
+class SanctionBatchScreeningRequest(BaseModel):
+    match_threshold: Optional[float] = Field(None, gt=0, le=1, description="Jaro-Winkler score for a potential match (default SANCTIONS_MATCH_THRESHOLD)")
+
+class SanctionScreeningRunResponse(BaseModel):
+    id: int
+    run_type: str
+    list_version_id: Optional[int] = None
+    status: str
+    match_threshold: float
+    customers_screened: int
+    entries_screened: int
+    matches_found: int
+    alerts_opened: int
+    alerts_retired: int
+    requested_by_user_id: Optional[str] = None
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    error_message: Optional[str] = None
+    created_at: datetime
+    class Config: orm_mode = True
+
+class SanctionListVersionResponse(BaseModel):
+    id: int
+    list_name: str
+    source_reference: Optional[str] = None
+    published_at: Optional[datetime] = None
+    loaded_at: datetime
+    entries_total: int
+    entries_added: int
+    entries_changed: int
+    entries_removed: int
+    class Config: orm_mode = True
+
+class SanctionAlertResponse(BaseModel):
+    id: int
+    customer_id: int
+    list_name: str
+    entry_uid: str
+    matched_name: str
+    match_score: float
+    status: str # OPEN, CLEARED, CONFIRMED, RETIRED
+    status_reason: Optional[str] = None
+    last_screening_run_id: Optional[int] = None
+    created_at: datetime
+    last_matched_at: Optional[datetime] = None
+    retired_at: Optional[datetime] = None
+    class Config: orm_mode = True
+
 class SanctionScreeningLogResponse(BaseModel): # For retrieving stored logs
     id: int
     customer_id: Optional[int] = None
@@ -138,6 +187,8 @@ class SanctionScreeningLogResponse(BaseModel): # For retrieving stored logs
     sanction_lists_checked: Optional[List[str]] = None # Parsed from JSON Text in model
     match_found: bool
     match_details_json: Optional[List[Dict[str, Any]]] = None # Parsed from JSON Text in model
+    best_match_score: Optional[float] = None
+    screening_run_id: Optional[int] = None
     class Config: orm_mode = True
 
 # --- CTR/STR Data Schemas ---
@@ -5,9 +5,7 @@ from . import models, schemas
 from .models import ReportStatusEnum, ReportNameEnum # Direct enum access
 from datetime import datetime, date, timedelta
 import json
-import csv # For CSV report generation
-import xml.etree.ElementTree as ET # For XML report generation (basic)
-# Potentially use libraries like `openpyxl` for Excel reports.
+from typing import List, Optional
 
 # Placeholder for other service integrations & data sources
 # from weezy_cbs.customer_identity_management.services import get_customer_details_for_reporting
@@ -85,46 +83,6 @@ def get_all_report_logs(db: Session, skip: int = 0, limit: int = 100, report_nam
     return query.order_by(models.GeneratedReportLog.reporting_period_end_date.desc(), models.GeneratedReportLog.id.desc()).offset(skip).limit(limit).all()
 
 # --- Report Generation (Conceptual - Specific logic for each report type) ---
-def _generate_cbn_crms_report_data(db: Session, start_date: date, end_date: date) -> List[dict]:
-    # Query loan_management_module for all relevant loan data (new loans, performing, NPLs, restructures, write-offs)
-    # within the reporting period.
-    # Format data according to CRMS XML schema specifications.
-    # loan_data = get_loan_data_for_reporting(db, start_date, end_date, report_type="CRMS")
-    # Example structure (highly simplified):
-    return [
-        {"loan_id": "L001", "bvn": "11122233344", "amount_disbursed": 100000, "status": "PERFORMING", "npl_since": None},
-        {"loan_id": "L002", "bvn": "55566677788", "amount_disbursed": 500000, "status": "NPL", "npl_since": "2023-01-15"},
-    ]
-
-def _generate_nfiu_ctr_report_data(db: Session, start_date: date, end_date: date) -> List[schemas.CTRRecordSchema]:
-    # Query transaction_management and/or deposit_collection_module for cash transactions
-    # exceeding NFIU thresholds (e.g., individuals > 5M, corporates > 10M).
-    # Individual transactions or aggregated daily transactions per customer might be needed.
-    # cash_transactions = get_cash_transactions_for_ctr(db, start_date, end_date)
-    # Example (simplified):
-    return [
-        schemas.CTRRecordSchema(transaction_date=date(2023,10,3), transaction_amount=decimal.Decimal("6000000.00"), transaction_currency="NGN", customer_bvn="123...", customer_name="John Doe", account_number="012...", transaction_type="CASH_DEPOSIT"),
-    ]
-
-def _format_data_as_xml(data: List[dict], root_element_name: str, item_element_name: str) -> str:
-    # Basic XML formatter. Real reports need specific schemas and namespaces.
-    root = ET.Element(root_element_name)
-    for item_data in data:
-        item_el = ET.SubElement(root, item_element_name)
-        for key, val in item_data.items():
-            child = ET.SubElement(item_el, str(key))
-            child.text = str(val)
-    return ET.tostring(root, encoding='unicode')
-
-def _format_data_as_csv(data: List[dict], fieldnames: List[str]) -> str:
-    import io
-    output = io.StringIO()
-    writer = csv.DictWriter(output, fieldnames=fieldnames)
-    writer.writeheader()
-    writer.writerows(data)
-    return output.getvalue()
-
-
 def generate_report_file(db: Session, report_log_id: int) -> models.GeneratedReportLog:
     report_log = db.query(models.GeneratedReportLog).filter(models.GeneratedReportLog.id == report_log_id).with_for_update().first()
     if not report_log or report_log.status != ReportStatusEnum.PENDING_GENERATION:
@@ -134,43 +92,26 @@ def generate_report_file(db: Session, report_log_id: int) -> models.GeneratedRep
     db.commit() # Commit status change before long operation
 
     try:
-        data = []
-        file_content_str = ""
-        file_format = "TXT" # Default
-
         if report_log.report_name == ReportNameEnum.CBN_CRMS:
-            data = _generate_cbn_crms_report_data(db, report_log.reporting_period_start_date, report_log.reporting_period_end_date)
-            # CRMS is usually XML, requires specific schema. This is a placeholder.
-            file_content_str = _format_data_as_xml(data, "CRMSReport", "LoanRecord")
-            file_format = "XML"
+            from .crms_pipeline import generate_crms_report
+            report_file = generate_crms_report(
+                db, report_log.reporting_period_start_date, report_log.reporting_period_end_date,
+                base_file_name=f"{report_log.report_name.value}_{report_log.reporting_period_end_date}")
         elif report_log.report_name == ReportNameEnum.NFIU_CTR:
-            ctr_records_schema = _generate_nfiu_ctr_report_data(db, report_log.reporting_period_start_date, report_log.reporting_period_end_date)
-            # Convert Pydantic schema list to list of dicts for CSV
-            data_for_csv = [record.dict() for record in ctr_records_schema]
-            if data_for_csv:
-                 fieldnames = list(data_for_csv[0].keys())
-                 file_content_str = _format_data_as_csv(data_for_csv, fieldnames)
-            else:
-                 file_content_str = "No CTR data for the period."
-            file_format = "CSV"
+            from .ctr_pipeline import generate_ctr_report
+            report_file = generate_ctr_report(
+                db, report_log.reporting_period_start_date, report_log.reporting_period_end_date,
+                base_file_name=f"{report_log.report_name.value}_{report_log.reporting_period_end_date}")
         # Add cases for NFIU_STR, NDIC_RETURNS, CBN_FINA, CBN_OVERSIGHT etc.
         else:
             raise NotImplementedError(f"Report generation for {report_log.report_name.value} not implemented.")
 
-        # Save file_content_str to a file storage (e.g., S3, local disk)
-        # file_path = file_storage_service.save_report_file(
-        #     report_log.report_name.value,
-        #     report_log.reporting_period_end_date,
-        #     file_content_str,
-        #     file_format
-        # )
-        mock_file_path = f"/reports_storage/{report_log.report_name.value}_{report_log.reporting_period_end_date}.{file_format.lower()}"
-
         report_log.status = ReportStatusEnum.GENERATED
         report_log.generated_at = datetime.utcnow()
-        report_log.file_path_or_url = mock_file_path
-        report_log.file_format = file_format
-        # report_log.checksum = calculate_checksum(mock_file_path) # If file is accessible
+        report_log.file_path_or_url = report_file.file_path # A split CRMS return points to its manifest
+        report_log.file_format = report_file.file_format
+        report_log.checksum = report_file.checksum
+        report_log.row_count = report_file.row_count
         db.commit()
 
     except Exception as e:
@@ -200,6 +141,7 @@ def create_aml_rule(db: Session, rule_in: schemas.AMLRuleCreateRequest) -> model
     db.add(db_rule)
     db.commit()
     db.refresh(db_rule)
+    _reload_live_aml_rules(db)
     return db_rule
 
 def update_aml_rule(db: Session, rule_id: int, rule_update: schemas.AMLRuleUpdateRequest) -> models.AMLRule:
@@ -217,40 +159,36 @@ def update_aml_rule(db: Session, rule_id: int, rule_update: schemas.AMLRuleUpdat
 
     db.commit()
     db.refresh(db_rule)
+    _reload_live_aml_rules(db)
     return db_rule
 
+def _reload_live_aml_rules(db: Session) -> None:
+    from .aml_engine import get_aml_worker
+    worker = get_aml_worker()
+    if worker is not None:
+        worker.reload_rules(db)
+
 def get_aml_rules(db: Session, active_only: bool = True) -> List[models.AMLRule]:
     query = db.query(models.AMLRule)
     if active_only:
         query = query.filter(models.AMLRule.is_active == True)
     return query.all()
 
-# --- AML Transaction Monitoring (Conceptual) ---
-# This would be a batch process or real-time stream processor.
-def monitor_transactions_for_aml(db: Session, transaction_id: str): # Or process a batch of transactions
-    # ft = get_transaction_by_id(db, transaction_id) # Get FinancialTransaction
-    # if not ft: return
-
-    # active_rules = get_aml_rules(db, active_only=True)
-    # for rule_model in active_rules:
-    #     params = json.loads(rule_model.parameters_json) if rule_model.parameters_json else {}
-    #     is_breached = False
-        # Example: Large Cash Deposit Rule
-        # if rule_model.rule_code == "LARGE_CASH_DEPOSIT":
-        #     if ft.transaction_type == "CASH_DEPOSIT" and ft.amount > params.get("threshold_amount", 5000000) and ft.currency == params.get("currency", "NGN"):
-        #         is_breached = True
-        # elif rule_model.rule_code == "HIGH_VELOCITY_TXNS":
-            # Query related transactions for the customer/account over params.get("period_days")
-            # If count > params.get("txn_count_threshold") or sum_amount > params.get("sum_amount_threshold")
-            # is_breached = True
-
-        # if is_breached:
-        #     log_suspicious_activity(
-        #         db, ft.customer_id, ft.account_id, ft.id, rule_model.rule_code,
-        #         f"Rule '{rule_model.description}' breached by transaction {ft.id}."
-        #     )
-            # Perform action_to_take (e.g. if "BLOCK_TRANSACTION", need to integrate with TransactionManagement)
-    pass # Placeholder for complex AML monitoring logic
+# --- AML Transaction Monitoring ---
+# Committed transactions are monitored continuously by the streaming engine (aml_engine.py), which keeps
+# sliding-window aggregates in memory instead of re-querying history per rule.
+def monitor_transactions_for_aml(db: Session, transaction_id: str) -> int:
+    """Evaluates one transaction immediately (e.g. re-check after a correction); returns the number of hits stored."""
+    from weezy_cbs.transaction_management.models import FinancialTransaction
+    from weezy_cbs.transaction_management.services import transaction_event_payload
+    from .aml_engine import TransactionEvent, evaluate_transaction, insert_hits
+
+    ft = db.query(FinancialTransaction).filter(FinancialTransaction.id == transaction_id).first()
+    if not ft: return 0
+    # A throwaway engine seeded from history: the live worker's windows and buffered hits are left alone
+    hits = evaluate_transaction(db, TransactionEvent.from_mapping(transaction_event_payload(ft)), get_aml_rules(db, active_only=True))
+    # Perform action_to_take (e.g. if "BLOCK_TRANSACTION", need to integrate with TransactionManagement)
+    return insert_hits(db, hits)
 
 def log_suspicious_activity(
     db: Session, customer_bvn: Optional[str], account_number: Optional[str],
@@ -293,30 +231,22 @@ def update_suspicious_activity_status(db: Session, log_id: int, update_data: sch
 
 # --- Sanction Screening Services ---
 def perform_sanction_screening(db: Session, screening_request: schemas.SanctionScreeningRequest) -> schemas.SanctionScreeningResult:
-    # This would call an external sanction list provider's API
-    # matches = sanction_list_provider_service.screen_name(
-    #     name=screening_request.name_to_screen,
-    #     entity_type=screening_request.entity_type,
-    #     # ... other identifiers ...
-    # )
-
-    # Mock response
-    matches_found_list = []
-    if "sanctioned" in screening_request.name_to_screen.lower():
-        matches_found_list.append({
-            "list_name": "OFAC_SDN_MOCK",
-            "matched_name": screening_request.name_to_screen,
-            "score": 0.95,
-            "details": "Entity found on OFAC SDN list (mock data)."
-        })
+    from .sanctions_index import get_sanctions_index
+    index = get_sanctions_index(db)
+    if not len(index):
+        # Reporting "no match" against empty lists would be a false all-clear
+        raise SanctionScreeningException("No sanction lists are loaded; screening cannot be performed.")
+    matches_found_list = index.screen(screening_request.name_to_screen, entity_type=screening_request.entity_type)
 
     log = models.SanctionScreeningLog(
+        customer_id=screening_request.customer_id,
         name_screened=screening_request.name_to_screen,
         bvn_screened=screening_request.bvn_to_screen,
         # entity_type=screening_request.entity_type,
-        sanction_lists_checked=json.dumps(["OFAC_SDN_MOCK", "UN_CONSOLIDATED_MOCK"]), # Example lists
+        sanction_lists_checked=json.dumps(index.list_names),
         match_found=bool(matches_found_list),
-        match_details_json=json.dumps(matches_found_list) if matches_found_list else None
+        match_details_json=json.dumps(matches_found_list) if matches_found_list else None,
+        best_match_score=matches_found_list[0]["score"] if matches_found_list else None
     )
     db.add(log)
     db.commit()
@@ -325,8 +255,99 @@ def perform_sanction_screening(db: Session, screening_request: schemas.SanctionS
         name_screened=screening_request.name_to_screen,
         screening_date=log.screening_date,
         match_found=log.match_found,
-        match_details=matches_found_list
+        match_details=matches_found_list,
+        sanction_lists_checked=index.list_names
+    )
+
+def create_sanction_screening_run(db: Session, request: schemas.SanctionBatchScreeningRequest, user_id: Optional[str] = None,
+                                  list_version_id: Optional[int] = None) -> models.SanctionScreeningRun:
+    """A FULL run screens every customer; with list_version_id, a DELTA run screens only that version's changes."""
+    from .sanctions_index import SANCTIONS_MATCH_THRESHOLD
+    if list_version_id is not None and not db.query(models.SanctionListVersion).filter(models.SanctionListVersion.id == list_version_id).first():
+        raise NotFoundException(f"Sanction list version {list_version_id} not found.")
+    if db.query(models.SanctionScreeningRun).filter(models.SanctionScreeningRun.status.in_(["PENDING", "RUNNING"])).first():
+        raise SanctionScreeningException("A batch sanction screening run is already in progress.")
+    run = models.SanctionScreeningRun(
+        run_type="FULL" if list_version_id is None else "DELTA",
+        list_version_id=list_version_id,
+        status="PENDING",
+        match_threshold=request.match_threshold or SANCTIONS_MATCH_THRESHOLD,
+        requested_by_user_id=user_id
     )
+    db.add(run)
+    db.commit()
+    db.refresh(run)
+    return run
+
+def execute_sanction_screening_run(run_id: int, workers: Optional[int] = None) -> None:
+    """Background task: runs a SanctionScreeningRun (FULL or DELTA) in its own session."""
+    from weezy_cbs.database import SessionLocal
+    from .sanction_rescreening import rescreen_list_version
+    from .sanctions_index import SANCTIONS_SCREENING_WORKERS, build_sanctions_index, screen_customers
+    db = SessionLocal()
+    try:
+        run = db.query(models.SanctionScreeningRun).get(run_id)
+        if run is None or run.status != "PENDING":
+            return
+        run.status = "RUNNING"
+        run.started_at = datetime.utcnow()
+        db.commit()
+
+        if run.run_type == "DELTA":
+            def record_delta_progress(progress):
+                run.entries_screened = progress.entries_screened
+                db.commit()
+
+            outcome = rescreen_list_version(db, run.list_version_id, threshold=run.match_threshold, run_id=run.id,
+                                            on_progress=record_delta_progress)
+            run.entries_screened = outcome.entries_screened
+            run.customers_screened = outcome.customers_matched
+            run.matches_found = outcome.matches_found
+            run.alerts_opened = outcome.alerts_opened
+            run.alerts_retired = outcome.alerts_retired
+        else:
+            index = build_sanctions_index(db)
+            if not len(index):
+                raise SanctionScreeningException("No sanction lists are loaded; screening cannot be performed.")
+
+            def record_progress(progress):
+                run.customers_screened = progress.customers_screened
+                run.matches_found = progress.matches_found
+                run.alerts_opened = progress.alerts_opened
+                db.commit()
+
+            screen_customers(db, index, threshold=run.match_threshold, run_id=run.id,
+                             workers=workers or SANCTIONS_SCREENING_WORKERS, on_progress=record_progress)
+        run.status = "COMPLETED"
+        run.completed_at = datetime.utcnow()
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        run = db.query(models.SanctionScreeningRun).get(run_id)
+        if run is not None:
+            run.status = "FAILED"
+            run.error_message = str(e)
+            run.completed_at = datetime.utcnow()
+            db.commit()
+    finally:
+        db.close()
+
+def get_sanction_screening_run(db: Session, run_id: int) -> Optional[models.SanctionScreeningRun]:
+    return db.query(models.SanctionScreeningRun).filter(models.SanctionScreeningRun.id == run_id).first()
+
+def get_sanction_list_versions(db: Session, list_name: Optional[str] = None, skip: int = 0, limit: int = 50) -> List[models.SanctionListVersion]:
+    query = db.query(models.SanctionListVersion)
+    if list_name:
+        query = query.filter(models.SanctionListVersion.list_name == list_name)
+    return query.order_by(models.SanctionListVersion.id.desc()).offset(skip).limit(limit).all()
+
+def get_sanction_alerts(db: Session, status: Optional[str] = None, customer_id: Optional[int] = None, skip: int = 0, limit: int = 50) -> List[models.SanctionAlert]:
+    query = db.query(models.SanctionAlert)
+    if status:
+        query = query.filter(models.SanctionAlert.status == status)
+    if customer_id:
+        query = query.filter(models.SanctionAlert.customer_id == customer_id)
+    return query.order_by(models.SanctionAlert.id.desc()).offset(skip).limit(limit).all()
 
 def get_sanction_screening_logs(db: Session, skip: int = 0, limit: int = 100, bvn: Optional[str]=None, name: Optional[str]=None, match_found: Optional[bool]=None) -> List[models.SanctionScreeningLog]:
     query = db.query(models.SanctionScreeningLog)
@@ -12,6 +12,7 @@ from .services import (
     AuditLogService, # For direct use if needed, though mostly static
     create_access_token
 )
+from .password_hashing import HashingBackpressureError
 
 # --- Authentication & Authorization Dependencies ---
 
@@ -52,7 +53,10 @@ auth_router = APIRouter(tags=["Authentication"])
 
 @auth_router.post("/login/token", response_model=schemas.TokenSchema)
 async def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
-    user = user_service.authenticate_user(db, username=form_data.username, password=form_data.password)
+    try:
+        user = await user_service.authenticate_user(db, username=form_data.username, password=form_data.password)
+    except HashingBackpressureError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=e.message, headers={"Retry-After": "1"})
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
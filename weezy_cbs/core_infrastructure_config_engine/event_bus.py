@@ -0,0 +1,69 @@
+# Small in-process event bus for cross-module notifications (cache invalidation and similar)
+#
+# Modules publish domain events such as "a ledger entry was posted for customer X" without importing the
+# modules that care about them. Handlers run synchronously on the publishing thread, so they must be
+# cheap (flip a flag, enqueue work); a failing handler is logged and never breaks the publisher.
+# This is process-local: with several workers each process invalidates its own caches, which is what
+# process-local caches need.
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List
+
+# Event types
+LEDGER_ENTRY_POSTED = "LEDGER_ENTRY_POSTED" # payload: customer_id, account_id
+LOAN_ACCOUNT_CHANGED = "LOAN_ACCOUNT_CHANGED" # payload: customer_id, loan_account_id, change
+CUSTOMER_PROFILE_CHANGED = "CUSTOMER_PROFILE_CHANGED" # payload: customer_id
+FINANCIAL_TRANSACTION_COMMITTED = "FINANCIAL_TRANSACTION_COMMITTED" # payload: transaction (dict of plain values, see transaction_event_payload)
+
+EventHandler = Callable[[Dict[str, Any]], None]
+
+_handlers: Dict[str, List[EventHandler]] = defaultdict(list)
+_handlers_lock = threading.Lock()
+
+
+def subscribe(event_type: str, handler: EventHandler) -> None:
+    with _handlers_lock:
+        if handler not in _handlers[event_type]:
+            _handlers[event_type].append(handler)
+
+def unsubscribe(event_type: str, handler: EventHandler) -> None:
+    with _handlers_lock:
+        if handler in _handlers[event_type]:
+            _handlers[event_type].remove(handler)
+
+def publish(event_type: str, **payload: Any) -> None:
+    with _handlers_lock:
+        handlers = list(_handlers.get(event_type, ()))
+    event = dict(payload, event_type=event_type)
+    for handler in handlers:
+        try:
+            handler(event)
+        except Exception as e:
+            print(f"Event handler {getattr(handler, '__name__', handler)} failed for {event_type}: {e}")
+
+
+_PENDING_KEY = "event_bus_pending"
+
+def publish_after_commit(db, event_type: str, **payload: Any) -> None:
+    """
+    Defers publishing until the session commits (dropped on rollback), so subscribers that re-read the
+    database see the new state. For code paths that flush inside a larger transaction whose commit is
+    owned by the caller, e.g. ledger postings.
+    """
+    pending = db.info.get(_PENDING_KEY)
+    if pending is None:
+        from sqlalchemy import event as sa_event
+        pending = db.info[_PENDING_KEY] = []
+
+        def _flush_pending(session):
+            events = list(session.info.get(_PENDING_KEY) or ())
+            session.info[_PENDING_KEY] = []
+            for queued_type, queued_payload in events:
+                publish(queued_type, **queued_payload)
+
+        def _discard_pending(session):
+            session.info[_PENDING_KEY] = []
+
+        sa_event.listen(db, "after_commit", _flush_pending)
+        sa_event.listen(db, "after_rollback", _discard_pending)
+    pending.append((event_type, payload))
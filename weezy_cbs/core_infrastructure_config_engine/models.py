@@ -26,7 +26,7 @@ class Branch(Base):
     opening_date = Column(Date, nullable=True)
     branch_manager_user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
 
-    users = relationship("User", back_populates="branch")
+    users = relationship("User", back_populates="branch", foreign_keys="User.branch_id") # Not branch_manager_user_id
     agents = relationship("Agent", back_populates="supervising_branch")
 
 class Agent(Base):
@@ -62,7 +62,7 @@ class User(Base):
     last_login_at = Column(DateTime(timezone=True), nullable=True)
     branch_id = Column(Integer, ForeignKey("branches.id"), nullable=True)
 
-    branch = relationship("Branch", back_populates="users")
+    branch = relationship("Branch", back_populates="users", foreign_keys=[branch_id])
     roles = relationship("Role", secondary="user_roles", back_populates="users")
 
 class Role(Base):
@@ -0,0 +1,141 @@
+# Authentication hashing service: bcrypt off the event loop, adaptive cost, verified-PIN session tokens
+#
+# bcrypt verification costs tens of milliseconds of CPU. Calling passlib directly from an async FastAPI
+# handler blocks the worker's event loop for that long, stalling every other request. This service runs
+# hash/verify calls on a bounded executor and rejects work beyond a queue limit (back-pressure) instead
+# of letting logins pile up.
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12")) # Raise over time; existing hashes are upgraded on next login
+HASHING_EXECUTOR_KIND = os.getenv("HASHING_EXECUTOR", "thread") # 'thread' (bcrypt releases the GIL) or 'process'
+HASHING_MAX_WORKERS = int(os.getenv("HASHING_MAX_WORKERS", str(os.cpu_count() or 2)))
+HASHING_MAX_QUEUED = int(os.getenv("HASHING_MAX_QUEUED", str(HASHING_MAX_WORKERS * 8))) # In flight + waiting
+
+PIN_SESSION_TTL_SECONDS = int(os.getenv("PIN_SESSION_TTL_SECONDS", "300"))
+PIN_SESSION_SECRET = os.getenv("PIN_SESSION_SECRET", "pin-session-secret-needs-to-be-from-config") # Placeholder: Use environment variables
+
+
+class HashingBackpressureError(Exception):
+    """Raised when the hashing queue is full; callers should answer 503 and let the client retry."""
+    def __init__(self, message="Authentication service busy, please retry shortly."):
+        self.message = message
+        super().__init__(self.message)
+
+
+def _build_context(rounds: int) -> CryptContext:
+    # Hashes below `rounds` are reported by needs_update/verify_and_update and get rehashed.
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds, bcrypt__min_rounds=rounds)
+
+# Worker-side helpers (top level so they can run in a process pool)
+_worker_contexts = {}
+
+def _worker_context(rounds: int) -> CryptContext:
+    context = _worker_contexts.get(rounds)
+    if context is None:
+        context = _worker_contexts[rounds] = _build_context(rounds)
+    return context
+
+def _verify_and_update(rounds: int, secret: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    try:
+        return _worker_context(rounds).verify_and_update(secret, hashed)
+    except (ValueError, TypeError): # Malformed/unknown hash format
+        return False, None
+
+def _hash(rounds: int, secret: str) -> str:
+    return _worker_context(rounds).hash(secret)
+
+
+class PasswordHashingService:
+    def __init__(self, rounds: int = BCRYPT_ROUNDS, executor_kind: str = HASHING_EXECUTOR_KIND,
+                 max_workers: int = HASHING_MAX_WORKERS, max_queued: int = HASHING_MAX_QUEUED):
+        self.rounds = rounds
+        self._executor_kind = executor_kind
+        self._max_workers = max_workers
+        self._executor: Optional[Executor] = None
+        self._executor_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_queued)
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    if self._executor_kind == "process":
+                        self._executor = ProcessPoolExecutor(max_workers=self._max_workers)
+                    else:
+                        self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="auth-hash")
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBackpressureError()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, self.rounds, *args)
+        finally:
+            self._slots.release()
+
+    # --- Async API (use from async handlers/services) ---
+    async def verify_and_update(self, secret: str, hashed: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """Returns (is_valid, new_hash). new_hash is set when the stored hash uses an outdated cost and should be replaced."""
+        if not secret or not hashed:
+            return False, None
+        return await self._run(_verify_and_update, secret, hashed)
+
+    async def verify(self, secret: str, hashed: Optional[str]) -> bool:
+        is_valid, _ = await self.verify_and_update(secret, hashed)
+        return is_valid
+
+    async def hash(self, secret: str) -> str:
+        return await self._run(_hash, secret)
+
+    # --- Sync API (for code paths that are not on the event loop, e.g. scripts/background jobs) ---
+    def verify_and_update_sync(self, secret: str, hashed: Optional[str]) -> Tuple[bool, Optional[str]]:
+        if not secret or not hashed:
+            return False, None
+        return _verify_and_update(self.rounds, secret, hashed)
+
+    def hash_sync(self, secret: str) -> str:
+        return _hash(self.rounds, secret)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+# --- Verified-PIN session tokens ---
+# After a transaction PIN is verified once, the client receives a short-lived signed token. Presenting it
+# on later transfers in the same session skips the bcrypt check. The token is bound to the profile and
+# to the current PIN hash, so changing the PIN invalidates outstanding tokens. Verification is an HMAC, O(1).
+def _pin_session_signature(profile_id: int, expires_at: int, pin_hash: str) -> str:
+    pin_fingerprint = hashlib.sha256(pin_hash.encode("utf-8")).hexdigest()[:16]
+    message = f"{profile_id}:{expires_at}:{pin_fingerprint}".encode("utf-8")
+    return hmac.new(PIN_SESSION_SECRET.encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+def issue_pin_session_token(profile_id: int, pin_hash: str, ttl_seconds: int = PIN_SESSION_TTL_SECONDS) -> str:
+    expires_at = int(time.time()) + ttl_seconds
+    raw = f"{profile_id}:{expires_at}:{_pin_session_signature(profile_id, expires_at, pin_hash)}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def validate_pin_session_token(token: Optional[str], profile_id: int, pin_hash: Optional[str]) -> bool:
+    if not token or not pin_hash:
+        return False
+    try:
+        token_profile_id, expires_at, signature = base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8").split(":")
+        token_profile_id, expires_at = int(token_profile_id), int(expires_at)
+    except (ValueError, UnicodeDecodeError):
+        return False
+    if token_profile_id != profile_id or expires_at < int(time.time()):
+        return False
+    return hmac.compare_digest(signature, _pin_session_signature(profile_id, expires_at, pin_hash))
+
+
+password_hashing_service = PasswordHashingService()
@@ -3,25 +3,27 @@ from typing import List, Optional, Type, Dict, Any
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func, or_
 from fastapi import HTTPException, status
-from passlib.context import CryptContext # For password hashing
 import secrets # For generating API client secrets
 from datetime import datetime, timedelta
 
 from . import models, schemas
+from .password_hashing import password_hashing_service
 # from weezy_cbs.database import SessionLocal # Assuming global session management
 
 # --- Password Hashing & Token Generation ---
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost and the executor used by async callers are configured in password_hashing.py
 # In a real app, JWT_SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES would come from config
 JWT_SECRET_KEY = "your-secret-key-needs-to-be-secure-and-from-config" # Placeholder: Use environment variables
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 # 1 day
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    # Synchronous; async request paths should await password_hashing_service instead.
+    is_valid, _ = password_hashing_service.verify_and_update_sync(plain_password, hashed_password)
+    return is_valid
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return password_hashing_service.hash_sync(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     from jose import jwt # Import here to avoid top-level dependency if not always used
@@ -303,15 +305,19 @@ class UserService(BaseCRUDService):
         )
         return db_user
 
-    def authenticate_user(self, db: Session, username: str, password: str) -> Optional[models.User]:
+    async def authenticate_user(self, db: Session, username: str, password: str) -> Optional[models.User]:
         user = self.get_user_by_username(db, username)
         if not user or not user.is_active: # Also check if user is active
             AuditLogService.create_audit_log_entry(db, username_performing_action=username, action_type="USER_LOGIN_FAIL", entity_type="User", entity_id=username, summary=f"Login failed for user '{username}': User not found or inactive.")
             return None
-        if not verify_password(password, user.hashed_password):
+        # bcrypt runs on the hashing pool; raises HashingBackpressureError when saturated
+        is_valid, upgraded_hash = await password_hashing_service.verify_and_update(password, user.hashed_password)
+        if not is_valid:
             AuditLogService.create_audit_log_entry(db, username_performing_action=username, action_type="USER_LOGIN_FAIL", entity_type="User", entity_id=username, summary=f"Login failed for user '{username}': Invalid password.")
             return None
 
+        if upgraded_hash: # Stored hash used an older cost factor; replace it transparently
+            user.hashed_password = upgraded_hash
         user.last_login_at = datetime.utcnow()
         db.add(user)
         db.commit()
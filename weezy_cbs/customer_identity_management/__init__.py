@@ -3,7 +3,8 @@
 from . import models
 from . import schemas
 from . import services
-from . import api
+# api is imported by main.py directly, so using models/services (e.g. the verification client) doesn't pull in FastAPI
+# routing and the core-infrastructure auth dependencies
 
 # You can define what gets imported when someone does 'from customer_identity_management import *'
 # __all__ = ['models', 'schemas', 'services', 'api']
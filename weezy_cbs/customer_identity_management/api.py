@@ -4,6 +4,9 @@ from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
 
 from . import services, schemas, models
+from weezy_cbs.database import get_db
+from weezy_cbs.core_infrastructure_config_engine.api import get_current_active_superuser
+from weezy_cbs.core_infrastructure_config_engine.models import User as CoreUser # For type hint
 
 router = APIRouter(
     prefix="/customer-identity",
@@ -41,6 +44,19 @@ def create_new_customer(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"An unexpected error occurred: {str(e)}")
 
 
+@router.post("/customers/duplicate-check", response_model=schemas.DuplicateCheckResponse)
+def check_probable_duplicate_customers(
+    customer_in: schemas.CustomerCreate,
+    threshold: float = Query(0.75, ge=0.0, le=1.0),
+    db: Session = Depends(get_db)
+):
+    """
+    Find existing customers that probably match an applicant (name variants, swapped first/last names,
+    reformatted phone numbers). Intended to run before onboarding; does not create anything.
+    """
+    matches = services.find_probable_duplicates(db, customer_in, threshold=threshold)
+    return schemas.DuplicateCheckResponse(probable_duplicates=[schemas.ProbableDuplicateSchema(**m) for m in matches])
+
 @router.get("/customers/{customer_id}", response_model=schemas.CustomerResponse)
 def read_customer_by_id(customer_id: int, db: Session = Depends(get_db)):
     """Retrieve a customer's details by their unique internal ID."""
@@ -246,6 +262,21 @@ def update_customer_overall_kyc_status( # Renamed from update_customer_kyc_detai
         # Log e
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Error updating KYC status: {str(e)}")
 
+@router.post("/customers/reverify", response_model=schemas.BulkReverificationResponse)
+def bulk_reverify_customer_identities(
+    request: schemas.BulkReverificationRequest,
+    current_staff_user: CoreUser = Depends(get_current_active_superuser) # Compliance operation: staff only
+):
+    """
+    Re-verify the BVN/NIN on file for a list of customers against NIBSS/NIMC (bypasses the verification cache).
+    Concurrency towards the external services is bounded by `max_concurrency`. (Compliance operation)
+    """
+    from weezy_cbs.database import SessionLocal # Each worker needs its own session
+    results = services.bulk_reverify_customers(
+        SessionLocal, request.customer_ids, max_concurrency=request.max_concurrency, verified_by_user_id=current_staff_user.username
+    )
+    return schemas.BulkReverificationResponse(results=[schemas.BulkReverificationResultItem(**r) for r in results])
+
 # Removed deactivate_customer_account (DELETE /customers/{customer_id})
 # Deactivation is a complex process, often tied to account closure rules (zero balance, no active loans etc.)
 # It should be a specific service call, e.g., services.request_customer_deactivation() which then updates is_active.
@@ -0,0 +1,277 @@
+# Near-duplicate customer detection using a blocking-key index
+#
+# Instead of comparing an applicant against every customer, each customer is indexed under a few
+# cheap "blocking keys" (phonetic name codes, name-token prefixes, DOB + name, normalized phone).
+# Only customers sharing at least one key with the applicant are loaded and scored.
+# The DOB key uses date_of_birth, or date_of_incorporation for businesses, on both the index and probe side.
+# Changing how keys are computed needs a rebuild: python -m weezy_cbs.customer_identity_management.duplicate_detection
+import re
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from difflib import SequenceMatcher
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+from . import models
+
+KEY_NAME_PHONETIC = "NAME_PHONETIC"
+KEY_NAME_PREFIX = "NAME_PREFIX" # Sorted 3-letter token prefixes: survives misspelt name endings
+KEY_DOB_NAME = "DOB_NAME"
+KEY_PHONE = "PHONE"
+
+MAX_CANDIDATES_PER_CHECK = 200 # Caps the work done for very common names
+DEFAULT_DUPLICATE_SCORE_THRESHOLD = 0.75
+INDEX_BUILD_BATCH_SIZE = 5000
+
+_NAME_TITLES = {"mr", "mrs", "ms", "miss", "dr", "chief", "alhaji", "alhaja", "engr", "prof", "sir", "hon"}
+_CORPORATE_SUFFIXES = {"ltd", "limited", "plc", "nig", "nigeria", "enterprises", "ventures", "co", "company", "inc"}
+
+
+# --- Normalization ---
+def normalize_name_tokens(*parts: Optional[str]) -> List[str]:
+    """Lower-cases, strips accents/punctuation and honorifics, and splits names into tokens."""
+    text = " ".join(p for p in parts if p)
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii").lower()
+    tokens = re.findall(r"[a-z]+", text)
+    return [t for t in tokens if t not in _NAME_TITLES and t not in _CORPORATE_SUFFIXES]
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """Reduces Nigerian numbers to their 10 significant digits (drops +234 / 234 / 0 prefixes)."""
+    if not phone:
+        return None
+    digits = re.sub(r"\D", "", phone)
+    if digits.startswith("234") and len(digits) > 10:
+        digits = digits[3:]
+    digits = digits.lstrip("0")
+    return digits[-10:] if len(digits) >= 7 else None
+
+def soundex(token: str) -> str:
+    """American Soundex code for a single lower-case ASCII token."""
+    if not token:
+        return ""
+    codes = {c: str(d) for d, letters in enumerate(["aeiouyhw", "bfpv", "cgjkqsxz", "dt", "l", "mn", "r"]) for c in letters}
+    first = token[0].upper()
+    result = []
+    previous = codes.get(token[0], "")
+    for char in token[1:]:
+        code = codes.get(char, "")
+        if code and code != "0" and code != previous:
+            result.append(code)
+        if char not in "hw": # h/w do not separate letters with the same code
+            previous = code
+    return (first + "".join(result) + "000")[:4]
+
+
+# --- Blocking keys ---
+def compute_blocking_keys(
+    first_name: Optional[str], last_name: Optional[str], company_name: Optional[str],
+    date_of_birth: Optional[date], phone_number: Optional[str]
+) -> Set[Tuple[str, str]]:
+    """
+    Returns the (key_type, key_value) pairs a customer is indexed under.
+    Name keys are built from sorted tokens so that swapped first/last names land in the same block.
+    `date_of_birth` is the date of incorporation for businesses.
+    """
+    keys: Set[Tuple[str, str]] = set()
+    tokens = normalize_name_tokens(company_name) if company_name and not (first_name or last_name) else normalize_name_tokens(first_name, last_name)
+    tokens = [t for t in tokens if len(t) >= 2]
+
+    if tokens:
+        keys.add((KEY_NAME_PHONETIC, "|".join(sorted(soundex(t) for t in tokens))[:64]))
+        keys.add((KEY_NAME_PREFIX, "|".join(sorted(t[:3] for t in tokens))[:64]))
+        if date_of_birth:
+            dob = date_of_birth.isoformat()
+            for token in tokens: # One key per name token tolerates a misspelling in the other name
+                keys.add((KEY_DOB_NAME, f"{dob}|{soundex(token)}"))
+
+    phone = normalize_phone(phone_number)
+    if phone:
+        keys.add((KEY_PHONE, phone))
+    return keys
+
+def compute_blocking_keys_for_rows(rows: List[Tuple]) -> List[Dict[str, Any]]:
+    """Worker for the index build: rows are (id, first_name, last_name, company_name, date_of_birth or date_of_incorporation, phone_number)."""
+    mappings = []
+    for customer_id, first_name, last_name, company_name, date_of_birth, phone_number in rows:
+        for key_type, key_value in compute_blocking_keys(first_name, last_name, company_name, date_of_birth, phone_number):
+            mappings.append({"customer_id": customer_id, "key_type": key_type, "key_value": key_value})
+    return mappings
+
+
+# --- Index maintenance ---
+def index_customer(db: Session, customer: models.Customer) -> None:
+    """
+    (Re)writes the blocking keys and the normalized phone for one customer. Called from create_customer
+    and update_customer_details; the caller's transaction commits the change.
+    """
+    customer.phone_number_normalized = normalize_phone(customer.phone_number)
+    if customer.id is None:
+        db.flush()
+    db.query(models.CustomerDuplicateBlockingKey).filter(
+        models.CustomerDuplicateBlockingKey.customer_id == customer.id
+    ).delete(synchronize_session=False)
+    keys = compute_blocking_keys(customer.first_name, customer.last_name, customer.company_name,
+                                 customer.date_of_birth or customer.date_of_incorporation, customer.phone_number)
+    db.bulk_insert_mappings(models.CustomerDuplicateBlockingKey, [
+        {"customer_id": customer.id, "key_type": key_type, "key_value": key_value} for key_type, key_value in keys
+    ])
+
+
+# --- Scoring ---
+def _token_sort_similarity(a_tokens: List[str], b_tokens: List[str]) -> float:
+    if not a_tokens or not b_tokens:
+        return 0.0
+    return SequenceMatcher(None, " ".join(sorted(a_tokens)), " ".join(sorted(b_tokens))).ratio()
+
+def score_candidate(
+    applicant: Dict[str, Any], candidate: models.Customer
+) -> Tuple[float, List[str]]:
+    """Scores an applicant (dict of CustomerCreate-style fields) against an existing customer. Returns (score, reasons)."""
+    reasons: List[str] = []
+
+    if applicant.get("bvn") and applicant["bvn"] == candidate.bvn:
+        return 1.0, ["Same BVN"]
+    if applicant.get("nin") and applicant["nin"] == candidate.nin:
+        return 1.0, ["Same NIN"]
+
+    is_business = bool(applicant.get("company_name")) and not (applicant.get("first_name") or applicant.get("last_name"))
+    if is_business:
+        a_tokens = normalize_name_tokens(applicant.get("company_name"))
+        b_tokens = normalize_name_tokens(candidate.company_name)
+        a_dob, b_dob = applicant.get("date_of_incorporation"), candidate.date_of_incorporation
+    else:
+        a_tokens = normalize_name_tokens(applicant.get("first_name"), applicant.get("last_name"))
+        b_tokens = normalize_name_tokens(candidate.first_name, candidate.last_name)
+        a_dob, b_dob = applicant.get("date_of_birth"), candidate.date_of_birth
+
+    name_score = _token_sort_similarity(a_tokens, b_tokens)
+    if name_score >= 0.85:
+        reasons.append(f"Similar name ({name_score:.2f})")
+    elif a_tokens and b_tokens and sorted(soundex(t) for t in a_tokens) == sorted(soundex(t) for t in b_tokens):
+        name_score = max(name_score, 0.85)
+        reasons.append("Phonetically identical name")
+
+    dob_score = 0.0
+    if a_dob and b_dob:
+        if a_dob == b_dob:
+            dob_score = 1.0
+            reasons.append("Same date of birth" if not is_business else "Same incorporation date")
+        elif (a_dob.year, a_dob.day, a_dob.month) == (b_dob.year, b_dob.month, b_dob.day):
+            dob_score = 0.8 # Day and month transposed
+            reasons.append("Date of birth with day/month swapped")
+
+    phone_score = 0.0
+    a_phone, b_phone = normalize_phone(applicant.get("phone_number")), normalize_phone(candidate.phone_number)
+    if a_phone and a_phone == b_phone:
+        phone_score = 1.0
+        reasons.append("Same phone number")
+
+    score = 0.5 * name_score + 0.25 * dob_score + 0.25 * phone_score
+    if phone_score and name_score >= 0.85: # Same phone and name is a duplicate even without DOB
+        score = max(score, 0.9)
+    return round(score, 4), reasons
+
+
+# --- Lookup ---
+def find_probable_duplicates(
+    db: Session, applicant: Dict[str, Any], threshold: float = DEFAULT_DUPLICATE_SCORE_THRESHOLD,
+    exclude_customer_id: Optional[int] = None, max_candidates: int = MAX_CANDIDATES_PER_CHECK
+) -> List[Dict[str, Any]]:
+    """
+    Returns existing customers that probably refer to the same person/business as `applicant`,
+    highest score first: [{"customer_id", "score", "reasons"}]. Only customers sharing a blocking
+    key with the applicant are loaded, most shared keys first, capped at `max_candidates`.
+    """
+    keys = compute_blocking_keys(
+        applicant.get("first_name"), applicant.get("last_name"), applicant.get("company_name"),
+        applicant.get("date_of_birth") or applicant.get("date_of_incorporation"), applicant.get("phone_number")
+    )
+    if not keys:
+        return []
+
+    key_table = models.CustomerDuplicateBlockingKey
+    shared_keys = func.count(key_table.id).label("shared_keys")
+    candidate_query = db.query(key_table.customer_id, shared_keys).filter(
+        or_(*[and_(key_table.key_type == key_type, key_table.key_value == key_value) for key_type, key_value in keys])
+    )
+    if exclude_customer_id is not None:
+        candidate_query = candidate_query.filter(key_table.customer_id != exclude_customer_id)
+    candidate_ids = [row.customer_id for row in candidate_query.group_by(key_table.customer_id).order_by(shared_keys.desc()).limit(max_candidates).all()]
+    if not candidate_ids:
+        return []
+
+    candidates = db.query(models.Customer).filter(models.Customer.id.in_(candidate_ids)).all()
+    matches = []
+    for candidate in candidates:
+        score, reasons = score_candidate(applicant, candidate)
+        if score >= threshold:
+            matches.append({"customer_id": candidate.id, "score": score, "reasons": reasons})
+    matches.sort(key=lambda m: m["score"], reverse=True)
+    return matches
+
+
+# --- One-off index build ---
+def _iter_customer_row_batches(db: Session, batch_size: int) -> Iterable[List[Tuple]]:
+    """Keyset-paginates the customers table as plain tuples (no ORM objects)."""
+    last_id = 0
+    while True:
+        rows = db.query(
+            models.Customer.id, models.Customer.first_name, models.Customer.last_name,
+            models.Customer.company_name, func.coalesce(models.Customer.date_of_birth, models.Customer.date_of_incorporation),
+            models.Customer.phone_number
+        ).filter(models.Customer.id > last_id).order_by(models.Customer.id).limit(batch_size).all()
+        if not rows:
+            return
+        yield [tuple(r) for r in rows]
+        last_id = rows[-1][0]
+
+def build_duplicate_index(
+    session_factory: Callable[[], Session], batch_size: int = INDEX_BUILD_BATCH_SIZE,
+    max_workers: Optional[int] = None
+) -> Dict[str, int]:
+    """
+    One-off job: rebuilds the blocking-key index (and Customer.phone_number_normalized) for the whole customer base.
+    The main process streams customers in id order and bulk-inserts keys; key computation
+    runs in parallel on a process pool. Safe to re-run (existing keys are replaced).
+    The delete and all inserts run in one transaction, so duplicate checks keep using the
+    old index until the rebuild commits (and see it unchanged if the rebuild fails).
+    Usage: python -m weezy_cbs.customer_identity_management.duplicate_detection
+    """
+    db = session_factory()
+    customers_indexed = 0
+    keys_written = 0
+    try:
+        db.query(models.CustomerDuplicateBlockingKey).delete(synchronize_session=False)
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            for mappings_batch, batch in _map_batches(pool, _iter_customer_row_batches(db, batch_size)):
+                db.bulk_insert_mappings(models.CustomerDuplicateBlockingKey, mappings_batch)
+                db.bulk_update_mappings(models.Customer, [{"id": row[0], "phone_number_normalized": normalize_phone(row[5])} for row in batch])
+                customers_indexed += len(batch)
+                keys_written += len(mappings_batch)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return {"customers_indexed": customers_indexed, "keys_written": keys_written}
+
+def _map_batches(pool: ProcessPoolExecutor, batches: Iterable[List[Tuple]], max_pending: int = 4):
+    """Submits batches to the pool keeping at most `max_pending` in flight; yields (mappings, batch) in order."""
+    pending = []
+    for batch in batches:
+        pending.append((pool.submit(compute_blocking_keys_for_rows, batch), batch))
+        if len(pending) >= max_pending:
+            future, done_batch = pending.pop(0)
+            yield future.result(), done_batch
+    for future, done_batch in pending:
+        yield future.result(), done_batch
+
+
+if __name__ == "__main__":
+    from weezy_cbs.database import SessionLocal
+    print("Building customer duplicate-detection index...")
+    print(build_duplicate_index(SessionLocal))
@@ -1,8 +1,10 @@
 # Database models for Customer & Identity Management
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Enum as SQLAlchemyEnum, Date, Text, ForeignKey, Index
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Enum as SQLAlchemyEnum, Date, Text, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
+from weezy_cbs.database import Base # Use the shared Base
+
 import enum
 
 class CBNSupportedAccountTier(enum.Enum): # Aligned with CBN tiers
@@ -41,6 +43,7 @@ class Customer(Base):
 
     email = Column(String, unique=True, index=True, nullable=True) # Email optional for some tiers/customer types
     phone_number = Column(String(15), unique=True, index=True, nullable=False) # Primary phone
+    phone_number_normalized = Column(String(10), index=True, nullable=True) # duplicate_detection.normalize_phone(phone_number); USSD/MSISDN lookups
     # secondary_phone_number = Column(String(15), nullable=True)
 
     date_of_birth = Column(Date, nullable=True) # For individuals
@@ -135,6 +138,41 @@ class KYCAuditLog(Base):
 
     customer = relationship("Customer", back_populates="kyc_audit_logs")
 
+class IdentityVerificationCache(Base):
+    # Persistent cache of NIBSS (BVN) / NIMC (NIN) lookup results, shared by all workers.
+    # Maintained by verification_client.IdentityVerificationClient; rows past expires_at are treated as misses.
+    __tablename__ = "identity_verification_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    service_name = Column(String(20), nullable=False) # 'NIBSS_BVN' or 'NIMC_NIN'
+    identifier = Column(String(20), nullable=False) # The BVN or NIN looked up
+
+    is_valid = Column(Boolean, nullable=False)
+    message = Column(String, nullable=True)
+    response_data_json = Column(Text, nullable=True) # Provider payload (names, DOB, phone, etc.)
+
+    fetched_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+    __table_args__ = (
+        UniqueConstraint('service_name', 'identifier', name='uq_identity_verification_cache_key'),
+    )
+
+class CustomerDuplicateBlockingKey(Base):
+    # Blocking-key index for near-duplicate detection (see duplicate_detection.py).
+    # One row per (customer, key); customers sharing a key form a block of candidates to score.
+    __tablename__ = "customer_duplicate_blocking_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False, index=True)
+    key_type = Column(String(20), nullable=False) # 'NAME_PHONETIC', 'NAME_PREFIX', 'DOB_NAME', 'PHONE'
+    key_value = Column(String(64), nullable=False)
+
+    __table_args__ = (
+        # Also serves key lookups (key_type, key_value prefix)
+        UniqueConstraint('key_type', 'key_value', 'customer_id', name='uq_dup_blocking_key'),
+    )
+
 # Note: To make this runnable with relationships across modules, a shared Base and
 # careful import order or use of string type for ForeignKey targets is needed.
 # For now, ForeignKey("customers.id") assumes "customers" table will be known to this Base.
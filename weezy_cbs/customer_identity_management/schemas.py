@@ -220,6 +220,27 @@ class KYCStatusUpdateRequest(BaseModel): # For admin/system to update verificati
     is_pep_status_override: Optional[bool] = None # Admin overriding PEP status after review
     notes: str = Field(..., description="Reason or audit note for this KYC status update")
 
+class ProbableDuplicateSchema(BaseModel):
+    customer_id: int
+    score: float # 0..1, higher means more likely the same person/business
+    reasons: List[str] = []
+
+class DuplicateCheckResponse(BaseModel):
+    probable_duplicates: List[ProbableDuplicateSchema]
+
+class BulkReverificationRequest(BaseModel):
+    customer_ids: List[int] = Field(..., min_length=1, max_length=10000)
+    max_concurrency: int = Field(8, ge=1, le=64, description="Maximum customers re-verified against NIBSS/NIMC at once")
+
+class BulkReverificationResultItem(BaseModel):
+    customer_id: int
+    bvn_valid: Optional[bool] = None
+    nin_valid: Optional[bool] = None
+    error: Optional[str] = None
+
+class BulkReverificationResponse(BaseModel):
+    results: List[BulkReverificationResultItem]
+
 class PaginatedCustomerResponse(BaseModel):
     items: List[CustomerResponse]
     total: int
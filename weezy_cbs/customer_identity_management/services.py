@@ -1,10 +1,14 @@
 # Service layer for Customer & Identity Management
 from sqlalchemy.orm import Session, joinedload
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import json # For handling JSON in audit logs
 
 from . import models, schemas
+from . import duplicate_detection
+from .verification_client import identity_verification_client, BULK_VERIFICATION_MAX_CONCURRENCY
+from weezy_cbs.core_infrastructure_config_engine import event_bus
 # Enums imported directly from models for use in service logic
 from .models import CBNSupportedAccountTier, CustomerTypeEnum, GenderEnum
 
@@ -93,7 +97,8 @@ def create_customer(db: Session, customer_in: schemas.CustomerCreate, created_by
     db.refresh(db_customer)
 
     _log_kyc_event_detailed(db, customer_id=db_customer.id, event_type="CUSTOMER_CREATED", details_after=customer_in.dict(), changed_by_user_id=created_by_user_id, notes=f"Initial tier set to {determined_tier.value}")
-    db.commit() # Commit log
+    duplicate_detection.index_customer(db, db_customer) # Keep near-duplicate blocking keys current
+    db.commit() # Commit log and index keys
 
     return db_customer
 
@@ -130,99 +135,112 @@ def update_customer_details(db: Session, customer_id: int, customer_in: schemas.
     db.add(db_customer) # Not strictly necessary if instance is already in session and modified
 
     _log_kyc_event_detailed(db, customer_id=db_customer.id, event_type="CUSTOMER_DETAILS_UPDATED", details_before=details_before, details_after=schemas.CustomerResponse.from_orm(db_customer).dict(), changed_by_user_id=updated_by_user_id)
+    duplicate_detection.index_customer(db, db_customer)
     db.commit()
     db.refresh(db_customer)
+    event_bus.publish(event_bus.CUSTOMER_PROFILE_CHANGED, customer_id=db_customer.id)
     return db_customer
 
+def find_probable_duplicates(db: Session, customer_in: schemas.CustomerCreate, threshold: float = duplicate_detection.DEFAULT_DUPLICATE_SCORE_THRESHOLD, exclude_customer_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Near-duplicate check for an applicant (name variants, swapped names, reformatted phone numbers).
+    Only customers sharing a blocking key with the applicant are scored; see duplicate_detection.py.
+    """
+    return duplicate_detection.find_probable_duplicates(db, customer_in.dict(), threshold=threshold, exclude_customer_id=exclude_customer_id)
+
 # --- KYC/AML Services ---
-def _simulate_external_verification(identifier_value: str, service_name: str, customer_phone: Optional[str]=None) -> Dict[str, Any]:
-    """Simulates a call to NIBSS (BVN) or NIMC (NIN)."""
-    # print(f"Simulating {service_name} verification for: {identifier_value}")
-    if "INVALID" in identifier_value.upper():
-        return {"is_valid": False, "message": f"{service_name} not found or invalid.", "data": None}
-
-    # Simulate data returned by NIBSS/NIMC
-    first_name = "VerifiedFirstName"
-    last_name = "VerifiedLastName"
-    dob_str = "1988-08-08"
-
-    if service_name == "NIBSS_BVN":
-        # NIBSS might return slightly different names, phone, DOB than provided initially
-        return {
-            "is_valid": True,
-            "message": "BVN details successfully retrieved.",
-            "data": {
-                "bvn": identifier_value,
-                "firstName": first_name, "lastName": last_name, "middleName": "V.",
-                "dateOfBirth": dob_str, "phoneNumber": customer_phone or "080VERIFIED123",
-                "nationality": "NG", "gender": "Male",
-                # "photoIdBase64": "base64_encoded_image_data_bvn..."
-            }
-        }
-    elif service_name == "NIMC_NIN":
-        return {
-            "is_valid": True,
-            "message": "NIN details successfully retrieved.",
-            "data": {
-                "nin": identifier_value,
-                "firstname": first_name, "surname": last_name, "middlename": "N.",
-                "birthdate": dob_str, "gender": "M",
-                "telephoneno": customer_phone or "090VERIFIED456",
-                # "photo": "base64_encoded_image_data_nin..."
-            }
-        }
-    return {"is_valid": False, "message": "Unknown verification service for simulation.", "data": None}
-
-
-def verify_bvn(db: Session, customer_id: int, bvn_verification_request: schemas.BVNVerificationRequest, verified_by_user_id: str) -> schemas.BVNVerificationResponse:
+def verify_bvn(db: Session, customer_id: int, bvn_verification_request: schemas.BVNVerificationRequest, verified_by_user_id: str, force_refresh: bool = False) -> schemas.BVNVerificationResponse:
     customer = get_customer(db, customer_id)
     if not customer:
         raise NotFoundException(f"Customer with ID {customer_id} not found.")
 
-    # In real scenario: result_dict = nibss_client.verify_bvn(bvn_verification_request.bvn, phone_number=bvn_verification_request.phone_number, ...)
-    simulated_result = _simulate_external_verification(bvn_verification_request.bvn, "NIBSS_BVN", customer.phone_number)
+    # Cached and coalesced NIBSS lookup; force_refresh bypasses the cache (periodic re-verification)
+    try:
+        lookup_result = identity_verification_client.verify_bvn(bvn_verification_request.bvn, db=db, customer_phone=customer.phone_number, force_refresh=force_refresh)
+    except Exception as e:
+        raise ExternalServiceException(f"NIBSS BVN lookup failed: {str(e)}")
 
     details_before = {"bvn": customer.bvn, "is_verified_bvn": customer.is_verified_bvn}
     event_notes = f"BVN verification attempt for {bvn_verification_request.bvn}."
 
-    if simulated_result["is_valid"]:
+    if lookup_result["is_valid"]:
         customer.bvn = bvn_verification_request.bvn # Store the verified BVN
         customer.is_verified_bvn = True
         # Optionally, update customer name/DOB if NIBSS data is considered authoritative and passes matching logic
         # For now, just log the retrieved data.
-        event_notes += f" NIBSS Data: {simulated_result['data']}"
-        _log_kyc_event_detailed(db, customer_id, "BVN_VERIFIED", details_before, {"bvn": customer.bvn, "is_verified_bvn": customer.is_verified_bvn, "nibss_data": simulated_result['data']}, event_notes, verified_by_user_id)
+        event_notes += f" NIBSS Data: {lookup_result['data']}"
+        _log_kyc_event_detailed(db, customer_id, "BVN_VERIFIED", details_before, {"bvn": customer.bvn, "is_verified_bvn": customer.is_verified_bvn, "nibss_data": lookup_result['data']}, event_notes, verified_by_user_id)
         db.commit()
         db.refresh(customer)
-        return schemas.BVNVerificationResponse(is_valid=True, message="BVN verified successfully and customer profile updated.", bvn_data=simulated_result["data"])
+        return schemas.BVNVerificationResponse(is_valid=True, message="BVN verified successfully and customer profile updated.", bvn_data=lookup_result["data"])
     else:
-        _log_kyc_event_detailed(db, customer_id, "BVN_VERIFICATION_FAILED", details_before, details_before, f"{event_notes} Failure: {simulated_result['message']}", verified_by_user_id)
+        if force_refresh and customer.is_verified_bvn: # Re-verification no longer matches: withdraw the flag
+            customer.is_verified_bvn = False
+        _log_kyc_event_detailed(db, customer_id, "BVN_VERIFICATION_FAILED", details_before, {"bvn": customer.bvn, "is_verified_bvn": customer.is_verified_bvn}, f"{event_notes} Failure: {lookup_result['message']}", verified_by_user_id)
         db.commit() # Commit log even on failure
-        return schemas.BVNVerificationResponse(is_valid=False, message=simulated_result["message"], bvn_data=None)
+        return schemas.BVNVerificationResponse(is_valid=False, message=lookup_result["message"], bvn_data=None)
 
-def verify_nin(db: Session, customer_id: int, nin_verification_request: schemas.NINVerificationRequest, verified_by_user_id: str) -> schemas.NINVerificationResponse:
+def verify_nin(db: Session, customer_id: int, nin_verification_request: schemas.NINVerificationRequest, verified_by_user_id: str, force_refresh: bool = False) -> schemas.NINVerificationResponse:
     customer = get_customer(db, customer_id)
     if not customer:
         raise NotFoundException(f"Customer with ID {customer_id} not found.")
 
-    # In real scenario: result_dict = nimc_client.verify_nin(nin_verification_request.nin, ...)
-    simulated_result = _simulate_external_verification(nin_verification_request.nin, "NIMC_NIN", customer.phone_number)
+    # Cached and coalesced NIMC lookup; force_refresh bypasses the cache (periodic re-verification)
+    try:
+        lookup_result = identity_verification_client.verify_nin(nin_verification_request.nin, db=db, customer_phone=customer.phone_number, force_refresh=force_refresh)
+    except Exception as e:
+        raise ExternalServiceException(f"NIMC NIN lookup failed: {str(e)}")
 
     details_before = {"nin": customer.nin, "is_verified_nin": customer.is_verified_nin}
     event_notes = f"NIN verification attempt for {nin_verification_request.nin}."
 
-    if simulated_result["is_valid"]:
+    if lookup_result["is_valid"]:
         customer.nin = nin_verification_request.nin
         customer.is_verified_nin = True
-        event_notes += f" NIMC Data: {simulated_result['data']}"
-        _log_kyc_event_detailed(db, customer_id, "NIN_VERIFIED", details_before, {"nin": customer.nin, "is_verified_nin": customer.is_verified_nin, "nimc_data": simulated_result['data']}, event_notes, verified_by_user_id)
+        event_notes += f" NIMC Data: {lookup_result['data']}"
+        _log_kyc_event_detailed(db, customer_id, "NIN_VERIFIED", details_before, {"nin": customer.nin, "is_verified_nin": customer.is_verified_nin, "nimc_data": lookup_result['data']}, event_notes, verified_by_user_id)
         db.commit()
         db.refresh(customer)
-        return schemas.NINVerificationResponse(is_valid=True, message="NIN verified successfully and customer profile updated.", nin_data=simulated_result["data"])
+        return schemas.NINVerificationResponse(is_valid=True, message="NIN verified successfully and customer profile updated.", nin_data=lookup_result["data"])
     else:
-        _log_kyc_event_detailed(db, customer_id, "NIN_VERIFICATION_FAILED", details_before, details_before, f"{event_notes} Failure: {simulated_result['message']}", verified_by_user_id)
+        if force_refresh and customer.is_verified_nin: # Re-verification no longer matches: withdraw the flag
+            customer.is_verified_nin = False
+        _log_kyc_event_detailed(db, customer_id, "NIN_VERIFICATION_FAILED", details_before, {"nin": customer.nin, "is_verified_nin": customer.is_verified_nin}, f"{event_notes} Failure: {lookup_result['message']}", verified_by_user_id)
         db.commit()
-        return schemas.NINVerificationResponse(is_valid=False, message=simulated_result["message"], nin_data=None)
+        return schemas.NINVerificationResponse(is_valid=False, message=lookup_result["message"], nin_data=None)
+
+def bulk_reverify_customers(
+    session_factory: Callable[[], Session], customer_ids: List[int],
+    max_concurrency: int = BULK_VERIFICATION_MAX_CONCURRENCY, verified_by_user_id: str = "SYSTEM_REVERIFICATION"
+) -> List[Dict[str, Any]]:
+    """
+    Re-verifies the BVN/NIN on file for each customer against NIBSS/NIMC (bypassing the result cache),
+    with at most `max_concurrency` customers in flight. Each worker uses its own session from
+    `session_factory` (e.g. database.SessionLocal). Returns one summary dict per customer, in input order.
+    """
+    def _reverify_one(customer_id: int) -> Dict[str, Any]:
+        db = session_factory()
+        summary: Dict[str, Any] = {"customer_id": customer_id}
+        try:
+            customer = get_customer(db, customer_id)
+            if not customer:
+                summary["error"] = "Customer not found."
+                return summary
+            if customer.bvn:
+                summary["bvn_valid"] = verify_bvn(db, customer_id, schemas.BVNVerificationRequest(bvn=customer.bvn), verified_by_user_id, force_refresh=True).is_valid
+            if customer.nin:
+                summary["nin_valid"] = verify_nin(db, customer_id, schemas.NINVerificationRequest(nin=customer.nin), verified_by_user_id, force_refresh=True).is_valid
+            if not customer.bvn and not customer.nin:
+                summary["error"] = "No BVN or NIN on file."
+        except Exception as e:
+            db.rollback()
+            summary["error"] = str(e)
+        finally:
+            db.close()
+        return summary
+
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+        return list(pool.map(_reverify_one, customer_ids))
 
 def update_customer_kyc_status(db: Session, customer_id: int, kyc_update: schemas.KYCStatusUpdateRequest, updated_by_user_id: str) -> models.Customer:
     customer = get_customer(db, customer_id)
@@ -0,0 +1,285 @@
+# Cached and coalesced client for BVN (NIBSS) and NIN (NIMC) identity lookups
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models
+
+SERVICE_NIBSS_BVN = "NIBSS_BVN"
+SERVICE_NIMC_NIN = "NIMC_NIN"
+
+# --- Cache TTLs ---
+# CBN KYC regulations allow a successful BVN/NIN match to be relied on until the next periodic
+# KYC refresh, so positive results are kept for the refresh window. "Not found" answers are kept
+# briefly only: new NIBSS/NIMC enrolments propagate within hours and a customer must be able to retry.
+# Provider/network errors are never cached.
+VERIFIED_RESULT_TTL = timedelta(days=int(os.getenv("IDENTITY_VERIFIED_RESULT_TTL_DAYS", "30")))
+NOT_FOUND_RESULT_TTL = timedelta(minutes=int(os.getenv("IDENTITY_NOT_FOUND_RESULT_TTL_MINUTES", "60")))
+LOCAL_CACHE_MAX_ENTRIES = int(os.getenv("IDENTITY_LOCAL_CACHE_MAX_ENTRIES", "50000"))
+BULK_VERIFICATION_MAX_CONCURRENCY = int(os.getenv("IDENTITY_BULK_MAX_CONCURRENCY", "8"))
+
+
+# --- Providers ---
+class IdentityVerificationProvider:
+    """Interface for the external identity services. Returns {"is_valid", "message", "data"}."""
+    def lookup(self, service_name: str, identifier: str, customer_phone: Optional[str] = None) -> Dict[str, Any]:
+        raise NotImplementedError
+
+class StubIdentityVerificationProvider(IdentityVerificationProvider):
+    """
+    Local stand-in for NIBSS/NIMC used in development and tests.
+    Identifiers containing 'INVALID' are reported as not found. `latency_seconds` simulates the
+    round trip and `call_count` records how many lookups actually reached the "external" service.
+    """
+    def __init__(self, latency_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+        self.call_count = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, service_name: str, identifier: str, customer_phone: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            self.call_count += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+        if "INVALID" in identifier.upper():
+            return {"is_valid": False, "message": f"{service_name} not found or invalid.", "data": None}
+
+        # Simulate data returned by NIBSS/NIMC
+        first_name = "VerifiedFirstName"
+        last_name = "VerifiedLastName"
+        dob_str = "1988-08-08"
+
+        if service_name == SERVICE_NIBSS_BVN:
+            # NIBSS might return slightly different names, phone, DOB than provided initially
+            return {
+                "is_valid": True,
+                "message": "BVN details successfully retrieved.",
+                "data": {
+                    "bvn": identifier,
+                    "firstName": first_name, "lastName": last_name, "middleName": "V.",
+                    "dateOfBirth": dob_str, "phoneNumber": customer_phone or "080VERIFIED123",
+                    "nationality": "NG", "gender": "Male",
+                }
+            }
+        elif service_name == SERVICE_NIMC_NIN:
+            return {
+                "is_valid": True,
+                "message": "NIN details successfully retrieved.",
+                "data": {
+                    "nin": identifier,
+                    "firstname": first_name, "surname": last_name, "middlename": "N.",
+                    "birthdate": dob_str, "gender": "M",
+                    "telephoneno": customer_phone or "090VERIFIED456",
+                }
+            }
+        return {"is_valid": False, "message": "Unknown verification service for simulation.", "data": None}
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+def _as_utc(value: datetime) -> datetime:
+    # expires_at is timezone-aware; SQLite hands it back naive (stored as UTC), PostgreSQL aware
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+# --- Single-flight ---
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs `fn`, everyone else
+    arriving while it is in flight waits for and shares its result (or exception).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Returns (result, shared). `shared` is True when the result came from another caller's call."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not is_leader:
+            return future.result(), True
+
+        try:
+            result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+
+# --- Client ---
+class IdentityVerificationClient:
+    """
+    Front door for BVN/NIN lookups.
+    Lookup order: in-process LRU -> IdentityVerificationCache table -> provider (single-flighted per identifier).
+    `db` is optional; without it only the in-process cache is used.
+    """
+    def __init__(self, provider: IdentityVerificationProvider, local_cache_max_entries: int = LOCAL_CACHE_MAX_ENTRIES):
+        self.provider = provider
+        self._local_cache: "OrderedDict[Tuple[str, str], Tuple[datetime, Dict[str, Any]]]" = OrderedDict()
+        self._local_cache_max_entries = local_cache_max_entries
+        self._cache_lock = threading.Lock()
+        self._single_flight = SingleFlight()
+        self.stats = {"local_hits": 0, "persistent_hits": 0, "provider_calls": 0, "coalesced": 0}
+
+    def _incr(self, stat: str) -> None:
+        with self._cache_lock:
+            self.stats[stat] += 1
+
+    def set_provider(self, provider: IdentityVerificationProvider) -> None:
+        self.provider = provider
+        self.clear_local_cache()
+
+    def clear_local_cache(self) -> None:
+        with self._cache_lock:
+            self._local_cache.clear()
+
+    def _ttl_for(self, result: Dict[str, Any]) -> timedelta:
+        return VERIFIED_RESULT_TTL if result.get("is_valid") else NOT_FOUND_RESULT_TTL
+
+    def _get_local(self, key: Tuple[str, str], now: datetime) -> Optional[Dict[str, Any]]:
+        with self._cache_lock:
+            entry = self._local_cache.get(key)
+            if entry is None:
+                return None
+            expires_at, result = entry
+            if expires_at <= now:
+                del self._local_cache[key]
+                return None
+            self._local_cache.move_to_end(key)
+            return result
+
+    def _put_local(self, key: Tuple[str, str], result: Dict[str, Any], expires_at: datetime) -> None:
+        with self._cache_lock:
+            self._local_cache[key] = (expires_at, result)
+            self._local_cache.move_to_end(key)
+            while len(self._local_cache) > self._local_cache_max_entries:
+                self._local_cache.popitem(last=False)
+
+    def _get_persistent(self, db: Session, key: Tuple[str, str], now: datetime) -> Optional[Tuple[Dict[str, Any], datetime]]:
+        row = db.query(models.IdentityVerificationCache).filter(
+            models.IdentityVerificationCache.service_name == key[0],
+            models.IdentityVerificationCache.identifier == key[1],
+            models.IdentityVerificationCache.expires_at > now
+        ).first()
+        if not row:
+            return None
+        result = {
+            "is_valid": row.is_valid,
+            "message": row.message,
+            "data": json.loads(row.response_data_json) if row.response_data_json else None,
+        }
+        return result, _as_utc(row.expires_at)
+
+    def _put_persistent(self, db: Session, key: Tuple[str, str], result: Dict[str, Any], fetched_at: datetime, expires_at: datetime) -> None:
+        values = {
+            "is_valid": bool(result.get("is_valid")),
+            "message": result.get("message"),
+            "response_data_json": json.dumps(result.get("data"), default=str) if result.get("data") is not None else None,
+            "fetched_at": fetched_at,
+            "expires_at": expires_at,
+        }
+        query = db.query(models.IdentityVerificationCache).filter(
+            models.IdentityVerificationCache.service_name == key[0],
+            models.IdentityVerificationCache.identifier == key[1]
+        )
+        row = query.first()
+        if not row:
+            try:
+                with db.begin_nested():
+                    db.add(models.IdentityVerificationCache(service_name=key[0], identifier=key[1], **values))
+                return
+            except IntegrityError:
+                # Another worker inserted the same key between our SELECT and INSERT; update its row instead
+                row = query.first()
+        for name, value in values.items():
+            setattr(row, name, value)
+        # Commit is left to the caller's transaction (verify_bvn/verify_nin commit with their KYC log)
+
+    def lookup(
+        self, service_name: str, identifier: str, db: Optional[Session] = None,
+        customer_phone: Optional[str] = None, force_refresh: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Returns the provider result dict for `identifier`. `force_refresh` skips both caches
+        (used by periodic re-verification) but is still coalesced with concurrent lookups.
+        """
+        key = (service_name, identifier)
+        now = _utcnow()
+
+        if not force_refresh:
+            cached = self._get_local(key, now)
+            if cached is not None:
+                self._incr("local_hits")
+                return cached
+            if db is not None:
+                persisted = self._get_persistent(db, key, now)
+                if persisted is not None:
+                    self._incr("persistent_hits")
+                    result, expires_at = persisted
+                    self._put_local(key, result, expires_at)
+                    return result
+
+        def _fetch() -> Dict[str, Any]:
+            self._incr("provider_calls")
+            result = self.provider.lookup(service_name, identifier, customer_phone)
+            fetched_at = _utcnow()
+            expires_at = fetched_at + self._ttl_for(result)
+            self._put_local(key, result, expires_at)
+            if db is not None:
+                self._put_persistent(db, key, result, fetched_at, expires_at)
+            return result
+
+        result, shared = self._single_flight.do(key, _fetch)
+        if shared:
+            self._incr("coalesced")
+        return result
+
+    def verify_bvn(self, bvn: str, db: Optional[Session] = None, customer_phone: Optional[str] = None, force_refresh: bool = False) -> Dict[str, Any]:
+        return self.lookup(SERVICE_NIBSS_BVN, bvn, db=db, customer_phone=customer_phone, force_refresh=force_refresh)
+
+    def verify_nin(self, nin: str, db: Optional[Session] = None, customer_phone: Optional[str] = None, force_refresh: bool = False) -> Dict[str, Any]:
+        return self.lookup(SERVICE_NIMC_NIN, nin, db=db, customer_phone=customer_phone, force_refresh=force_refresh)
+
+    def bulk_lookup(
+        self, items: Iterable[Tuple[str, str]], max_concurrency: int = BULK_VERIFICATION_MAX_CONCURRENCY,
+        force_refresh: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Looks up many (service_name, identifier) pairs with at most `max_concurrency` provider calls
+        in flight. Results are returned in input order; a failed lookup yields {"is_valid": False, "error": ...}.
+        Uses the in-process cache only; callers that need rows persisted should go through
+        services.bulk_reverify_customers, which gives each worker its own session.
+        """
+        def _one(item: Tuple[str, str]) -> Dict[str, Any]:
+            try:
+                return self.lookup(item[0], item[1], force_refresh=force_refresh)
+            except Exception as e:
+                return {"is_valid": False, "message": "Verification service error.", "data": None, "error": str(e)}
+
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            return list(pool.map(_one, items))
+
+
+# Shared client for the process. Swap in the real NIBSS/NIMC provider at startup with set_provider().
+identity_verification_client = IdentityVerificationClient(provider=StubIdentityVerificationProvider())
@@ -2,7 +2,7 @@ from typing import List, Optional, Any
 
 from fastapi import APIRouter, Depends, HTTPException, status, Body, Header, Request
 from fastapi.security import OAuth2PasswordBearer # For API token auth
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from jose import JWTError, jwt # For decoding JWT
 
 from weezy_cbs.database import get_db
@@ -15,6 +15,8 @@ from .services import (
 # Assuming JWT_SECRET_KEY and ALGORITHM are defined, possibly in services or a config module
 # For now, let's use what's in services, but ideally, this comes from a central config.
 from .services import JWT_SECRET_KEY, ALGORITHM
+from weezy_cbs.core_infrastructure_config_engine.password_hashing import HashingBackpressureError, PIN_SESSION_TTL_SECONDS
+from .token_revocation import token_revocation_index
 
 
 # --- Authentication & Authorization Dependencies for Digital Channels ---
@@ -38,19 +40,16 @@ async def get_current_digital_user_profile(
     except JWTError:
         raise credentials_exception
 
+    # Logged-out sessions: O(1) in-memory check, no SessionLog query (see token_revocation.py)
+    if token_revocation_index.is_revoked(payload.get("jti")):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session expired or invalid", headers={"WWW-Authenticate": "Bearer"})
+
     user_profile = digital_user_profile_service._get_digital_user_profile(db, user_id=user_id) # Use service method
     if user_profile is None:
         raise credentials_exception
     if not user_profile.is_active:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user profile")
 
-    # Optional: Check session validity based on JTI if stored in token and SessionLog
-    # session_jti = payload.get("jti")
-    # if session_jti:
-    #     active_session = db.query(models.SessionLog).filter(models.SessionLog.session_token_jti == session_jti, models.SessionLog.is_active == True).first()
-    #     if not active_session:
-    #         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session expired or invalid")
-
     return user_profile
 
 # Router for digital user profiles and related actions
@@ -78,32 +77,29 @@ async def login_digital_user(
     login_data.ip_address = request.client.host if request.client else "Unknown IP"
     login_data.user_agent = request.headers.get("user-agent", "Unknown User-Agent")
 
-    user_profile = digital_user_profile_service.authenticate_digital_user(db, login_data=login_data)
-    if not user_profile:
+    try:
+        authenticated = await digital_user_profile_service.authenticate_digital_user(db, login_data=login_data)
+    except HashingBackpressureError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=e.message, headers={"Retry-After": "1"})
+    if not authenticated:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password, or account locked/inactive.",
             headers={"WWW-Authenticate": "Bearer"},
         )
-
-    # Create session log entry (already done inside authenticate_digital_user, get JTI if created)
-    active_session = db.query(models.SessionLog)\
-        .filter(models.SessionLog.digital_user_profile_id == user_profile.id, models.SessionLog.is_active == True)\
-        .order_by(models.SessionLog.login_time.desc())\
-        .first()
+    user_profile, session_jti = authenticated # JTI of the SessionLog created for this login
 
     # Standard JWT claims: sub, exp. Add user_profile_id and jti (JWT ID for session tracking)
     token_data = {
         "sub": user_profile.username,
         "user_profile_id": user_profile.id,
-        "jti": active_session.session_token_jti if active_session and active_session.session_token_jti else None
+        "jti": session_jti
     }
     access_token = create_access_token(data=token_data) # Uses core_infra token creation
 
     return schemas.DigitalUserTokenSchema(
         access_token=access_token,
         user_profile=schemas.DigitalUserProfileResponse.from_orm(user_profile),
-        # session_jti=active_session.session_token_jti if active_session else None
     )
 
 @profiles_router.post("/logout")
@@ -117,7 +113,7 @@ async def logout_digital_user(
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[ALGORITHM], options={"verify_exp": False}) # Allow expired for logout
         session_jti = payload.get("jti")
         if session_jti:
-            session_log_service.end_session_log(db, session_jti=session_jti)
+            session_log_service.end_session_log(db, session_jti=session_jti, token_expires_at=payload.get("exp"))
             digital_user_profile_service._audit_log(db, "DIGITAL_LOGOUT", current_profile, f"User logged out, session JTI {session_jti} invalidated.")
             return {"message": "Logout successful, session invalidated."}
     except JWTError:
@@ -164,7 +160,7 @@ async def change_current_user_password(
     db: Session = Depends(get_db),
     current_profile: models.DigitalUserProfile = Depends(get_current_digital_user_profile)
 ):
-    if not digital_user_profile_service.change_password(db, profile_id=current_profile.id, pass_change=pass_change):
+    if not await digital_user_profile_service.change_password(db, profile_id=current_profile.id, pass_change=pass_change):
         # This case should be handled by exceptions within the service for specific errors
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Password change failed.")
     return None
@@ -175,9 +171,24 @@ async def set_current_user_transaction_pin(
     db: Session = Depends(get_db),
     current_profile: models.DigitalUserProfile = Depends(get_current_digital_user_profile)
 ):
-    digital_user_profile_service.set_transaction_pin(db, profile_id=current_profile.id, pin_set=pin_set)
+    await digital_user_profile_service.set_transaction_pin(db, profile_id=current_profile.id, pin_set=pin_set)
     return None
 
+@profiles_router.post("/me/verify-pin", response_model=schemas.PinSessionTokenSchema)
+async def verify_current_user_transaction_pin(
+    pin_verify: schemas.TransactionPinVerifySchema,
+    db: Session = Depends(get_db),
+    current_profile: models.DigitalUserProfile = Depends(get_current_digital_user_profile)
+):
+    """Verifies the transaction PIN once and returns a short-lived token that stands in for it on later transactions."""
+    try:
+        token = await digital_user_profile_service.issue_pin_session(db, profile_id=current_profile.id, pin=pin_verify.pin)
+    except HashingBackpressureError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=e.message, headers={"Retry-After": "1"})
+    if not token:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid transaction PIN.")
+    return schemas.PinSessionTokenSchema(pin_session_token=token, expires_in_seconds=PIN_SESSION_TTL_SECONDS)
+
 # OTP Endpoints (could be part of profiles or separate)
 @profiles_router.post("/otp/request", summary="Request OTP for a specific purpose")
 async def request_otp(
@@ -238,6 +249,15 @@ async def verify_otp(
 
     return {"message": f"OTP verified successfully for {otp_verify.otp_purpose}."}
 
+@profiles_router.post("/password-reset", status_code=status.HTTP_204_NO_CONTENT, summary="Reset password with a PASSWORD_RESET OTP")
+async def reset_password(
+    reset_in: schemas.DigitalUserPasswordResetSchema,
+    db: Session = Depends(get_db)
+):
+    recipient_contact_for_otp_key = "customer_phone_placeholder" # Must match what /otp/request used for sending
+    await digital_user_profile_service.reset_password(db, reset_in=reset_in, recipient_identifier=recipient_contact_for_otp_key)
+    return None
+
 @profiles_router.get("/me/dashboard-summary", response_model=schemas.CustomerDashboardSummaryResponse)
 async def get_customer_dashboard_summary_endpoint(
     db: Session = Depends(get_db),
@@ -366,6 +386,15 @@ async def get_notification_logs(
     return {"items": logs, "total": total, "page": (skip // limit) + 1, "size": limit}
 
 
+@notifications_admin_router.post("/bulk", response_model=schemas.BulkNotificationQueuedResponse, status_code=status.HTTP_202_ACCEPTED)
+async def queue_bulk_notifications(
+    bulk_request: schemas.BulkNotificationRequest,
+    db: Session = Depends(get_db)
+):
+    log_ids = notification_service.queue_notifications(db, notifications=bulk_request.notifications)
+    return schemas.BulkNotificationQueuedResponse(queued_count=len(log_ids), notification_log_ids=log_ids)
+
+
 # Main router for this module to be included in the FastAPI app
 digital_channels_api_router = APIRouter(prefix="/digital-channels")
 digital_channels_api_router.include_router(profiles_router)
@@ -0,0 +1,150 @@
+# Per-customer dashboard snapshot cache with event invalidation and stale-while-revalidate
+#
+# The dashboard summary is the first call after every mobile login and fans out to accounts,
+# transactions and loans. Snapshots are built on first request and then served from memory:
+#   - fresh (younger than DASHBOARD_FRESH_SECONDS, not invalidated): returned as is;
+#   - stale or invalidated, but younger than DASHBOARD_MAX_STALE_SECONDS: returned at once while one
+#     background refresh per customer rebuilds it;
+#   - missing or too old: rebuilt synchronously (concurrent requests for one customer share the build).
+# Ledger postings, loan events and profile changes invalidate entries via the core event bus.
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from weezy_cbs.core_infrastructure_config_engine import event_bus
+
+DASHBOARD_FRESH_SECONDS = int(os.getenv("DASHBOARD_FRESH_SECONDS", "60"))
+DASHBOARD_MAX_STALE_SECONDS = int(os.getenv("DASHBOARD_MAX_STALE_SECONDS", "900"))
+DASHBOARD_CACHE_MAX_ENTRIES = int(os.getenv("DASHBOARD_CACHE_MAX_ENTRIES", "50000"))
+DASHBOARD_REFRESH_WORKERS = int(os.getenv("DASHBOARD_REFRESH_WORKERS", "4"))
+
+
+class _Entry:
+    __slots__ = ("snapshot", "built_at", "generation", "built_generation")
+
+    def __init__(self):
+        self.snapshot: Any = None
+        self.built_at = 0.0
+        self.generation = 0 # Bumped on every invalidation
+        self.built_generation = -1 # Generation the snapshot was built against
+
+
+class DashboardSnapshotCache:
+    """
+    `builder(customer_id)` produces a snapshot and must open its own DB session when called from the
+    background pool. Invalidation bumps a generation counter, so a refresh that started before an
+    invalidation never marks its (possibly pre-posting) result as fresh.
+    """
+    def __init__(self, fresh_seconds: float = DASHBOARD_FRESH_SECONDS, max_stale_seconds: float = DASHBOARD_MAX_STALE_SECONDS,
+                 max_entries: int = DASHBOARD_CACHE_MAX_ENTRIES, refresh_workers: int = DASHBOARD_REFRESH_WORKERS):
+        self.fresh_seconds = fresh_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._builds: Dict[int, Future] = {} # customer_id -> in-flight build (sync or background)
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="dashboard-refresh")
+        self.stats = {"fresh_hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "invalidations": 0}
+
+    def _entry(self, customer_id: int) -> _Entry:
+        entry = self._entries.get(customer_id)
+        if entry is None:
+            entry = self._entries[customer_id] = _Entry()
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(customer_id)
+        return entry
+
+    def invalidate(self, customer_id: Optional[int]) -> None:
+        if customer_id is None:
+            return
+        with self._lock:
+            entry = self._entries.get(customer_id)
+            if entry is not None:
+                entry.generation += 1
+                self.stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _build(self, customer_id: int, builder: Callable[[int], Any]) -> Any:
+        with self._lock:
+            generation = self._entry(customer_id).generation
+        snapshot = builder(customer_id)
+        with self._lock:
+            entry = self._entry(customer_id)
+            entry.snapshot = snapshot
+            entry.built_at = time.monotonic()
+            entry.built_generation = generation # Stays behind entry.generation if invalidated mid-build
+            self._builds.pop(customer_id, None)
+        return snapshot
+
+    def _start_build(self, customer_id: int, builder: Callable[[int], Any], background: bool) -> Future:
+        # Caller holds self._lock
+        future = self._builds.get(customer_id)
+        if future is not None:
+            return future
+        if background:
+            future = self._executor.submit(self._build_logged, customer_id, builder)
+            self.stats["refreshes"] += 1
+        else:
+            future = Future() # Completed by the requesting thread itself
+        self._builds[customer_id] = future
+        return future
+
+    def _build_logged(self, customer_id: int, builder: Callable[[int], Any]) -> Any:
+        try:
+            return self._build(customer_id, builder)
+        except Exception as e: # Keep serving the stale snapshot; next request retries the refresh
+            with self._lock:
+                self._builds.pop(customer_id, None)
+            print(f"Dashboard refresh failed for customer {customer_id}: {e}")
+            return None
+
+    def get(self, customer_id: int, builder: Callable[[int], Any], background_builder: Optional[Callable[[int], Any]] = None) -> Any:
+        """
+        `builder` runs on the calling thread for misses (it may use the request's DB session);
+        `background_builder` (default: builder) runs on the refresh pool for stale hits.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entry(customer_id)
+            age = now - entry.built_at
+            if entry.snapshot is not None and age <= self.max_stale_seconds:
+                if age <= self.fresh_seconds and entry.built_generation == entry.generation:
+                    self.stats["fresh_hits"] += 1
+                else:
+                    self.stats["stale_hits"] += 1
+                    self._start_build(customer_id, background_builder or builder, background=True)
+                return entry.snapshot
+            self.stats["misses"] += 1
+            existing = self._builds.get(customer_id)
+            future = self._start_build(customer_id, builder, background=False)
+        if existing is not None:
+            result = future.result()
+            if result is not None:
+                return result
+            return self._build(customer_id, builder) # The shared build failed; try once on this thread
+        try:
+            snapshot = self._build(customer_id, builder)
+            future.set_result(snapshot)
+            return snapshot
+        except Exception as e:
+            with self._lock:
+                self._builds.pop(customer_id, None)
+            future.set_result(None) # Waiters fall back to building themselves
+            raise e
+
+    def subscribe_to_events(self) -> None:
+        handler = lambda event: self.invalidate(event.get("customer_id"))
+        for event_type in (event_bus.LEDGER_ENTRY_POSTED, event_bus.LOAN_ACCOUNT_CHANGED, event_bus.CUSTOMER_PROFILE_CHANGED):
+            event_bus.subscribe(event_type, handler)
+
+
+dashboard_snapshot_cache = DashboardSnapshotCache()
+dashboard_snapshot_cache.subscribe_to_events()
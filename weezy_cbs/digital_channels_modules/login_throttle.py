@@ -0,0 +1,400 @@
+# Login throttling: sliding-window failed-attempt counters per username, device and IP in a fast store
+#
+# Failed logins used to cost a DigitalUserProfile write + commit each, so credential-stuffing bursts
+# became database write storms. Counters and lockout decisions now live here (in-memory or Redis);
+# the profile row is written only when lock state changes (LoginThrottle.record_failure returns
+# newly_locked=True exactly once per lock). Failed-attempt audit rows go through FailedLoginAuditWriter,
+# which bulk-inserts them off the request path (one commit per batch); lockouts are still audited at once.
+#
+# Counters use the sliding-window-counter approximation: two fixed buckets per key, the previous one
+# weighted by how much of it still overlaps the window. O(1) memory and one round trip per check.
+#
+#   python -m weezy_cbs.digital_channels_modules.login_throttle --rate 10000 --seconds 5
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from .otp_store import OTP_REDIS_URL
+
+LOGIN_THROTTLE_BACKEND = os.getenv("LOGIN_THROTTLE_BACKEND", os.getenv("OTP_STORE_BACKEND", "memory")) # 'memory' or 'redis'
+LOGIN_THROTTLE_REDIS_KEY_PREFIX = "weezy:login:"
+
+# (max failures, window seconds, block seconds) per dimension
+USERNAME_LIMIT = (int(os.getenv("LOGIN_MAX_FAILURES_PER_USERNAME", "5")), 30 * 60, 30 * 60) # Mirrors MAX_LOGIN_ATTEMPTS / ACCOUNT_LOCK_DURATION_MINUTES
+DEVICE_LIMIT = (int(os.getenv("LOGIN_MAX_FAILURES_PER_DEVICE", "20")), 15 * 60, 15 * 60)
+IP_LIMIT = (int(os.getenv("LOGIN_MAX_FAILURES_PER_IP", "100")), 15 * 60, 15 * 60) # Higher: NAT/carrier-grade IPs are shared
+
+LOGIN_AUDIT_BATCH_SIZE = 500
+LOGIN_AUDIT_FLUSH_SECONDS = float(os.getenv("LOGIN_AUDIT_FLUSH_SECONDS", "2"))
+LOGIN_AUDIT_MAX_QUEUED = int(os.getenv("LOGIN_AUDIT_MAX_QUEUED", "100000")) # Bounds memory during an attack
+
+DIMENSION_USERNAME = "user"
+DIMENSION_DEVICE = "device"
+DIMENSION_IP = "ip"
+
+
+class ThrottleDecision:
+    __slots__ = ("allowed", "blocked_dimension", "retry_after_seconds", "newly_locked", "username_failures")
+
+    def __init__(self, allowed: bool = True, blocked_dimension: Optional[str] = None, retry_after_seconds: int = 0,
+                 newly_locked: bool = False, username_failures: int = 0):
+        self.allowed = allowed
+        self.blocked_dimension = blocked_dimension
+        self.retry_after_seconds = retry_after_seconds
+        self.newly_locked = newly_locked # Username lock was set by this call: persist it to the profile
+        self.username_failures = username_failures
+
+
+class LoginThrottleStore:
+    """Interface: sliding-window counters and block markers keyed by '<dimension>:<value>'."""
+    def increment(self, key: str, window_seconds: int, now: float) -> float:
+        """Adds one failure and returns the sliding-window count including it."""
+        raise NotImplementedError
+
+    def reset(self, key: str, window_seconds: int, now: float) -> None:
+        raise NotImplementedError
+
+    def block(self, key: str, until: float, now: float) -> bool:
+        """Sets a block until `until` (epoch seconds). Returns True if the key was not already blocked."""
+        raise NotImplementedError
+
+    def blocked_until(self, key: str, now: float) -> Optional[float]:
+        raise NotImplementedError
+
+    def unblock(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class _Shard:
+    __slots__ = ("lock", "counters", "blocks")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[str, List[float]] = {} # key -> [bucket_index, current_count, previous_count, window]
+        self.blocks: Dict[str, float] = {}
+
+
+class InMemoryLoginThrottleStore(LoginThrottleStore):
+    """Sharded in-process store. Idle counters/blocks are dropped by sweep() (run from a daemon thread)."""
+    def __init__(self, shard_count: int = 32, sweep_interval_seconds: Optional[float] = 60):
+        self._shards = [_Shard() for _ in range(shard_count)]
+        if sweep_interval_seconds:
+            threading.Thread(target=self._sweep_loop, args=(sweep_interval_seconds,), name="login-throttle-sweeper", daemon=True).start()
+
+    def _shard(self, key: str) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def increment(self, key: str, window_seconds: int, now: float) -> float:
+        bucket = int(now // window_seconds)
+        shard = self._shard(key)
+        with shard.lock:
+            counter = shard.counters.get(key)
+            if counter is None:
+                counter = shard.counters[key] = [bucket, 0, 0, window_seconds]
+            elif counter[0] != bucket:
+                counter[2] = counter[1] if counter[0] == bucket - 1 else 0
+                counter[1] = 0
+                counter[0] = bucket
+            counter[1] += 1
+            elapsed_fraction = (now % window_seconds) / window_seconds
+            return counter[1] + counter[2] * (1.0 - elapsed_fraction)
+
+    def reset(self, key: str, window_seconds: int, now: float) -> None:
+        shard = self._shard(key)
+        with shard.lock:
+            shard.counters.pop(key, None)
+
+    def block(self, key: str, until: float, now: float) -> bool:
+        shard = self._shard(key)
+        with shard.lock:
+            current = shard.blocks.get(key)
+            if current is not None and current > now:
+                return False # Already blocked; keep the original expiry
+            shard.blocks[key] = until
+            return True
+
+    def blocked_until(self, key: str, now: float) -> Optional[float]:
+        shard = self._shard(key)
+        with shard.lock:
+            until = shard.blocks.get(key)
+        return until if until and until > now else None
+
+    def unblock(self, key: str) -> None:
+        shard = self._shard(key)
+        with shard.lock:
+            shard.blocks.pop(key, None)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        removed = 0
+        for shard in self._shards:
+            with shard.lock:
+                stale = [k for k, c in shard.counters.items() if int(now // c[3]) > c[0] + 1]
+                for k in stale:
+                    del shard.counters[k]
+                expired = [k for k, until in shard.blocks.items() if until <= now]
+                for k in expired:
+                    del shard.blocks[k]
+                removed += len(stale) + len(expired)
+        return removed
+
+    def _sweep_loop(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            self.sweep()
+
+
+class RedisLoginThrottleStore(LoginThrottleStore):
+    """Shared across workers. Buckets are INCR'd keys with a 2-window TTL; one Lua call per increment."""
+    _INCREMENT_LUA = """
+local current = redis.call('INCR', KEYS[1])
+if current == 1 then redis.call('EXPIRE', KEYS[1], ARGV[1]) end
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+return {current, previous}
+"""
+
+    def __init__(self, redis_client=None, key_prefix: str = LOGIN_THROTTLE_REDIS_KEY_PREFIX):
+        if redis_client is None:
+            try:
+                import redis # Optional dependency, only needed for this backend
+            except ImportError as e:
+                raise RuntimeError("LOGIN_THROTTLE_BACKEND=redis requires the 'redis' package.") from e
+            redis_client = redis.Redis.from_url(OTP_REDIS_URL)
+        self._redis = redis_client
+        self._prefix = key_prefix
+        self._increment = self._redis.register_script(self._INCREMENT_LUA)
+
+    def increment(self, key: str, window_seconds: int, now: float) -> float:
+        bucket = int(now // window_seconds)
+        current, previous = self._increment(
+            keys=[f"{self._prefix}c:{key}:{bucket}", f"{self._prefix}c:{key}:{bucket - 1}"], args=[window_seconds * 2])
+        elapsed_fraction = (now % window_seconds) / window_seconds
+        return int(current) + int(previous) * (1.0 - elapsed_fraction)
+
+    def reset(self, key: str, window_seconds: int, now: float) -> None:
+        bucket = int(now // window_seconds)
+        self._redis.delete(f"{self._prefix}c:{key}:{bucket}", f"{self._prefix}c:{key}:{bucket - 1}")
+
+    def block(self, key: str, until: float, now: float) -> bool:
+        ttl = max(1, int(until - now))
+        return bool(self._redis.set(f"{self._prefix}b:{key}", str(until), ex=ttl, nx=True))
+
+    def blocked_until(self, key: str, now: float) -> Optional[float]:
+        raw = self._redis.get(f"{self._prefix}b:{key}")
+        return float(raw) if raw else None
+
+    def unblock(self, key: str) -> None:
+        self._redis.delete(f"{self._prefix}b:{key}")
+
+
+class LoginThrottle:
+    def __init__(self, store: LoginThrottleStore, username_limit: Tuple[int, int, int] = USERNAME_LIMIT,
+                 device_limit: Tuple[int, int, int] = DEVICE_LIMIT, ip_limit: Tuple[int, int, int] = IP_LIMIT):
+        self.store = store
+        self._limits = {DIMENSION_USERNAME: username_limit, DIMENSION_DEVICE: device_limit, DIMENSION_IP: ip_limit}
+
+    @staticmethod
+    def _keys(username: Optional[str], device_id: Optional[str], ip_address: Optional[str]) -> List[Tuple[str, str]]:
+        keys = []
+        if username:
+            keys.append((DIMENSION_USERNAME, f"{DIMENSION_USERNAME}:{username.lower()}"))
+        if device_id:
+            keys.append((DIMENSION_DEVICE, f"{DIMENSION_DEVICE}:{device_id}"))
+        if ip_address:
+            keys.append((DIMENSION_IP, f"{DIMENSION_IP}:{ip_address}"))
+        return keys
+
+    def check(self, username: Optional[str], device_id: Optional[str] = None, ip_address: Optional[str] = None, now: Optional[float] = None) -> ThrottleDecision:
+        """Pre-authentication gate: no password check or DB access happens for a blocked username/device/IP."""
+        now = time.time() if now is None else now
+        for dimension, key in self._keys(username, device_id, ip_address):
+            until = self.store.blocked_until(key, now)
+            if until:
+                return ThrottleDecision(allowed=False, blocked_dimension=dimension, retry_after_seconds=max(1, int(until - now)))
+        return ThrottleDecision()
+
+    def record_failure(self, username: Optional[str], device_id: Optional[str] = None, ip_address: Optional[str] = None, now: Optional[float] = None) -> ThrottleDecision:
+        now = time.time() if now is None else now
+        decision = ThrottleDecision()
+        for dimension, key in self._keys(username, device_id, ip_address):
+            max_failures, window, block_seconds = self._limits[dimension]
+            count = self.store.increment(key, window, now)
+            if dimension == DIMENSION_USERNAME:
+                decision.username_failures = int(count)
+            if count >= max_failures:
+                newly_blocked = self.store.block(key, now + block_seconds, now)
+                if decision.allowed: # Report the first dimension that blocks
+                    decision.allowed = False
+                    decision.blocked_dimension = dimension
+                    decision.retry_after_seconds = block_seconds
+                if dimension == DIMENSION_USERNAME and newly_blocked:
+                    decision.newly_locked = True
+        return decision
+
+    def record_success(self, username: str, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        self.store.reset(f"{DIMENSION_USERNAME}:{username.lower()}", self._limits[DIMENSION_USERNAME][1], now)
+
+    def unlock_username(self, username: str) -> None:
+        """Admin unlock: clears the block and counter (the caller also clears DigitalUserProfile.locked_until)."""
+        self.store.unblock(f"{DIMENSION_USERNAME}:{username.lower()}")
+        self.record_success(username)
+
+
+class FailedLoginAuditWriter:
+    """
+    Background writer for failed-login audit rows. Requests only enqueue; a daemon thread bulk-inserts
+    batches into audit_logs with its own DB session and one commit per batch. When the queue is full
+    rows are dropped and counted, and the next batch carries one row recording how many were lost.
+    """
+    def __init__(self, session_factory=None, batch_size: int = LOGIN_AUDIT_BATCH_SIZE,
+                 flush_seconds: float = LOGIN_AUDIT_FLUSH_SECONDS, max_queued: int = LOGIN_AUDIT_MAX_QUEUED):
+        self._session_factory = session_factory
+        self._batch_size = batch_size
+        self._flush_seconds = flush_seconds
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queued)
+        self._dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+
+    def record(self, action_type: str, username: Optional[str], summary: str, entity_id: Optional[str] = None, ip_address: Optional[str] = None) -> None:
+        row = {
+            "timestamp": datetime.utcnow(), "username_performing_action": (username or "UNKNOWN_DIGITAL_USER")[:50],
+            "action_type": action_type, "entity_type": "DigitalUserProfile", "entity_id": entity_id or "N/A",
+            "summary": summary, "ip_address": ip_address, "status": "FAILURE",
+        }
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._dropped_lock:
+                self._dropped += 1
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="login-audit-writer", daemon=True)
+                    self._worker.start()
+
+    def _take_dropped_row(self) -> Optional[Dict[str, Any]]:
+        with self._dropped_lock:
+            dropped, self._dropped = self._dropped, 0
+        if not dropped:
+            return None
+        return {"timestamp": datetime.utcnow(), "username_performing_action": "SYSTEM", "action_type": "DIGITAL_LOGIN_FAIL_DROPPED",
+                "entity_type": "DigitalUserProfile", "entity_id": "N/A", "ip_address": None, "status": "FAILURE",
+                "summary": f"{dropped} failed-login audit rows dropped (audit queue full)."}
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self._flush_seconds
+            while len(batch) < self._batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.write_batch(batch)
+            except Exception as e: # Never kill the writer thread
+                print(f"Failed-login audit write failed for {len(batch)} rows: {e}")
+
+    def write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        from sqlalchemy import insert
+        from weezy_cbs.core_infrastructure_config_engine import models as core_models # Lazy: the throttle itself has no ORM dependency
+        dropped_row = self._take_dropped_row()
+        if dropped_row:
+            batch = batch + [dropped_row]
+        session_factory = self._session_factory
+        if session_factory is None:
+            from weezy_cbs.database import SessionLocal
+            session_factory = SessionLocal
+        db = session_factory()
+        try:
+            db.execute(insert(core_models.AuditLog), batch)
+            db.commit()
+        finally:
+            db.close()
+
+    def drain(self) -> None:
+        """Writes everything queued so far on the calling thread (shutdown hooks, tests)."""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for start in range(0, len(batch), self._batch_size):
+            self.write_batch(batch[start:start + self._batch_size])
+
+
+def build_login_throttle_store() -> LoginThrottleStore:
+    return RedisLoginThrottleStore() if LOGIN_THROTTLE_BACKEND == "redis" else InMemoryLoginThrottleStore()
+
+
+class _CountingAuditWriter(FailedLoginAuditWriter):
+    """Benchmark stand-in: counts batches (one commit each) instead of writing them."""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.rows = 0
+        self.commits = 0
+
+    def write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        self.rows += len(batch)
+        self.commits += 1
+
+
+def run_benchmark(rate_per_second: int = 10000, seconds: int = 5, targeted_usernames: int = 2000,
+                  attacker_ips: int = 200, seed: int = 7) -> Dict[str, float]:
+    """
+    Simulates a credential-stuffing burst of `rate_per_second` failed attempts on a simulated clock and
+    reports how fast the throttle decides them (wall time), how many would still reach the password
+    check / cause a profile write, and the audit rows and commits they cost.
+    """
+    import random
+    rnd = random.Random(seed)
+    throttle = LoginThrottle(InMemoryLoginThrottleStore(sweep_interval_seconds=None))
+    audit_writer = _CountingAuditWriter(max_queued=rate_per_second * seconds + 1)
+    total = rate_per_second * seconds
+    start_clock = 1_700_000_000.0
+    reached_password_check = profile_writes = blocked = 0
+    started = time.perf_counter()
+    for i in range(total):
+        now = start_clock + i / rate_per_second
+        username = f"user{rnd.randrange(targeted_usernames)}"
+        ip_index = rnd.randrange(attacker_ips)
+        ip_address = f"10.0.{ip_index // 256}.{ip_index % 256}"
+        if not throttle.check(username, None, ip_address, now=now).allowed:
+            blocked += 1
+            continue
+        reached_password_check += 1
+        audit_writer.record("DIGITAL_LOGIN_FAIL", username, "Login attempt failed: Incorrect password.", ip_address=ip_address)
+        if throttle.record_failure(username, None, ip_address, now=now).newly_locked:
+            profile_writes += 1 # Plus one immediate DIGITAL_ACCOUNT_LOCKED audit commit
+    elapsed = time.perf_counter() - started
+    audit_writer.drain()
+    return {
+        "attempts": total, "simulated_rate_per_s": rate_per_second, "wall_s": elapsed,
+        "decisions_per_s": total / elapsed if elapsed else 0.0,
+        "blocked_before_password_check": blocked, "reached_password_check": reached_password_check,
+        "profile_writes": profile_writes, "profile_writes_without_throttle": reached_password_check, # One row write per failed password check
+        "audit_rows": audit_writer.rows + profile_writes,
+        "audit_commits": audit_writer.commits + profile_writes, # Batched failure rows + one per lockout
+        "audit_commits_without_batching": reached_password_check + profile_writes, # One commit per failed attempt
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Login throttle benchmark (simulated failed-login burst).")
+    parser.add_argument("--rate", type=int, default=10000)
+    parser.add_argument("--seconds", type=int, default=5)
+    parser.add_argument("--usernames", type=int, default=2000)
+    parser.add_argument("--ips", type=int, default=200)
+    args = parser.parse_args()
+    print(run_benchmark(args.rate, args.seconds, targeted_usernames=args.usernames, attacker_ips=args.ips))
@@ -0,0 +1,489 @@
+# Batched, rate-limited notification dispatcher
+#
+# Bulk payment alerts and campaigns produce hundreds of thousands of messages. Instead of sending and
+# committing one NotificationLog per message on the request path, messages are:
+#   1. bulk-inserted into notification_logs as QUEUED (one INSERT ... RETURNING per enqueue call),
+#   2. queued per provider kind (SMS / EMAIL / PUSH),
+#   3. sent in provider-sized batches by one worker thread per provider, throttled by a token bucket,
+#   4. retried with exponential backoff + jitter on retryable failures,
+#   5. marked SENT/FAILED (or RETRYING) with one bulk UPDATE per batch.
+# Rows still QUEUED/RETRYING when a process stops (crash, or redeploy past the drain timeout) are re-enqueued
+# by recover_pending() on the next startup, so delivery is at-least-once.
+# Providers are pluggable (NotificationProvider); the Fake* providers simulate latency/failures so
+# throughput can be measured offline:
+#   python -m weezy_cbs.digital_channels_modules.notification_dispatcher --messages 100000
+import heapq
+import itertools
+import os
+import queue
+import random
+import string
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+PROVIDER_SMS = "SMS"
+PROVIDER_EMAIL = "EMAIL"
+PROVIDER_PUSH = "PUSH"
+
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", "5"))
+NOTIFICATION_RETRY_BASE_SECONDS = float(os.getenv("NOTIFICATION_RETRY_BASE_SECONDS", "2"))
+NOTIFICATION_RETRY_MAX_SECONDS = float(os.getenv("NOTIFICATION_RETRY_MAX_SECONDS", "300"))
+NOTIFICATION_BATCH_WAIT_SECONDS = 0.05 # How long a worker waits to fill a batch before sending a partial one
+# With several app processes on one database, enable recovery on one of them only
+NOTIFICATION_RECOVER_ON_STARTUP = os.getenv("NOTIFICATION_RECOVER_ON_STARTUP", "true").lower() == "true"
+NOTIFICATION_RECOVERY_BATCH_SIZE = 5000
+NOTIFICATION_SHUTDOWN_DRAIN_SECONDS = float(os.getenv("NOTIFICATION_SHUTDOWN_DRAIN_SECONDS", "10"))
+RECOVERABLE_STATUSES = ("QUEUED", "RETRYING")
+
+# Per-provider defaults; override with e.g. NOTIFICATION_SMS_RATE_PER_SECOND
+PROVIDER_DEFAULTS = {
+    PROVIDER_SMS: {"rate_per_second": 200.0, "burst": 400, "max_batch_size": 100},
+    PROVIDER_EMAIL: {"rate_per_second": 100.0, "burst": 200, "max_batch_size": 50},
+    PROVIDER_PUSH: {"rate_per_second": 1000.0, "burst": 2000, "max_batch_size": 500},
+}
+
+def _provider_setting(kind: str, name: str, cast):
+    return cast(os.getenv(f"NOTIFICATION_{kind}_{name.upper()}", PROVIDER_DEFAULTS[kind][name]))
+
+
+def resolve_provider_kind(channel_type: Any, message_type: Optional[str]) -> Optional[str]:
+    """Maps (channel, message type) to a provider kind, following the routing trigger_notification has always used."""
+    channel = getattr(channel_type, "value", channel_type)
+    message_type = (message_type or "").upper()
+    if channel in ("SMS_BANKING", "USSD"): # USSD sends SMS receipts
+        return PROVIDER_SMS
+    if "EMAIL" in message_type and channel in ("INTERNET_BANKING", "MOBILE_BANKING_APP"):
+        return PROVIDER_EMAIL
+    if "PUSH" in message_type and channel == "MOBILE_BANKING_APP":
+        return PROVIDER_PUSH
+    return None
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens/second, at most `capacity` banked."""
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """Takes tokens if available and returns 0; otherwise returns the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1, stop_event: Optional[threading.Event] = None) -> bool:
+        tokens = min(tokens, self.capacity) # A batch larger than the burst still drains at `rate`
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0.0:
+                return True
+            if stop_event is not None and stop_event.wait(wait):
+                return False
+            if stop_event is None:
+                time.sleep(wait)
+
+
+# --- Providers ---
+class NotificationProvider:
+    """
+    Interface for a delivery provider. send_batch receives message dicts (log_id, recipient, subject, content)
+    and returns one result per message, in order: {"success", "external_id", "error", "retryable"}.
+    Raising from send_batch marks the whole batch as a retryable failure.
+    """
+    kind: str = ""
+    name: str = ""
+    max_batch_size: int = 1
+    rate_per_second: float = 10.0
+    burst: int = 10
+
+    def send_batch(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+
+class FakeNotificationProvider(NotificationProvider):
+    """Simulated provider: fixed per-call latency plus per-message latency, random transient/permanent failures."""
+    def __init__(self, kind: str, batch_latency_seconds: float = 0.02, per_message_latency_seconds: float = 0.0,
+                 transient_failure_rate: float = 0.0, permanent_failure_rate: float = 0.0, seed: Optional[int] = None,
+                 rate_per_second: Optional[float] = None):
+        self.kind = kind
+        self.name = f"fake_{kind.lower()}"
+        self.max_batch_size = _provider_setting(kind, "max_batch_size", int)
+        self.rate_per_second = rate_per_second or _provider_setting(kind, "rate_per_second", float)
+        self.burst = max(self.max_batch_size, int(self.rate_per_second * 2)) if rate_per_second else _provider_setting(kind, "burst", int)
+        self.batch_latency_seconds = batch_latency_seconds
+        self.per_message_latency_seconds = per_message_latency_seconds
+        self.transient_failure_rate = transient_failure_rate
+        self.permanent_failure_rate = permanent_failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.delivered = 0
+
+    def send_batch(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        time.sleep(self.batch_latency_seconds + self.per_message_latency_seconds * len(messages))
+        results = []
+        with self._lock:
+            self.calls += 1
+            for _ in messages:
+                roll = self._random.random()
+                if roll < self.permanent_failure_rate:
+                    results.append({"success": False, "error": "Invalid recipient (simulated).", "retryable": False})
+                elif roll < self.permanent_failure_rate + self.transient_failure_rate:
+                    results.append({"success": False, "error": "Provider throttled (simulated).", "retryable": True})
+                else:
+                    self.delivered += 1
+                    external_id = f"{self.kind.lower()}_sim_" + "".join(self._random.choices(string.ascii_lowercase + string.digits, k=10))
+                    results.append({"success": True, "external_id": external_id})
+        return results
+
+def FakeSMSProvider(**kwargs) -> FakeNotificationProvider:
+    return FakeNotificationProvider(PROVIDER_SMS, **kwargs)
+
+def FakeEmailProvider(**kwargs) -> FakeNotificationProvider:
+    return FakeNotificationProvider(PROVIDER_EMAIL, **kwargs)
+
+def FakePushProvider(**kwargs) -> FakeNotificationProvider:
+    return FakeNotificationProvider(PROVIDER_PUSH, **kwargs)
+
+
+# --- Dispatcher ---
+class _ProviderWorker:
+    def __init__(self, dispatcher: "NotificationDispatcher", provider: NotificationProvider):
+        self.dispatcher = dispatcher
+        self.provider = provider
+        self.bucket = TokenBucket(provider.rate_per_second, provider.burst)
+        self.queue: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self.retry_heap: List[Tuple[float, int, Dict[str, Any]]] = [] # (due monotonic, seq, message)
+        self.retry_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name=f"notify-{provider.kind.lower()}", daemon=True)
+
+    def _due_retries(self, limit: int) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        due = []
+        with self.retry_lock:
+            while self.retry_heap and self.retry_heap[0][0] <= now and len(due) < limit:
+                due.append(heapq.heappop(self.retry_heap)[2])
+        return due
+
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        limit = self.provider.max_batch_size
+        batch = self._due_retries(limit)
+        deadline = time.monotonic() + NOTIFICATION_BATCH_WAIT_SECONDS
+        while len(batch) < limit:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=timeout) if timeout > 0 and not batch else self.queue.get_nowait())
+            except queue.Empty:
+                if batch or timeout <= 0:
+                    break
+        return batch
+
+    def _run(self) -> None:
+        stop = self.dispatcher._stop
+        while not stop.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            if not self.bucket.acquire(len(batch), stop_event=stop):
+                return
+            self.dispatcher._process_batch(self, batch)
+
+    def schedule_retry(self, message: Dict[str, Any], delay: float) -> None:
+        with self.retry_lock:
+            heapq.heappush(self.retry_heap, (time.monotonic() + delay, next(self.dispatcher._seq), message))
+
+
+class NotificationDispatcher:
+    """
+    Queues notifications per provider and sends them in rate-limited batches on background workers.
+    `session_factory=None` disables persistence (offline benchmarking); log ids are then synthetic.
+    """
+    def __init__(self, providers: List[NotificationProvider], session_factory: Optional[Callable[[], Any]] = None,
+                 max_attempts: int = NOTIFICATION_MAX_ATTEMPTS, retry_base_seconds: float = NOTIFICATION_RETRY_BASE_SECONDS,
+                 retry_max_seconds: float = NOTIFICATION_RETRY_MAX_SECONDS):
+        self._session_factory = session_factory
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._stop = threading.Event()
+        self._seq = itertools.count()
+        self._synthetic_ids = itertools.count(1)
+        self._stats_lock = threading.Lock()
+        self.stats = {"queued": 0, "sent": 0, "failed": 0, "retried": 0, "provider_calls": 0}
+        self._outstanding = 0 # Queued messages not yet SENT/FAILED (includes in-flight and awaiting retry)
+        self._workers: Dict[str, _ProviderWorker] = {p.kind: _ProviderWorker(self, p) for p in providers}
+        for worker in self._workers.values():
+            worker.thread.start()
+
+    def _incr(self, key: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[key] += n
+            if key == "queued":
+                self._outstanding += n
+
+    def _settle(self, key: str) -> None:
+        """Records a queued message reaching a final state (SENT/FAILED)."""
+        with self._stats_lock:
+            self.stats[key] += 1
+            self._outstanding -= 1
+
+    # --- Enqueue ---
+    def enqueue(self, notifications: List[Dict[str, Any]], db=None) -> List[int]:
+        """
+        Accepts dicts with the NotificationCreateSchema fields (direct_content required). Rows are inserted
+        as QUEUED in one statement; returns the NotificationLog ids in input order.
+        Notifications with no provider for their channel are logged as FAILED and not queued.
+        """
+        rows, kinds = [], []
+        for n in notifications:
+            if not n.get("recipient_identifier"):
+                raise ValueError("Recipient identifier could not be determined.")
+            if not n.get("direct_content"):
+                raise ValueError("Notification content must be provided (template rendering not yet implemented).")
+            kind = resolve_provider_kind(n["channel_type"], n.get("message_type"))
+            if kind not in self._workers:
+                kind = None
+            kinds.append(kind)
+            rows.append({
+                "customer_id": n.get("customer_id"),
+                "digital_user_profile_id": n.get("digital_user_profile_id"),
+                "channel_type": n["channel_type"],
+                "recipient_identifier": n["recipient_identifier"],
+                "message_type": n.get("message_type"),
+                "subject": n.get("subject"),
+                "content": n["direct_content"],
+                "status": "QUEUED" if kind else "FAILED",
+                "failure_reason": None if kind else "Unsupported notification channel.",
+                "reference_id": n.get("reference_id"),
+            })
+
+        log_ids = self._insert_rows(rows, db)
+        self._incr("queued", sum(1 for k in kinds if k)) # Counted before the workers can see the messages
+        for log_id, row, kind in zip(log_ids, rows, kinds):
+            if kind is None:
+                continue
+            self._workers[kind].queue.put({
+                "log_id": log_id, "recipient": row["recipient_identifier"], "subject": row["subject"],
+                "content": row["content"], "attempts": 0,
+            })
+        self._incr("failed", sum(1 for k in kinds if not k))
+        return log_ids
+
+    def _insert_rows(self, rows: List[Dict[str, Any]], db=None) -> List[int]:
+        if not rows:
+            return []
+        if db is None and self._session_factory is None:
+            return [next(self._synthetic_ids) for _ in rows]
+        from sqlalchemy import insert
+        from . import models
+        own_session = db is None
+        db = db or self._session_factory()
+        try:
+            result = db.execute(insert(models.NotificationLog).returning(models.NotificationLog.id, sort_by_parameter_order=True), rows)
+            log_ids = [row_id for (row_id,) in result.all()]
+            db.commit()
+            return log_ids
+        finally:
+            if own_session:
+                db.close()
+
+    # --- Sending ---
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.retry_max_seconds, self.retry_base_seconds * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.5, 1.0) # Jitter so retries of one batch do not stampede together
+
+    def _process_batch(self, worker: _ProviderWorker, batch: List[Dict[str, Any]]) -> None:
+        self._incr("provider_calls")
+        try:
+            results = worker.provider.send_batch(batch)
+        except Exception as e:
+            results = [{"success": False, "error": f"Provider error: {e}", "retryable": True}] * len(batch)
+
+        now = datetime.utcnow()
+        updates = []
+        for message, result in zip(batch, results):
+            message["attempts"] += 1
+            if result.get("success"):
+                updates.append({"id": message["log_id"], "status": "SENT", "sent_at": now,
+                                "external_message_id": result.get("external_id"), "failure_reason": None})
+                self._settle("sent")
+            elif result.get("retryable") and message["attempts"] < self.max_attempts:
+                worker.schedule_retry(message, self._backoff(message["attempts"]))
+                updates.append({"id": message["log_id"], "status": "RETRYING", "failure_reason": result.get("error")})
+                self._incr("retried")
+            else:
+                updates.append({"id": message["log_id"], "status": "FAILED", "failure_reason": result.get("error")})
+                self._settle("failed")
+        self._update_rows(updates)
+
+    def _update_rows(self, updates: List[Dict[str, Any]]) -> None:
+        if not updates or self._session_factory is None:
+            return
+        from sqlalchemy import update
+        from . import models
+        db = self._session_factory()
+        try:
+            # Group by key set so each executemany uses a uniform parameter shape
+            by_shape: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+            for u in updates:
+                by_shape.setdefault(tuple(sorted(u)), []).append(u)
+            for rows in by_shape.values():
+                db.execute(update(models.NotificationLog), rows) # Bulk UPDATE by primary key
+            db.commit()
+        except Exception as e: # Delivery already happened; log and keep the worker alive
+            db.rollback()
+            print(f"Failed to update {len(updates)} notification log rows: {e}")
+        finally:
+            db.close()
+
+    # --- Lifecycle ---
+    def recover_pending(self, batch_size: int = NOTIFICATION_RECOVERY_BATCH_SIZE) -> int:
+        """
+        Re-enqueues rows a previous process left QUEUED/RETRYING. Reads in id order up to the highest id
+        present when it starts, so rows this process enqueues meanwhile are not queued twice. Attempt
+        counts restart at zero. Returns the number of messages re-enqueued.
+        """
+        if self._session_factory is None:
+            return 0
+        from sqlalchemy import func
+        from . import models
+        log = models.NotificationLog
+        recovered = 0
+        db = self._session_factory()
+        try:
+            max_id = db.query(func.max(log.id)).scalar() or 0
+            last_id = 0
+            while True:
+                rows = db.query(log.id, log.channel_type, log.message_type, log.recipient_identifier, log.subject, log.content).filter(
+                    log.status.in_(RECOVERABLE_STATUSES), log.id > last_id, log.id <= max_id
+                ).order_by(log.id).limit(batch_size).all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                messages, unroutable = [], []
+                for row in rows:
+                    kind = resolve_provider_kind(row.channel_type, row.message_type)
+                    if kind not in self._workers:
+                        unroutable.append({"id": row.id, "status": "FAILED", "failure_reason": "Unsupported notification channel."})
+                        continue
+                    messages.append((kind, {"log_id": row.id, "recipient": row.recipient_identifier, "subject": row.subject,
+                                            "content": row.content, "attempts": 0}))
+                self._incr("queued", len(messages))
+                for kind, message in messages:
+                    self._workers[kind].queue.put(message)
+                self._update_rows(unroutable)
+                self._incr("failed", len(unroutable))
+                recovered += len(messages)
+        finally:
+            db.close()
+        return recovered
+
+    def pending(self) -> int:
+        with self._stats_lock:
+            return self._outstanding
+
+    def wait_until_idle(self, timeout: Optional[float] = None, poll_seconds: float = 0.01) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(poll_seconds)
+        return True
+
+    def shutdown(self, drain_timeout: Optional[float] = 10.0) -> None:
+        self.wait_until_idle(drain_timeout)
+        self._stop.set()
+        for worker in self._workers.values():
+            worker.thread.join(timeout=1.0)
+
+
+def default_providers() -> List[NotificationProvider]:
+    # Replace with real provider adapters (SMS aggregator, SMTP/SendGrid, FCM/APNS) in deployment wiring.
+    return [FakeSMSProvider(), FakeEmailProvider(), FakePushProvider()]
+
+
+_dispatcher: Optional[NotificationDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+def get_notification_dispatcher() -> NotificationDispatcher:
+    """Process-wide dispatcher, created on first use with the default providers and SessionLocal."""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                from weezy_cbs.database import SessionLocal
+                _dispatcher = NotificationDispatcher(default_providers(), session_factory=SessionLocal)
+    return _dispatcher
+
+def set_notification_dispatcher(dispatcher: NotificationDispatcher) -> None:
+    """Overrides the process-wide dispatcher (startup wiring and tests)."""
+    global _dispatcher
+    _dispatcher = dispatcher
+
+def start_notification_dispatcher() -> int:
+    """App startup: creates the dispatcher and re-enqueues undelivered rows (if enabled). Returns the recovered count."""
+    dispatcher = get_notification_dispatcher()
+    return dispatcher.recover_pending() if NOTIFICATION_RECOVER_ON_STARTUP else 0
+
+def stop_notification_dispatcher(drain_timeout: float = NOTIFICATION_SHUTDOWN_DRAIN_SECONDS) -> None:
+    """App shutdown: sends what it can within `drain_timeout`; the rest stays QUEUED/RETRYING for the next startup."""
+    global _dispatcher
+    with _dispatcher_lock:
+        dispatcher, _dispatcher = _dispatcher, None
+    if dispatcher is not None:
+        dispatcher.shutdown(drain_timeout)
+
+
+def run_benchmark(total_messages: int, sms_share: float = 0.7, email_share: float = 0.2, transient_failure_rate: float = 0.01,
+                  batch_latency_seconds: float = 0.02, rate_per_second: Optional[float] = None, enqueue_chunk: int = 5000) -> Dict[str, Any]:
+    """
+    Offline throughput run with fake providers and no persistence; retries use a short backoff.
+    `rate_per_second` overrides every provider's limit (default: the configured provider limits).
+    """
+    fake_kwargs = {"batch_latency_seconds": batch_latency_seconds, "transient_failure_rate": transient_failure_rate, "rate_per_second": rate_per_second}
+    dispatcher = NotificationDispatcher(
+        [FakeSMSProvider(seed=1, **fake_kwargs), FakeEmailProvider(seed=2, **fake_kwargs), FakePushProvider(seed=3, **fake_kwargs)],
+        session_factory=None, retry_base_seconds=0.05, retry_max_seconds=0.5,
+    )
+    rnd = random.Random(0)
+    started = time.perf_counter()
+    for offset in range(0, total_messages, enqueue_chunk):
+        chunk = []
+        for i in range(offset, min(total_messages, offset + enqueue_chunk)):
+            roll = rnd.random()
+            if roll < sms_share:
+                chunk.append({"channel_type": "SMS_BANKING", "message_type": "TRANSACTION_ALERT", "recipient_identifier": f"080{i:08d}", "direct_content": "Credit alert"})
+            elif roll < sms_share + email_share:
+                chunk.append({"channel_type": "INTERNET_BANKING", "message_type": "EMAIL_STATEMENT", "recipient_identifier": f"user{i}@example.com", "subject": "Alert", "direct_content": "Credit alert"})
+            else:
+                chunk.append({"channel_type": "MOBILE_BANKING_APP", "message_type": "PUSH_ALERT", "recipient_identifier": f"device-{i}", "direct_content": "Credit alert"})
+        dispatcher.enqueue(chunk)
+    dispatcher.wait_until_idle()
+    elapsed = time.perf_counter() - started
+    dispatcher.shutdown(drain_timeout=0)
+    return dict(dispatcher.stats, elapsed_s=elapsed, messages_per_s=total_messages / elapsed if elapsed else 0.0)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Offline notification dispatcher throughput benchmark (fake providers).")
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--transient-failure-rate", type=float, default=0.01)
+    parser.add_argument("--batch-latency", type=float, default=0.02, help="Simulated provider latency per batch call, seconds.")
+    parser.add_argument("--rate", type=float, default=None, help="Per-provider messages/second limit (default: configured limits).")
+    args = parser.parse_args()
+    print(run_benchmark(args.messages, transient_failure_rate=args.transient_failure_rate,
+                        batch_latency_seconds=args.batch_latency, rate_per_second=args.rate))
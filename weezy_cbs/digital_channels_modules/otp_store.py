@@ -0,0 +1,184 @@
+# Pluggable TTL store for one-time codes (login/registration OTPs, cardless withdrawal PINs)
+#
+# Two backends share the OTPStore interface:
+#   - InMemoryOTPStore: sharded dicts with a min-heap expiry sweeper. Single-process only (dev/tests).
+#   - RedisOTPStore: native key TTLs and an atomic check-and-consume Lua script. Shared by all
+#     uvicorn workers, so an OTP issued through one worker verifies on another.
+# Codes are stored as SHA-256 digests (salted with the key), never in clear.
+import hashlib
+import heapq
+import hmac
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+OTP_STORE_BACKEND = os.getenv("OTP_STORE_BACKEND", "memory") # 'memory' or 'redis'
+OTP_REDIS_URL = os.getenv("OTP_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+OTP_REDIS_KEY_PREFIX = "weezy:otp:"
+IN_MEMORY_SHARD_COUNT = 16
+SWEEP_INTERVAL_SECONDS = 30
+
+
+def _digest(key: str, code: str) -> str:
+    return hashlib.sha256(f"{key}:{code}".encode("utf-8")).hexdigest()
+
+
+class OTPStore:
+    """Interface for one-time code storage. Keys are opaque strings, e.g. 'LOGIN_2FA:08012345678'."""
+    def put(self, key: str, code: str, ttl_seconds: int) -> None:
+        raise NotImplementedError
+
+    def check_and_consume(self, key: str, code: str) -> bool:
+        """True if `code` matches the live entry for `key`; the entry is deleted atomically on success."""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class _Shard:
+    __slots__ = ("lock", "entries", "expiry_heap")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Tuple[str, float]] = {} # key -> (digest, expires_at monotonic)
+        self.expiry_heap: List[Tuple[float, str]] = []
+
+
+class InMemoryOTPStore(OTPStore):
+    """
+    Sharded in-process store. Expired entries are never returned; they are removed by a daemon
+    sweeper that pops a per-shard min-heap ordered by expiry, so memory stays bounded by live codes.
+    Heap entries for keys that were overwritten or consumed are skipped when popped.
+    """
+    def __init__(self, shard_count: int = IN_MEMORY_SHARD_COUNT, sweep_interval_seconds: Optional[float] = SWEEP_INTERVAL_SECONDS):
+        self._shards = [_Shard() for _ in range(shard_count)]
+        self._stop = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+        if sweep_interval_seconds:
+            self._sweeper = threading.Thread(target=self._sweep_loop, args=(sweep_interval_seconds,), name="otp-expiry-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def _shard(self, key: str) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def put(self, key: str, code: str, ttl_seconds: int) -> None:
+        expires_at = time.monotonic() + ttl_seconds
+        shard = self._shard(key)
+        with shard.lock:
+            shard.entries[key] = (_digest(key, code), expires_at)
+            heapq.heappush(shard.expiry_heap, (expires_at, key))
+
+    def check_and_consume(self, key: str, code: str) -> bool:
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if not entry:
+                return False
+            digest, expires_at = entry
+            if expires_at <= time.monotonic():
+                del shard.entries[key]
+                return False
+            if not hmac.compare_digest(digest, _digest(key, code)):
+                return False
+            del shard.entries[key]
+            return True
+
+    def exists(self, key: str) -> bool:
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.entries.get(key)
+            return bool(entry) and entry[1] > time.monotonic()
+
+    def delete(self, key: str) -> None:
+        shard = self._shard(key)
+        with shard.lock:
+            shard.entries.pop(key, None)
+
+    def sweep_expired(self, now: Optional[float] = None) -> int:
+        """Removes expired entries from every shard. Returns the number removed."""
+        now = time.monotonic() if now is None else now
+        removed = 0
+        for shard in self._shards:
+            with shard.lock:
+                heap = shard.expiry_heap
+                while heap and heap[0][0] <= now:
+                    expires_at, key = heapq.heappop(heap)
+                    entry = shard.entries.get(key)
+                    if entry and entry[1] == expires_at: # Skip stale heap items for re-issued codes
+                        del shard.entries[key]
+                        removed += 1
+                if len(heap) > 2 * len(shard.entries) + 64: # Drop stale heap items left by consumed codes
+                    shard.expiry_heap = [(exp, k) for k, (_, exp) in shard.entries.items()]
+                    heapq.heapify(shard.expiry_heap)
+        return removed
+
+    def __len__(self) -> int:
+        return sum(len(shard.entries) for shard in self._shards)
+
+    def _sweep_loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            self.sweep_expired()
+
+    def close(self) -> None:
+        self._stop.set()
+
+
+class RedisOTPStore(OTPStore):
+    """Redis-backed store; expiry is handled by Redis key TTLs, consumption by a Lua script (GET+compare+DEL)."""
+    _CHECK_AND_CONSUME_LUA = """
+local stored = redis.call('GET', KEYS[1])
+if stored and stored == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+return 0
+"""
+
+    def __init__(self, redis_client=None, key_prefix: str = OTP_REDIS_KEY_PREFIX):
+        if redis_client is None:
+            try:
+                import redis # Optional dependency, only needed for this backend
+            except ImportError as e:
+                raise RuntimeError("OTP_STORE_BACKEND=redis requires the 'redis' package.") from e
+            redis_client = redis.Redis.from_url(OTP_REDIS_URL)
+        self._redis = redis_client
+        self._key_prefix = key_prefix
+        self._check_and_consume = self._redis.register_script(self._CHECK_AND_CONSUME_LUA)
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self._key_prefix}{key}"
+
+    def put(self, key: str, code: str, ttl_seconds: int) -> None:
+        self._redis.set(self._redis_key(key), _digest(key, code), ex=ttl_seconds)
+
+    def check_and_consume(self, key: str, code: str) -> bool:
+        return bool(self._check_and_consume(keys=[self._redis_key(key)], args=[_digest(key, code)]))
+
+    def exists(self, key: str) -> bool:
+        return bool(self._redis.exists(self._redis_key(key)))
+
+    def delete(self, key: str) -> None:
+        self._redis.delete(self._redis_key(key))
+
+
+_otp_store: Optional[OTPStore] = None
+_otp_store_lock = threading.Lock()
+
+def get_otp_store() -> OTPStore:
+    """Process-wide store, chosen by OTP_STORE_BACKEND on first use."""
+    global _otp_store
+    if _otp_store is None:
+        with _otp_store_lock:
+            if _otp_store is None:
+                _otp_store = RedisOTPStore() if OTP_STORE_BACKEND == "redis" else InMemoryOTPStore()
+    return _otp_store
+
+def set_otp_store(store: OTPStore) -> None:
+    """Overrides the process-wide store (startup wiring and tests)."""
+    global _otp_store
+    _otp_store = store
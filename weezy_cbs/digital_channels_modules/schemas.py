@@ -62,6 +62,7 @@ class DigitalUserProfileResponse(DigitalUserProfileBase):
 
     class Config:
         orm_mode = True
+        from_attributes = True
         use_enum_values = True
 
 
@@ -69,15 +70,27 @@ class DigitalUserPasswordChangeSchema(BaseModel):
     current_password: str
     new_password: str = Field(..., min_length=8)
 
+class DigitalUserPasswordResetSchema(BaseModel):
+    identifier: str # Username the PASSWORD_RESET OTP was requested for
+    otp_code: str = Field(..., min_length=6, max_length=6)
+    new_password: str = Field(..., min_length=8)
+
 class DigitalUserTransactionPinSetSchema(BaseModel):
     password: str
-    new_pin: str = Field(..., min_length=4, max_length=6, regex=r"^\d{4,6}$")
+    new_pin: str = Field(..., min_length=4, max_length=6, pattern=r"^\d{4,6}$")
 
 class DigitalUserTransactionPinChangeSchema(BaseModel):
-    current_pin: str = Field(..., min_length=4, max_length=6, regex=r"^\d{4,6}$")
-    new_pin: str = Field(..., min_length=4, max_length=6, regex=r"^\d{4,6}$")
+    current_pin: str = Field(..., min_length=4, max_length=6, pattern=r"^\d{4,6}$")
+    new_pin: str = Field(..., min_length=4, max_length=6, pattern=r"^\d{4,6}$")
     password: Optional[str] = None
 
+class TransactionPinVerifySchema(BaseModel):
+    pin: str = Field(..., min_length=4, max_length=6, pattern=r"^\d{4,6}$")
+
+class PinSessionTokenSchema(BaseModel):
+    pin_session_token: str # Present on subsequent transactions instead of re-entering the PIN
+    expires_in_seconds: int
+
 class DigitalUserLoginSchema(BaseModel):
     username: str
     password: str
@@ -129,6 +142,7 @@ class RegisteredDeviceResponse(RegisteredDeviceBase):
 
     class Config:
         orm_mode = True
+        from_attributes = True
 
 class DigitalUserProfileWithDevicesResponse(DigitalUserProfileResponse):
     registered_devices: List[RegisteredDeviceResponse] = []
@@ -148,6 +162,7 @@ class SessionLogResponse(BaseModel):
 
     class Config:
         orm_mode = True
+        from_attributes = True
         use_enum_values = True
 
 # --- USSD Schemas ---
@@ -169,7 +184,7 @@ class USSDSessionData(BaseModel):
 
 class USSDPinVerificationRequest(BaseModel):
     session_id: str
-    pin: str = Field(..., min_length=4, max_length=4, regex=r"^\d{4}$")
+    pin: str = Field(..., min_length=4, max_length=4, pattern=r"^\d{4}$")
 
 
 # --- NotificationLog Schemas ---
@@ -192,6 +207,13 @@ class NotificationCreateSchema(BaseModel):
             raise ValueError('Provide either direct_content or content_params, not both')
         return v
 
+class BulkNotificationRequest(BaseModel):
+    notifications: List[NotificationCreateSchema] = Field(..., min_items=1, max_items=10000)
+
+class BulkNotificationQueuedResponse(BaseModel):
+    queued_count: int
+    notification_log_ids: List[int] # Track delivery via GET /notifications/logs (QUEUED -> SENT/FAILED)
+
 class NotificationLogResponse(BaseModel):
     id: int
     customer_id: Optional[int] = None
@@ -210,6 +232,7 @@ class NotificationLogResponse(BaseModel):
 
     class Config:
         orm_mode = True
+        from_attributes = True
         use_enum_values = True
 
 # --- Chatbot Schemas ---
@@ -253,6 +276,7 @@ class ChatbotInteractionLogResponse(BaseModel):
 
     class Config:
         orm_mode = True
+        from_attributes = True
         use_enum_values = True
 
 # --- Schemas for Customer Dashboard ---
@@ -293,6 +317,7 @@ class CustomerDashboardSummaryResponse(BaseModel):
 
     class Config:
         orm_mode = True
+        from_attributes = True
 
 # --- Paginated Responses for Digital Channels ---
 class PaginatedDigitalUserProfileResponse(BaseModel):
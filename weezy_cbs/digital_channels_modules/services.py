@@ -1,15 +1,31 @@
 import json
-from typing import List, Optional, Type, Dict, Any
+from typing import List, Optional, Type, Dict, Any, Tuple
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func
 from fastapi import HTTPException, status
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 import random
 import string
+import uuid
 
 from . import models, schemas
-from weezy_cbs.core_infrastructure_config_engine.services import AuditLogService, get_password_hash, verify_password, create_access_token
+from .otp_store import get_otp_store
+from .notification_dispatcher import get_notification_dispatcher
+from .dashboard_cache import dashboard_snapshot_cache
+from .token_revocation import token_revocation_index, _to_epoch
+from .login_throttle import (
+    LoginThrottle, ThrottleDecision, FailedLoginAuditWriter, DIMENSION_USERNAME, DEVICE_LIMIT, IP_LIMIT, build_login_throttle_store
+)
+from .ussd_engine import (
+    USSDEngine, USSDContext, USSDSessionPersister, build_session_store, compiled_ussd_menu, AUTH_ENTRY_STATE
+)
+from weezy_cbs.core_infrastructure_config_engine.password_hashing import (
+    password_hashing_service, issue_pin_session_token, validate_pin_session_token
+)
+from weezy_cbs.core_infrastructure_config_engine import event_bus
+from weezy_cbs.core_infrastructure_config_engine.services import (
+    AuditLogService, get_password_hash, verify_password, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, JWT_SECRET_KEY, ALGORITHM
+)
 # Attempt to import Customer model for type hinting and linking. This creates a circular dependency if not careful.
 # from weezy_cbs.customer_identity_management.models import Customer as CIMCustomer
 # For now, assume customer_id is sufficient and validation happens at higher levels or via direct DB checks.
@@ -17,53 +33,46 @@ from weezy_cbs.core_infrastructure_config_engine.services import AuditLogService
 # --- Constants & Configuration (should be in a config file) ---
 OTP_LENGTH = 6
 OTP_EXPIRY_MINUTES = 5
+PASSWORD_RESET_OTP_PURPOSE = "PASSWORD_RESET"
 MAX_LOGIN_ATTEMPTS = 5
 ACCOUNT_LOCK_DURATION_MINUTES = 30
 USSD_SESSION_TIMEOUT_MINUTES = 5 # Standard USSD timeout
-
-# Local pwd_context if not sharing directly from core_infra for digital user passwords
-digital_pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
+USSD_THROTTLE_PREFIX = "ussd:" # USSD PIN logins count against the username dimension as 'ussd:<msisdn>'
+
+# Failed-login counters and lockout decisions (per username, device, IP) live in a fast store, not the profile row
+login_throttle = LoginThrottle(
+    build_login_throttle_store(),
+    username_limit=(MAX_LOGIN_ATTEMPTS, ACCOUNT_LOCK_DURATION_MINUTES * 60, ACCOUNT_LOCK_DURATION_MINUTES * 60),
+    device_limit=DEVICE_LIMIT, ip_limit=IP_LIMIT,
+)
+# Failed-attempt audit rows are batched off the request path; lockouts and successes are audited at once
+failed_login_audit_writer = FailedLoginAuditWriter()
+
+# Digital user passwords/PINs share the core hashing service (bcrypt cost, executor, back-pressure).
+# These sync helpers are for non-async callers; request paths await password_hashing_service.
 def verify_digital_password(plain_password: str, hashed_password: str) -> bool:
-    return digital_pwd_context.verify(plain_password, hashed_password)
+    is_valid, _ = password_hashing_service.verify_and_update_sync(plain_password, hashed_password)
+    return is_valid
 
 def get_digital_password_hash(password: str) -> str:
-    return digital_pwd_context.hash(password)
+    return password_hashing_service.hash_sync(password)
 
-# --- OTP Management (Conceptual - In-memory or Redis backed) ---
-# For a real app, use Redis or a dedicated OTP table.
-# This is a simplified in-memory store for demonstration.
-otp_store: Dict[str, Dict[str, Any]] = {} # Key: identifier_purpose, Value: {otp: "xxxx", expiry: datetime}
+# --- OTP Management ---
+# Codes live in the pluggable TTL store (otp_store.py): in-memory for a single process,
+# Redis when OTP_STORE_BACKEND=redis so every uvicorn worker sees the same codes.
 
 def generate_otp_value(length: int = OTP_LENGTH) -> str:
     return "".join(random.choices(string.digits, k=length))
 
-def store_otp(identifier: str, purpose: str, otp: str, expiry_minutes: int = OTP_EXPIRY_MINUTES):
-    key = f"{identifier.lower()}_{purpose.upper()}"
-    otp_store[key] = {
-        "otp": otp,
-        "expiry": datetime.utcnow() + timedelta(minutes=expiry_minutes),
-        "verified": False # Mark as unverified initially
-    }
+def _otp_key(identifier: str, purpose: str) -> str:
+    return f"{purpose.upper()}:{identifier.lower()}"
 
-def retrieve_otp(identifier: str, purpose: str) -> Optional[Dict[str, Any]]:
-    key = f"{identifier.lower()}_{purpose.upper()}"
-    return otp_store.get(key)
+def store_otp(identifier: str, purpose: str, otp: str, expiry_minutes: int = OTP_EXPIRY_MINUTES):
+    get_otp_store().put(_otp_key(identifier, purpose), otp, ttl_seconds=expiry_minutes * 60)
 
 def verify_and_consume_otp(identifier: str, purpose: str, otp_code: str) -> bool:
-    stored_otp_data = retrieve_otp(identifier, purpose)
-    if not stored_otp_data:
-        return False
-    if stored_otp_data["otp"] == otp_code and datetime.utcnow() < stored_otp_data["expiry"] and not stored_otp_data["verified"]:
-        # Mark as verified to prevent reuse (important for some flows)
-        # For some OTPs (like login 2FA), you might delete it immediately after verification.
-        # For others (like registration verification), you might mark as verified and allow one final action.
-        stored_otp_data["verified"] = True
-        # Optionally, remove from store after verification:
-        # key = f"{identifier.lower()}_{purpose.upper()}"
-        # del otp_store[key]
-        return True
-    return False
+    # Atomic check-and-delete: a code can only be used once, even across workers.
+    return get_otp_store().check_and_consume(_otp_key(identifier, purpose), otp_code)
 
 
 # --- Base Service for Digital Channels (if common patterns emerge) ---
@@ -131,68 +140,124 @@ class DigitalUserProfileService(BaseDigitalChannelService):
             if self._get_digital_user_profile(db, username=update_data["username"]):
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="New username already taken.")
 
+        if "locked_until" in update_data and update_data["locked_until"] is None:
+            self._clear_login_lock(db_profile) # Unlock: under the current username, before any rename below
+
         for field, value in update_data.items():
             setattr(db_profile, field, value)
 
         db.commit()
         db.refresh(db_profile)
+        event_bus.publish(event_bus.CUSTOMER_PROFILE_CHANGED, customer_id=db_profile.customer_id)
         self._audit_log(db, "DIGITAL_PROFILE_UPDATE", db_profile, "Digital profile updated.", performing_username=performing_username)
         return db_profile
 
-    def change_password(self, db: Session, profile_id: int, pass_change: schemas.DigitalUserPasswordChangeSchema) -> bool:
+    async def change_password(self, db: Session, profile_id: int, pass_change: schemas.DigitalUserPasswordChangeSchema) -> bool:
         db_profile = self._get_digital_user_profile(db, user_id=profile_id)
         if not db_profile or not db_profile.is_active:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User profile not found or inactive.")
 
-        if not verify_digital_password(pass_change.current_password, db_profile.hashed_password):
+        if not await password_hashing_service.verify(pass_change.current_password, db_profile.hashed_password):
             self._audit_log(db, "DIGITAL_PASSWORD_CHANGE_FAIL", db_profile, "Password change failed: Incorrect current password.")
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Incorrect current password.")
 
-        db_profile.hashed_password = get_digital_password_hash(pass_change.new_password)
+        db_profile.hashed_password = await password_hashing_service.hash(pass_change.new_password)
         db.commit()
         self._audit_log(db, "DIGITAL_PASSWORD_CHANGE_SUCCESS", db_profile, "Password changed successfully.")
         return True
 
-    def set_transaction_pin(self, db: Session, profile_id: int, pin_set: schemas.DigitalUserTransactionPinSetSchema) -> bool:
+    async def reset_password(self, db: Session, reset_in: schemas.DigitalUserPasswordResetSchema, recipient_identifier: str) -> bool:
+        """Sets a new password after a PASSWORD_RESET OTP check; also lifts any login lock on the profile."""
+        db_profile = self._get_digital_user_profile(db, username=reset_in.identifier)
+        if not db_profile or not db_profile.is_active:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User profile not found or inactive.")
+
+        if not self.verify_otp_for_profile(db, db_profile.id, PASSWORD_RESET_OTP_PURPOSE, reset_in.otp_code, recipient_identifier):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid or expired OTP.")
+
+        db_profile.hashed_password = await password_hashing_service.hash(reset_in.new_password)
+        self._clear_login_lock(db_profile)
+        db.commit()
+        self._audit_log(db, "DIGITAL_PASSWORD_RESET_SUCCESS", db_profile, "Password reset via OTP.")
+        return True
+
+    def _clear_login_lock(self, profile: models.DigitalUserProfile):
+        # The throttle store holds the counters and block; the profile row only mirrors the lock
+        login_throttle.unlock_username(profile.username)
+        profile.failed_login_attempts = 0
+        profile.locked_until = None
+
+    async def set_transaction_pin(self, db: Session, profile_id: int, pin_set: schemas.DigitalUserTransactionPinSetSchema) -> bool:
         db_profile = self._get_digital_user_profile(db, user_id=profile_id)
         if not db_profile or not db_profile.is_active:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User profile not found or inactive.")
-        if not verify_digital_password(pin_set.password, db_profile.hashed_password):
+        if not await password_hashing_service.verify(pin_set.password, db_profile.hashed_password):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Incorrect login password provided for PIN setup.")
 
-        db_profile.transaction_pin_hashed = get_digital_password_hash(pin_set.new_pin) # Hash the PIN
+        db_profile.transaction_pin_hashed = await password_hashing_service.hash(pin_set.new_pin) # Hash the PIN (invalidates outstanding PIN session tokens)
         db_profile.is_transaction_pin_set = True
         db.commit()
         self._audit_log(db, "DIGITAL_TXN_PIN_SET", db_profile, "Transaction PIN set successfully.")
         return True
 
-    def verify_transaction_pin(self, db: Session, profile_id: int, pin: str) -> bool:
+    async def verify_transaction_pin(self, db: Session, profile_id: int, pin: Optional[str] = None, pin_session_token: Optional[str] = None) -> bool:
+        """
+        Checks a transaction PIN. A valid verified-PIN session token (see issue_pin_session) is accepted
+        instead of the PIN and skips bcrypt entirely; otherwise the PIN is checked on the hashing pool.
+        """
         db_profile = self._get_digital_user_profile(db, user_id=profile_id)
         if not db_profile or not db_profile.is_active or not db_profile.is_transaction_pin_set or not db_profile.transaction_pin_hashed:
             return False # Or raise specific errors
-        return verify_digital_password(pin, db_profile.transaction_pin_hashed)
+        if pin_session_token and validate_pin_session_token(pin_session_token, db_profile.id, db_profile.transaction_pin_hashed):
+            return True
+        if not pin:
+            return False
+        is_valid, upgraded_hash = await password_hashing_service.verify_and_update(pin, db_profile.transaction_pin_hashed)
+        if is_valid and upgraded_hash:
+            db_profile.transaction_pin_hashed = upgraded_hash
+            db.commit()
+        return is_valid
+
+    async def issue_pin_session(self, db: Session, profile_id: int, pin: str) -> Optional[str]:
+        """Verifies the PIN once and returns a short-lived token for subsequent transactions in this session."""
+        if not await self.verify_transaction_pin(db, profile_id, pin=pin):
+            return None
+        db_profile = self._get_digital_user_profile(db, user_id=profile_id)
+        return issue_pin_session_token(db_profile.id, db_profile.transaction_pin_hashed)
+
 
+    async def authenticate_digital_user(self, db: Session, login_data: schemas.DigitalUserLoginSchema) -> Optional[Tuple[models.DigitalUserProfile, str]]:
+        """Returns (profile, session_jti) on success. The JTI names the new SessionLog and goes into the access token."""
+        # Throttle gate: blocked usernames/devices/IPs are rejected before any DB read, audit write or bcrypt
+        throttle = login_throttle.check(login_data.username, login_data.device_identifier, login_data.ip_address)
+        if not throttle.allowed:
+            self._raise_throttled(throttle)
 
-    def authenticate_digital_user(self, db: Session, login_data: schemas.DigitalUserLoginSchema) -> Optional[models.DigitalUserProfile]:
         db_profile = self._get_digital_user_profile(db, username=login_data.username)
         if not db_profile:
-            self._audit_log(db, "DIGITAL_LOGIN_FAIL", summary=f"Login attempt failed for username {login_data.username}: User not found.", performing_username=login_data.username)
+            login_throttle.record_failure(login_data.username, login_data.device_identifier, login_data.ip_address)
+            failed_login_audit_writer.record("DIGITAL_LOGIN_FAIL", login_data.username, f"Login attempt failed for username {login_data.username}: User not found.", ip_address=login_data.ip_address)
             return None
 
         if not db_profile.is_active:
-            self._audit_log(db, "DIGITAL_LOGIN_FAIL", db_profile, "Login attempt failed: Account inactive.")
+            self._audit_failed_login(db_profile, "Login attempt failed: Account inactive.", login_data.ip_address)
             return None
 
         if db_profile.locked_until and datetime.utcnow() < db_profile.locked_until:
-            self._audit_log(db, "DIGITAL_LOGIN_FAIL", db_profile, f"Login attempt failed: Account locked until {db_profile.locked_until}.")
+            self._audit_failed_login(db_profile, f"Login attempt failed: Account locked until {db_profile.locked_until}.", login_data.ip_address)
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Account locked. Try again after {db_profile.locked_until.strftime('%Y-%m-%d %H:%M:%S UTC')}.")
 
-        if not verify_digital_password(login_data.password, db_profile.hashed_password):
-            self.record_failed_login_attempt(db, db_profile)
-            self._audit_log(db, "DIGITAL_LOGIN_FAIL", db_profile, "Login attempt failed: Incorrect password.")
+        # bcrypt runs on the hashing pool; raises HashingBackpressureError when saturated
+        is_valid, upgraded_hash = await password_hashing_service.verify_and_update(login_data.password, db_profile.hashed_password)
+        if not is_valid:
+            self.record_failed_login_attempt(db, db_profile, device_identifier=login_data.device_identifier, ip_address=login_data.ip_address)
+            self._audit_failed_login(db_profile, "Login attempt failed: Incorrect password.", login_data.ip_address)
             return None
 
         # Successful login: reset failed attempts, update last login
+        if upgraded_hash: # Stored hash used an older cost factor; replace it transparently
+            db_profile.hashed_password = upgraded_hash
+        login_throttle.record_success(db_profile.username)
         db_profile.failed_login_attempts = 0
         db_profile.locked_until = None
         db_profile.last_login_at = datetime.utcnow()
@@ -202,18 +267,32 @@ class DigitalUserProfileService(BaseDigitalChannelService):
         db.refresh(db_profile)
 
         # Create session log
-        SessionLogService().create_session_log(db, profile_id=db_profile.id, channel=login_data.channel, ip_address=login_data.ip_address, user_agent=login_data.user_agent)
+        # The JTI goes into the access token so logout can revoke exactly this session
+        session_jti = uuid.uuid4().hex
+        SessionLogService().create_session_log(db, profile_id=db_profile.id, channel=login_data.channel, ip_address=login_data.ip_address, user_agent=login_data.user_agent, session_jti=session_jti)
 
         self._audit_log(db, "DIGITAL_LOGIN_SUCCESS", db_profile, f"Login successful via {login_data.channel.value}.")
-        return db_profile
+        return db_profile, session_jti
 
-    def record_failed_login_attempt(self, db: Session, profile: models.DigitalUserProfile):
-        profile.failed_login_attempts += 1
-        if profile.failed_login_attempts >= MAX_LOGIN_ATTEMPTS:
+    def _audit_failed_login(self, profile: models.DigitalUserProfile, summary: str, ip_address: Optional[str] = None):
+        failed_login_audit_writer.record("DIGITAL_LOGIN_FAIL", profile.username, summary, entity_id=str(profile.id), ip_address=ip_address)
+
+    def record_failed_login_attempt(self, db: Session, profile: models.DigitalUserProfile, device_identifier: Optional[str] = None, ip_address: Optional[str] = None):
+        # Counting happens in the throttle store; the profile row is written only when the lock is set
+        decision = login_throttle.record_failure(profile.username, device_identifier, ip_address)
+        if decision.newly_locked:
+            profile.failed_login_attempts = decision.username_failures
             profile.locked_until = datetime.utcnow() + timedelta(minutes=ACCOUNT_LOCK_DURATION_MINUTES)
+            db.commit()
+            db.refresh(profile)
             self._audit_log(db, "DIGITAL_ACCOUNT_LOCKED", profile, f"Account locked due to {MAX_LOGIN_ATTEMPTS} failed login attempts.")
-        db.commit()
-        db.refresh(profile)
+
+    def _raise_throttled(self, decision: ThrottleDecision):
+        if decision.blocked_dimension == DIMENSION_USERNAME:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Account locked. Try again in {decision.retry_after_seconds // 60 + 1} minutes.",
+                                headers={"Retry-After": str(decision.retry_after_seconds)})
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many failed login attempts. Please try again later.",
+                            headers={"Retry-After": str(decision.retry_after_seconds)})
 
     def generate_and_send_otp(self, db: Session, profile_id: int, purpose: str, delivery_channel: schemas.ChannelTypeEnum, recipient_identifier: Optional[str] = None) -> bool:
         db_profile = self._get_digital_user_profile(db, user_id=profile_id)
@@ -273,6 +352,28 @@ class DigitalUserProfileService(BaseDigitalChannelService):
             return False
 
     async def get_customer_dashboard_summary(self, db: Session, profile: models.DigitalUserProfile) -> schemas.CustomerDashboardSummaryResponse:
+        """
+        Serves the dashboard from the per-customer snapshot cache (see dashboard_cache.py). A miss builds
+        on this request's session; stale or invalidated snapshots are returned at once and refreshed in
+        the background. last_login_at is always taken from the live profile.
+        """
+        def build_in_background(customer_id: int) -> Optional[schemas.CustomerDashboardSummaryResponse]:
+            from weezy_cbs.database import SessionLocal
+            refresh_db = SessionLocal()
+            try:
+                refresh_profile = refresh_db.query(models.DigitalUserProfile).filter(models.DigitalUserProfile.customer_id == customer_id).first()
+                return self._build_customer_dashboard_summary(refresh_db, refresh_profile) if refresh_profile else None
+            finally:
+                refresh_db.close()
+
+        summary = dashboard_snapshot_cache.get(
+            profile.customer_id,
+            builder=lambda customer_id: self._build_customer_dashboard_summary(db, profile),
+            background_builder=build_in_background,
+        )
+        return summary.copy(update={"last_login_at": profile.last_login_at})
+
+    def _build_customer_dashboard_summary(self, db: Session, profile: models.DigitalUserProfile) -> schemas.CustomerDashboardSummaryResponse:
         """
         Aggregates data from various services to build the customer dashboard summary.
         This is a conceptual implementation showing data fetching points.
@@ -480,7 +581,7 @@ class SessionLogService(BaseDigitalChannelService):
         # Minimal audit, as session log itself is a log.
         return db_log
 
-    def end_session_log(self, db: Session, session_jti: Optional[str] = None, session_id_pk: Optional[int] = None) -> Optional[models.SessionLog]:
+    def end_session_log(self, db: Session, session_jti: Optional[str] = None, session_id_pk: Optional[int] = None, token_expires_at: Optional[float] = None) -> Optional[models.SessionLog]:
         db_log = None
         if session_jti:
             db_log = db.query(models.SessionLog).filter(models.SessionLog.session_token_jti == session_jti, models.SessionLog.is_active == True).first()
@@ -492,106 +593,76 @@ class SessionLogService(BaseDigitalChannelService):
             db_log.is_active = False
             db.commit()
             db.refresh(db_log)
+            if db_log.session_token_jti:
+                # Token exp if the caller has it, else the lifetime it was issued with
+                if token_expires_at is None:
+                    login_time = db_log.login_time.replace(tzinfo=None) if db_log.login_time and db_log.login_time.tzinfo else (db_log.login_time or datetime.utcnow())
+                    token_expires_at = _to_epoch(login_time + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+                token_revocation_index.revoke(db_log.session_token_jti, token_expires_at)
             # Audit this logout event for the user associated with db_log.digital_user_profile_id
             # self._audit_log(db, "DIGITAL_LOGOUT", profile_id=db_log.digital_user_profile_id, summary=f"Session {db_log.id} ended.")
             return db_log
         return None
 
-# --- USSD Service (Conceptual - Menu logic is complex) ---
+# --- USSD Service ---
+# Menus are declared in ussd_engine.USSD_MENU_DEFINITION and compiled into a transition table. Per-hop
+# session state lives in a TTL store (memory/Redis); the USSDSession row is written asynchronously
+# when the session ends. Only states with an action (login, balance) touch the database.
+ussd_session_persister = USSDSessionPersister()
+ussd_engine = USSDEngine(compiled_ussd_menu, build_session_store(ussd_session_persister), ussd_session_persister)
+
 class USSDService(BaseDigitalChannelService):
-    # This is highly simplified. Real USSD apps use a menu definition structure
-    # (e.g., XML, JSON, or Python dicts) and a state machine.
+    def __init__(self, engine: USSDEngine = ussd_engine):
+        self.engine = engine
+
+    def _get_profile_by_phone(self, db: Session, msisdn: str) -> Optional[models.DigitalUserProfile]:
+        # The gateway sends 234XXXXXXXXXX while customers are stored as 0803..., +234..., etc.
+        # Customer.phone_number_normalized holds the indexed 10-digit form written with normalize_phone.
+        from weezy_cbs.customer_identity_management.models import Customer as CIMCustomer
+        from weezy_cbs.customer_identity_management.duplicate_detection import normalize_phone
+        phone = normalize_phone(msisdn)
+        if not phone:
+            return None
+        return db.query(models.DigitalUserProfile)\
+            .join(CIMCustomer, CIMCustomer.id == models.DigitalUserProfile.customer_id)\
+            .filter(CIMCustomer.phone_number_normalized == phone, models.DigitalUserProfile.is_active == True)\
+            .first()
 
     async def handle_ussd_request(self, db: Session, request_data: schemas.USSDRequestSchema) -> schemas.USSDResponseSchema:
-        session_id = request_data.sessionId
-        msisdn = request_data.msisdn # Normalize this msisdn
-        user_input = request_data.ussdString
-
-        # Try to find existing session or create new
-        ussd_session = db.query(models.USSDSession).filter(models.USSDSession.id == session_id).first()
-
-        digital_profile: Optional[models.DigitalUserProfile] = None
-        # Try to link MSISDN to a digital user profile (e.g. via customer's phone number)
-        # This requires querying Customer table based on phone, then getting DigitalUserProfile
-        # For now, we'll assume this link can be established if user is registered.
-
-        if not ussd_session:
-            # New session
-            # Check if MSISDN is registered (simplified check)
-            # In real scenario: query Customer by phone, then get DigitalUserProfile
-            # For now, we'll mock this. If user_input could be PIN for initial auth:
-            # digital_profile = self._get_profile_by_phone_and_verify_pin(db, msisdn, initial_pin_if_any)
-
-            ussd_session = models.USSDSession(
-                id=session_id,
-                phone_number=msisdn,
-                # digital_user_profile_id = digital_profile.id if digital_profile else None,
-                current_menu_code="MAIN_MENU_UNAUTH" if not digital_profile else "MAIN_MENU_AUTH",
-                session_data_json=json.dumps({}),
-                expires_at=datetime.utcnow() + timedelta(minutes=USSD_SESSION_TIMEOUT_MINUTES),
-                status="ACTIVE"
-            )
-            db.add(ussd_session)
-        else:
-            # Existing session, update expiry and last interaction
-            ussd_session.expires_at = datetime.utcnow() + timedelta(minutes=USSD_SESSION_TIMEOUT_MINUTES)
-            ussd_session.last_interaction_at = datetime.utcnow()
-            if ussd_session.digital_user_profile_id:
-                digital_profile = self._get_digital_user_profile(db, user_id=ussd_session.digital_user_profile_id)
-
-
-        session_data = json.loads(ussd_session.session_data_json or "{}")
-
-        # --- Simplified Menu Logic ---
-        # This should be a proper state machine or rule engine
-        response_text = ""
-        current_menu = ussd_session.current_menu_code
-
-        if current_menu == "MAIN_MENU_UNAUTH":
-            if not user_input: # First request
-                response_text = "CON Welcome to WeezyBank!\n1. Login (Enter PIN)\n2. Register\n3. Info"
-                ussd_session.current_menu_code = "MAIN_MENU_UNAUTH_CHOICE"
-            # ... handle choices for UNAUTH ...
-        elif current_menu == "MAIN_MENU_AUTH":
-            if not digital_profile: # Should not happen if menu is AUTH
-                 response_text = "END Error: Authentication lost. Please redial."
-            elif not user_input:
-                response_text = f"CON Welcome {digital_profile.username}!\n1. Balance\n2. Transfer\n0. Exit"
-                ussd_session.current_menu_code = "MAIN_MENU_AUTH_CHOICE"
-            # ... handle choices for AUTH ...
-        # ... more menu states ...
-        else: # Default or unknown state
-            response_text = "END Invalid option. Please try again."
-            ussd_session.status = "COMPLETED" # Or TIMED_OUT if error
-
-        # Example: PIN entry state
-        if current_menu == "AWAITING_PIN_FOR_LOGIN":
-            if user_input and len(user_input) == 4: # Assuming 4-digit PIN
-                # profile_to_auth = self._get_profile_by_phone(db, msisdn) # More complex lookup
-                # if profile_to_auth and self.verify_transaction_pin(db, profile_to_auth.id, user_input):
-                #    ussd_session.digital_user_profile_id = profile_to_auth.id
-                #    ussd_session.current_menu_code = "MAIN_MENU_AUTH"
-                #    response_text = "CON Login successful! Main Menu...\n1. Balance..." # Recursive call or next menu
-                # else:
-                #    response_text = "CON Invalid PIN. Try again or 0 to go back."
-                #    # Handle PIN attempts
-                pass # Placeholder for actual PIN verification logic
-            else:
-                response_text = "CON Invalid PIN format. Enter your 4-digit PIN."
-
-
-        if not response_text.startswith("CON ") and not response_text.startswith("END "):
-             response_text = "END An unexpected error occurred. Please redial." # Default to END if not set
-
-        ussd_session.session_data_json = json.dumps(session_data)
-        if response_text.startswith("END "):
-            ussd_session.status = "COMPLETED"
-
-        db.commit()
-        # db.refresh(ussd_session) # Not strictly needed before returning schema
-
+        response_text = await self.engine.handle(request_data.sessionId, request_data.msisdn, request_data.ussdString, db=db)
         return schemas.USSDResponseSchema(response_string=response_text)
 
+@ussd_engine.action("login_with_pin")
+async def _ussd_login_with_pin(ctx: USSDContext) -> str:
+    # PINs are 4 digits, so attempts are throttled per MSISDN (normalized, like the lookup) before any bcrypt
+    from weezy_cbs.customer_identity_management.duplicate_detection import normalize_phone
+    throttle_key = f"{USSD_THROTTLE_PREFIX}{normalize_phone(ctx.msisdn) or ctx.msisdn}"
+    if not login_throttle.check(throttle_key).allowed:
+        return "LOGIN_LOCKED"
+
+    profile = ussd_service._get_profile_by_phone(ctx.db, ctx.msisdn)
+    pin = ctx.state.get("secrets", {}).get("pin")
+    if not profile or not await digital_user_profile_service.verify_transaction_pin(ctx.db, profile.id, pin=pin):
+        decision = login_throttle.record_failure(throttle_key)
+        failed_login_audit_writer.record("USSD_LOGIN_FAIL", profile.username if profile else None,
+                                         f"USSD PIN login failed for MSISDN {ctx.msisdn}.", entity_id=str(profile.id) if profile else None)
+        return "LOGIN_FAILED" if decision.allowed else "LOGIN_LOCKED"
+    login_throttle.record_success(throttle_key)
+    ctx.state["profile_id"] = profile.id
+    ctx.data["username"] = profile.username
+    ctx.data["customer_id"] = profile.customer_id
+    return AUTH_ENTRY_STATE
+
+@ussd_engine.action("balance_inquiry")
+async def _ussd_balance_inquiry(ctx: USSDContext) -> None:
+    from weezy_cbs.accounts_ledger_management.services import get_accounts_by_customer_id
+    accounts = get_accounts_by_customer_id(ctx.db, ctx.data["customer_id"], limit=3)
+    if not accounts:
+        ctx.data["balance_text"] = "No account found on this profile."
+        return None
+    lines = [f"{acc.account_number}: {getattr(acc.currency, 'value', acc.currency)} {acc.available_balance:,.2f}" for acc in accounts]
+    ctx.data["balance_text"] = "Available balance\n" + "\n".join(lines)
+    return None
 
 # --- Notification Service ---
 class NotificationService(BaseDigitalChannelService):
@@ -667,6 +738,17 @@ class NotificationService(BaseDigitalChannelService):
         # self._audit_log(db, "NOTIFICATION_TRIGGERED", profile_id=notification_data.digital_user_profile_id, summary=f"Notification {log_entry.id} ({status}) to {recipient} via {notification_data.channel_type.value}.")
         return log_entry
 
+    def queue_notifications(self, db: Session, notifications: List[schemas.NotificationCreateSchema]) -> List[int]:
+        """
+        High-volume path (bulk payment alerts, campaigns): logs all notifications as QUEUED in one insert and
+        hands them to the batched, rate-limited dispatcher. trigger_notification remains for single
+        latency-sensitive sends such as OTPs.
+        """
+        try:
+            return get_notification_dispatcher().enqueue([n.dict() for n in notifications], db=db)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
 # --- Chatbot Service (Conceptual) ---
 class ChatbotService(BaseDigitalChannelService):
     async def handle_chatbot_message(self, db: Session, request_data: schemas.ChatbotRequestSchema) -> schemas.ChatbotResponseSchema:
@@ -0,0 +1,148 @@
+# Revoked-JTI index for digital channel access tokens
+#
+# Every authenticated request must know whether its JWT was revoked (logout, forced sign-out) without a
+# SessionLog query. Revoked JTIs are held in an in-process dict (jti -> token expiry) checked in O(1);
+# an entry is dropped once the token would have expired anyway, so the index only ever holds revoked,
+# still-valid tokens (a few thousand at most). An exact dict at that size is smaller than the false-positive
+# handling a bloom filter would need.
+#
+# Multi-worker deployments: set TOKEN_REVOCATION_SYNC=redis. Each revoke is published on a Redis channel
+# and every worker applies it to its own index. On startup the index is rebuilt from SessionLog rows
+# (ended sessions whose tokens are still inside their lifetime), so a restarted worker misses nothing.
+import heapq
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from .otp_store import OTP_REDIS_URL
+
+TOKEN_REVOCATION_SYNC = os.getenv("TOKEN_REVOCATION_SYNC", "none") # 'none' or 'redis'
+TOKEN_REVOCATION_CHANNEL = "weezy:jti-revoked"
+
+
+class TokenRevocationIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._revoked: Dict[str, float] = {} # jti -> token expiry (epoch seconds)
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._listeners = [] # Called with (jti, expires_at) on local revokes (e.g. the Redis publisher)
+
+    def revoke(self, jti: str, expires_at: float, propagate: bool = True) -> None:
+        if not jti or expires_at <= time.time():
+            return # Already expired tokens are rejected by JWT validation; nothing to remember
+        with self._lock:
+            if self._revoked.get(jti, 0) >= expires_at:
+                return
+            self._revoked[jti] = expires_at
+            heapq.heappush(self._expiry_heap, (expires_at, jti))
+            self._purge_locked(time.time())
+        if propagate:
+            for listener in self._listeners:
+                listener(jti, expires_at)
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        if not jti:
+            return False
+        expires_at = self._revoked.get(jti) # Lock-free read; dict get is atomic
+        return expires_at is not None and expires_at > time.time()
+
+    def _purge_locked(self, now: float) -> None:
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            expires_at, jti = heapq.heappop(heap)
+            if self._revoked.get(jti) == expires_at:
+                del self._revoked[jti]
+
+    def purge_expired(self) -> None:
+        with self._lock:
+            self._purge_locked(time.time())
+
+    def add_listener(self, listener) -> None:
+        self._listeners.append(listener)
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    def rebuild_from_session_logs(self, db, token_lifetime: timedelta) -> int:
+        """
+        Loads ended sessions whose tokens may still be unexpired. Token expiry is taken as login_time +
+        token_lifetime (the JWT exp used at issue). Returns the number of JTIs loaded.
+        """
+        from . import models
+        now = datetime.utcnow()
+        rows = db.query(models.SessionLog.session_token_jti, models.SessionLog.login_time)\
+            .filter(models.SessionLog.is_active == False,
+                    models.SessionLog.session_token_jti.isnot(None),
+                    models.SessionLog.login_time >= now - token_lifetime)\
+            .yield_per(5000)
+        loaded = 0
+        for jti, login_time in rows:
+            login_time = login_time.replace(tzinfo=None) if login_time.tzinfo else login_time
+            self.revoke(jti, _to_epoch(login_time + token_lifetime), propagate=False)
+            loaded += 1
+        return loaded
+
+
+def _to_epoch(naive_utc: datetime) -> float:
+    return (naive_utc - datetime(1970, 1, 1)).total_seconds()
+
+
+class RedisRevocationSync:
+    """Publishes local revokes and applies revokes from other workers (Redis pub/sub)."""
+    def __init__(self, index: TokenRevocationIndex, redis_client=None, channel: str = TOKEN_REVOCATION_CHANNEL):
+        if redis_client is None:
+            try:
+                import redis # Optional dependency, only needed for this sync mode
+            except ImportError as e:
+                raise RuntimeError("TOKEN_REVOCATION_SYNC=redis requires the 'redis' package.") from e
+            redis_client = redis.Redis.from_url(OTP_REDIS_URL)
+        self._redis = redis_client
+        self._channel = channel
+        self._index = index
+        self._origin = f"{os.getpid()}-{id(self)}" # Skip our own messages when they come back
+        index.add_listener(self.publish)
+        self._thread = threading.Thread(target=self._listen, name="jti-revocation-sync", daemon=True)
+        self._thread.start()
+
+    def publish(self, jti: str, expires_at: float) -> None:
+        try:
+            self._redis.publish(self._channel, json.dumps({"jti": jti, "exp": expires_at, "origin": self._origin}))
+        except Exception as e: # The revoke is already local and in SessionLog (startup rebuild covers peers)
+            print(f"Failed to publish JTI revocation: {e}")
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self._channel)
+                for message in pubsub.listen():
+                    data = json.loads(message["data"])
+                    if data.get("origin") != self._origin:
+                        self._index.revoke(data["jti"], float(data["exp"]), propagate=False)
+            except Exception as e:
+                print(f"JTI revocation subscriber error, reconnecting: {e}")
+                time.sleep(1)
+
+
+token_revocation_index = TokenRevocationIndex()
+_sync: Optional[RedisRevocationSync] = None
+
+def start_token_revocation_sync(session_factory=None, token_lifetime: Optional[timedelta] = None) -> int:
+    """Startup hook: rebuilds the index from SessionLog and starts Redis sync if configured."""
+    global _sync
+    if TOKEN_REVOCATION_SYNC == "redis" and _sync is None:
+        _sync = RedisRevocationSync(token_revocation_index) # Subscribe first so nothing is missed during the rebuild
+    if session_factory is None:
+        from weezy_cbs.database import SessionLocal
+        session_factory = SessionLocal
+    if token_lifetime is None:
+        from weezy_cbs.core_infrastructure_config_engine.services import ACCESS_TOKEN_EXPIRE_MINUTES
+        token_lifetime = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    db = session_factory()
+    try:
+        return token_revocation_index.rebuild_from_session_logs(db, token_lifetime)
+    finally:
+        db.close()
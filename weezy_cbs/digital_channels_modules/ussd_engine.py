@@ -0,0 +1,393 @@
+# USSD menu engine: declarative menus compiled into a transition table, session state in a TTL store
+#
+# The gateway gives us 2-3 seconds per hop and peak traffic is thousands of sessions per second, so a
+# keypress must not touch the database. Per hop the engine does one store GET, a dict lookup in the
+# compiled table and one store SET. The USSDSession row is written once, off the request path, when
+# the session ends (END response or TTL expiry) by USSDSessionPersister.
+#
+# Menu definition format (see USSD_MENU_DEFINITION below):
+#   "<STATE>": {
+#       "text": "Prompt shown to the user, may use {placeholders} from session data",
+#       "options": {"1": "NEXT_STATE", "0": "END_STATE", ...},     # Fixed choices
+#       "input": {"field": "amount", "pattern": r"^\d+$", "next": "NEXT_STATE"},  # Free-text capture
+#       "action": "action_name",  # Optional async hook run on entering the state (DB/integration work)
+#       "end": True,              # Terminal state: response is END, session is closed and persisted
+#   }
+import json
+import os
+import queue
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .otp_store import OTP_REDIS_URL
+
+USSD_SESSION_TTL_SECONDS = int(os.getenv("USSD_SESSION_TTL_SECONDS", "300")) # Matches USSD_SESSION_TIMEOUT_MINUTES
+USSD_SESSION_STORE_BACKEND = os.getenv("USSD_SESSION_STORE_BACKEND", os.getenv("OTP_STORE_BACKEND", "memory")) # 'memory' or 'redis'
+USSD_REDIS_KEY_PREFIX = "weezy:ussd:"
+USSD_PERSIST_BATCH_SIZE = 200
+USSD_PERSIST_FLUSH_SECONDS = 1.0
+USSD_MAX_INVALID_INPUTS = 3
+
+INVALID_OPTION_TEXT = "Invalid option."
+ENTRY_STATE = "MAIN_MENU_UNAUTH"
+AUTH_ENTRY_STATE = "MAIN_MENU_AUTH"
+
+USSD_MENU_DEFINITION: Dict[str, Dict[str, Any]] = {
+    "MAIN_MENU_UNAUTH": {
+        "text": "Welcome to WeezyBank!\n1. Login (Enter PIN)\n2. Register\n3. Info",
+        "options": {"1": "AWAITING_PIN_FOR_LOGIN", "2": "REGISTER_INFO", "3": "BANK_INFO"},
+    },
+    "AWAITING_PIN_FOR_LOGIN": {
+        "text": "Enter your 4-digit PIN:",
+        "input": {"field": "pin", "pattern": r"^\d{4}$", "next": "LOGIN_RESULT", "sensitive": True},
+    },
+    "LOGIN_RESULT": {"action": "login_with_pin"}, # Action redirects to MAIN_MENU_AUTH, LOGIN_FAILED or LOGIN_LOCKED
+    "LOGIN_FAILED": {"text": "Invalid PIN. Please redial to try again.", "end": True},
+    "LOGIN_LOCKED": {"text": "Too many wrong PIN attempts. Please try again in 30 minutes.", "end": True},
+    "REGISTER_INFO": {"text": "Visit any WeezyBank branch or download the WeezyBank app to register.", "end": True},
+    "BANK_INFO": {"text": "WeezyBank: banking made simple. Call 0700-WEEZY for support.", "end": True},
+    "MAIN_MENU_AUTH": {
+        "text": "Welcome {username}!\n1. Balance\n2. Transfer\n0. Exit",
+        "options": {"1": "BALANCE", "2": "TRANSFER_UNAVAILABLE", "0": "EXIT"},
+    },
+    "BALANCE": {"action": "balance_inquiry", "text": "{balance_text}", "end": True},
+    # Transfers need the NIP outward flow in transaction_management (bank selection, name enquiry, debit)
+    "TRANSFER_UNAVAILABLE": {"text": "Transfers are not available on USSD yet. Please use the WeezyBank app or internet banking.", "end": True},
+    "EXIT": {"text": "Thank you for banking with WeezyBank.", "end": True},
+}
+
+
+class MenuDefinitionError(Exception):
+    pass
+
+
+class CompiledState:
+    __slots__ = ("code", "text", "options", "input_field", "input_pattern", "input_next", "input_sensitive", "action", "end", "needs_format")
+
+    def __init__(self, code: str, spec: Dict[str, Any]):
+        self.code = code
+        self.text: str = spec.get("text", "")
+        self.needs_format = "{" in self.text
+        self.options: Dict[str, str] = dict(spec.get("options", {}))
+        input_spec = spec.get("input")
+        self.input_field: Optional[str] = input_spec["field"] if input_spec else None
+        self.input_pattern = re.compile(input_spec["pattern"]) if input_spec else None
+        self.input_next: Optional[str] = input_spec["next"] if input_spec else None
+        self.input_sensitive: bool = bool(input_spec and input_spec.get("sensitive"))
+        self.action: Optional[str] = spec.get("action")
+        self.end: bool = bool(spec.get("end"))
+
+
+class CompiledMenu:
+    """Transition table built once at import time; lookups on the hot path are plain dict gets."""
+    def __init__(self, states: Dict[str, CompiledState]):
+        self.states = states
+
+    def next_state(self, state: CompiledState, user_input: str) -> Optional[str]:
+        if state.options:
+            return state.options.get(user_input)
+        if state.input_pattern is not None and state.input_pattern.match(user_input):
+            return state.input_next
+        return None
+
+
+def compile_menu(definition: Dict[str, Dict[str, Any]], entry_states: Tuple[str, ...] = (ENTRY_STATE, AUTH_ENTRY_STATE)) -> CompiledMenu:
+    """Validates the definition (every target exists, entry states present) and builds the transition table."""
+    states = {code: CompiledState(code, spec) for code, spec in definition.items()}
+    for code in entry_states:
+        if code not in states:
+            raise MenuDefinitionError(f"Entry state '{code}' is not defined.")
+    for state in states.values():
+        targets = list(state.options.values()) + ([state.input_next] if state.input_next else [])
+        for target in targets:
+            if target not in states:
+                raise MenuDefinitionError(f"State '{state.code}' points to undefined state '{target}'.")
+        if state.options and state.input_pattern is not None:
+            raise MenuDefinitionError(f"State '{state.code}' cannot define both options and input.")
+        if not (state.end or state.options or state.input_pattern is not None or state.action):
+            raise MenuDefinitionError(f"State '{state.code}' is a dead end; mark it 'end' or give it transitions.")
+    return CompiledMenu(states)
+
+
+# --- Session state store ---
+class USSDSessionStore:
+    """Interface: session_id -> state dict, expiring after the USSD timeout."""
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def put(self, session_id: str, state: Dict[str, Any], ttl_seconds: int) -> None:
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> None:
+        raise NotImplementedError
+
+
+class InMemoryUSSDSessionStore(USSDSessionStore):
+    """Single-process store. Expired sessions are handed to `on_expire` (e.g. to record TIMED_OUT) by sweep_expired()."""
+    def __init__(self, on_expire: Optional[Callable[[str, Dict[str, Any]], None]] = None, sweep_interval_seconds: Optional[float] = 30):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[Dict[str, Any], float]] = {}
+        self._on_expire = on_expire
+        self._stop = threading.Event()
+        if sweep_interval_seconds:
+            threading.Thread(target=self._sweep_loop, args=(sweep_interval_seconds,), name="ussd-session-sweeper", daemon=True).start()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(session_id)
+        if not entry or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
+
+    def put(self, session_id: str, state: Dict[str, Any], ttl_seconds: int) -> None:
+        with self._lock:
+            self._entries[session_id] = (state, time.monotonic() + ttl_seconds)
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def sweep_expired(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            expired = [(sid, state) for sid, (state, exp) in self._entries.items() if exp <= now]
+            for sid, _ in expired:
+                del self._entries[sid]
+        if self._on_expire:
+            for sid, state in expired:
+                self._on_expire(sid, state)
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _sweep_loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            self.sweep_expired()
+
+    def close(self) -> None:
+        self._stop.set()
+
+
+class RedisUSSDSessionStore(USSDSessionStore):
+    """
+    Shared across workers; Redis key TTLs handle expiry. Sessions that time out in Redis are not
+    persisted (only END-ed sessions reach USSDSession) unless keyspace notifications are wired up.
+    """
+    def __init__(self, redis_client=None, key_prefix: str = USSD_REDIS_KEY_PREFIX):
+        if redis_client is None:
+            try:
+                import redis # Optional dependency, only needed for this backend
+            except ImportError as e:
+                raise RuntimeError("USSD_SESSION_STORE_BACKEND=redis requires the 'redis' package.") from e
+            redis_client = redis.Redis.from_url(OTP_REDIS_URL)
+        self._redis = redis_client
+        self._key_prefix = key_prefix
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        raw = self._redis.get(f"{self._key_prefix}{session_id}")
+        return json.loads(raw) if raw else None
+
+    def put(self, session_id: str, state: Dict[str, Any], ttl_seconds: int) -> None:
+        self._redis.set(f"{self._key_prefix}{session_id}", json.dumps(state), ex=ttl_seconds)
+
+    def delete(self, session_id: str) -> None:
+        self._redis.delete(f"{self._key_prefix}{session_id}")
+
+
+# --- Asynchronous persistence to USSDSession ---
+class USSDSessionPersister:
+    """
+    Background writer for finished sessions. Requests only enqueue a snapshot; a daemon thread
+    batches snapshots and upserts them into ussd_sessions with its own DB session.
+    """
+    def __init__(self, session_factory=None, batch_size: int = USSD_PERSIST_BATCH_SIZE, flush_seconds: float = USSD_PERSIST_FLUSH_SECONDS):
+        self._session_factory = session_factory
+        self._batch_size = batch_size
+        self._flush_seconds = flush_seconds
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+
+    def enqueue(self, session_id: str, state: Dict[str, Any], status: str) -> None:
+        snapshot = dict(state, session_id=session_id, status=status, ended_at=datetime.utcnow().isoformat())
+        self._queue.put(snapshot)
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="ussd-session-persister", daemon=True)
+                    self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self._flush_seconds
+            while len(batch) < self._batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.write_batch(batch)
+            except Exception as e: # Persistence is best-effort audit; never kill the writer thread
+                print(f"USSD session persistence failed for {len(batch)} sessions: {e}")
+
+    def write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        from . import models # Imported lazily so the engine itself carries no ORM dependency
+        session_factory = self._session_factory
+        if session_factory is None:
+            from weezy_cbs.database import SessionLocal
+            session_factory = SessionLocal
+        db = session_factory()
+        try:
+            for snapshot in batch:
+                db.merge(models.USSDSession(
+                    id=snapshot["session_id"],
+                    phone_number=snapshot["msisdn"],
+                    digital_user_profile_id=snapshot.get("profile_id"),
+                    current_menu_code=snapshot.get("state"),
+                    session_data_json=json.dumps(snapshot.get("data", {})),
+                    last_interaction_at=datetime.utcfromtimestamp(snapshot["last_interaction_at"]),
+                    expires_at=datetime.utcfromtimestamp(snapshot["expires_at"]),
+                    status=snapshot["status"],
+                ))
+            db.commit()
+        finally:
+            db.close()
+
+    def drain(self) -> None:
+        """Writes everything queued so far on the calling thread (shutdown hooks, tests)."""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self.write_batch(batch)
+
+
+class NullUSSDSessionPersister(USSDSessionPersister):
+    """Discards snapshots; used by the load-test harness to measure the engine alone."""
+    def enqueue(self, session_id: str, state: Dict[str, Any], status: str) -> None:
+        pass
+
+
+# --- Engine ---
+ActionHandler = Callable[["USSDContext"], Awaitable[Optional[str]]]
+
+class USSDContext:
+    """What an action sees: the session state (mutable `data`), the DB session and the caller's MSISDN."""
+    __slots__ = ("session_id", "msisdn", "state", "db")
+
+    def __init__(self, session_id: str, msisdn: str, state: Dict[str, Any], db):
+        self.session_id = session_id
+        self.msisdn = msisdn
+        self.state = state
+        self.db = db
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        return self.state["data"]
+
+
+class USSDEngine:
+    def __init__(self, menu: CompiledMenu, store: USSDSessionStore, persister: USSDSessionPersister,
+                 ttl_seconds: int = USSD_SESSION_TTL_SECONDS, max_invalid_inputs: int = USSD_MAX_INVALID_INPUTS):
+        self.menu = menu
+        self.store = store
+        self.persister = persister
+        self.ttl_seconds = ttl_seconds
+        self.max_invalid_inputs = max_invalid_inputs
+        self._actions: Dict[str, ActionHandler] = {}
+
+    def action(self, name: str):
+        """Decorator registering an async action. It may update ctx.data and return a state code to redirect to."""
+        def register(fn: ActionHandler) -> ActionHandler:
+            self._actions[name] = fn
+            return fn
+        return register
+
+    def _new_state(self, msisdn: str, now: float) -> Dict[str, Any]:
+        return {"msisdn": msisdn, "state": ENTRY_STATE, "profile_id": None, "data": {}, "invalid_inputs": 0,
+                "started_at": now, "last_interaction_at": now, "expires_at": now + self.ttl_seconds}
+
+    async def _enter(self, ctx: USSDContext, code: str) -> "CompiledState":
+        # Follow action redirects (bounded to catch definition loops)
+        for _ in range(len(self.menu.states)):
+            state = self.menu.states[code]
+            ctx.state["state"] = code
+            if not state.action:
+                return state
+            handler = self._actions.get(state.action)
+            if handler is None:
+                raise MenuDefinitionError(f"No handler registered for action '{state.action}'.")
+            redirect = await handler(ctx)
+            if not redirect or redirect == code:
+                return state
+            code = redirect
+        raise MenuDefinitionError(f"Action redirect loop detected at state '{code}'.")
+
+    def _render(self, state: CompiledState, ctx: USSDContext, prefix: str = "") -> str:
+        text = state.text.format_map(_DefaultDict(ctx.data, username=ctx.data.get("username", ""))) if state.needs_format else state.text
+        return f"{'END' if state.end else 'CON'} {prefix}{text}"
+
+    async def handle(self, session_id: str, msisdn: str, user_input: Optional[str], db=None) -> str:
+        now = time.time()
+        session_state = self.store.get(session_id)
+        is_new = session_state is None
+        if is_new:
+            session_state = self._new_state(msisdn, now)
+        ctx = USSDContext(session_id, msisdn, session_state, db)
+        user_input = (user_input or "").strip()
+
+        if is_new:
+            state = await self._enter(ctx, session_state["state"])
+            response = self._render(state, ctx)
+        else:
+            current = self.menu.states.get(session_state["state"])
+            next_code = self.menu.next_state(current, user_input) if current else None
+            if next_code is None:
+                session_state["invalid_inputs"] += 1
+                if current is None or session_state["invalid_inputs"] >= self.max_invalid_inputs:
+                    state, response = None, "END Too many invalid entries. Please redial."
+                else:
+                    state, response = current, self._render(current, ctx, prefix=f"{INVALID_OPTION_TEXT}\n")
+            else:
+                if current.input_field:
+                    # Sensitive captures (PINs) are kept out of `data`, which is persisted
+                    target = session_state.setdefault("secrets", {}) if current.input_sensitive else session_state["data"]
+                    target[current.input_field] = user_input
+                session_state["invalid_inputs"] = 0
+                state = await self._enter(ctx, next_code)
+                response = self._render(state, ctx)
+
+        session_state.pop("secrets", None) # Captured PINs are consumed by the action in the same hop, never stored
+        session_state["last_interaction_at"] = now
+        session_state["expires_at"] = now + self.ttl_seconds
+        if response.startswith("END "):
+            self.store.delete(session_id)
+            self.persister.enqueue(session_id, session_state, status="COMPLETED")
+        else:
+            self.store.put(session_id, session_state, self.ttl_seconds)
+        return response
+
+
+class _DefaultDict(dict):
+    def __missing__(self, key):
+        return ""
+
+
+def build_session_store(persister: USSDSessionPersister) -> USSDSessionStore:
+    if USSD_SESSION_STORE_BACKEND == "redis":
+        return RedisUSSDSessionStore()
+    return InMemoryUSSDSessionStore(on_expire=lambda sid, state: persister.enqueue(sid, state, status="TIMED_OUT"))
+
+
+compiled_ussd_menu = compile_menu(USSD_MENU_DEFINITION)
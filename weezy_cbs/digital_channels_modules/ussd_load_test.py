@@ -0,0 +1,121 @@
+# USSD load-test harness: drives many concurrent sessions through a scripted menu path and reports
+# latency percentiles per hop.
+#
+# In-process mode (default) exercises USSDEngine with the in-memory store and stubbed actions, i.e. the
+# per-keypress cost without network or DB. HTTP mode (--url) posts to a running callback endpoint and
+# needs the optional 'httpx' package.
+#
+#   python -m weezy_cbs.digital_channels_modules.ussd_load_test --sessions 5000 --concurrency 500
+#   python -m weezy_cbs.digital_channels_modules.ussd_load_test --url http://localhost:8000/api/v1/digital-channels/digital-channels/ussd/callback
+import argparse
+import asyncio
+import time
+import uuid
+from typing import Dict, List, Optional, Sequence
+
+from .ussd_engine import (
+    USSDEngine, USSDContext, InMemoryUSSDSessionStore, NullUSSDSessionPersister, compiled_ussd_menu, AUTH_ENTRY_STATE
+)
+
+# Login -> Balance
+DEFAULT_SCRIPT: Sequence[str] = ("", "1", "1234", "1")
+
+
+def build_in_process_engine() -> USSDEngine:
+    engine = USSDEngine(compiled_ussd_menu, InMemoryUSSDSessionStore(sweep_interval_seconds=None), NullUSSDSessionPersister())
+
+    @engine.action("login_with_pin")
+    async def _login(ctx: USSDContext) -> str:
+        ctx.state["profile_id"] = 1
+        ctx.data["username"] = "loadtest"
+        ctx.data["customer_id"] = 1
+        return AUTH_ENTRY_STATE
+
+    @engine.action("balance_inquiry")
+    async def _balance(ctx: USSDContext) -> None:
+        ctx.data["balance_text"] = "Available balance\n0123456789: NGN 1,000.00"
+
+    return engine
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+async def run_load_test(sessions: int, concurrency: int, script: Sequence[str] = DEFAULT_SCRIPT,
+                        engine: Optional[USSDEngine] = None, url: Optional[str] = None) -> Dict[str, object]:
+    """Returns {'hops': [{'hop', 'input', 'count', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'}], 'errors', 'elapsed_s', 'hops_per_s'}."""
+    latencies: List[List[float]] = [[] for _ in script]
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    http_client = None
+    if url:
+        try:
+            import httpx # Optional dependency, only needed for HTTP mode
+        except ImportError as e:
+            raise RuntimeError("HTTP mode requires the 'httpx' package.") from e
+        http_client = httpx.AsyncClient(timeout=5.0, limits=httpx.Limits(max_connections=concurrency))
+    elif engine is None:
+        engine = build_in_process_engine()
+
+    async def hop(session_id: str, msisdn: str, user_input: str) -> str:
+        if http_client is not None:
+            response = await http_client.post(url, json={"sessionId": session_id, "msisdn": msisdn, "serviceCode": "*000#", "ussdString": user_input})
+            response.raise_for_status()
+            return response.json()["response_string"]
+        return await engine.handle(session_id, msisdn, user_input)
+
+    async def run_session(n: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            session_id, msisdn = uuid.uuid4().hex, f"080{n:08d}"
+            for i, user_input in enumerate(script):
+                started = time.perf_counter()
+                try:
+                    response = await hop(session_id, msisdn, user_input)
+                except Exception:
+                    errors += 1
+                    return
+                latencies[i].append((time.perf_counter() - started) * 1000.0)
+                if response.startswith("END "):
+                    return
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(run_session(n) for n in range(sessions)))
+    finally:
+        if http_client is not None:
+            await http_client.aclose()
+    elapsed = time.perf_counter() - started
+
+    hops = []
+    for i, values in enumerate(latencies):
+        values.sort()
+        hops.append({
+            "hop": i + 1, "input": script[i] or "<dial>", "count": len(values),
+            "p50_ms": percentile(values, 50), "p95_ms": percentile(values, 95),
+            "p99_ms": percentile(values, 99), "max_ms": values[-1] if values else 0.0,
+        })
+    total_hops = sum(h["count"] for h in hops)
+    return {"hops": hops, "errors": errors, "elapsed_s": elapsed, "hops_per_s": total_hops / elapsed if elapsed else 0.0}
+
+
+def _print_report(report: Dict[str, object]) -> None:
+    print(f"{'hop':>4} {'input':>12} {'count':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for h in report["hops"]:
+        print(f"{h['hop']:>4} {h['input']:>12} {h['count']:>8} {h['p50_ms']:>9.3f} {h['p95_ms']:>9.3f} {h['p99_ms']:>9.3f} {h['max_ms']:>9.3f}")
+    print(f"errors={report['errors']} elapsed={report['elapsed_s']:.2f}s throughput={report['hops_per_s']:.0f} hops/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="USSD per-hop latency load test.")
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--url", default=None, help="Callback URL for HTTP mode; omit to test the engine in-process.")
+    parser.add_argument("--script", default=None, help="Comma-separated inputs per hop (first is the dial, usually empty).")
+    args = parser.parse_args()
+    script = tuple(args.script.split(",")) if args.script else DEFAULT_SCRIPT
+    _print_report(asyncio.run(run_load_test(args.sessions, args.concurrency, script=script, url=args.url)))
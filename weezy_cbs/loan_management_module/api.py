@@ -0,0 +1,59 @@
+# API Endpoints for Loan Management
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from typing import List
+
+from . import services, schemas
+# from weezy_cbs.database import get_db
+# from weezy_cbs.auth.dependencies import get_current_active_admin_user
+
+# Placeholder get_db and auth
+def get_db_placeholder(): yield None
+get_db = get_db_placeholder
+def get_current_active_admin_user_placeholder(): return {"id": "admin01", "role": "admin"}
+get_current_active_admin_user = get_current_active_admin_user_placeholder
+
+
+router = APIRouter(
+    prefix="/loans",
+    tags=["Loan Management"],
+    responses={404: {"description": "Not found"}},
+)
+
+# --- Loan Product Endpoints ---
+@router.post("/products", response_model=schemas.LoanProductResponse, status_code=status.HTTP_201_CREATED)
+def create_loan_product(
+    product_in: schemas.LoanProductCreateRequest,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_active_admin_user)
+):
+    """Create a loan product. (Admin operation)"""
+    if db is None: raise HTTPException(status_code=503, detail="Database not configured for API.")
+    return services.create_loan_product(db, product_in)
+
+@router.get("/products", response_model=List[schemas.LoanProductResponse])
+def list_loan_products(skip: int = 0, limit: int = 100, active_only: bool = True, db: Session = Depends(get_db)):
+    """List loan products."""
+    if db is None: raise HTTPException(status_code=503, detail="Database not configured for API.")
+    return services.get_loan_products(db, skip=skip, limit=limit, active_only=active_only)
+
+# --- Loan Application Endpoints ---
+@router.post("/applications", response_model=schemas.LoanApplicationResponse, status_code=status.HTTP_201_CREATED)
+def submit_loan_application(application_in: schemas.LoanApplicationCreateRequest, db: Session = Depends(get_db)):
+    """Submit a loan application against an active product."""
+    if db is None: raise HTTPException(status_code=503, detail="Database not configured for API.")
+    try:
+        return services.create_loan_application(db, application_in)
+    except services.NotFoundException as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except services.InvalidOperationException as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/applications/{application_id}", response_model=schemas.LoanApplicationResponse)
+def get_loan_application(application_id: int, db: Session = Depends(get_db)):
+    """Get a loan application by ID."""
+    if db is None: raise HTTPException(status_code=503, detail="Database not configured for API.")
+    application = services.get_loan_application(db, application_id)
+    if not application:
+        raise HTTPException(status_code=404, detail=f"Loan application {application_id} not found")
+    return application
@@ -3,11 +3,13 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func
 from . import models, schemas
 from .models import LoanApplicationStatusEnum, LoanAccountStatusEnum, CurrencyEnum # Direct enum access
+from typing import List, Optional
 import decimal
 import random
 import string
 from datetime import datetime, date
 from dateutil.relativedelta import relativedelta # For adding months to dates
+from weezy_cbs.core_infrastructure_config_engine import event_bus
 
 # Placeholder for shared exceptions, other services, and utilities
 # from weezy_cbs.shared import exceptions
@@ -26,7 +28,7 @@ def generate_loan_account_number_placeholder():
     return "LACC" + "".join(random.choices(string.digits, k=8))
 
 # --- Loan Product Services ---
-def create_loan_product(db: Session, product_in: schemas.LoanProductCreate) -> models.LoanProduct:
+def create_loan_product(db: Session, product_in: schemas.LoanProductCreateRequest) -> models.LoanProduct:
     db_product = models.LoanProduct(**product_in.dict())
     db.add(db_product)
     db.commit()
@@ -43,7 +45,7 @@ def get_loan_products(db: Session, skip: int = 0, limit: int = 100, active_only:
     return query.offset(skip).limit(limit).all()
 
 # --- Loan Application Services ---
-def create_loan_application(db: Session, application_in: schemas.LoanApplicationCreate) -> models.LoanApplication:
+def create_loan_application(db: Session, application_in: schemas.LoanApplicationCreateRequest) -> models.LoanApplication:
     # Validate customer exists
     # customer = get_customer(db, application_in.customer_id)
     # if not customer:
@@ -216,6 +218,7 @@ def disburse_loan(db: Session, disbursement_request: schemas.LoanDisbursementReq
     # Generate Repayment Schedule
     generate_repayment_schedule(db, db_loan_account.id)
 
+    event_bus.publish(event_bus.LOAN_ACCOUNT_CHANGED, customer_id=db_loan_account.customer_id, loan_account_id=db_loan_account.id, change="DISBURSED")
     return db_loan_account
 
 def get_loan_account(db: Session, loan_account_id: int) -> Optional[models.LoanAccount]:
@@ -287,7 +290,7 @@ def get_repayment_schedule(db: Session, loan_account_id: int) -> List[models.Loa
     return db.query(models.LoanRepaymentSchedule).filter(models.LoanRepaymentSchedule.loan_account_id == loan_account_id).order_by(models.LoanRepaymentSchedule.installment_number).all()
 
 # --- Loan Repayment Processing ---
-def process_loan_repayment(db: Session, repayment_in: schemas.LoanRepaymentCreate) -> models.LoanRepayment:
+def process_loan_repayment(db: Session, repayment_in: schemas.LoanRepaymentCreateRequest) -> models.LoanRepayment:
     loan_account = get_loan_account_by_number(db, repayment_in.loan_account_number)
     if not loan_account:
         raise NotFoundException(f"Loan account {repayment_in.loan_account_number} not found.")
@@ -355,10 +358,11 @@ def process_loan_repayment(db: Session, repayment_in: schemas.LoanRepaymentCreat
     db.commit()
     db.refresh(db_repayment)
     db.refresh(loan_account)
+    event_bus.publish(event_bus.LOAN_ACCOUNT_CHANGED, customer_id=loan_account.customer_id, loan_account_id=loan_account.id, change="REPAYMENT")
     return db_repayment
 
 # --- Guarantors and Collaterals ---
-def add_guarantor(db: Session, guarantor_in: schemas.GuarantorCreate) -> models.Guarantor:
+def add_guarantor(db: Session, guarantor_in: schemas.GuarantorCreateRequest) -> models.Guarantor:
     # Check if application exists
     app = get_loan_application(db, guarantor_in.loan_application_id)
     if not app:
@@ -370,7 +374,7 @@ def add_guarantor(db: Session, guarantor_in: schemas.GuarantorCreate) -> models.
     db.refresh(db_guarantor)
     return db_guarantor
 
-def add_collateral(db: Session, collateral_in: schemas.CollateralCreate) -> models.Collateral:
+def add_collateral(db: Session, collateral_in: schemas.CollateralCreateRequest) -> models.Collateral:
     app = get_loan_application(db, collateral_in.loan_application_id)
     if not app:
         raise NotFoundException(f"Loan application {collateral_in.loan_application_id} not found.")
@@ -45,7 +45,51 @@ async def startup_event():
     # print("Creating database tables on startup...")
     # create_all_tables() # This function needs to be defined in database.py and ensure all models are imported there
     # print("Database tables checked/created.")
-    pass
+
+    # Load revoked-but-unexpired token JTIs so logged-out sessions stay rejected across restarts
+    from weezy_cbs.digital_channels_modules.token_revocation import start_token_revocation_sync
+    try:
+        start_token_revocation_sync()
+    except Exception as e: # DB may be unavailable at boot; revokes from this point on are still enforced
+        print(f"Token revocation index rebuild failed: {e}")
+
+    from weezy_cbs.reports_analytics.report_scheduler import REPORT_SCHEDULER_ENABLED, start_report_scheduler
+    if REPORT_SCHEDULER_ENABLED:
+        start_report_scheduler()
+
+    from weezy_cbs.reports_analytics.rollups import REPORT_ROLLUPS_ENABLED, start_rollup_refresher
+    if REPORT_ROLLUPS_ENABLED:
+        start_rollup_refresher()
+
+    from weezy_cbs.compliance_regulatory_reporting.aml_engine import AML_ENGINE_ENABLED, start_aml_engine
+    if AML_ENGINE_ENABLED:
+        start_aml_engine()
+
+    # Re-enqueue notifications a previous process left QUEUED/RETRYING
+    from weezy_cbs.digital_channels_modules.notification_dispatcher import start_notification_dispatcher
+    try:
+        start_notification_dispatcher()
+    except Exception as e: # DB may be unavailable at boot; the rows are picked up on the next start
+        print(f"Notification recovery failed: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Flush USSD sessions that ended but are still queued for persistence
+    from weezy_cbs.digital_channels_modules.services import ussd_session_persister, failed_login_audit_writer
+    ussd_session_persister.drain()
+    failed_login_audit_writer.drain()
+
+    from weezy_cbs.reports_analytics.report_scheduler import stop_report_scheduler
+    stop_report_scheduler()
+
+    from weezy_cbs.reports_analytics.rollups import stop_rollup_refresher
+    stop_rollup_refresher()
+
+    from weezy_cbs.compliance_regulatory_reporting.aml_engine import stop_aml_engine
+    stop_aml_engine() # Flushes buffered hits and checkpoints window state
+
+    from weezy_cbs.digital_channels_modules.notification_dispatcher import stop_notification_dispatcher
+    stop_notification_dispatcher() # Unsent messages stay QUEUED/RETRYING and are recovered on the next start
 
 # Include routers from each module
 # The prefix here defines the base path for all routes in that router.
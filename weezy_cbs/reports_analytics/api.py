@@ -1,4 +1,5 @@
-from typing import List, Optional, Any, Union
+from typing import List, Optional, Any, Union, Dict
+import json
 
 from fastapi import APIRouter, Depends, HTTPException, status, Body, BackgroundTasks, Query
 from sqlalchemy.orm import Session
@@ -9,6 +10,8 @@ from .services import (
     report_definition_service, scheduled_report_service, generated_report_log_service,
     dashboard_layout_service, ReportGenerationService # ReportGenerationService needs instantiation
 )
+from .query_compiler import DynamicFilterError
+from .query_guard import ReportCostExceededError
 # Assuming an authentication dependency from core_infrastructure_config_engine
 from weezy_cbs.core_infrastructure_config_engine.api import get_current_active_superuser, get_performing_user_username
 from weezy_cbs.core_infrastructure_config_engine.models import User as CoreUser # For type hint
@@ -84,7 +87,7 @@ async def generate_report_from_definition_endpoint(
     definition_id: int,
     background_tasks: BackgroundTasks,
     parameters: Optional[Dict[str, Any]] = Body(None, description="Parameters for the report"),
-    output_format: str = Query("CSV", description="Desired output format (e.g., CSV, JSON, PDF)"),
+    output_format: str = Query("CSV", description="Desired output format: CSV, JSON, JSONL, PARQUET or ARROW"),
     db: Session = Depends(get_db), # Pass db session to endpoint
     current_user: CoreUser = Depends(get_current_active_superuser)
 ):
@@ -120,12 +123,39 @@ async def generate_report_from_definition_endpoint(
         username=current_user.username,
         # Pass the log_entry_id to the background task to update it, instead of the object itself.
         # The background task will then fetch the log entry using its ID.
-        # This is a conceptual change if generate_report_from_definition is refactored for true async.
-        # For now, the service updates the log entry passed to it.
+        log_entry_id=log_entry.id,
     )
 
     return log_entry # Return the initial log entry (status PENDING)
 
+@exec_logs_router.post("/definitions/{definition_id}/preview", response_model=schemas.DynamicReportPageResponse)
+async def preview_dynamic_report_endpoint(
+    definition_id: int,
+    parameters: Optional[Dict[str, Any]] = Body(None, description="Filters for the report"),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    db: Session = Depends(get_db),
+    current_user: CoreUser = Depends(get_current_active_superuser)
+):
+    # Keyset-paginated rows of a DYNAMIC_FILTERS_ON_MODEL report, without generating a file
+    report_def = report_definition_service.get_definition_by_id(db, definition_id)
+    if not report_def:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Report Definition not found")
+    if report_def.query_logic_type != models.ReportQueryLogicTypeEnum.DYNAMIC_FILTERS_ON_MODEL:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Preview is only available for dynamic filter reports.")
+    query_details = json.loads(report_def.query_details_json)
+    report_gen_service = ReportGenerationService(db, generated_report_log_service, report_definition_service)
+    try:
+        rows, next_cursor = report_gen_service._execute_dynamic_filter_report(
+            query_details["base_model_name"], parameters or {}, query_details.get("default_select_fields"),
+            query_details.get("default_sort_by"), limit=limit, cursor=cursor, keyset=True,
+            allowed_filter_fields=query_details.get("allowed_filter_fields"),
+            max_estimated_cost=report_def.max_estimated_cost, statement_timeout_seconds=report_def.statement_timeout_seconds
+        )
+    except (DynamicFilterError, ReportCostExceededError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"rows": rows, "next_cursor": next_cursor}
+
 @exec_logs_router.get("/generated-logs/{log_id}", response_model=schemas.GeneratedReportLogResponse)
 async def get_generated_report_log_endpoint(log_id: int, db: Session = Depends(get_db)):
     log_entry = generated_report_log_service.get_log_by_id(db, log_id)
@@ -194,6 +224,15 @@ async def list_scheduled_reports_endpoint(skip: int = 0, limit: int = 20, db: Se
     schedules, total = scheduled_report_service.get_schedules(db, skip=skip, limit=limit)
     return {"items": schedules, "total": total, "page": (skip // limit) + 1, "size": limit}
 
+@schedules_router.get("/scheduler/metrics", response_model=Dict[str, Any])
+async def get_report_scheduler_metrics_endpoint(current_user: CoreUser = Depends(get_current_active_superuser)):
+    # Metrics of this node's scheduler daemon (queue lag, run durations, in-flight runs)
+    from .report_scheduler import get_report_scheduler
+    scheduler = get_report_scheduler()
+    if scheduler is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Report scheduler is not running on this node.")
+    return scheduler.metrics()
+
 @schedules_router.get("/{schedule_id}", response_model=schemas.ScheduledReportResponse)
 async def read_scheduled_report_endpoint(schedule_id: int, db: Session = Depends(get_db)):
     db_sched = scheduled_report_service.get_schedule_by_id(db, schedule_id)
@@ -268,6 +307,19 @@ async def read_dashboard_layout_endpoint(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dashboard Layout not found or not accessible.")
     return db_layout
 
+@dashboards_router.get("/{dashboard_id}/widgets/{widget_id}/data", response_model=schemas.WidgetDataResponse)
+async def get_dashboard_widget_data_endpoint(
+    dashboard_id: int,
+    widget_id: str,
+    db: Session = Depends(get_db),
+    current_user: CoreUser = Depends(get_current_active_superuser)
+):
+    # Served from the transaction rollups when the widget's grouping/filters allow it
+    widget_data = dashboard_layout_service.get_widget_data(db, layout_id=dashboard_id, widget_id=widget_id, user_id=current_user.id)
+    if not widget_data:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dashboard or widget not found or not accessible.")
+    return widget_data
+
 @dashboards_router.put("/{dashboard_id}", response_model=schemas.DashboardLayoutResponse)
 async def update_dashboard_layout_endpoint(
     dashboard_id: int,
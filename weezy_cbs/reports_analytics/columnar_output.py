@@ -0,0 +1,174 @@
+# Columnar (Parquet / Arrow IPC) report output
+#
+# Analysts load the large MIS and regulatory extracts into pandas, Spark or DuckDB. Re-parsing multi-GB
+# CSVs every day is slow and loses types. These writers take the same row batches the streaming
+# executor reads from the server-side cursor and write them as typed columns:
+#   - PARQUET: compressed columnar file (zstd by default). Each row group holds up to
+#     REPORT_PARQUET_ROW_GROUP_ROWS rows, so memory is bounded by one row group.
+#   - ARROW: Arrow IPC file format, uncompressed, so consumers can memory-map it and read it zero-copy
+#     (pyarrow.memory_map + pyarrow.ipc.open_file).
+# Column types come from SQLAlchemy where known (Numeric -> decimal128, DateTime -> timestamp, Enum ->
+# dictionary<int32, string>). Otherwise they are inferred from the first batch.
+# pyarrow is an optional dependency, only needed when these formats are requested.
+import enum
+import os
+from decimal import Decimal
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+REPORT_PARQUET_COMPRESSION = os.getenv("REPORT_PARQUET_COMPRESSION", "zstd")
+REPORT_PARQUET_ROW_GROUP_ROWS = int(os.getenv("REPORT_PARQUET_ROW_GROUP_ROWS", "131072"))
+
+COLUMNAR_OUTPUT_FORMATS = ("PARQUET", "ARROW")
+COLUMNAR_FILE_EXTENSIONS = {"PARQUET": "parquet", "ARROW": "arrow"}
+
+
+def _pyarrow():
+    try:
+        import pyarrow # Optional dependency, only needed for columnar report formats
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("PARQUET/ARROW report output requires the 'pyarrow' package.") from e
+    return pyarrow
+
+
+def arrow_type_for_sqlalchemy(sa_type) -> Optional[Any]:
+    """Maps a SQLAlchemy column type to an Arrow type; None when it should be inferred from data."""
+    pa = _pyarrow()
+    import sqlalchemy as sa
+    if isinstance(sa_type, sa.Enum):
+        return pa.dictionary(pa.int32(), pa.string())
+    if isinstance(sa_type, sa.Boolean):
+        return pa.bool_()
+    if isinstance(sa_type, sa.SmallInteger):
+        return pa.int16()
+    if isinstance(sa_type, sa.Integer): # Includes BigInteger
+        return pa.int64()
+    if isinstance(sa_type, sa.Numeric) and not isinstance(sa_type, sa.Float):
+        return pa.decimal128(min(sa_type.precision or 38, 38), sa_type.scale if sa_type.scale is not None else 6)
+    if isinstance(sa_type, sa.Float):
+        return pa.float64()
+    if isinstance(sa_type, sa.DateTime):
+        return pa.timestamp("us", tz="UTC" if sa_type.timezone else None)
+    if isinstance(sa_type, sa.Date):
+        return pa.date32()
+    if isinstance(sa_type, (sa.String, sa.Text)):
+        return pa.string()
+    if isinstance(sa_type, sa.LargeBinary):
+        return pa.binary()
+    return None
+
+
+def _inferred_type(values: Sequence[Any]):
+    pa = _pyarrow()
+    sample = [v for v in values if v is not None]
+    if not sample:
+        return pa.string() # All-null column in the first batch
+    first = sample[0]
+    if isinstance(first, enum.Enum):
+        return pa.dictionary(pa.int32(), pa.string())
+    if isinstance(first, Decimal):
+        # DB numerics come back with the column's scale, so the first batch shows it
+        scale = max(-v.as_tuple().exponent for v in sample if isinstance(v, Decimal))
+        return pa.decimal128(38, max(scale, 0))
+    if isinstance(first, datetime):
+        return pa.timestamp("us", tz="UTC" if first.tzinfo is not None else None)
+    if isinstance(first, date):
+        return pa.date32()
+    return pa.array(sample[:1000]).type
+
+
+def build_arrow_schema(columns: Sequence[str], first_batch: Sequence[Sequence[Any]],
+                       column_types: Optional[Dict[str, Any]] = None, dictionary_columns: Iterable[str] = ()):
+    """`column_types` maps column name -> SQLAlchemy type; `dictionary_columns` forces dictionary encoding (e.g. enum-like text)."""
+    pa = _pyarrow()
+    column_types = column_types or {}
+    dictionary_columns = set(dictionary_columns or ())
+    values_by_column = list(zip(*first_batch)) if first_batch else [() for _ in columns]
+    fields = []
+    for i, name in enumerate(columns):
+        arrow_type = arrow_type_for_sqlalchemy(column_types[name]) if column_types.get(name) is not None else None
+        if arrow_type is None:
+            arrow_type = _inferred_type(values_by_column[i])
+        if name in dictionary_columns and not pa.types.is_dictionary(arrow_type):
+            arrow_type = pa.dictionary(pa.int32(), pa.string())
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+def _record_batch(schema, batch: Sequence[Sequence[Any]]):
+    pa = _pyarrow()
+    columns = list(zip(*batch))
+    arrays = []
+    for i, field in enumerate(schema):
+        values = columns[i]
+        if pa.types.is_dictionary(field.type):
+            values = [v.value if isinstance(v, enum.Enum) else (None if v is None else str(v)) for v in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_columnar_stream(columns: Sequence[str], batches: Iterable[Sequence[Sequence[Any]]], output_format: str, out_binary,
+                          column_types: Optional[Dict[str, Any]] = None, dictionary_columns: Iterable[str] = (),
+                          on_progress: Optional[Callable[[int, int], None]] = None, progress_every_rows: int = 100000) -> Tuple[int, int]:
+    """
+    Writes row batches as Parquet or an Arrow IPC file into `out_binary`.
+    Returns (rows_written, bytes_written).
+    """
+    from .report_streaming import _CountingWriter
+    pa = _pyarrow()
+    output_format = output_format.upper()
+    if output_format not in COLUMNAR_OUTPUT_FORMATS:
+        raise ValueError(f"Output format {output_format} is not a columnar format.")
+
+    counter = _CountingWriter(out_binary)
+    batch_iter = iter(batches)
+    first_batch = next(batch_iter, [])
+    schema = build_arrow_schema(columns, first_batch, column_types, dictionary_columns)
+    dictionary_names = [f.name for f in schema if pa.types.is_dictionary(f.type)]
+
+    if output_format == "PARQUET":
+        writer = pa.parquet.ParquetWriter(counter, schema, compression=REPORT_PARQUET_COMPRESSION,
+                                          use_dictionary=dictionary_names or False)
+    else:
+        writer = pa.ipc.new_file(counter, schema)
+
+    rows_written = 0
+    next_progress = progress_every_rows
+    pending: List[Any] = [] # Record batches buffered into one Parquet row group
+    pending_rows = 0
+
+    def flush_row_group():
+        nonlocal pending, pending_rows
+        if pending:
+            writer.write_table(pa.Table.from_batches(pending, schema=schema))
+            pending, pending_rows = [], 0
+
+    try:
+        for batch in _chain_first(first_batch, batch_iter):
+            record_batch = _record_batch(schema, batch)
+            if output_format == "PARQUET":
+                pending.append(record_batch)
+                pending_rows += record_batch.num_rows
+                if pending_rows >= REPORT_PARQUET_ROW_GROUP_ROWS:
+                    flush_row_group()
+            else:
+                writer.write_batch(record_batch)
+            rows_written += record_batch.num_rows
+            if on_progress is not None and rows_written >= next_progress:
+                on_progress(rows_written, counter.bytes_written)
+                next_progress = rows_written + progress_every_rows
+        if output_format == "PARQUET":
+            flush_row_group()
+    finally:
+        writer.close()
+    return rows_written, counter.bytes_written
+
+
+def _chain_first(first_batch, rest):
+    if first_batch:
+        yield first_batch
+    for batch in rest:
+        if batch:
+            yield batch
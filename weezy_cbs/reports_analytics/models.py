@@ -1,5 +1,5 @@
 # Database models for Reports & Analytics Module
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Enum as SQLAlchemyEnum, UniqueConstraint
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Boolean, Text, Numeric, Float, ForeignKey, Enum as SQLAlchemyEnum, UniqueConstraint, Index
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.sql import func
 import enum
@@ -38,6 +38,10 @@ class ReportDefinition(Base):
 
     is_system_report = Column(Boolean, default=False, nullable=False)
     version = Column(Integer, default=1, nullable=False)
+    result_cache_ttl_seconds = Column(Integer, nullable=True) # Reuse identical runs for this long (see result_cache.py); null/0 = off
+    # Execution guard (see query_guard.py); null = global defaults
+    statement_timeout_seconds = Column(Integer, nullable=True)
+    max_estimated_cost = Column(Float, nullable=True) # Planner cost units
 
     # Ensure User model (core_infra) has: report_definitions_created = relationship("ReportDefinition", foreign_keys="[ReportDefinition.created_by_user_id]", back_populates="created_by_user")
     created_by_user_id = Column(Integer, ForeignKey("users.id", name="fk_reportdef_createdby"), nullable=True)
@@ -46,7 +50,7 @@ class ReportDefinition(Base):
 
     # created_by_user = relationship("User", foreign_keys=[created_by_user_id]) # If User model is importable
     scheduled_reports = relationship("ScheduledReport", back_populates="report_definition", cascade="all, delete-orphan")
-    generated_logs = relationship("GeneratedReportLog", back_populates="report_definition", cascade="all, delete-orphan") # If a def is deleted, logs might be orphaned or deleted.
+    generated_logs = relationship("weezy_cbs.reports_analytics.models.GeneratedReportLog", back_populates="report_definition", cascade="all, delete-orphan") # If a def is deleted, logs might be orphaned or deleted.
 
 
 class ScheduledReport(Base):
@@ -94,10 +98,22 @@ class GeneratedReportLog(Base):
     status = Column(SQLAlchemyEnum(ReportStatusEnum), default=ReportStatusEnum.PENDING, nullable=False, index=True)
     file_name = Column(String(255), nullable=True)
     file_path_or_link = Column(Text, nullable=True)
-    file_size_bytes = Column(Integer, nullable=True)
+    file_size_bytes = Column(BigInteger, nullable=True) # Stored (compressed) size
+    rows_written = Column(BigInteger, nullable=True) # Updated while a streamed report is being written
     error_message = Column(Text, nullable=True)
     processing_time_seconds = Column(Integer, nullable=True)
 
+    # Result cache: key of (definition, version, params, format); hits point at the run whose artifact they reuse
+    cache_key = Column(String(64), nullable=True, index=True)
+    served_from_cache = Column(Boolean, default=False, nullable=False)
+    cached_from_log_id = Column(Integer, ForeignKey("generated_report_logs.id", name="fk_genlog_cachedfrom", ondelete="SET NULL"), nullable=True)
+
+    # Execution guard: planner estimate before the run, and what the run actually cost
+    estimated_cost = Column(Float, nullable=True)
+    estimated_rows = Column(BigInteger, nullable=True)
+    query_seconds = Column(Float, nullable=True) # Time spent waiting on the database (excludes writing the file)
+    executed_on = Column(String(10), nullable=True) # PRIMARY or REPLICA
+
     report_definition = relationship("ReportDefinition", back_populates="generated_logs")
     scheduled_report = relationship("ScheduledReport") # Add back_populates="generated_logs" to ScheduledReport if bi-directional
     # generated_by_user = relationship("User", foreign_keys=[generated_by_user_id])
@@ -119,6 +135,40 @@ class DashboardLayout(Base):
     # user = relationship("User", foreign_keys=[user_id]) # If User model is importable
     __table_args__ = (UniqueConstraint('user_id', 'dashboard_name', name='uq_user_dashboard_name'),)
 
+class RollupGrainEnum(enum.Enum):
+    HOUR = "HOUR"; DAY = "DAY"
+
+
+class TransactionRollup(Base):
+    # Pre-aggregated FinancialTransaction counts/amounts per time bucket and dimension combination (see rollups.py)
+    __tablename__ = "transaction_rollups"
+    id = Column(Integer, primary_key=True, index=True)
+    grain = Column(SQLAlchemyEnum(RollupGrainEnum), nullable=False)
+    bucket_start = Column(DateTime, nullable=False) # UTC, truncated to the grain
+
+    channel = Column(String(30), nullable=False)
+    transaction_type = Column(String(50), nullable=False)
+    status = Column(String(30), nullable=False)
+    currency = Column(String(5), nullable=False)
+
+    txn_count = Column(BigInteger, nullable=False, default=0)
+    total_amount = Column(Numeric(precision=24, scale=2), nullable=False, default=0)
+    total_fees = Column(Numeric(precision=24, scale=2), nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint('grain', 'bucket_start', 'channel', 'transaction_type', 'status', 'currency', name='uq_txn_rollup_bucket'),
+        Index('ix_txn_rollup_grain_bucket', 'grain', 'bucket_start'),
+    )
+
+
+class RollupWatermark(Base):
+    # Source rows with updated_at <= high_watermark are reflected in the rollups
+    __tablename__ = "rollup_watermarks"
+    source = Column(String(50), primary_key=True)
+    high_watermark = Column(DateTime, nullable=False) # UTC
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
 # Notes on Foreign Keys and Relationships:
 # - `users.id` refers to the User model in `core_infrastructure_config_engine`.
 # - `ondelete="CASCADE"` on `ScheduledReport.report_definition_id` means if a ReportDefinition is deleted,
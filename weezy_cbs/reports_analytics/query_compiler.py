@@ -0,0 +1,303 @@
+# Dynamic-filter query compiler with a plan cache
+#
+# DYNAMIC_FILTERS_ON_MODEL reports send filters as {"field": "operator:value"}. Instead of importing the
+# model map and re-interpreting the filters into an ORM query on every run, a request is split into:
+#   - its shape: model, (field, operator) pairs, selected columns, sort, limit/keyset flags. This is
+#     validated against the model catalogue once and compiled into a Core select() with bind
+#     parameters, then kept in an LRU plan cache (SQLAlchemy's own compiled cache keys off the same
+#     statement objects);
+#   - its values, which are coerced to the column types and bound on every execution.
+# Only the selected columns are fetched, as plain tuples (no ORM identity map or object construction).
+# Limits and keyset pagination (sort column + primary key, no OFFSET) are built into the plan.
+import base64
+import enum
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, bindparam, or_, select
+import sqlalchemy
+
+QUERY_PLAN_CACHE_SIZE = int(os.getenv("REPORT_QUERY_PLAN_CACHE_SIZE", "512"))
+
+OPERATORS = ("eq", "ne", "gt", "gte", "lt", "lte", "like", "ilike", "in_", "notin_")
+_LIST_OPERATORS = ("in_", "notin_")
+
+
+class DynamicFilterError(ValueError):
+    """Invalid dynamic filter request (unknown model, field or operator, or a value of the wrong type)."""
+
+
+# --- Model catalogue ---
+class CatalogueEntry:
+    __slots__ = ("name", "table", "columns", "primary_key")
+
+    def __init__(self, name: str, table):
+        self.name = name
+        self.table = table
+        self.columns = {c.name: c for c in table.columns}
+        pk = list(table.primary_key.columns)
+        if len(pk) != 1:
+            raise DynamicFilterError(f"Model '{name}' needs a single-column primary key for keyset pagination.")
+        self.primary_key = pk[0]
+
+
+class ModelCatalogue:
+    def __init__(self):
+        self._entries: Dict[str, CatalogueEntry] = {}
+        self._defaults_loaded = False
+        self._lock = threading.Lock()
+
+    def register(self, name: str, model) -> None:
+        table = getattr(model, "__table__", model)
+        self._entries[name] = CatalogueEntry(name, table)
+
+    def _load_defaults(self) -> None:
+        # Imported once, on first use (these modules import each other's models)
+        from weezy_cbs.customer_identity_management.models import Customer
+        from weezy_cbs.accounts_ledger_management.models import Account, LedgerEntry
+        from weezy_cbs.transaction_management.models import FinancialTransaction
+        for name, model in (("Customer", Customer), ("Account", Account), ("LedgerEntry", LedgerEntry),
+                            ("FinancialTransaction", FinancialTransaction)):
+            self._entries.setdefault(name, CatalogueEntry(name, model.__table__))
+
+    def get(self, name: str) -> CatalogueEntry:
+        if not self._defaults_loaded:
+            with self._lock:
+                if not self._defaults_loaded:
+                    self._load_defaults()
+                    self._defaults_loaded = True
+        entry = self._entries.get(name)
+        if entry is None:
+            raise DynamicFilterError(f"Unsupported model for dynamic filtering: {name}")
+        return entry
+
+
+model_catalogue = ModelCatalogue()
+
+
+# --- Value coercion ---
+def _coercer_for(column) -> Callable[[str], Any]:
+    col_type = column.type
+    if isinstance(col_type, sqlalchemy.Enum) and col_type.enum_class is not None:
+        enum_class = col_type.enum_class
+        def to_enum(value: str):
+            try:
+                return enum_class[value]
+            except KeyError:
+                return enum_class(value)
+        return to_enum
+    if isinstance(col_type, sqlalchemy.Boolean):
+        return lambda value: value.lower() in ("true", "1", "yes")
+    if isinstance(col_type, sqlalchemy.Integer):
+        return int
+    if isinstance(col_type, sqlalchemy.Float):
+        return float
+    if isinstance(col_type, sqlalchemy.Numeric):
+        return Decimal
+    if isinstance(col_type, sqlalchemy.DateTime):
+        return datetime.fromisoformat
+    if isinstance(col_type, sqlalchemy.Date):
+        return date.fromisoformat
+    return str
+
+
+def _coerce(coercer: Callable[[str], Any], raw: str, field: str) -> Any:
+    try:
+        return coercer(raw)
+    except (ValueError, KeyError, InvalidOperation):
+        raise DynamicFilterError(f"Invalid value '{raw}' for field '{field}'.")
+
+
+def _parse_filters(filters: Optional[Dict[str, str]]) -> List[Tuple[str, str, str]]:
+    parsed = []
+    for field, spec in sorted((filters or {}).items()):
+        operator, _, value = str(spec).partition(":")
+        parsed.append((field, operator.lower(), value))
+    return parsed
+
+
+# --- Compiled plans ---
+class CompiledReportQuery:
+    """A validated, compiled plan for one request shape. Bind values with `params()` for each execution."""
+    def __init__(self, stmt, column_names: List[str], column_types: Dict[str, Any], filter_binds: List[Tuple[str, str, Callable]],
+                 sort_column, primary_key, descending: bool, keyset: bool, has_cursor: bool, limited: bool):
+        self.stmt = stmt
+        self.column_names = column_names
+        self.column_types = column_types
+        self._filter_binds = filter_binds # (field, bind name, coercer) in filter order
+        self._sort_column = sort_column
+        self._primary_key = primary_key
+        self._descending = descending
+        self.keyset = keyset
+        self.has_cursor = has_cursor
+        self.limited = limited
+        # Positions of the keyset columns in the result rows (they are always selected)
+        self._cursor_positions = (column_names.index(sort_column.name), column_names.index(primary_key.name)) if keyset else None
+
+    def params(self, filters: Optional[Dict[str, str]] = None, limit: Optional[int] = None, cursor: Optional[str] = None) -> Dict[str, Any]:
+        values = {}
+        parsed = {field: value for field, _, value in _parse_filters(filters)}
+        for field, bind_name, coercer in self._filter_binds:
+            raw = parsed[field]
+            if bind_name.endswith("_list"):
+                values[bind_name] = [_coerce(coercer, v.strip(), field) for v in raw.split(",") if v.strip()]
+            else:
+                values[bind_name] = _coerce(coercer, raw, field)
+        if self.limited:
+            values["_limit"] = int(limit)
+        if self.has_cursor:
+            if not cursor:
+                raise DynamicFilterError("This plan was compiled for a follow-up page and needs a cursor.")
+            after_sort, after_pk = decode_cursor(cursor)
+            # Cursor values went through JSON: dates, decimals and enums come back as strings
+            values["_after_sort"] = _coerce(_coercer_for(self._sort_column), after_sort, self._sort_column.name) if isinstance(after_sort, str) else after_sort
+            values["_after_pk"] = _coerce(_coercer_for(self._primary_key), after_pk, self._primary_key.name) if isinstance(after_pk, str) else after_pk
+        return values
+
+    def next_cursor(self, last_row: Sequence[Any]) -> Optional[str]:
+        if not self.keyset or last_row is None:
+            return None
+        sort_pos, pk_pos = self._cursor_positions
+        return encode_cursor(last_row[sort_pos], last_row[pk_pos])
+
+
+def encode_cursor(sort_value: Any, pk_value: Any) -> str:
+    def plain(value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        if isinstance(value, enum.Enum):
+            return value.name
+        return value
+    return base64.urlsafe_b64encode(json.dumps([plain(sort_value), plain(pk_value)]).encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[Any, Any]:
+    try:
+        sort_value, pk_value = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise DynamicFilterError("Invalid pagination cursor.")
+    return sort_value, pk_value
+
+
+class DynamicFilterQueryCompiler:
+    def __init__(self, catalogue: ModelCatalogue = model_catalogue, cache_size: int = QUERY_PLAN_CACHE_SIZE):
+        self.catalogue = catalogue
+        self.cache_size = cache_size
+        self._plans: "OrderedDict[tuple, CompiledReportQuery]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "compiles": 0}
+
+    def compile(self, model_name: str, filters: Optional[Dict[str, str]] = None, select_fields: Optional[Sequence[str]] = None,
+                sort_by: Optional[str] = None, limit: Optional[int] = None, keyset: bool = False, cursor: Optional[str] = None,
+                allowed_filter_fields: Optional[Sequence[str]] = None) -> CompiledReportQuery:
+        """
+        Returns the cached plan for this request's shape (values are ignored; bind them with plan.params()).
+        `keyset` orders by the sort column plus primary key so pages can continue from plan.next_cursor().
+        """
+        shape = (
+            model_name,
+            tuple((field, operator) for field, operator, _ in _parse_filters(filters)),
+            tuple(select_fields or ()),
+            sort_by or "",
+            limit is not None,
+            keyset,
+            keyset and cursor is not None, # First pages and follow-up pages are separate plans
+            tuple(sorted(allowed_filter_fields)) if allowed_filter_fields is not None else None,
+        )
+        with self._lock:
+            plan = self._plans.get(shape)
+            if plan is not None:
+                self._plans.move_to_end(shape)
+                self.stats["hits"] += 1
+                return plan
+        plan = self._compile(*shape)
+        with self._lock:
+            self._plans[shape] = plan
+            self.stats["compiles"] += 1
+            while len(self._plans) > self.cache_size:
+                self._plans.popitem(last=False)
+        return plan
+
+    def _compile(self, model_name, filter_shape, select_fields, sort_by, limited, keyset, has_cursor, allowed_filter_fields) -> CompiledReportQuery:
+        entry = self.catalogue.get(model_name)
+        columns = entry.columns
+
+        for field in select_fields:
+            if field not in columns:
+                raise DynamicFilterError(f"Unknown select field '{field}' for model '{model_name}'.")
+        selected = [columns[f] for f in select_fields] if select_fields else list(entry.table.columns)
+
+        sort_column, descending = None, False
+        if sort_by:
+            sort_field, _, direction = sort_by.partition(":")
+            if sort_field not in columns:
+                raise DynamicFilterError(f"Unknown sort field '{sort_field}' for model '{model_name}'.")
+            sort_column, descending = columns[sort_field], direction.lower() == "desc"
+        if keyset:
+            sort_column = sort_column if sort_column is not None else entry.primary_key
+            for required in (sort_column, entry.primary_key): # The cursor is read from the result rows
+                if not any(c is required for c in selected): # Identity: Column == Column builds SQL
+                    selected.append(required)
+
+        conditions = []
+        filter_binds = []
+        for i, (field, operator) in enumerate(filter_shape):
+            if field not in columns:
+                raise DynamicFilterError(f"Invalid filter field '{field}' for model '{model_name}'.")
+            if allowed_filter_fields is not None and field not in allowed_filter_fields:
+                raise DynamicFilterError(f"Filtering on '{field}' is not allowed for this report.")
+            if operator not in OPERATORS:
+                raise DynamicFilterError(f"Unsupported operator '{operator}' for field '{field}'.")
+            column = columns[field]
+            if operator in _LIST_OPERATORS:
+                bind_name = f"f{i}_list"
+                param = bindparam(bind_name, expanding=True)
+                conditions.append(column.in_(param) if operator == "in_" else column.notin_(param))
+                coercer = _coercer_for(column)
+            elif operator in ("like", "ilike"):
+                bind_name = f"f{i}"
+                param = bindparam(bind_name)
+                pattern = sqlalchemy.literal("%") + param + sqlalchemy.literal("%")
+                conditions.append(column.like(pattern) if operator == "like" else column.ilike(pattern))
+                coercer = str
+            else:
+                bind_name = f"f{i}"
+                param = bindparam(bind_name)
+                conditions.append({"eq": column == param, "ne": column != param, "gt": column > param,
+                                   "gte": column >= param, "lt": column < param, "lte": column <= param}[operator])
+                coercer = _coercer_for(column)
+            filter_binds.append((field, bind_name, coercer))
+
+        stmt = select(*selected)
+        if conditions:
+            stmt = stmt.where(and_(*conditions))
+        pk = entry.primary_key
+        if keyset:
+            if has_cursor:
+                after_sort, after_pk = bindparam("_after_sort"), bindparam("_after_pk")
+                if sort_column is pk:
+                    after = pk < after_pk if descending else pk > after_pk
+                elif descending:
+                    after = or_(sort_column < after_sort, and_(sort_column == after_sort, pk < after_pk))
+                else:
+                    after = or_(sort_column > after_sort, and_(sort_column == after_sort, pk > after_pk))
+                stmt = stmt.where(after)
+            stmt = stmt.order_by(*( [sort_column.desc()] if descending else [sort_column.asc()] ),
+                                 *([] if sort_column is pk else [pk.desc() if descending else pk.asc()]))
+        elif sort_column is not None:
+            stmt = stmt.order_by(sort_column.desc() if descending else sort_column.asc())
+        if limited:
+            stmt = stmt.limit(bindparam("_limit", type_=sqlalchemy.Integer))
+
+        column_names = [c.name for c in selected]
+        return CompiledReportQuery(stmt, column_names, {c.name: c.type for c in selected}, filter_binds,
+                                   sort_column, pk, descending, keyset, has_cursor, limited)
+
+
+dynamic_filter_compiler = DynamicFilterQueryCompiler()
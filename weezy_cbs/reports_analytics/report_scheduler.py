@@ -0,0 +1,304 @@
+# In-process cron scheduler for ScheduledReport rows
+#
+# The daemon thread keeps schedules that fall due within REPORT_SCHEDULER_LOOKAHEAD_SECONDS in a
+# min-heap ordered by next_run_at. The heap is refreshed from the database every
+# REPORT_SCHEDULER_POLL_SECONDS, so schedules created or edited elsewhere are picked up.
+# When an entry falls due it is claimed and handed to a bounded process pool:
+#   - Claiming locks the row (SELECT ... FOR UPDATE SKIP LOCKED), re-checks that it is still ACTIVE and
+#     due, and advances next_run_at to the next cron occurrence in the same transaction (conditional on
+#     next_run_at being unchanged). Any number of nodes can run the daemon: a run is executed by
+#     whichever node claims it first, exactly once.
+#   - A schedule is only claimed when a pool slot is free and its definition is below
+#     REPORT_SCHEDULER_PER_DEFINITION_LIMIT concurrent runs on this node. Otherwise it stays in the heap (or is left
+#     for another node) rather than queueing behind busy workers.
+# Metrics: queue lag (claim time - next_run_at) and run duration, exposed via `metrics()`.
+#
+# Enable in the API process with REPORT_SCHEDULER_ENABLED=true, or run it standalone:
+#   python -m weezy_cbs.reports_analytics.report_scheduler
+import heapq
+import json
+import os
+import signal
+import socket
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+REPORT_SCHEDULER_ENABLED = os.getenv("REPORT_SCHEDULER_ENABLED", "false").lower() == "true"
+REPORT_SCHEDULER_POLL_SECONDS = float(os.getenv("REPORT_SCHEDULER_POLL_SECONDS", "30"))
+REPORT_SCHEDULER_LOOKAHEAD_SECONDS = float(os.getenv("REPORT_SCHEDULER_LOOKAHEAD_SECONDS", "300"))
+REPORT_SCHEDULER_MAX_WORKERS = int(os.getenv("REPORT_SCHEDULER_MAX_WORKERS", "4"))
+REPORT_SCHEDULER_PER_DEFINITION_LIMIT = int(os.getenv("REPORT_SCHEDULER_PER_DEFINITION_LIMIT", "1"))
+REPORT_SCHEDULER_NODE_ID = os.getenv("REPORT_SCHEDULER_NODE_ID", f"{socket.gethostname()}-{os.getpid()}")
+SCHEDULER_USERNAME = "REPORT_SCHEDULER"
+
+_METRIC_WINDOW = 1000 # Recent samples kept for percentiles
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _percentile(samples: List[float], pct: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+# --- Worker process side ---
+def _init_worker_process() -> None:
+    # Connections inherited from the parent must not be reused (or closed) by the child
+    from weezy_cbs.database import engine
+    engine.dispose(close=False)
+
+def run_scheduled_report(sched_id: int, def_id: int, params: Optional[Dict[str, Any]], output_format: str, user_id: int) -> Tuple[str, float, Optional[int]]:
+    """Executes one claimed run in a pool process. Returns (status, duration seconds, log id)."""
+    from weezy_cbs.database import SessionLocal
+    from . import models
+    from .services import ReportGenerationService, generated_report_log_service, report_definition_service, scheduled_report_service
+
+    started = time.monotonic()
+    db = SessionLocal()
+    try:
+        report_def = report_definition_service.get_definition_by_id(db, def_id)
+        log_entry = generated_report_log_service.create_log_entry(
+            db, report_name=report_def.report_name if report_def else f"Schedule {sched_id}", generated_by_user_id=user_id,
+            output_format=output_format, report_def_id=def_id, scheduled_rep_id=sched_id, params_used=params
+        )
+        log_entry = ReportGenerationService(db, generated_report_log_service, report_definition_service).generate_report_from_definition(
+            def_id, params, output_format, user_id, SCHEDULER_USERNAME, log_entry_id=log_entry.id
+        )
+        scheduled_report_service.record_schedule_run(db, sched_id, log_entry.status, log_entry, log_entry.error_message, advance_next_run=False)
+        return log_entry.status.value, time.monotonic() - started, log_entry.id
+    except Exception as e:
+        db.rollback()
+        scheduled_report_service.record_schedule_run(db, sched_id, models.ReportStatusEnum.FAILED, None, str(e), advance_next_run=False)
+        return models.ReportStatusEnum.FAILED.value, time.monotonic() - started, None
+    finally:
+        db.close()
+
+
+# --- Scheduler ---
+class ReportSchedulerDaemon:
+    def __init__(self, session_factory: Optional[Callable] = None, executor=None,
+                 max_workers: int = REPORT_SCHEDULER_MAX_WORKERS, per_definition_limit: int = REPORT_SCHEDULER_PER_DEFINITION_LIMIT,
+                 poll_seconds: float = REPORT_SCHEDULER_POLL_SECONDS, lookahead_seconds: float = REPORT_SCHEDULER_LOOKAHEAD_SECONDS,
+                 run_fn: Callable = run_scheduled_report, clock: Callable[[], datetime] = datetime.utcnow):
+        if session_factory is None:
+            from weezy_cbs.database import SessionLocal
+            session_factory = SessionLocal
+        self._session_factory = session_factory
+        self._executor = executor
+        self.max_workers = max_workers
+        self.per_definition_limit = per_definition_limit
+        self.poll_seconds = poll_seconds
+        self.lookahead_seconds = lookahead_seconds
+        self._run_fn = run_fn
+        self._clock = clock
+
+        self._heap: List[Tuple[datetime, int, int]] = [] # (next_run_at, schedule id, definition id)
+        self._lock = threading.Lock() # Guards the in-flight counters (touched by pool callbacks)
+        self._inflight_total = 0
+        self._inflight_by_definition: Dict[int, int] = defaultdict(int)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.stats = {"claimed": 0, "claim_conflicts": 0, "deferred_definition_limit": 0, "succeeded": 0, "failed": 0}
+        self._queue_lag: Deque[float] = deque(maxlen=_METRIC_WINDOW)
+        self._durations: Deque[float] = deque(maxlen=_METRIC_WINDOW)
+
+    # Heap maintenance
+    def refresh(self) -> int:
+        """Reloads ACTIVE schedules due within the lookahead window. Returns the heap size."""
+        from . import models
+        horizon = self._clock() + timedelta(seconds=self.lookahead_seconds)
+        db = self._session_factory()
+        try:
+            rows = db.query(models.ScheduledReport.id, models.ScheduledReport.report_definition_id, models.ScheduledReport.next_run_at)\
+                .filter(models.ScheduledReport.status == models.ScheduledReportStatusEnum.ACTIVE,
+                        models.ScheduledReport.next_run_at.isnot(None),
+                        models.ScheduledReport.next_run_at <= horizon).all()
+        finally:
+            db.close()
+        heap = [(_naive_utc(next_run_at), sched_id, def_id) for sched_id, def_id, next_run_at in rows]
+        heapq.heapify(heap)
+        self._heap = heap
+        return len(heap)
+
+    # Claiming
+    def _claim(self, sched_id: int) -> Optional[Dict[str, Any]]:
+        from . import models
+        from .services import calculate_next_run
+        now = self._clock()
+        db = self._session_factory()
+        try:
+            sched = db.query(models.ScheduledReport).filter(
+                models.ScheduledReport.id == sched_id,
+                models.ScheduledReport.status == models.ScheduledReportStatusEnum.ACTIVE,
+                models.ScheduledReport.next_run_at <= now
+            ).with_for_update(skip_locked=True).first()
+            if sched is None: # Claimed by another node, paused, or edited to a later time
+                db.rollback()
+                return None
+            claim = {
+                "sched_id": sched.id, "def_id": sched.report_definition_id, "due_at": _naive_utc(sched.next_run_at),
+                "params": json.loads(sched.parameters_values_json) if sched.parameters_values_json else None,
+                "output_format": sched.output_format, "user_id": sched.created_by_user_id,
+            }
+            # The claim: advance next_run_at only if nobody else did (guards databases without row locks, e.g. SQLite)
+            claimed_rows = db.query(models.ScheduledReport).filter(
+                models.ScheduledReport.id == sched.id,
+                models.ScheduledReport.next_run_at == sched.next_run_at
+            ).update({"next_run_at": calculate_next_run(sched.cron_expression, now)}, synchronize_session=False)
+            if claimed_rows != 1:
+                db.rollback()
+                return None
+            db.commit()
+            return claim
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _dispatch_due(self) -> int:
+        now = self._clock()
+        deferred = []
+        dispatched = 0
+        while self._heap and self._heap[0][0] <= now:
+            with self._lock:
+                if self._inflight_total >= self.max_workers:
+                    break # Leave the rest due; a completion (or another node) picks them up
+            item = heapq.heappop(self._heap)
+            _, sched_id, def_id = item
+            with self._lock:
+                at_limit = self._inflight_by_definition[def_id] >= self.per_definition_limit
+            if at_limit:
+                self.stats["deferred_definition_limit"] += 1
+                deferred.append(item)
+                continue
+            claim = self._claim(sched_id)
+            if claim is None:
+                self.stats["claim_conflicts"] += 1
+                continue
+            self._submit(claim, now)
+            dispatched += 1
+        for item in deferred:
+            heapq.heappush(self._heap, item)
+        return dispatched
+
+    def _submit(self, claim: Dict[str, Any], claimed_at: datetime) -> None:
+        def_id = claim["def_id"]
+        with self._lock:
+            self._inflight_total += 1
+            self._inflight_by_definition[def_id] += 1
+        self.stats["claimed"] += 1
+        self._queue_lag.append(max(0.0, (claimed_at - claim["due_at"]).total_seconds()))
+        future = self._get_executor().submit(self._run_fn, claim["sched_id"], def_id, claim["params"], claim["output_format"], claim["user_id"])
+        future.add_done_callback(lambda f: self._on_done(def_id, f))
+
+    def _on_done(self, def_id: int, future) -> None:
+        try:
+            run_status, duration, _ = future.result()
+            self._durations.append(duration)
+            self.stats["succeeded" if run_status == "SUCCESS" else "failed"] += 1
+        except Exception as e: # Worker process died, result not picklable, ...
+            self.stats["failed"] += 1
+            print(f"Scheduled report run failed in pool: {e}")
+        with self._lock:
+            self._inflight_total -= 1
+            self._inflight_by_definition[def_id] -= 1
+            if self._inflight_by_definition[def_id] <= 0:
+                del self._inflight_by_definition[def_id]
+        self._wake.set() # A slot is free: due entries that were held back can go now
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker_process)
+        return self._executor
+
+    # Loop
+    def run_once(self) -> int:
+        """One refresh + dispatch pass (used by the loop; handy for tests and cron-style invocation)."""
+        self.refresh()
+        return self._dispatch_due()
+
+    def _loop(self) -> None:
+        next_refresh = 0.0
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() >= next_refresh:
+                    self.refresh()
+                    next_refresh = time.monotonic() + self.poll_seconds
+                self._dispatch_due()
+            except Exception as e: # DB hiccup: keep the daemon alive and retry on the next tick
+                print(f"Report scheduler iteration failed: {e}")
+            timeout = max(0.0, next_refresh - time.monotonic())
+            if self._heap:
+                timeout = min(timeout, max(0.0, (self._heap[0][0] - self._clock()).total_seconds()))
+            self._wake.wait(timeout=max(timeout, 0.05))
+            self._wake.clear()
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="report-scheduler", daemon=True)
+        self._thread.start()
+        print(f"Report scheduler started on node {REPORT_SCHEDULER_NODE_ID} ({self.max_workers} workers)")
+
+    def stop(self, wait: bool = True) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+    def metrics(self) -> Dict[str, Any]:
+        lag, durations = list(self._queue_lag), list(self._durations)
+        with self._lock:
+            inflight = self._inflight_total
+        return dict(self.stats, inflight=inflight, heap_size=len(self._heap),
+                    queue_lag_p50_seconds=_percentile(lag, 50), queue_lag_p95_seconds=_percentile(lag, 95),
+                    queue_lag_max_seconds=max(lag) if lag else None,
+                    run_duration_p50_seconds=_percentile(durations, 50), run_duration_p95_seconds=_percentile(durations, 95),
+                    run_duration_max_seconds=max(durations) if durations else None)
+
+
+_scheduler: Optional[ReportSchedulerDaemon] = None
+
+def get_report_scheduler() -> Optional[ReportSchedulerDaemon]:
+    return _scheduler
+
+def start_report_scheduler(**kwargs) -> ReportSchedulerDaemon:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = ReportSchedulerDaemon(**kwargs)
+    _scheduler.start()
+    return _scheduler
+
+def stop_report_scheduler() -> None:
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.stop()
+        _scheduler = None
+
+
+if __name__ == "__main__":
+    scheduler = start_report_scheduler()
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    try:
+        while not stopped.wait(60):
+            print(f"Report scheduler metrics: {scheduler.metrics()}")
+    except KeyboardInterrupt:
+        pass
+    stop_report_scheduler()
@@ -0,0 +1,197 @@
+# Streaming report execution
+#
+# Regulatory and MIS reports can run to tens of millions of rows. Materialising them as a list of dicts
+# and rendering the output into one StringIO made worker memory grow with result size. This path reads
+# rows through a server-side cursor in fixed-size batches and writes each batch straight to the report
+# store, gzip-compressing on the fly. Peak memory is bounded by one batch plus the writer buffers, not by
+# the number of rows.
+#
+# Files are written to "<name>.part" and renamed on success, so a half-written report is never served.
+import csv
+import enum
+import gzip
+import io
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+REPORT_STREAM_BATCH_ROWS = int(os.getenv("REPORT_STREAM_BATCH_ROWS", "5000"))
+REPORT_STORAGE_DIR = os.getenv("REPORT_STORAGE_DIR", "/reports_storage")
+REPORT_COMPRESSION = os.getenv("REPORT_COMPRESSION", "gzip") # 'gzip' or 'none'
+REPORT_PROGRESS_EVERY_ROWS = int(os.getenv("REPORT_PROGRESS_EVERY_ROWS", "100000"))
+
+TEXT_OUTPUT_FORMATS = ("CSV", "JSON", "JSONL")
+STREAMING_OUTPUT_FORMATS = TEXT_OUTPUT_FORMATS + ("PARQUET", "ARROW") # PARQUET/ARROW: see columnar_output.py
+
+RowBatches = Iterable[Sequence[Sequence[Any]]] # Batches of row tuples, in column order
+ProgressCallback = Callable[[int, int], None] # (rows_written, bytes_written)
+
+
+# --- Row sources ---
+def stream_statement_batches(db, stmt, params: Optional[dict], batch_size: int = REPORT_STREAM_BATCH_ROWS) -> Tuple[List[str], Iterator[Sequence[Sequence[Any]]]]:
+    """
+    Executes a Core statement with a server-side cursor (stream_results) and returns
+    (column names, iterator of row batches). The cursor is closed when the iterator is exhausted or closed.
+    """
+    result = db.execute(stmt.execution_options(stream_results=True, max_row_buffer=batch_size), params or {})
+    columns = list(result.keys())
+
+    def batches():
+        try:
+            for partition in result.partitions(batch_size):
+                yield partition
+        finally:
+            result.close()
+    return columns, batches()
+
+def stream_sql_batches(db, sql_template: str, params: Optional[dict], batch_size: int = REPORT_STREAM_BATCH_ROWS) -> Tuple[List[str], Iterator[Sequence[Sequence[Any]]]]:
+    """Streams a parameterised SQL report (see stream_statement_batches)."""
+    from sqlalchemy import text
+    return stream_statement_batches(db, text(sql_template), params, batch_size)
+
+
+# --- Value rendering ---
+def _json_default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return str(value) # Keep full precision for amounts
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, bytes):
+        return value.hex()
+    return str(value)
+
+def _csv_row(row: Sequence[Any]) -> Sequence[Any]:
+    for value in row:
+        if isinstance(value, enum.Enum):
+            return [v.value if isinstance(v, enum.Enum) else v for v in row]
+    return row
+
+
+# --- Output ---
+class _CountingWriter(io.RawIOBase):
+    """Counts the bytes that actually reach storage (i.e. after compression)."""
+    def __init__(self, raw):
+        self._raw = raw
+        self.bytes_written = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._raw.write(b)
+        n = len(b)
+        self.bytes_written += n
+        return n
+
+    def close(self) -> None:
+        # The underlying file belongs to the caller
+        super().close()
+
+
+def write_report_stream(columns: Sequence[str], batches: RowBatches, output_format: str, out_binary,
+                        compression: str = REPORT_COMPRESSION, on_progress: Optional[ProgressCallback] = None,
+                        progress_every_rows: int = REPORT_PROGRESS_EVERY_ROWS) -> Tuple[int, int]:
+    """
+    Renders row batches as CSV, JSONL or a JSON array into the binary stream `out_binary`.
+    Returns (rows_written, bytes_written); bytes are counted after compression.
+    """
+    output_format = output_format.upper()
+    if output_format not in TEXT_OUTPUT_FORMATS:
+        raise ValueError(f"Output format {output_format} is not a text format.")
+
+    counter = _CountingWriter(out_binary)
+    if compression == "gzip":
+        binary = gzip.GzipFile(fileobj=counter, mode="wb", mtime=0)
+    else:
+        binary = io.BufferedWriter(counter)
+    out = io.TextIOWrapper(binary, encoding="utf-8", newline="")
+
+    rows_written = 0
+    next_progress = progress_every_rows
+    try:
+        if output_format == "CSV":
+            writer = csv.writer(out)
+            writer.writerow(columns)
+        elif output_format == "JSON":
+            out.write("[")
+        column_names = list(columns)
+        dumps = json.dumps
+        array_separator = "" # JSON array: no comma before the first element
+
+        for batch in batches:
+            if output_format == "CSV":
+                writer.writerows(_csv_row(row) for row in batch)
+            elif output_format == "JSONL":
+                out.writelines(dumps(dict(zip(column_names, row)), default=_json_default) + "\n" for row in batch)
+            else:
+                for row in batch:
+                    out.write(array_separator)
+                    out.write(dumps(dict(zip(column_names, row)), default=_json_default))
+                    array_separator = ","
+            rows_written += len(batch)
+            if on_progress is not None and rows_written >= next_progress:
+                out.flush()
+                on_progress(rows_written, counter.bytes_written)
+                next_progress = rows_written + progress_every_rows
+
+        if output_format == "JSON":
+            out.write("]")
+    finally:
+        out.close() # Flushes the text buffer and writes the gzip trailer into `counter`
+    return rows_written, counter.bytes_written
+
+
+class StreamedReport:
+    __slots__ = ("file_name", "file_path", "rows_written", "bytes_written")
+
+    def __init__(self, file_name: str, file_path: str, rows_written: int, bytes_written: int):
+        self.file_name = file_name
+        self.file_path = file_path
+        self.rows_written = rows_written
+        self.bytes_written = bytes_written
+
+
+class LocalReportStore:
+    """Report files on local or mounted storage (NFS, a bucket FUSE mount)."""
+    def __init__(self, base_dir: str = REPORT_STORAGE_DIR):
+        self.base_dir = base_dir
+
+    def write(self, file_name: str, render: Callable[[Any], Tuple[int, int]]) -> StreamedReport:
+        os.makedirs(self.base_dir, exist_ok=True)
+        final_path = os.path.join(self.base_dir, file_name)
+        part_path = final_path + ".part"
+        try:
+            with open(part_path, "wb") as fh:
+                rows_written, bytes_written = render(fh)
+            os.replace(part_path, final_path)
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        return StreamedReport(file_name, final_path, rows_written, bytes_written)
+
+
+def stream_report_to_store(columns: Sequence[str], batches: RowBatches, output_format: str, base_file_name: str,
+                           store: Optional[LocalReportStore] = None, compression: str = REPORT_COMPRESSION,
+                           on_progress: Optional[ProgressCallback] = None, column_types: Optional[Dict[str, Any]] = None,
+                           dictionary_columns: Iterable[str] = ()) -> StreamedReport:
+    """
+    Writes a streamed report to the report store as `<base_file_name>.<csv|json|jsonl>[.gz]`, or as
+    `.parquet` / `.arrow`. Columnar formats use their own encoding and are never gzipped, so Arrow files
+    stay memory-mappable. `column_types` (SQLAlchemy types by column) and `dictionary_columns` are only
+    used by the columnar formats.
+    """
+    from .columnar_output import COLUMNAR_FILE_EXTENSIONS, write_columnar_stream
+    output_format = output_format.upper()
+    store = store or LocalReportStore()
+    if output_format in COLUMNAR_FILE_EXTENSIONS:
+        return store.write(f"{base_file_name}.{COLUMNAR_FILE_EXTENSIONS[output_format]}", lambda fh: write_columnar_stream(
+            columns, batches, output_format, fh, column_types=column_types, dictionary_columns=dictionary_columns,
+            on_progress=on_progress, progress_every_rows=REPORT_PROGRESS_EVERY_ROWS))
+    file_name = f"{base_file_name}.{output_format.lower()}" + (".gz" if compression == "gzip" else "")
+    return store.write(file_name, lambda fh: write_report_stream(
+        columns, batches, output_format, fh, compression=compression, on_progress=on_progress))
@@ -0,0 +1,93 @@
+# Parameter-keyed result cache for report definitions
+#
+# Dashboards and staff run the same definition with the same parameters many times a day. A successful
+# run's artifact (the file in the report store) is reused for later requests with the same key:
+#   (definition id, definition version, canonicalised parameters, output format)
+# for ReportDefinition.result_cache_ttl_seconds (no caching when unset/0).
+#
+# The cache index lives in generated_report_logs: a source run stores its cache_key, and a hit is just
+# a "fresh SUCCESS log with this key whose file still exists". Every worker therefore shares it, and a
+# hit is recorded as its own log row (served_from_cache, cached_from_log_id) so the savings show up in
+# the log. update_definition clears the keys of that definition's logs.
+# Concurrent requests for the same key in one process are coalesced: one leader generates, the others
+# wait for it and then take the cached result.
+import hashlib
+import json
+import os
+import threading
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Optional, Tuple
+
+from . import models
+
+REPORT_CACHE_WAIT_SECONDS = float(os.getenv("REPORT_CACHE_WAIT_SECONDS", "600")) # Max wait for a coalesced leader
+
+
+def _canonical_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {str(k): _canonical_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical_value(v) for v in value]
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value.normalize())
+    return value
+
+def report_cache_key(report_def: models.ReportDefinition, params: Optional[Dict[str, Any]], output_format: str) -> str:
+    payload = {
+        "definition_id": report_def.id,
+        "version": report_def.version,
+        "params": _canonical_value(params or {}),
+        "format": output_format.upper(),
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ReportResultCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, threading.Event] = {}
+
+    def find_fresh(self, db, report_def: models.ReportDefinition, cache_key: str) -> Optional[models.GeneratedReportLog]:
+        ttl = report_def.result_cache_ttl_seconds
+        if not ttl:
+            return None
+        cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+        candidates = db.query(models.GeneratedReportLog).filter(
+            models.GeneratedReportLog.cache_key == cache_key,
+            models.GeneratedReportLog.status == models.ReportStatusEnum.SUCCESS,
+            models.GeneratedReportLog.served_from_cache == False,
+            models.GeneratedReportLog.generation_timestamp >= cutoff
+        ).order_by(models.GeneratedReportLog.generation_timestamp.desc()).limit(3).all()
+        for log in candidates:
+            if log.file_path_or_link and os.path.exists(log.file_path_or_link): # Storage may have been cleaned up
+                return log
+        return None
+
+    def begin(self, cache_key: str) -> Tuple[bool, threading.Event]:
+        """Returns (is_leader, event). Followers wait on the event; the leader must call end()."""
+        with self._lock:
+            event = self._inflight.get(cache_key)
+            if event is not None:
+                return False, event
+            event = self._inflight[cache_key] = threading.Event()
+            return True, event
+
+    def end(self, cache_key: str) -> None:
+        with self._lock:
+            event = self._inflight.pop(cache_key, None)
+        if event is not None:
+            event.set()
+
+    def invalidate_definition(self, db, def_id: int) -> int:
+        """Drops every cached artifact of a definition (its logs stay, they just stop being cache sources)."""
+        return db.query(models.GeneratedReportLog).filter(
+            models.GeneratedReportLog.report_definition_id == def_id,
+            models.GeneratedReportLog.cache_key.isnot(None)
+        ).update({"cache_key": None}, synchronize_session=False)
+
+
+report_result_cache = ReportResultCache()
@@ -0,0 +1,505 @@
+# Incrementally maintained transaction rollups for dashboard widgets
+#
+# Dashboard KPI/chart widgets aggregate FinancialTransaction (count, value, fees) by channel, type,
+# status and currency over a time window. Aggregating the raw table on every dashboard load takes
+# seconds once it holds tens of millions of rows. Instead, TransactionRollup keeps pre-aggregated rows:
+#   - HOUR rows: one per (hour, channel, transaction_type, status, currency)
+#   - DAY rows: the same, summed per UTC day (built from the HOUR rows)
+#
+# Incremental refresh (refresh_transaction_rollups) uses a watermark on FinancialTransaction.updated_at:
+#   1. rows with updated_at in (watermark, now - REPORT_ROLLUP_SAFETY_LAG_SECONDS] are "changed"
+#   2. the hours those rows were initiated in are "dirty"; only those hours are re-aggregated from the
+#      source (delete + insert), then the affected days are rebuilt from their hours
+#   3. the watermark advances
+# Recomputing whole hours, rather than applying deltas, keeps status changes (PENDING -> SUCCESSFUL)
+# and retries correct without tracking old values. The safety lag covers transactions that committed
+# after the timestamp they were stamped with. Hard deletes are not seen; run a backfill for the range.
+#
+# query_transaction_aggregates() answers widget queries from the rollups when the requested grouping
+# and filters only use rollup dimensions and the time range is hour-aligned (whole days from DAY rows,
+# the edges from HOUR rows). Anything else falls back to aggregating the source table.
+# Rollups are as fresh as the last refresh; results carry `as_of` (the watermark).
+#
+# Refresh in the API process with REPORT_ROLLUPS_ENABLED=true, or from cron / the CLI:
+#   python -m weezy_cbs.reports_analytics.rollups refresh
+#   python -m weezy_cbs.reports_analytics.rollups backfill --from 2024-01-01 --to 2024-07-01
+import argparse
+import enum
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from . import models
+
+REPORT_ROLLUPS_ENABLED = os.getenv("REPORT_ROLLUPS_ENABLED", "false").lower() == "true"
+REPORT_ROLLUP_REFRESH_SECONDS = float(os.getenv("REPORT_ROLLUP_REFRESH_SECONDS", "60"))
+REPORT_ROLLUP_SAFETY_LAG_SECONDS = int(os.getenv("REPORT_ROLLUP_SAFETY_LAG_SECONDS", "120"))
+
+TRANSACTION_ROLLUP_SOURCE = "financial_transactions"
+ROLLUP_DIMENSIONS = ("channel", "transaction_type", "status", "currency")
+ROLLUP_MEASURES = ("txn_count", "total_amount", "total_fees")
+BUCKET_KEY = "bucket" # Pseudo group-by field: the HOUR/DAY bucket start
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+UNBUILT_WATERMARK = datetime(1970, 1, 1) # Watermark row exists but the initial backfill has not completed
+
+
+class RollupQueryError(ValueError):
+    pass
+
+
+def _transaction_model():
+    from weezy_cbs.transaction_management.models import FinancialTransaction
+    return FinancialTransaction
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _aware_utc(value: datetime) -> datetime:
+    # Bind value for the timezone-aware source columns (naive values would be read in the session zone)
+    return _naive_utc(value).replace(tzinfo=timezone.utc)
+
+def _floor_hour(value: datetime) -> datetime:
+    return _naive_utc(value).replace(minute=0, second=0, microsecond=0)
+
+def _floor_day(value: datetime) -> datetime:
+    return _floor_hour(value).replace(hour=0)
+
+def _as_hour(value: Any) -> datetime:
+    if isinstance(value, str): # SQLite strftime()
+        value = datetime.fromisoformat(value)
+    return _floor_hour(value)
+
+def _dimension_value(value: Any) -> str:
+    return value.value if isinstance(value, enum.Enum) else str(value)
+
+def _hour_bucket_expr(dialect_name: str, column):
+    """SQL expression truncating `column` to its UTC hour, or None when the dialect has no known form."""
+    if dialect_name == "postgresql":
+        return func.date_trunc("hour", func.timezone("UTC", column))
+    if dialect_name == "sqlite":
+        return func.strftime("%Y-%m-%d %H:00:00", column)
+    if dialect_name in ("mysql", "mariadb"):
+        return func.date_format(column, "%Y-%m-%d %H:00:00")
+    return None
+
+def _hour_ranges(hours: Iterable[datetime]) -> List[Tuple[datetime, datetime]]:
+    """Collapses a set of hour starts into contiguous [start, end) ranges."""
+    ranges: List[Tuple[datetime, datetime]] = []
+    for hour in sorted(hours):
+        if ranges and ranges[-1][1] == hour:
+            ranges[-1] = (ranges[-1][0], hour + HOUR)
+        else:
+            ranges.append((hour, hour + HOUR))
+    return ranges
+
+
+# --- Maintenance ---
+def _aggregate_hours(db, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """Aggregates the source table into HOUR rollup mappings for [start, end)."""
+    txn = _transaction_model()
+    dims = [getattr(txn, d) for d in ROLLUP_DIMENSIONS]
+    measures = [func.count(txn.id), func.sum(txn.amount), func.sum(func.coalesce(txn.fee_amount, 0))]
+    bucket = _hour_bucket_expr(db.get_bind().dialect.name, txn.initiated_at)
+
+    if bucket is not None:
+        windows = [(start, end, bucket)]
+    else: # One query per hour; the bucket is known from the window
+        windows = []
+        hour = start
+        while hour < end:
+            windows.append((hour, hour + HOUR, None))
+            hour += HOUR
+
+    mappings = []
+    for window_start, window_end, bucket_expr in windows:
+        group_cols = ([bucket_expr] if bucket_expr is not None else []) + dims
+        stmt = select(*group_cols, *measures).where(
+            txn.initiated_at >= _aware_utc(window_start), txn.initiated_at < _aware_utc(window_end)
+        ).group_by(*group_cols)
+        for row in db.execute(stmt):
+            values = list(row)
+            hour = _as_hour(values.pop(0)) if bucket_expr is not None else window_start
+            mapping = {"grain": models.RollupGrainEnum.HOUR, "bucket_start": hour}
+            mapping.update((d, _dimension_value(v)) for d, v in zip(ROLLUP_DIMENSIONS, values[:len(dims)]))
+            count, amount, fees = values[len(dims):]
+            mapping.update(txn_count=count or 0, total_amount=Decimal(amount or 0), total_fees=Decimal(fees or 0))
+            mappings.append(mapping)
+    return mappings
+
+def _rebuild_hours(db, start: datetime, end: datetime) -> int:
+    rollup = models.TransactionRollup
+    db.query(rollup).filter(
+        rollup.grain == models.RollupGrainEnum.HOUR, rollup.bucket_start >= start, rollup.bucket_start < end
+    ).delete(synchronize_session=False)
+    mappings = _aggregate_hours(db, start, end)
+    if mappings:
+        db.bulk_insert_mappings(rollup, mappings)
+    return len(mappings)
+
+def _rebuild_days(db, days: Iterable[datetime]) -> int:
+    """Rebuilds DAY rollups from the (already refreshed) HOUR rollups of each day."""
+    rollup = models.TransactionRollup
+    written = 0
+    for day_start, day_end in _hour_ranges_by_day(days):
+        db.query(rollup).filter(
+            rollup.grain == models.RollupGrainEnum.DAY, rollup.bucket_start >= day_start, rollup.bucket_start < day_end
+        ).delete(synchronize_session=False)
+        totals: Dict[Tuple, List[Any]] = defaultdict(lambda: [0, Decimal("0"), Decimal("0")])
+        hour_rows = db.query(rollup).filter(
+            rollup.grain == models.RollupGrainEnum.HOUR, rollup.bucket_start >= day_start, rollup.bucket_start < day_end
+        )
+        for row in hour_rows:
+            key = (_floor_day(row.bucket_start),) + tuple(getattr(row, d) for d in ROLLUP_DIMENSIONS)
+            acc = totals[key]
+            acc[0] += row.txn_count
+            acc[1] += Decimal(row.total_amount)
+            acc[2] += Decimal(row.total_fees)
+        mappings = [
+            dict(grain=models.RollupGrainEnum.DAY, bucket_start=key[0], **dict(zip(ROLLUP_DIMENSIONS, key[1:])),
+                 txn_count=acc[0], total_amount=acc[1], total_fees=acc[2])
+            for key, acc in totals.items()
+        ]
+        if mappings:
+            db.bulk_insert_mappings(rollup, mappings)
+        written += len(mappings)
+    return written
+
+def _hour_ranges_by_day(days: Iterable[datetime]) -> List[Tuple[datetime, datetime]]:
+    ranges: List[Tuple[datetime, datetime]] = []
+    for day in sorted(set(_floor_day(d) for d in days)):
+        if ranges and ranges[-1][1] == day:
+            ranges[-1] = (ranges[-1][0], day + DAY)
+        else:
+            ranges.append((day, day + DAY))
+    return ranges
+
+def _dirty_hours(db, since: datetime, until: datetime) -> Set[datetime]:
+    """Hours holding source rows changed in (since, until]."""
+    txn = _transaction_model()
+    changed = (txn.updated_at > _aware_utc(since), txn.updated_at <= _aware_utc(until))
+    bucket = _hour_bucket_expr(db.get_bind().dialect.name, txn.initiated_at)
+    if bucket is not None:
+        return {_as_hour(v) for v in db.execute(select(bucket).where(*changed).distinct()).scalars() if v is not None}
+    stmt = select(txn.initiated_at).where(*changed).execution_options(stream_results=True)
+    return {_floor_hour(v) for v in db.execute(stmt).scalars() if v is not None}
+
+def rebuild_transaction_rollups(db, start: datetime, end: datetime, hours: Optional[Iterable[datetime]] = None) -> Dict[str, int]:
+    """
+    Recomputes the rollups of `hours` (default: every hour in [start, end)), one day per commit.
+    Returns counts of rewritten rows.
+    """
+    start, end = _floor_hour(start), _floor_hour(end - timedelta(microseconds=1)) + HOUR
+    if hours is None:
+        dirty = []
+        hour = start
+        while hour < end:
+            dirty.append(hour)
+            hour += HOUR
+    else:
+        dirty = sorted(set(_floor_hour(h) for h in hours))
+
+    stats = {"hours": len(dirty), "hour_rows": 0, "day_rows": 0}
+    by_day: Dict[datetime, List[datetime]] = defaultdict(list)
+    for hour in dirty:
+        by_day[_floor_day(hour)].append(hour)
+    for day in sorted(by_day):
+        for range_start, range_end in _hour_ranges(by_day[day]):
+            stats["hour_rows"] += _rebuild_hours(db, range_start, range_end)
+        stats["day_rows"] += _rebuild_days(db, [day])
+        db.commit() # Bounded transactions for long backfills
+    return stats
+
+def backfill_transaction_rollups(db, start: datetime, end: datetime) -> Dict[str, int]:
+    """Rebuilds every rollup in [start, end). Does not move the watermark."""
+    return rebuild_transaction_rollups(db, start, end)
+
+def get_rollup_watermark(db, source: str = TRANSACTION_ROLLUP_SOURCE) -> Optional[datetime]:
+    wm = db.query(models.RollupWatermark).filter(models.RollupWatermark.source == source).first()
+    return wm.high_watermark if wm and wm.high_watermark != UNBUILT_WATERMARK else None
+
+def _lock_watermark(db, source: str) -> models.RollupWatermark:
+    """
+    Returns the watermark row locked FOR UPDATE, creating it (as UNBUILT_WATERMARK) first if needed.
+    FOR UPDATE on a missing row locks nothing, so the row must exist before two nodes can serialise on it.
+    """
+    query = db.query(models.RollupWatermark).filter(models.RollupWatermark.source == source)
+    if query.first() is None:
+        try:
+            with db.begin_nested():
+                db.add(models.RollupWatermark(source=source, high_watermark=UNBUILT_WATERMARK))
+        except IntegrityError:
+            pass # Another node created it; the lock below waits for that node's refresh
+    return query.with_for_update().populate_existing().one()
+
+def _rebuild_dirty_hours(db, hours: Iterable[datetime]) -> Dict[str, int]:
+    """Rebuilds `hours` and their days without committing, so the caller keeps the watermark lock."""
+    stats = {"hours": 0, "hour_rows": 0, "day_rows": 0}
+    for day_hours in _group_by_day(hours):
+        for range_start, range_end in _hour_ranges(day_hours):
+            stats["hour_rows"] += _rebuild_hours(db, range_start, range_end)
+        stats["day_rows"] += _rebuild_days(db, day_hours[:1])
+        stats["hours"] += len(day_hours)
+    return stats
+
+def refresh_transaction_rollups(db, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Brings the rollups up to date with source changes since the watermark. The watermark row is locked
+    for the duration (FOR UPDATE), so concurrent refreshers on other nodes wait rather than duplicate work.
+    With no watermark yet, every hour holding transactions is built (initial backfill) in the same
+    locked transaction.
+    """
+    txn = _transaction_model()
+    high_watermark = _naive_utc(now or datetime.utcnow()) - timedelta(seconds=REPORT_ROLLUP_SAFETY_LAG_SECONDS)
+    wm = _lock_watermark(db, TRANSACTION_ROLLUP_SOURCE)
+    initial = wm.high_watermark == UNBUILT_WATERMARK
+
+    if initial:
+        first, last = db.query(func.min(txn.initiated_at), func.max(txn.initiated_at)).one()
+        hours: List[datetime] = []
+        if first is not None:
+            hour, last = _floor_hour(_naive_utc(_coerce_datetime(first))), _naive_utc(_coerce_datetime(last))
+            while hour <= last:
+                hours.append(hour)
+                hour += HOUR
+        stats: Dict[str, Any] = _rebuild_dirty_hours(db, hours)
+    elif high_watermark <= wm.high_watermark:
+        db.rollback() # Release the lock
+        return {"hours": 0, "hour_rows": 0, "day_rows": 0, "high_watermark": wm.high_watermark}
+    else:
+        stats = _rebuild_dirty_hours(db, _dirty_hours(db, wm.high_watermark, high_watermark))
+
+    # Everything is one transaction here, so the watermark moves atomically with the rows
+    wm.high_watermark = high_watermark
+    db.commit()
+    stats["high_watermark"] = high_watermark
+    if initial:
+        stats["initial_backfill"] = True
+    return stats
+
+def _group_by_day(hours: Iterable[datetime]) -> List[List[datetime]]:
+    by_day: Dict[datetime, List[datetime]] = defaultdict(list)
+    for hour in hours:
+        by_day[_floor_day(hour)].append(hour)
+    return [sorted(by_day[day]) for day in sorted(by_day)]
+
+def _coerce_datetime(value: Any) -> datetime:
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+# --- Queries ---
+class AggregateResult:
+    __slots__ = ("rows", "served_from", "as_of")
+
+    def __init__(self, rows: List[Dict[str, Any]], served_from: str, as_of: Optional[datetime]):
+        self.rows = rows
+        self.served_from = served_from # ROLLUP or SOURCE
+        self.as_of = as_of # Rollup watermark (None when served from source)
+
+
+def _normalise_filters(filters: Optional[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    return {k: (list(v) if isinstance(v, (list, tuple, set)) else [v]) for k, v in (filters or {}).items()}
+
+def _can_use_rollups(start: datetime, end: datetime, group_by: Sequence[str], filters: Dict[str, List[Any]]) -> bool:
+    allowed = set(ROLLUP_DIMENSIONS) | {BUCKET_KEY}
+    return (set(group_by) <= allowed and set(filters) <= set(ROLLUP_DIMENSIONS)
+            and _floor_hour(start) == start and _floor_hour(end) == end)
+
+def _rollup_pieces(start: datetime, end: datetime, grain: models.RollupGrainEnum) -> List[Tuple[models.RollupGrainEnum, datetime, datetime]]:
+    """Splits [start, end) into whole days (DAY rows) and partial-day edges (HOUR rows)."""
+    if grain == models.RollupGrainEnum.HOUR:
+        return [(models.RollupGrainEnum.HOUR, start, end)]
+    first_day = _floor_day(start) if _floor_day(start) == start else _floor_day(start) + DAY
+    last_day = _floor_day(end)
+    if first_day >= last_day:
+        return [(models.RollupGrainEnum.HOUR, start, end)]
+    pieces = []
+    if start < first_day:
+        pieces.append((models.RollupGrainEnum.HOUR, start, first_day))
+    pieces.append((models.RollupGrainEnum.DAY, first_day, last_day))
+    if last_day < end:
+        pieces.append((models.RollupGrainEnum.HOUR, last_day, end))
+    return pieces
+
+def _accumulate(totals: Dict[Tuple, List[Any]], key: Tuple, count: Any, amount: Any, fees: Any) -> None:
+    acc = totals[key]
+    acc[0] += int(count or 0)
+    acc[1] += Decimal(amount or 0)
+    acc[2] += Decimal(fees or 0)
+
+def _result_rows(totals: Dict[Tuple, List[Any]], group_by: Sequence[str]) -> List[Dict[str, Any]]:
+    rows = []
+    for key in sorted(totals, key=lambda k: tuple("" if v is None else str(v) for v in k)):
+        row = dict(zip(group_by, key))
+        row.update(zip(ROLLUP_MEASURES, totals[key]))
+        rows.append(row)
+    return rows
+
+def _query_rollups(db, start, end, group_by, filters, grain) -> List[Dict[str, Any]]:
+    rollup = models.TransactionRollup
+    totals: Dict[Tuple, List[Any]] = defaultdict(lambda: [0, Decimal("0"), Decimal("0")])
+    group_cols = [getattr(rollup, g) for g in group_by if g != BUCKET_KEY]
+    for piece_grain, piece_start, piece_end in _rollup_pieces(start, end, grain):
+        cols = ([rollup.bucket_start] if BUCKET_KEY in group_by else []) + group_cols
+        stmt = select(*cols, func.sum(rollup.txn_count), func.sum(rollup.total_amount), func.sum(rollup.total_fees)).where(
+            rollup.grain == piece_grain, rollup.bucket_start >= piece_start, rollup.bucket_start < piece_end,
+            *[getattr(rollup, f).in_([_dimension_value(v) for v in values]) for f, values in filters.items()]
+        ).group_by(*cols)
+        for row in db.execute(stmt):
+            values = list(row)
+            by_name = {}
+            if BUCKET_KEY in group_by:
+                bucket = _coerce_datetime(values.pop(0))
+                by_name[BUCKET_KEY] = _floor_day(bucket) if grain == models.RollupGrainEnum.DAY else bucket
+            by_name.update(zip([g for g in group_by if g != BUCKET_KEY], values[:len(group_cols)]))
+            _accumulate(totals, tuple(by_name[g] for g in group_by), *values[len(group_cols):])
+    return _result_rows(totals, group_by)
+
+def _query_source(db, start, end, group_by, filters) -> List[Dict[str, Any]]:
+    txn = _transaction_model()
+    if BUCKET_KEY in group_by:
+        raise RollupQueryError("Grouping by bucket requires an hour-aligned time range.")
+    try:
+        group_cols = [getattr(txn, g).expression for g in group_by]
+        conditions = []
+        for field, values in filters.items():
+            column = getattr(txn, field)
+            enum_class = getattr(column.type, "enum_class", None)
+            if enum_class is not None:
+                values = [v if isinstance(v, enum_class) else enum_class(v) for v in values]
+            conditions.append(column.in_(values))
+    except (AttributeError, ValueError) as e:
+        raise RollupQueryError(f"Invalid group_by or filter for transaction aggregates: {e}") from e
+
+    stmt = select(*group_cols, func.count(txn.id), func.sum(txn.amount), func.sum(func.coalesce(txn.fee_amount, 0))).where(
+        txn.initiated_at >= _aware_utc(start), txn.initiated_at < _aware_utc(end), *conditions
+    ).group_by(*group_cols)
+    totals: Dict[Tuple, List[Any]] = defaultdict(lambda: [0, Decimal("0"), Decimal("0")])
+    for row in db.execute(stmt):
+        values = list(row)
+        key = tuple(_dimension_value(v) if isinstance(v, enum.Enum) else v for v in values[:len(group_cols)])
+        _accumulate(totals, key, *values[len(group_cols):])
+    return _result_rows(totals, group_by)
+
+def query_transaction_aggregates(db, start: datetime, end: datetime, group_by: Sequence[str] = (),
+                                 filters: Optional[Dict[str, Any]] = None, grain: str = "DAY") -> AggregateResult:
+    """
+    Transaction count / value / fees over [start, end), grouped by `group_by` (rollup dimensions, any
+    FinancialTransaction column, or "bucket" for the time bucket at `grain`). `filters` maps a field to a
+    value or list of values. Served from the rollups when possible, otherwise from the source table.
+    """
+    start, end = _naive_utc(start), _naive_utc(end)
+    if end <= start:
+        raise RollupQueryError("end must be after start.")
+    try:
+        grain_enum = models.RollupGrainEnum(grain.upper())
+    except ValueError:
+        raise RollupQueryError(f"Unsupported grain '{grain}'. Use HOUR or DAY.")
+    group_by = list(group_by)
+    filters_by_field = _normalise_filters(filters)
+
+    if _can_use_rollups(start, end, group_by, filters_by_field):
+        # With grain DAY, partial edge days are read from HOUR rows and folded into their day bucket
+        as_of = get_rollup_watermark(db)
+        if as_of is not None: # Rollups exist
+            return AggregateResult(_query_rollups(db, start, end, group_by, filters_by_field, grain_enum), "ROLLUP", as_of)
+    return AggregateResult(_query_source(db, start, end, group_by, filters_by_field), "SOURCE", None)
+
+
+# --- Background refresher ---
+class RollupRefresher:
+    def __init__(self, interval_seconds: float = REPORT_ROLLUP_REFRESH_SECONDS, session_factory=None):
+        self.interval_seconds = interval_seconds
+        self._session_factory = session_factory
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_stats: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[str] = None
+
+    def _session(self):
+        if self._session_factory is None:
+            from weezy_cbs.database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    def refresh_once(self) -> Dict[str, Any]:
+        db = self._session()
+        try:
+            self.last_stats = refresh_transaction_rollups(db)
+            self.last_error = None
+            return self.last_stats
+        except Exception as e:
+            db.rollback()
+            self.last_error = str(e)
+            raise
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.refresh_once()
+            except Exception as e: # Keep refreshing; the next run recomputes everything since the watermark
+                print(f"Transaction rollup refresh failed: {e}")
+            self._stop.wait(self.interval_seconds)
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rollup-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 30) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+_refresher: Optional[RollupRefresher] = None
+
+def start_rollup_refresher(**kwargs) -> RollupRefresher:
+    global _refresher
+    if _refresher is None:
+        _refresher = RollupRefresher(**kwargs)
+    _refresher.start()
+    return _refresher
+
+def stop_rollup_refresher() -> None:
+    global _refresher
+    if _refresher is not None:
+        _refresher.stop()
+        _refresher = None
+
+
+def _parse_cli_datetime(value: str) -> datetime:
+    return _naive_utc(datetime.fromisoformat(value))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain transaction rollups for dashboards.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("refresh", help="Apply source changes since the watermark (initial backfill if none).")
+    backfill_cmd = commands.add_parser("backfill", help="Rebuild rollups for a UTC time range.")
+    backfill_cmd.add_argument("--from", dest="start", required=True, type=_parse_cli_datetime, help="Start (ISO date/time, UTC)")
+    backfill_cmd.add_argument("--to", dest="end", required=True, type=_parse_cli_datetime, help="End, exclusive (ISO date/time, UTC)")
+    args = parser.parse_args()
+
+    from weezy_cbs.database import SessionLocal
+    session = SessionLocal()
+    try:
+        if args.command == "refresh":
+            print(refresh_transaction_rollups(session))
+        else:
+            print(backfill_transaction_rollups(session, args.start, args.end))
+    finally:
+        session.close()
@@ -24,6 +24,8 @@ class ReportParametersSchema(BaseModel): # For the overall parameters_schema_jso
 
 class QueryDetailsSQL(BaseModel):
     sql_template: str = Field(..., description="SQL query with placeholders like :param_name")
+    # PARQUET/ARROW output: low-cardinality text columns (statuses, codes) to store dictionary-encoded
+    dictionary_encode_columns: Optional[List[str]] = None
 
 class QueryDetailsDynamicFilters(BaseModel):
     base_model_name: str = Field(..., description="e.g., Customer, Account, Transaction") # Name of the primary SQLAlchemy model to query
@@ -53,6 +55,15 @@ class DashboardWidgetConfig(BaseModel):
     viz_options: Optional[Dict[str, Any]] = None
 
 
+def _parse_json_string(value):
+    # Validators take no field/config arguments so they work under both Pydantic v1 and v2
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            raise ValueError("Invalid JSON string")
+    return value
+
 # --- ReportDefinition Schemas ---
 class ReportDefinitionBase(BaseModel):
     report_code: str = Field(..., max_length=50, pattern=r"^[A-Z0-9_]+$", description="Unique code, e.g., REG_CBN_001")
@@ -66,26 +77,16 @@ class ReportDefinitionBase(BaseModel):
     allowed_roles_json: Optional[List[str]] = Field(None, description="JSON array of role names that can access")
     is_system_report: bool = False
     version: int = Field(1, ge=1)
+    result_cache_ttl_seconds: Optional[int] = Field(None, ge=0, description="Serve identical runs (same params and format) from cache for this many seconds")
+    statement_timeout_seconds: Optional[int] = Field(None, gt=0, description="Query time limit for a run; default REPORT_STATEMENT_TIMEOUT_SECONDS")
+    max_estimated_cost: Optional[float] = Field(None, gt=0, description="Reject runs whose planner cost estimate exceeds this; default REPORT_MAX_ESTIMATED_COST")
 
     @validator('source_modules_json', 'default_output_formats_json', 'allowed_roles_json', 'query_details_json', 'parameters_schema_json', pre=True)
-    def parse_json_fields(cls, value, field):
-        if isinstance(value, str):
-            try:
-                parsed_value = json.loads(value)
-                # Further validation based on field.name if needed by Pydantic model for that field
-                if field.name == 'parameters_schema_json' and parsed_value is not None:
-                    return ReportParametersSchema.parse_obj(parsed_value) # Validate against helper schema
-                # Add similar for query_details based on query_logic_type if it was a string
-                return parsed_value
-            except json.JSONDecodeError:
-                raise ValueError(f"Invalid JSON string for {field.name}")
-        # If already parsed or meant to be a specific Pydantic model (like query_details_json)
-        if field.name == 'parameters_schema_json' and isinstance(value, dict) and value is not None:
-             return ReportParametersSchema.parse_obj(value)
+    def parse_json_fields(cls, value):
+        # Strings are parsed here; parameters_schema_json dicts are then validated against ReportParametersSchema by the field type
         # Add specific parsing for query_details_json based on query_logic_type if it's a dict
         # This is complex with Union, might need a root_validator or manual parsing in service based on type
-        return value
-
+        return _parse_json_string(value)
 
 class ReportDefinitionCreate(ReportDefinitionBase):
     # created_by_user_id is set by the service from authenticated user
@@ -102,21 +103,13 @@ class ReportDefinitionUpdate(BaseModel): # Partial updates
     allowed_roles_json: Optional[List[str]] = None
     is_system_report: Optional[bool] = None
     version: Optional[int] = Field(None, ge=1) # Consider if version update is manual or auto
+    result_cache_ttl_seconds: Optional[int] = Field(None, ge=0)
+    statement_timeout_seconds: Optional[int] = Field(None, gt=0)
+    max_estimated_cost: Optional[float] = Field(None, gt=0)
 
     @validator('source_modules_json', 'default_output_formats_json', 'allowed_roles_json', 'query_details_json', 'parameters_schema_json', pre=True)
-    def parse_update_json_fields(cls, value, field): # Duplicate for updates
-        if value is None: return None
-        if isinstance(value, str):
-            try:
-                parsed_value = json.loads(value)
-                if field.name == 'parameters_schema_json' and parsed_value is not None:
-                    return ReportParametersSchema.parse_obj(parsed_value)
-                return parsed_value
-            except json.JSONDecodeError:
-                raise ValueError(f"Invalid JSON string for {field.name}")
-        if field.name == 'parameters_schema_json' and isinstance(value, dict) and value is not None:
-             return ReportParametersSchema.parse_obj(value)
-        return value
+    def parse_update_json_fields(cls, value): # Duplicate for updates
+        return _parse_json_string(value)
 
 class ReportDefinitionResponse(ReportDefinitionBase):
     id: int
@@ -199,8 +192,15 @@ class GeneratedReportLogResponse(BaseModel):
     file_name: Optional[str] = None
     file_path_or_link: Optional[str] = None # Could be a presigned URL
     file_size_bytes: Optional[int] = None
+    rows_written: Optional[int] = None
     error_message: Optional[str] = None
     processing_time_seconds: Optional[int] = None
+    served_from_cache: bool = False
+    cached_from_log_id: Optional[int] = None
+    estimated_cost: Optional[float] = None
+    estimated_rows: Optional[int] = None
+    query_seconds: Optional[float] = None
+    executed_on: Optional[str] = None
 
     report_definition_code: Optional[str] = None # Added by service for context
 
@@ -290,6 +290,22 @@ class ReportDataResponse(BaseModel):
     log_id: Optional[int] = Field(None, description="ID of the GeneratedReportLog entry")
 
 
+class DynamicReportPageResponse(BaseModel):
+    rows: List[Dict[str, Any]]
+    next_cursor: Optional[str] = Field(None, description="Pass as `cursor` to fetch the next page; null on the last page")
+
+
+class WidgetDataResponse(BaseModel):
+    widget_id: str
+    metric_key: str
+    value: Any = Field(None, description="Metric total over the whole range (for KPI widgets)")
+    rows: List[Dict[str, Any]] = Field(default_factory=list, description="Grouped rows: group_by fields plus txn_count, total_amount, total_fees")
+    range_start: datetime
+    range_end: datetime
+    served_from: str = Field(..., description="ROLLUP or SOURCE")
+    as_of: Optional[datetime] = Field(None, description="Rollup watermark; source changes after this are not yet reflected")
+
+
 # --- Paginated Responses ---
 class PaginatedReportDefinitionResponse(BaseModel):
     items: List[ReportDefinitionResponse]
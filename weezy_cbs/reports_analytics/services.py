@@ -5,19 +5,26 @@ from sqlalchemy import text # For executing raw SQL safely
 from fastapi import HTTPException, status
 from datetime import datetime, timedelta
 # import pandas as pd # Optional: For data manipulation and CSV/Excel export if used
-import csv # For CSV generation
-import io # For CSV generation
 
 from . import models, schemas
+from .report_streaming import STREAMING_OUTPUT_FORMATS, stream_statement_batches, stream_report_to_store
+from .query_guard import ReportCostExceededError, apply_statement_timeout, replica_session, report_execution_guard
+from .query_compiler import dynamic_filter_compiler
+from .result_cache import REPORT_CACHE_WAIT_SECONDS, report_cache_key, report_result_cache
+from .rollups import RollupQueryError, query_transaction_aggregates
 from weezy_cbs.core_infrastructure_config_engine.services import AuditLogService
 # Conceptual: For mapping model names to actual SQLAlchemy models for dynamic queries
 # from weezy_cbs import models as all_models # This would require a central models.__init__
 
-# --- Helper for Cron & Next Run Time (Conceptual) ---
-# In a real app, use a library like 'croniter'
+# --- Helper for Cron & Next Run Time ---
 def calculate_next_run(cron_expression: str, last_run: Optional[datetime] = None) -> Optional[datetime]:
-    # This is a placeholder. Real implementation needs a cron expression parser.
-    # For simplicity, let's assume it just adds a fixed interval for demo.
+    try:
+        from croniter import croniter # Listed in requirements; the fallback below only knows two patterns
+    except ImportError:
+        croniter = None
+    if croniter is not None:
+        return croniter(cron_expression, last_run or datetime.utcnow()).get_next(datetime)
+    # Fallback without croniter: fixed intervals for the common patterns.
     if "0 0 * * *" in cron_expression: # Daily at midnight
         return (last_run or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
     if "0 * * * *" in cron_expression: # Hourly
@@ -60,6 +67,9 @@ class ReportDefinitionService(BaseReportingService):
             allowed_roles_json=json.dumps(def_in.allowed_roles_json) if def_in.allowed_roles_json else None,
             is_system_report=def_in.is_system_report,
             version=def_in.version,
+            result_cache_ttl_seconds=def_in.result_cache_ttl_seconds,
+            statement_timeout_seconds=def_in.statement_timeout_seconds,
+            max_estimated_cost=def_in.max_estimated_cost,
             created_by_user_id=user_id
         )
         db.add(db_def)
@@ -95,6 +105,7 @@ class ReportDefinitionService(BaseReportingService):
                     setattr(db_def, field, value)
 
         db_def.updated_at = datetime.utcnow()
+        report_result_cache.invalidate_definition(db, db_def.id) # Cached artifacts were built from the old definition
         db.commit()
         db.refresh(db_def)
         self._audit_log(db, "REPORT_DEF_UPDATE", "ReportDefinition", db_def.id, f"Report definition '{db_def.report_name}' updated.", username)
@@ -128,22 +139,53 @@ class GeneratedReportLogService(BaseReportingService):
         db.refresh(db_log)
         return db_log
 
-    def update_log_status_success(self, db: Session, log_id: int, file_name: Optional[str], file_path: Optional[str], file_size: Optional[int], processing_time_sec: Optional[int]):
+    def update_log_status_success(self, db: Session, log_id: int, file_name: Optional[str], file_path: Optional[str], file_size: Optional[int], processing_time_sec: Optional[int], rows_written: Optional[int] = None, cache_key: Optional[str] = None, execution_stats: Optional[Dict[str, Any]] = None):
         db_log = db.query(models.GeneratedReportLog).filter(models.GeneratedReportLog.id == log_id).first()
         if db_log:
+            for field, value in (execution_stats or {}).items(): # estimated_cost, query_seconds, ... (see query_guard.py)
+                setattr(db_log, field, value)
             db_log.status = models.ReportStatusEnum.SUCCESS
             db_log.file_name = file_name
             db_log.file_path_or_link = file_path
             db_log.file_size_bytes = file_size
+            db_log.rows_written = rows_written
+            db_log.cache_key = cache_key
             db_log.processing_time_seconds = processing_time_sec
             db_log.error_message = None
             db.commit()
             db.refresh(db_log)
         return db_log
 
-    def update_log_status_failed(self, db: Session, log_id: int, error_message: str, processing_time_sec: Optional[int]):
+    def update_log_status_cache_hit(self, db: Session, log_id: int, source_log: models.GeneratedReportLog, processing_time_sec: Optional[int]):
         db_log = db.query(models.GeneratedReportLog).filter(models.GeneratedReportLog.id == log_id).first()
         if db_log:
+            db_log.status = models.ReportStatusEnum.SUCCESS
+            db_log.file_name = source_log.file_name
+            db_log.file_path_or_link = source_log.file_path_or_link
+            db_log.file_size_bytes = source_log.file_size_bytes
+            db_log.rows_written = source_log.rows_written
+            db_log.cache_key = source_log.cache_key
+            db_log.served_from_cache = True
+            db_log.cached_from_log_id = source_log.id
+            db_log.processing_time_seconds = processing_time_sec
+            db_log.error_message = None
+            db.commit()
+            db.refresh(db_log)
+        return db_log
+
+    def update_log_progress(self, db: Session, log_id: int, rows_written: int, bytes_written: int):
+        # Called from a separate session while a report streams (committing the reading session would close its cursor)
+        db.query(models.GeneratedReportLog).filter(models.GeneratedReportLog.id == log_id).update(
+            {"status": models.ReportStatusEnum.PROCESSING, "rows_written": rows_written, "file_size_bytes": bytes_written},
+            synchronize_session=False
+        )
+        db.commit()
+
+    def update_log_status_failed(self, db: Session, log_id: int, error_message: str, processing_time_sec: Optional[int], execution_stats: Optional[Dict[str, Any]] = None):
+        db_log = db.query(models.GeneratedReportLog).filter(models.GeneratedReportLog.id == log_id).first()
+        if db_log:
+            for field, value in (execution_stats or {}).items():
+                setattr(db_log, field, value)
             db_log.status = models.ReportStatusEnum.FAILED
             db_log.error_message = error_message
             db_log.processing_time_seconds = processing_time_sec
@@ -169,215 +211,179 @@ class ReportGenerationService(BaseReportingService):
         self.log_service = log_service
         self.def_service = def_service
 
-    def _format_data_to_csv(self, data: List[Dict[str, Any]]) -> str:
-        if not data: return ""
-        output = io.StringIO()
-        writer = csv.DictWriter(output, fieldnames=data[0].keys())
-        writer.writeheader()
-        writer.writerows(data)
-        return output.getvalue()
-
-    def _execute_sql_report(self, sql_template: str, params: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        # IMPORTANT: Ensure params are safely bound, not directly formatted into SQL string, to prevent SQL injection.
-        # SQLAlchemy's text() handles parameter binding.
-        stmt = text(sql_template)
-        result_proxy = self.db.execute(stmt, params or {})
-        # Convert rows to list of dicts
-        # data = [dict(row) for row in result_proxy] # For SQLAlchemy 1.x
-        data = [dict(row._mapping) for row in result_proxy] # For SQLAlchemy 2.x with Row._mapping
-        return data
-
-    def _execute_dynamic_filter_report(self, model_name: str, filters: Dict, select_fields: Optional[List[str]], sort_by: Optional[str]) -> List[Dict[str, Any]]:
-        # This is highly conceptual and complex.
-        # It requires a mapping from model_name (string) to actual SQLAlchemy model classes.
-        # And a robust filter parser to convert {"field": "op:value"} into SQLAlchemy filter conditions.
-        # This is highly conceptual and complex.
-        # It requires a mapping from model_name (string) to actual SQLAlchemy model classes.
-        # And a robust filter parser to convert {"field": "op:value"} into SQLAlchemy filter conditions.
-
-        # Conceptual model map - in a real system, this would be more robust, possibly auto-discovered
-        # or explicitly registered. For now, using placeholder models from other modules.
-        # This assumes models from other modules are importable.
-        from weezy_cbs.customer_identity_management.models import Customer
-        from weezy_cbs.accounts_ledger_management.models import Account, LedgerEntry
-        from weezy_cbs.transaction_management.models import FinancialTransaction
-
-        MODEL_MAP = {
-            "Customer": Customer,
-            "Account": Account,
-            "LedgerEntry": LedgerEntry,
-            "FinancialTransaction": FinancialTransaction,
-            # ... add other queryable models ...
-        }
-
-        target_model = MODEL_MAP.get(model_name)
-        if not target_model:
-            raise ValueError(f"Unsupported model for dynamic filtering: {model_name}")
-
-        query = self.db.query(target_model)
-
-        # Apply filters (conceptual parsing)
-        # Filters format: {"field_name": "operator:value", "age": "gte:30", "status": "in:ACTIVE,PENDING"}
-        if filters:
-            for field_key, filter_value_str in filters.items():
-                parts = filter_value_str.split(":", 1)
-                operator = parts[0].lower()
-                value_str = parts[1] if len(parts) > 1 else ""
-
-                column_attr = getattr(target_model, field_key, None)
-                if not column_attr:
-                    print(f"WARN: Invalid filter field '{field_key}' for model '{model_name}'. Skipping.")
-                    continue
-
-                # Convert value based on column type (simplified - real type conversion needed)
-                actual_value: Any = value_str
-                # TODO: Add type conversion based on column_attr.type (e.g., for int, date, bool)
-                # For 'in' operator, split by comma
-                if operator == "in_" or operator == "notin_":
-                    actual_value = [v.strip() for v in value_str.split(',')]
-                elif isinstance(column_attr.type, (sqlalchemy.Integer, sqlalchemy.Numeric)):
-                    try: actual_value = int(value_str) if isinstance(column_attr.type, sqlalchemy.Integer) else float(value_str)
-                    except ValueError: print(f"WARN: Could not convert value '{value_str}' for field '{field_key}'. Skipping filter."); continue
-                elif isinstance(column_attr.type, sqlalchemy.Date):
-                    try: actual_value = datetime.strptime(value_str, '%Y-%m-%d').date()
-                    except ValueError: print(f"WARN: Could not convert date value '{value_str}' for field '{field_key}'. Use YYYY-MM-DD. Skipping filter."); continue
-                elif isinstance(column_attr.type, sqlalchemy.Boolean):
-                    actual_value = value_str.lower() in ['true', '1', 'yes']
-
-
-                if operator == "eq": query = query.filter(column_attr == actual_value)
-                elif operator == "ne": query = query.filter(column_attr != actual_value)
-                elif operator == "gt": query = query.filter(column_attr > actual_value)
-                elif operator == "gte": query = query.filter(column_attr >= actual_value)
-                elif operator == "lt": query = query.filter(column_attr < actual_value)
-                elif operator == "lte": query = query.filter(column_attr <= actual_value)
-                elif operator == "like": query = query.filter(column_attr.like(f"%{actual_value}%"))
-                elif operator == "ilike": query = query.filter(column_attr.ilike(f"%{actual_value}%"))
-                elif operator == "in_": query = query.filter(column_attr.in_(actual_value))
-                elif operator == "notin_": query = query.filter(column_attr.notin_(actual_value))
-                else: print(f"WARN: Unsupported operator '{operator}' for field '{field_key}'. Skipping filter.")
-
-
-        # Apply select_fields
-        if select_fields:
-            selected_columns = [getattr(target_model, field) for field in select_fields if hasattr(target_model, field)]
-            if selected_columns:
-                query = query.with_entities(*selected_columns)
-
-        # Apply sort_by (e.g., "field_name:asc" or "field_name:desc")
-        if sort_by:
-            sort_field_name, direction = (sort_by.split(":") + ["asc"])[:2] # Default to asc
-            sort_column = getattr(target_model, sort_field_name, None)
-            if sort_column:
-                query = query.order_by(sort_column.desc() if direction.lower() == "desc" else sort_column.asc())
-
-        results_orm = query.all()
-
-        # Convert results to list of dicts
-        data = []
-        if results_orm:
-            if select_fields and selected_columns: # If specific columns were selected
-                 data = [dict(zip(select_fields, row)) for row in results_orm]
-            else: # Full model objects
-                 data = [ {c.name: getattr(row, c.name) for c in target_model.__table__.columns} for row in results_orm]
-
-        print(f"SIMULATED DYNAMIC FILTER RESULT for {model_name}: Found {len(data)} records.")
-        return data
-
-
-    def generate_report_from_definition(self, def_id: int, params: Optional[Dict[str, Any]], output_format: str, generated_by_user_id: int, username: str) -> models.GeneratedReportLog:
+    def _execute_dynamic_filter_report(self, model_name: str, filters: Dict, select_fields: Optional[List[str]], sort_by: Optional[str],
+                                       limit: Optional[int] = None, cursor: Optional[str] = None, keyset: bool = False,
+                                       allowed_filter_fields: Optional[List[str]] = None, max_estimated_cost: Optional[float] = None,
+                                       statement_timeout_seconds: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Runs a dynamic filter query through the compiler's cached plan (see query_compiler.py).
+        Returns (rows as dicts, next page cursor; None without keyset or on the last page).
+        """
+        plan = dynamic_filter_compiler.compile(model_name, filters, select_fields, sort_by, limit=limit, keyset=keyset,
+                                               cursor=cursor, allowed_filter_fields=allowed_filter_fields)
+        bind_params = plan.params(filters, limit=limit, cursor=cursor)
+        decision = report_execution_guard.assess(self.db, plan.stmt, bind_params, max_cost=max_estimated_cost,
+                                                 timeout_seconds=statement_timeout_seconds) # Raises ReportCostExceededError
+        apply_statement_timeout(self.db, decision.timeout_seconds)
+        rows = self.db.execute(plan.stmt, bind_params).all()
+        next_cursor = plan.next_cursor(rows[-1]) if rows and limit is not None and len(rows) == limit else None
+        return [dict(zip(plan.column_names, row)) for row in rows], next_cursor
+
+
+    def _report_statement(self, report_def: models.ReportDefinition, params: Optional[Dict[str, Any]]):
+        """
+        (statement, bind params, SQLAlchemy column types) for a definition, not yet executed.
+        Types are known for dynamic filter reports; SQL reports leave them to be inferred.
+        """
+        query_details = self._parse_json_field(report_def.query_details_json)
+        if not query_details:
+            raise ValueError("Invalid query details in report definition.")
+
+        if report_def.query_logic_type == models.ReportQueryLogicTypeEnum.PREDEFINED_SQL:
+            if not isinstance(query_details, dict) or "sql_template" not in query_details:
+                 raise ValueError("SQL template missing in query details for PREDEFINED_SQL report.")
+            return text(query_details["sql_template"]), params or {}, {}
+
+        elif report_def.query_logic_type == models.ReportQueryLogicTypeEnum.DYNAMIC_FILTERS_ON_MODEL:
+            # This requires query_details to be parsed into schemas.QueryDetailsDynamicFilters
+            # For simplicity, assuming it's already a dict with expected keys.
+            if not isinstance(query_details, dict) or "base_model_name" not in query_details:
+                raise ValueError("Base model name missing for DYNAMIC_FILTERS report.")
+            filters = params or {} # Assuming params directly map to filters for this type
+            plan = dynamic_filter_compiler.compile(
+                query_details["base_model_name"], filters,
+                query_details.get("default_select_fields"),
+                query_details.get("default_sort_by"),
+                allowed_filter_fields=query_details.get("allowed_filter_fields")
+            )
+            return plan.stmt, plan.params(filters), plan.column_types
+        elif report_def.query_logic_type == models.ReportQueryLogicTypeEnum.PYTHON_SCRIPT:
+            # Placeholder: Invoke a python script/function
+            # raw_data = some_python_script_runner(query_details.get("script_path"), params)
+            raise NotImplementedError("Python script execution for reports not yet implemented.")
+        else:
+            raise ValueError(f"Unsupported query logic type: {report_def.query_logic_type}")
+
+    def _report_row_source(self, report_def: models.ReportDefinition, params: Optional[Dict[str, Any]], db: Optional[Session] = None):
+        """(column names, row batches, column types) for a definition, read through a server-side cursor on `db`."""
+        stmt, bind_params, column_types = self._report_statement(report_def, params)
+        columns, batches = stream_statement_batches(db or self.db, stmt, bind_params)
+        return columns, batches, column_types
+
+    def _progress_reporter(self, log_id: int):
+        # Progress goes through its own short-lived session; see GeneratedReportLogService.update_log_progress
+        from weezy_cbs.database import SessionLocal
+        def report_progress(rows_written: int, bytes_written: int):
+            progress_db = SessionLocal()
+            try:
+                self.log_service.update_log_progress(progress_db, log_id, rows_written, bytes_written)
+            except Exception as e: # Progress is informational; never fail the report over it
+                print(f"Could not record progress for report log {log_id}: {e}")
+            finally:
+                progress_db.close()
+        return report_progress
+
+    def generate_report_from_definition(self, def_id: int, params: Optional[Dict[str, Any]], output_format: str, generated_by_user_id: int, username: str, log_entry_id: Optional[int] = None) -> models.GeneratedReportLog:
         report_def = self.def_service.get_definition_by_id(self.db, def_id)
         if not report_def:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Report definition not found.")
 
-        log_entry = self.log_service.create_log_entry(
-            self.db, report_name=report_def.report_name, generated_by_user_id=generated_by_user_id,
-            output_format=output_format, report_def_id=report_def.id, params_used=params
-        )
+        log_entry = self.log_service.get_log_by_id(self.db, log_entry_id) if log_entry_id else None
+        if log_entry is None: # Not pre-created by the caller (e.g. the API returns the PENDING log before generation)
+            log_entry = self.log_service.create_log_entry(
+                self.db, report_name=report_def.report_name, generated_by_user_id=generated_by_user_id,
+                output_format=output_format, report_def_id=report_def.id, params_used=params
+            )
 
         start_time = datetime.utcnow()
-        raw_data: List[Dict[str, Any]] = []
         error_msg: Optional[str] = None
+        execution_stats: Dict[str, Any] = {}
+
+        # Result cache (per-definition TTL): reuse a fresh artifact of an identical run instead of re-querying
+        cache_key = report_cache_key(report_def, params, output_format) if report_def.result_cache_ttl_seconds else None
+        is_cache_leader = False
+        if cache_key:
+            cached_log = report_result_cache.find_fresh(self.db, report_def, cache_key)
+            if cached_log is None:
+                is_cache_leader, inflight = report_result_cache.begin(cache_key)
+                if not is_cache_leader: # The same run is in progress in this process: wait and reuse its file
+                    inflight.wait(REPORT_CACHE_WAIT_SECONDS)
+                    cached_log = report_result_cache.find_fresh(self.db, report_def, cache_key)
+            if cached_log is not None:
+                self.log_service.update_log_status_cache_hit(
+                    self.db, log_entry.id, cached_log, int((datetime.utcnow() - start_time).total_seconds())
+                )
+                self._audit_log(self.db, "REPORT_GENERATE_CACHE_HIT", "GeneratedReportLog", log_entry.id, f"Report '{report_def.report_name}' served from cached run {cached_log.id}.", username)
+                self.db.refresh(log_entry)
+                return log_entry
 
         try:
             # Validate params against report_def.parameters_schema_json (conceptual)
             # ...
-
-            query_details = self._parse_json_field(report_def.query_details_json)
-            if not query_details:
-                raise ValueError("Invalid query details in report definition.")
-
-            if report_def.query_logic_type == models.ReportQueryLogicTypeEnum.PREDEFINED_SQL:
-                if not isinstance(query_details, dict) or "sql_template" not in query_details:
-                     raise ValueError("SQL template missing in query details for PREDEFINED_SQL report.")
-                raw_data = self._execute_sql_report(query_details["sql_template"], params)
-
-            elif report_def.query_logic_type == models.ReportQueryLogicTypeEnum.DYNAMIC_FILTERS_ON_MODEL:
-                # This requires query_details to be parsed into schemas.QueryDetailsDynamicFilters
-                # For simplicity, assuming it's already a dict with expected keys.
-                if not isinstance(query_details, dict) or "base_model_name" not in query_details:
-                    raise ValueError("Base model name missing for DYNAMIC_FILTERS report.")
-                raw_data = self._execute_dynamic_filter_report(
-                    query_details["base_model_name"],
-                    params or {}, # Assuming params directly map to filters for this type
-                    query_details.get("default_select_fields"),
-                    query_details.get("default_sort_by")
-                )
-            elif report_def.query_logic_type == models.ReportQueryLogicTypeEnum.PYTHON_SCRIPT:
-                # Placeholder: Invoke a python script/function
-                # raw_data = some_python_script_runner(query_details.get("script_path"), params)
-                raise NotImplementedError("Python script execution for reports not yet implemented.")
-            else:
-                raise ValueError(f"Unsupported query logic type: {report_def.query_logic_type}")
-
-            # Format data (conceptual - only CSV implemented simply)
-            formatted_output: Union[str, List[Dict[str, Any]]]
-            file_name_final = f"{report_def.report_code.replace(' ','_')}_{start_time.strftime('%Y%m%d%H%M%S')}.{output_format.lower()}"
-
-            if output_format.upper() == "CSV":
-                formatted_output = self._format_data_to_csv(raw_data)
-                # In real app, save to S3/file system and get path/link
-                # For now, we'll just indicate success and conceptually store it.
-                file_path_final = f"/reports_storage/{file_name_final}" # Placeholder
-                file_size_final = len(formatted_output.encode('utf-8'))
-
-                self.log_service.update_log_status_success(
-                    self.db, log_entry.id, file_name_final, file_path_final, file_size_final,
-                    int((datetime.utcnow() - start_time).total_seconds())
-                )
-            elif output_format.upper() == "JSON":
-                formatted_output = raw_data # Already in desired list of dicts
-                file_path_final = f"/reports_storage/{file_name_final}" # Placeholder
-                file_size_final = len(json.dumps(formatted_output).encode('utf-8'))
-                self.log_service.update_log_status_success(
-                     self.db, log_entry.id, file_name_final, file_path_final, file_size_final,
-                    int((datetime.utcnow() - start_time).total_seconds())
-                )
-
-            else: # PDF, XLSX etc.
+            if output_format.upper() not in STREAMING_OUTPUT_FORMATS: # PDF, XLSX etc.
                 raise NotImplementedError(f"Output format {output_format} not yet supported.")
 
-            self._audit_log(self.db, "REPORT_GENERATE_SUCCESS", "GeneratedReportLog", log_entry.id, f"Report '{report_def.report_name}' generated.", username)
+            # Cost guard: EXPLAIN first; over-budget runs are rejected, heavy ones queue for a slot and
+            # go to the read replica when configured (see query_guard.py)
+            stmt, bind_params, column_types = self._report_statement(report_def, params)
+            decision = report_execution_guard.assess(
+                self.db, stmt, bind_params, max_cost=report_def.max_estimated_cost,
+                timeout_seconds=report_def.statement_timeout_seconds
+            )
+            execution_stats = decision.execution_stats()
+            query_details = self._parse_json_field(report_def.query_details_json) or {}
+            file_base_name = f"{report_def.report_code.replace(' ','_')}_{start_time.strftime('%Y%m%d%H%M%S')}_{log_entry.id}"
+
+            with report_execution_guard.slot(decision):
+                run_db = (replica_session() if decision.use_replica else None) or self.db
+                try:
+                    apply_statement_timeout(run_db, decision.timeout_seconds)
+                    # Rows are streamed from a server-side cursor straight into the (compressed) report file,
+                    # so memory stays flat however large the result is.
+                    columns, batches = stream_statement_batches(run_db, stmt, bind_params)
+                    streamed = stream_report_to_store(
+                        columns, report_execution_guard.timed_batches(batches, decision.timeout_seconds, execution_stats),
+                        output_format.upper(), file_base_name,
+                        on_progress=self._progress_reporter(log_entry.id),
+                        column_types=column_types, # PARQUET/ARROW only
+                        dictionary_columns=query_details.get("dictionary_encode_columns") or () # Enum-like text columns of SQL reports
+                    )
+                finally:
+                    if run_db is not self.db:
+                        run_db.close()
+
+            self.log_service.update_log_status_success(
+                self.db, log_entry.id, streamed.file_name, streamed.file_path, streamed.bytes_written,
+                int((datetime.utcnow() - start_time).total_seconds()), rows_written=streamed.rows_written,
+                cache_key=cache_key, execution_stats=execution_stats
+            )
+            self._audit_log(self.db, "REPORT_GENERATE_SUCCESS", "GeneratedReportLog", log_entry.id, f"Report '{report_def.report_name}' generated ({streamed.rows_written} rows).", username)
 
         except Exception as e:
+            self.db.rollback() # Discard the failed read transaction before recording the failure
             error_msg = str(e)
+            if isinstance(e, ReportCostExceededError):
+                execution_stats = {"estimated_cost": e.estimate.total_cost, "estimated_rows": e.estimate.plan_rows}
             self.log_service.update_log_status_failed(
                 self.db, log_entry.id, error_msg,
-                int((datetime.utcnow() - start_time).total_seconds())
+                int((datetime.utcnow() - start_time).total_seconds()), execution_stats=execution_stats
             )
             self._audit_log(self.db, "REPORT_GENERATE_FAIL", "GeneratedReportLog", log_entry.id, f"Report '{report_def.report_name}' generation failed: {error_msg}", username)
             # Do not re-raise HTTPException here as it's an async/background type process ideally.
             # The log entry reflects the failure. The API endpoint will return the log entry.
+        finally:
+            if is_cache_leader:
+                report_result_cache.end(cache_key) # Wake coalesced waiters (they fall back to generating on failure)
 
-        db.refresh(log_entry) # Get final state of log entry
+        self.db.refresh(log_entry) # Get final state of log entry
         return log_entry
 
 
 # --- ScheduledReport Service ---
 class ScheduledReportService(BaseReportingService):
     # CRUD, and methods to list upcoming runs, update next_run_at after execution
-    # Actual execution trigger would be an external scheduler (Celery Beat, K8s CronJob)
-    # calling an endpoint or a command that uses ReportGenerationService.
+    # Runs are triggered by the scheduler daemon in report_scheduler.py (or an external scheduler
+    # calling an endpoint or a command that uses ReportGenerationService).
     def create_schedule(self, db: Session, sched_in: schemas.ScheduledReportCreate, user_id: int, username: str) -> models.ScheduledReport:
         # Validate report_definition_id
         if not ReportDefinitionService().get_definition_by_id(db, sched_in.report_definition_id):
@@ -440,14 +446,15 @@ class ScheduledReportService(BaseReportingService):
         db.commit()
         return True
 
-    def record_schedule_run(self, db: Session, sched_id: int, run_status: models.ReportStatusEnum, log_entry: Optional[models.GeneratedReportLog] = None, error_msg: Optional[str] = None):
+    def record_schedule_run(self, db: Session, sched_id: int, run_status: models.ReportStatusEnum, log_entry: Optional[models.GeneratedReportLog] = None, error_msg: Optional[str] = None, advance_next_run: bool = True):
         db_sched = self.get_schedule_by_id(db, sched_id)
         if db_sched:
             db_sched.last_run_at = datetime.utcnow()
             db_sched.last_run_status = run_status
             db_sched.last_error_message = error_msg if run_status == models.ReportStatusEnum.FAILED else None
 
-            if db_sched.status != models.ScheduledReportStatusEnum.COMPLETED_ONCE: # Don't update next_run for one-off
+            # The scheduler daemon already advanced next_run_at when it claimed the run
+            if advance_next_run and db_sched.status != models.ScheduledReportStatusEnum.COMPLETED_ONCE: # Don't update next_run for one-off
                 db_sched.next_run_at = calculate_next_run(db_sched.cron_expression, db_sched.last_run_at)
 
             if run_status == models.ReportStatusEnum.FAILED and db_sched.status == models.ScheduledReportStatusEnum.ACTIVE:
@@ -457,6 +464,9 @@ class ScheduledReportService(BaseReportingService):
             # Audit this specific run via GeneratedReportLog or a dedicated schedule execution log.
 
 # --- DashboardLayout Service ---
+# Widget metric_key -> measure returned by query_transaction_aggregates (see rollups.py)
+WIDGET_TRANSACTION_METRICS = {"TXN_VOLUME": "txn_count", "TXN_VALUE": "total_amount", "TXN_FEES": "total_fees"}
+
 class DashboardLayoutService(BaseReportingService):
     # CRUD for dashboard layouts
     def create_layout(self, db: Session, layout_in: schemas.DashboardLayoutCreate, user_id: int, username: str) -> models.DashboardLayout:
@@ -510,6 +520,42 @@ class DashboardLayoutService(BaseReportingService):
         self._audit_log(db, "DASH_LAYOUT_UPDATE", "DashboardLayout", db_layout.id, f"Dashboard '{db_layout.dashboard_name}' updated.", username)
         return db_layout
 
+    def get_widget_data(self, db: Session, layout_id: int, widget_id: str, user_id: int, now: Optional[datetime] = None) -> Optional[schemas.WidgetDataResponse]:
+        """
+        Data for a transaction metric widget. widget.report_params may hold group_by, filters, grain (HOUR/DAY),
+        and either start/end (ISO, UTC) or lookback_days (default 7, up to the current hour).
+        """
+        db_layout = self.get_layout_by_id(db, layout_id, user_id)
+        if not db_layout: return None
+        widgets = [schemas.DashboardWidgetConfig.parse_obj(w) for w in json.loads(db_layout.layout_config_json or "[]")]
+        widget = next((w for w in widgets if w.id == widget_id), None)
+        if not widget: return None
+        metric = WIDGET_TRANSACTION_METRICS.get((widget.metric_key or "").upper())
+        if not metric:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Widget '{widget_id}' has no supported metric_key ({', '.join(WIDGET_TRANSACTION_METRICS)}).")
+
+        params = widget.report_params or {}
+        try:
+            if params.get("start") and params.get("end"):
+                range_start, range_end = datetime.fromisoformat(params["start"]), datetime.fromisoformat(params["end"])
+            else:
+                # Hour-aligned so the rollups can answer it; the current hour is included
+                current_hour = (now or datetime.utcnow()).replace(minute=0, second=0, microsecond=0)
+                range_end = current_hour + timedelta(hours=1)
+                range_start = current_hour.replace(hour=0) - timedelta(days=int(params.get("lookback_days", 7)) - 1)
+            result = query_transaction_aggregates(
+                db, range_start, range_end, group_by=params.get("group_by") or [],
+                filters=params.get("filters"), grain=params.get("grain", "DAY")
+            )
+        except (RollupQueryError, ValueError) as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+        return schemas.WidgetDataResponse(
+            widget_id=widget.id, metric_key=widget.metric_key.upper(),
+            value=sum((row[metric] for row in result.rows), 0), rows=result.rows,
+            range_start=range_start, range_end=range_end, served_from=result.served_from, as_of=result.as_of
+        )
+
     def delete_layout(self, db: Session, layout_id: int, user_id: int, username: str) -> bool:
         db_layout = self.get_layout_by_id(db, layout_id, user_id)
         if not db_layout: return False
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from weezy_cbs.compliance_regulatory_reporting import aml_engine
+from weezy_cbs.compliance_regulatory_reporting.aml_engine import (
+    AMLEngine, AMLStreamWorker, RuleSpec, TransactionEvent, evaluate_transaction, run_benchmark,
+)
+
+START = datetime(2024, 3, 1, 9, 0)
+
+
+def _event(i, amount=10000, debit="0000000001", credit="0000000002", transaction_type="FUNDS_TRANSFER", seconds=None):
+    return TransactionEvent(
+        id=f"T{i}", transaction_type=transaction_type, channel="MOBILE_APP", amount=Decimal(amount), currency="NGN",
+        debit_account_number=debit, credit_account_number=credit, debit_customer_id=1, credit_customer_id=2,
+        processed_at=START + timedelta(seconds=i if seconds is None else seconds),
+    )
+
+VELOCITY = RuleSpec("VELOCITY_1", "High velocity", {"rule_type": "VELOCITY", "max_count": 3, "window_seconds": 3600, "direction": "DEBIT"})
+
+
+def test_large_cash_fires_on_threshold():
+    engine = AMLEngine([RuleSpec("LARGE_CASH", "Large cash", {"threshold_amount": 5000000})])
+    engine.process(_event(1, 4999999, transaction_type="CASH_DEPOSIT"))
+    engine.process(_event(2, 5000000, transaction_type="CASH_DEPOSIT"))
+    engine.process(_event(3, 9000000)) # Not cash
+    hits = engine.take_hits()
+    assert [h["financial_transaction_id"] for h in hits] == ["T2"]
+    assert hits[0]["account_number"] == "0000000002"
+
+
+def test_velocity_fires_once_per_window_and_expires():
+    engine = AMLEngine([VELOCITY])
+    for i in range(6):
+        engine.process(_event(i, seconds=i * 60))
+    assert [h["financial_transaction_id"] for h in engine.take_hits()] == ["T3"] # Quiet for the rest of the window
+
+    engine.process(_event(10, seconds=3 * 3600)) # Old buckets expired
+    assert engine.take_hits() == []
+
+
+def test_fan_out_counts_distinct_beneficiaries():
+    rule = RuleSpec("FAN_OUT", "Fan out", {"min_counterparties": 3, "window_seconds": 86400})
+    engine = AMLEngine([rule])
+    for i, credit in enumerate(["A", "A", "B", "C"]):
+        engine.process(_event(i, credit=credit))
+    hits = engine.take_hits()
+    assert [h["financial_transaction_id"] for h in hits] == ["T3"]
+
+
+def test_structuring_needs_count_and_total():
+    rule = RuleSpec("STRUCTURING", "Structuring", {"threshold_amount": 1000000, "min_count": 3, "window_seconds": 86400})
+    engine = AMLEngine([rule])
+    engine.process(_event(1, 950000, transaction_type="CASH_DEPOSIT", debit=None))
+    engine.process(_event(2, 100000, transaction_type="CASH_DEPOSIT", debit=None)) # Below the band, ignored
+    engine.process(_event(3, 900000, transaction_type="CASH_DEPOSIT", debit=None))
+    assert engine.take_hits() == []
+    engine.process(_event(4, 850000, transaction_type="CASH_DEPOSIT", debit=None))
+    assert [h["financial_transaction_id"] for h in engine.take_hits()] == ["T4"]
+
+
+def test_evaluate_transaction_seeds_from_history_and_leaves_live_engine_alone(monkeypatch):
+    history = [_event(i, seconds=i * 60) for i in range(3)]
+    monkeypatch.setattr(aml_engine, "iter_transaction_events", lambda db, start, end: iter(history))
+    live = AMLStreamWorker(engine=AMLEngine([VELOCITY]), session_factory=lambda: None)
+    live.engine.pending_hits.append({"financial_transaction_id": "BUFFERED"})
+    monkeypatch.setattr(aml_engine, "_worker", live)
+
+    hits = evaluate_transaction(None, _event(3, seconds=180), [VELOCITY])
+    assert [h["financial_transaction_id"] for h in hits] == ["T3"]
+    assert live.engine.pending_hits == [{"financial_transaction_id": "BUFFERED"}]
+    assert live.engine.events_processed == 0
+    assert live.engine.evaluators["VELOCITY_1"].windows == {}
+
+
+def test_replay_benchmark():
+    result = run_benchmark(total_events=20000, accounts=500)
+    assert result["events"] == 20000
+    assert result["rules"] == 5
+    assert result["hits_by_rule"]["LARGE_CASH"] > 0
+    assert result["events_per_s"] > 0
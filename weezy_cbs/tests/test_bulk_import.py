@@ -0,0 +1,75 @@
+import csv
+import io
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from weezy_cbs.accounts_ledger_management.bulk_import import nuban_check_digit, run_bulk_import
+from weezy_cbs.accounts_ledger_management.models import Account, LedgerEntry, NubanSerialRange
+from weezy_cbs.core_infrastructure_config_engine.models import ProductConfig
+from weezy_cbs.customer_identity_management.models import Customer, CustomerDuplicateBlockingKey, KYCAuditLog
+from weezy_cbs.database import Base
+
+TABLES = [Customer, KYCAuditLog, CustomerDuplicateBlockingKey, ProductConfig, Account, LedgerEntry, NubanSerialRange]
+
+SOURCE = """legacy_reference,first_name,last_name,phone_number,bvn,date_of_birth,product_code,initial_deposit_amount
+L1,Ada,Obi,08030000001,22200000001,1990-01-15,SAV001,5000.00
+L2,Femi,Ade,08030000002,,1985-06-01,CUR001,500.00
+L3,Ngozi,Eze,08030000003,,,SAV001,
+L4,Tunde,Bello,08030000004,1234,,SAV001,100.00
+L5,Kemi,Ojo,08030000005,,,LOAN001,100.00
+L6,Bola,Ade,08030000001,,,SAV001,100.00
+L7,Chidi,Nwosu,08030000007,,,,
+"""
+
+
+@pytest.fixture()
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'import.db'}")
+    Base.metadata.create_all(bind=engine, tables=[model.__table__ for model in TABLES])
+    return sessionmaker(bind=engine)
+
+
+def test_import_writes_good_rows_and_rejects_bad_ones(session_factory, tmp_path):
+    reject_path = tmp_path / "rejects.csv"
+    progress = []
+    stats = run_bulk_import(session_factory, io.StringIO(SOURCE), "csv", str(reject_path), chunk_size=4, max_workers=1,
+                            progress_callback=progress.append)
+
+    assert (stats["rows_read"], stats["rows_imported"], stats["rows_rejected"], stats["chunks"]) == (7, 3, 4, 2)
+    assert progress[-1]["rows_read"] == 7
+
+    with open(reject_path, newline="") as fh:
+        rejects = {row["legacy_reference"]: row for row in csv.DictReader(fh)}
+    assert sorted(rejects) == ["L2", "L4", "L5", "L6"]
+    assert "below the product minimum" in rejects["L2"]["reason"]
+    assert rejects["L4"]["reason"].startswith("bvn")
+    assert "LOAN001" in rejects["L5"]["reason"]
+    assert rejects["L6"]["reason"].startswith("Database conflict") # Same phone as L1, caught on the row-by-row retry
+    assert rejects["L4"]["line_number"] == "5"
+
+    db = session_factory()
+    assert sorted(c.phone_number for c in db.query(Customer)) == ["08030000001", "08030000003", "08030000007"]
+    accounts = db.query(Account).order_by(Account.id).all()
+    assert [a.customer.phone_number for a in accounts] == ["08030000001", "08030000003"] # L7 has no product_code
+    for account in accounts:
+        serial = account.account_number[:9]
+        assert serial.startswith("9") and account.account_number[9] == nuban_check_digit("999", serial)
+    assert int(accounts[1].account_number[:9]) == int(accounts[0].account_number[:9]) + 1
+    assert [(e.account_id, e.amount) for e in db.query(LedgerEntry)] == [(accounts[0].id, Decimal("5000.00"))] # No zero opening entries
+    assert db.query(KYCAuditLog).count() == 3
+    db.close()
+
+
+def test_next_import_continues_after_the_reserved_block(session_factory, tmp_path):
+    rows = "first_name,last_name,phone_number,product_code\nAda,Obi,08030000001,SAV001\n"
+    run_bulk_import(session_factory, io.StringIO(rows), "csv", str(tmp_path / "r1.csv"), max_workers=1)
+    run_bulk_import(session_factory, io.StringIO(rows.replace("0001", "0002")), "csv", str(tmp_path / "r2.csv"), max_workers=1)
+
+    db = session_factory()
+    first, second = [a.account_number[:9] for a in db.query(Account).order_by(Account.id)]
+    assert int(second) - int(first) == 10000 # The first run's unused serials are skipped, never reissued
+    assert db.query(NubanSerialRange).one().next_serial == int(second) + 10000
+    db.close()
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from weezy_cbs.accounts_ledger_management.models import Account, AccountTypeEnum
+from weezy_cbs.cards_wallets_management import services
+from weezy_cbs.cards_wallets_management.models import CardlessWithdrawalToken, CurrencyEnum
+from weezy_cbs.cards_wallets_management.schemas import CardlessWithdrawalRedemptionRequest
+from weezy_cbs.core_infrastructure_config_engine.models import ProductConfig
+from weezy_cbs.customer_identity_management.models import Customer
+from weezy_cbs.database import Base
+from weezy_cbs.digital_channels_modules import otp_store
+from weezy_cbs.digital_channels_modules.otp_store import InMemoryOTPStore
+from weezy_cbs.transaction_management.models import FinancialTransaction # Mapped so the account relationships resolve
+
+TABLES = [Customer, ProductConfig, Account, CardlessWithdrawalToken]
+TOKEN, PIN = "123456789012", "4321"
+
+
+@pytest.fixture()
+def db(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cardless.db'}")
+    Base.metadata.create_all(bind=engine, tables=[model.__table__ for model in TABLES])
+    store = InMemoryOTPStore(sweep_interval_seconds=None)
+    monkeypatch.setattr(otp_store, "_otp_store", store)
+
+    session = sessionmaker(bind=engine)()
+    session.add(Customer(id=1, first_name="Ada", last_name="Obi", phone_number="08030000001"))
+    session.add(Account(id=1, account_number="0000000001", customer_id=1, product_code="P1", account_type=AccountTypeEnum.SAVINGS, currency="NGN"))
+    session.add(CardlessWithdrawalToken(account_id=1, token=TOKEN, amount=Decimal("20000.00"), currency=CurrencyEnum.NGN,
+                                        status="ACTIVE", expiry_date=datetime.utcnow() + timedelta(hours=1)))
+    session.commit()
+    store.put(services._cardless_pin_key(TOKEN), PIN, ttl_seconds=3600)
+    yield session
+    session.close()
+
+
+def _redeem(db, pin, token=TOKEN):
+    return services.redeem_cardless_withdrawal_token(db, CardlessWithdrawalRedemptionRequest(token=token, one_time_pin=pin, terminal_id="ATM01"))
+
+
+def test_correct_pin_redeems_once(db):
+    assert _redeem(db, "0000") == "FAILED_INVALID_PIN"
+    assert _redeem(db, PIN) == "SUCCESSFUL"
+    assert _redeem(db, PIN) == "FAILED_INVALID_TOKEN"
+    token = db.query(CardlessWithdrawalToken).one()
+    assert (token.status, token.failed_pin_attempts) == ("USED", 1)
+
+
+def test_wrong_pins_lock_the_token(db):
+    results = [_redeem(db, "0000") for _ in range(services.CARDLESS_MAX_PIN_ATTEMPTS)]
+    assert results == ["FAILED_INVALID_PIN"] * (services.CARDLESS_MAX_PIN_ATTEMPTS - 1) + ["FAILED_TOKEN_LOCKED"]
+
+    token = db.query(CardlessWithdrawalToken).one()
+    assert (token.status, token.failed_pin_attempts) == ("LOCKED", services.CARDLESS_MAX_PIN_ATTEMPTS)
+    assert not otp_store.get_otp_store().exists(services._cardless_pin_key(TOKEN)) # The PIN is discarded with the token
+    assert _redeem(db, PIN) == "FAILED_INVALID_TOKEN"
+
+
+def test_expired_token_is_marked_and_rejected(db):
+    db.query(CardlessWithdrawalToken).update({"expiry_date": datetime.utcnow() - timedelta(minutes=1)})
+    db.commit()
+    assert _redeem(db, PIN) == "FAILED_EXPIRED_TOKEN"
+    assert db.query(CardlessWithdrawalToken).one().status == "EXPIRED"
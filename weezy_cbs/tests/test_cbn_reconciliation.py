@@ -0,0 +1,143 @@
+import io
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from weezy_cbs.accounts_ledger_management.models import Account # Mapped so the customer relationships resolve
+from weezy_cbs.customer_identity_management.models import Customer
+from weezy_cbs.database import Base
+from weezy_cbs.transaction_management.models import (
+    BulkPaymentBatch, CurrencyEnum, FinancialTransaction, StandingOrder, TransactionChannelEnum, TransactionStatusEnum,
+    TransactionTypeCategoryEnum,
+)
+from weezy_cbs.treasury_liquidity_management.cbn_reconciliation import StatementFormatError, reconcile_statement
+from weezy_cbs.treasury_liquidity_management.models import (
+    CBNReconciliationDiscrepancy, CBNReconciliationRun, CBNRepoOperation, CBNSettlementStatementEntry, InterbankPlacement,
+    TreasuryBillInvestment,
+)
+
+STATEMENT_DATE = date(2026, 10, 16)
+TABLES = [Customer, FinancialTransaction, BulkPaymentBatch, StandingOrder, InterbankPlacement, TreasuryBillInvestment,
+          CBNRepoOperation, CBNReconciliationRun, CBNSettlementStatementEntry, CBNReconciliationDiscrepancy]
+
+STATEMENT = """cbn_reference,value_date,narration,debit_amount,credit_amount,balance
+CBN001,2026-10-16,RTGS out,"1,000,000.00",,
+cbn 002,2026-10-16,RTGS in,,500000.50,
+CBN003,2026-10-16,RTGS out,210000.00,,
+XREF9,2026-10-16,Interbank placement,300000.00,,
+CBN999,,Unknown credit,,42000.00,
+"""
+
+
+def _rtgs(db, ref, amount, outward=True, day=STATEMENT_DATE):
+    db.add(FinancialTransaction(
+        id=f"FT{ref}", external_transaction_id=ref, transaction_type=TransactionTypeCategoryEnum.FUNDS_TRANSFER,
+        channel=TransactionChannelEnum.RTGS, status=TransactionStatusEnum.SUCCESSFUL, amount=Decimal(amount), currency=CurrencyEnum.NGN,
+        credit_bank_code="058" if outward else "999", narration="RTGS", initiated_at=datetime.combine(day, datetime.min.time()) + timedelta(hours=10),
+    ))
+
+
+@pytest.fixture()
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'recon.db'}")
+    Base.metadata.create_all(bind=engine, tables=[model.__table__ for model in TABLES])
+    session = sessionmaker(bind=engine)()
+    _rtgs(session, "CBN001", "1000000.00")
+    _rtgs(session, "CBN002", "500000.00", outward=False)
+    _rtgs(session, "CBN003", "200000.00")
+    _rtgs(session, "CBN004", "75000.00")
+    _rtgs(session, "CBN005", "64000.00", day=STATEMENT_DATE - timedelta(days=5)) # Outside the date window
+    session.add(InterbankPlacement(deal_reference="IBP-77", placement_type="LENDING", counterparty_bank_code="044", counterparty_bank_name="Bank",
+                                   principal_amount=Decimal("300000.00"), currency="NGN", interest_rate_pa=Decimal("10"),
+                                   placement_date=STATEMENT_DATE - timedelta(days=1), maturity_date=STATEMENT_DATE + timedelta(days=29), tenor_days=30))
+    session.commit()
+    yield session
+    session.close()
+
+
+def _entries(db):
+    return {e.cbn_reference: (e.reconciliation_status, e.matched_internal_reference) for e in db.query(CBNSettlementStatementEntry)}
+
+def _discrepancies(db, run_id):
+    return sorted((d.discrepancy_type, d.cbn_reference, d.internal_reference, d.statement_amount, d.internal_amount)
+                  for d in db.query(CBNReconciliationDiscrepancy).filter(CBNReconciliationDiscrepancy.reconciliation_run_id == run_id))
+
+
+def test_statement_is_matched_exactly_then_within_tolerance(db):
+    run = reconcile_statement(db, io.StringIO(STATEMENT), STATEMENT_DATE, source_file_name="stmt.csv")
+
+    assert run.status == "COMPLETED"
+    assert (run.statement_entry_count, run.matched_exact_count, run.matched_tolerance_count, run.discrepancy_count) == (5, 1, 2, 4)
+    assert (run.statement_debit_total, run.statement_credit_total) == (Decimal("1510000.00"), Decimal("542000.50"))
+    assert run.internal_entry_count == 5 # Four RTGS on the day plus the placement's start leg the day before
+    assert _entries(db) == {
+        "CBN001": ("MATCHED", "RTGS:FTCBN001"),
+        "cbn 002": ("MATCHED_TOLERANCE", "RTGS:FTCBN002"), # Reference normalised; 50 kobo is within the 1.00 tolerance
+        "CBN003": ("DISCREPANCY", "RTGS:FTCBN003"), # Reference matches, amount does not
+        "XREF9": ("MATCHED_TOLERANCE", "INTERBANK:1"), # No reference match; same amount, a day apart
+        "CBN999": ("DISCREPANCY", None),
+    }
+    assert _discrepancies(db, run.id) == [
+        ("AMOUNT_MISMATCH", "CBN003", "RTGS:FTCBN003", Decimal("-210000.00"), Decimal("-200000.00")),
+        ("AMOUNT_MISMATCH", "cbn 002", "RTGS:FTCBN002", Decimal("500000.50"), Decimal("500000.00")),
+        ("MISSING_INTERNAL", "CBN999", None, Decimal("42000.00"), None),
+        ("MISSING_ON_STATEMENT", None, "RTGS:FTCBN004", None, Decimal("-75000.00")),
+    ]
+
+
+def test_tighter_tolerance_turns_near_matches_into_discrepancies(db):
+    run = reconcile_statement(db, io.StringIO(STATEMENT), STATEMENT_DATE, amount_tolerance=Decimal("0.00"), date_tolerance_days=0)
+    entries = _entries(db)
+    assert entries["cbn 002"] == ("DISCREPANCY", "RTGS:FTCBN002")
+    assert entries["XREF9"] == ("DISCREPANCY", None) # The placement leg is outside a zero-day window
+    assert run.matched_tolerance_count == 0
+
+
+def test_rerun_needs_replace_and_supersedes_the_earlier_run(db):
+    first = reconcile_statement(db, io.StringIO(STATEMENT), STATEMENT_DATE)
+    with pytest.raises(ValueError, match="already been reconciled"):
+        reconcile_statement(db, io.StringIO(STATEMENT), STATEMENT_DATE)
+
+    corrected = STATEMENT.replace("210000.00", "200000.00")
+    second = reconcile_statement(db, io.StringIO(corrected), STATEMENT_DATE, replace_existing=True)
+
+    db.refresh(first)
+    assert (first.status, second.status) == ("SUPERSEDED", "COMPLETED")
+    assert _discrepancies(db, first.id) == [] # Open discrepancies of the replaced run are dropped
+    assert db.query(CBNSettlementStatementEntry).count() == 5
+    assert _entries(db)["CBN003"] == ("MATCHED", "RTGS:FTCBN003")
+    assert second.discrepancy_count == 3
+
+
+def test_failed_replacement_rolls_back_and_keeps_the_earlier_run(db):
+    first = reconcile_statement(db, io.StringIO(STATEMENT), STATEMENT_DATE)
+    malformed = STATEMENT.replace("210000.00", "2l0000.00")
+
+    with pytest.raises(StatementFormatError, match="Line 4: debit_amount is not an amount"):
+        reconcile_statement(db, io.StringIO(malformed), STATEMENT_DATE, replace_existing=True)
+
+    failed = db.query(CBNReconciliationRun).filter(CBNReconciliationRun.id != first.id).one()
+    assert failed.status == "FAILED" and "debit_amount" in failed.error_message
+    db.refresh(first)
+    assert first.status == "COMPLETED"
+    assert {e.reconciliation_run_id for e in db.query(CBNSettlementStatementEntry)} == {first.id}
+    assert len(_discrepancies(db, first.id)) == 4
+
+
+@pytest.mark.parametrize("statement, message", [
+    ("cbn_reference,debit_amount\nCBN001,100.00\n", "missing column"),
+    ("cbn_reference,debit_amount,credit_amount\nCBN001,100.00,50.00\n", "exactly one of"),
+    ("cbn_reference,debit_amount,credit_amount\nCBN001,-100.00,\n", "must not be negative"),
+    ("cbn_reference,value_date,debit_amount,credit_amount\nCBN001,16/10/2026,100.00,\n", "value_date is not a date"),
+    ("cbn_reference,debit_amount,credit_amount\nCBN001,100.00,\nCBN001,,100.00\n", "Line 3: duplicate cbn_reference"),
+])
+def test_bad_statement_fails_the_run_and_keeps_nothing(db, statement, message):
+    with pytest.raises(StatementFormatError, match=message):
+        reconcile_statement(db, io.StringIO(statement), STATEMENT_DATE)
+
+    assert [run.status for run in db.query(CBNReconciliationRun)] == ["FAILED"]
+    assert db.query(CBNSettlementStatementEntry).count() == 0
+    assert db.query(CBNReconciliationDiscrepancy).count() == 0
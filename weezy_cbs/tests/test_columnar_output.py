@@ -0,0 +1,89 @@
+import enum
+import io
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.parquet as pq
+import sqlalchemy as sa
+
+from weezy_cbs.reports_analytics import columnar_output
+from weezy_cbs.reports_analytics.columnar_output import build_arrow_schema, write_columnar_stream
+
+
+class Channel(enum.Enum):
+    USSD = "USSD"
+    POS = "POS"
+
+
+COLUMNS = ["id", "channel", "amount", "posted_at", "value_date", "narration"]
+
+
+def _batches(total_rows, batch_size=100):
+    for start in range(0, total_rows, batch_size):
+        yield [
+            (i, Channel.USSD if i % 2 else Channel.POS, Decimal("10.50"), datetime(2024, 1, 31, 12, 0, tzinfo=timezone.utc),
+             date(2024, 1, 31), None if i < batch_size else f"txn {i}")
+            for i in range(start, min(total_rows, start + batch_size))
+        ]
+
+
+def _parquet(total_rows, **kwargs):
+    out = io.BytesIO()
+    rows, size = write_columnar_stream(COLUMNS, _batches(total_rows), "PARQUET", out, **kwargs)
+    assert size == len(out.getvalue())
+    return rows, pq.ParquetFile(io.BytesIO(out.getvalue()))
+
+
+def test_types_are_inferred_from_the_first_batch():
+    schema = build_arrow_schema(COLUMNS, next(_batches(10)))
+    assert [field.type for field in schema] == [
+        pa.int64(), pa.dictionary(pa.int32(), pa.string()), pa.decimal128(38, 2), pa.timestamp("us", tz="UTC"), pa.date32(),
+        pa.string(), # All-null in the first batch
+    ]
+
+
+def test_declared_sqlalchemy_types_win_over_inference():
+    column_types = {"id": sa.SmallInteger(), "amount": sa.Numeric(18, 4), "posted_at": sa.DateTime(), "narration": sa.Text()}
+    schema = build_arrow_schema(COLUMNS, next(_batches(10)), column_types=column_types, dictionary_columns=["narration"])
+    assert schema.field("id").type == pa.int16()
+    assert schema.field("amount").type == pa.decimal128(18, 4)
+    assert schema.field("posted_at").type == pa.timestamp("us")
+    assert schema.field("narration").type == pa.dictionary(pa.int32(), pa.string())
+
+
+def test_parquet_row_groups_are_bounded(monkeypatch):
+    monkeypatch.setattr(columnar_output, "REPORT_PARQUET_ROW_GROUP_ROWS", 250)
+    rows, parquet = _parquet(1000)
+
+    assert rows == parquet.metadata.num_rows == 1000
+    assert [parquet.metadata.row_group(i).num_rows for i in range(parquet.num_row_groups)] == [300, 300, 300, 100]
+    table = parquet.read()
+    assert table.column("channel").to_pylist()[:2] == ["POS", "USSD"] # Enums are written by value
+    assert table.column("narration").to_pylist()[99:101] == [None, "txn 100"]
+
+
+def test_arrow_ipc_file_round_trips():
+    out = io.BytesIO()
+    progress = []
+    rows, _ = write_columnar_stream(COLUMNS, _batches(1000), "arrow", out, on_progress=lambda r, b: progress.append(r), progress_every_rows=400)
+
+    table = pa.ipc.open_file(pa.BufferReader(out.getvalue())).read_all()
+    assert rows == table.num_rows == 1000
+    assert table.column("amount")[999].as_py() == Decimal("10.50")
+    assert progress == [400, 800]
+
+
+def test_empty_result_still_writes_a_readable_file():
+    column_types = {"id": sa.Integer(), "amount": sa.Numeric(18, 2)}
+    out = io.BytesIO()
+    assert write_columnar_stream(["id", "amount"], iter([]), "PARQUET", out, column_types=column_types)[0] == 0
+    table = pq.read_table(io.BytesIO(out.getvalue()))
+    assert table.num_rows == 0 and table.schema.field("amount").type == pa.decimal128(18, 2)
+
+
+def test_non_columnar_format_is_rejected():
+    with pytest.raises(ValueError):
+        write_columnar_stream(COLUMNS, _batches(10), "CSV", io.BytesIO())
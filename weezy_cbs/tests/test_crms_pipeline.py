@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import xml.etree.ElementTree as ET
+from datetime import date, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from weezy_cbs.accounts_ledger_management.models import Account # Mapped so the compliance relationships resolve
+from weezy_cbs.compliance_regulatory_reporting import crms_pipeline, services
+from weezy_cbs.compliance_regulatory_reporting.models import GeneratedReportLog, ReportNameEnum, ReportStatusEnum
+from weezy_cbs.customer_identity_management.models import Customer
+from weezy_cbs.compliance_regulatory_reporting.crms_pipeline import crms_records, generate_crms_report
+from weezy_cbs.database import Base
+from weezy_cbs.reports_analytics import models as report_models
+from weezy_cbs.reports_analytics.report_streaming import LocalReportStore
+from weezy_cbs.transaction_management.models import FinancialTransaction
+
+AS_OF = date(2026, 10, 31)
+
+
+def _loan(loan_id, status="ACTIVE", principal="1000000.00"):
+    return SimpleNamespace(
+        id=loan_id, loan_account_number=f"LN{loan_id:08d}", principal_disbursed=Decimal("1200000.00"), currency="NGN",
+        interest_rate_pa=Decimal("24.5"), tenor_months=12, principal_outstanding=Decimal(principal),
+        interest_outstanding=Decimal("0.00"), fees_outstanding=None, penalties_outstanding=None, status=status,
+        crms_loan_status=None, loan_purpose_code="TRD", disbursement_date=date(2026, 1, 15), maturity_date=date(2027, 1, 15),
+        next_repayment_date=date(2026, 11, 15), crms_product_code="TL", customer_type="INDIVIDUAL", bvn="22200000001",
+        tin=None, rc_number=None, first_name="Ada", middle_name=None, last_name="Obi", company_name=None,
+    )
+
+def _overdue_since(days):
+    return SimpleNamespace(amount_overdue=Decimal("100000.00"), oldest_unpaid_due=AS_OF - timedelta(days=days), installments_outstanding=3)
+
+
+@pytest.mark.parametrize("days_past_due, classification, provision", [
+    (0, "PERFORMING", "6000.00"),
+    (29, "PERFORMING", "6000.00"),
+    (30, "WATCHLIST", "30000.00"),
+    (90, "SUBSTANDARD", "60000.00"),
+    (180, "DOUBTFUL", "300000.00"),
+    (360, "LOST", "600000.00"),
+])
+def test_classification_bands_and_provision(days_past_due, classification, provision):
+    collateral = {1: SimpleNamespace(collateral_value=Decimal("400000.00"), collateral_type="VEHICLE")}
+    [record] = crms_records([_loan(1)], {1: _overdue_since(days_past_due)}, collateral, AS_OF)
+    assert record["days_past_due"] == days_past_due
+    assert record["classification"] == classification
+    assert record["provision_required"] == Decimal(provision) # Rate applied to the 600k not covered by collateral
+
+
+def test_written_off_facility_is_lost_whatever_its_arrears():
+    [record] = crms_records([_loan(1, status="WRITTEN_OFF")], {}, {}, AS_OF)
+    assert record["days_past_due"] == 0
+    assert record["classification"] == "LOST"
+    assert record["provision_required"] == Decimal("1000000.00")
+
+
+def _feed(monkeypatch, loans):
+    records = crms_records(loans, {}, {}, AS_OF)
+    monkeypatch.setattr(crms_pipeline, "iter_crms_records", lambda db, start, end, page_size: iter(records))
+
+
+def test_return_that_fits_is_one_xml_file(monkeypatch, tmp_path):
+    _feed(monkeypatch, [_loan(i) for i in range(1, 6)])
+    report = generate_crms_report(None, date(2026, 10, 1), AS_OF, store=LocalReportStore(str(tmp_path)), base_file_name="CRMS")
+
+    assert report.file_format == "XML"
+    assert report.file_name == "CRMS.xml"
+    with open(report.file_path, "rb") as fh:
+        content = fh.read()
+    assert report.checksum == hashlib.sha256(content).hexdigest()
+    assert len(ET.fromstring(content).findall("CreditFacility")) == report.row_count == 5
+    assert sorted(os.listdir(tmp_path)) == ["CRMS.xml"]
+
+
+def test_split_return_writes_parts_and_manifest(monkeypatch, tmp_path):
+    max_file_bytes = 4000
+    _feed(monkeypatch, [_loan(i) for i in range(1, 51)])
+    report = generate_crms_report(None, date(2026, 10, 1), AS_OF, store=LocalReportStore(str(tmp_path)),
+                                  base_file_name="CRMS", max_file_bytes=max_file_bytes)
+
+    assert report.file_format == "MANIFEST"
+    assert report.file_name == "CRMS.manifest.json"
+    with open(report.file_path, "rb") as fh:
+        manifest_bytes = fh.read()
+    assert report.checksum == hashlib.sha256(manifest_bytes).hexdigest()
+
+    manifest = json.loads(manifest_bytes)
+    assert len(manifest["parts"]) > 1
+    assert manifest["row_count"] == report.row_count == 50
+    facilities = []
+    for part in manifest["parts"]:
+        with open(tmp_path / part["file_name"], "rb") as fh:
+            content = fh.read()
+        assert len(content) == part["bytes_written"] <= max_file_bytes
+        assert hashlib.sha256(content).hexdigest() == part["sha256"]
+        rows = ET.fromstring(content).findall("CreditFacility")
+        assert len(rows) == part["row_count"]
+        facilities += [row.findtext("FacilityReference") for row in rows]
+    assert facilities == [f"LN{i:08d}" for i in range(1, 51)]
+    assert not (tmp_path / "CRMS.xml").exists()
+
+
+def test_report_log_generation_records_the_file(monkeypatch, tmp_path):
+    # Runs through the services entry point, which loads the reports_analytics models alongside the compliance ones
+    engine = create_engine(f"sqlite:///{tmp_path / 'crms.db'}")
+    Base.metadata.create_all(bind=engine, tables=[GeneratedReportLog.__table__, report_models.GeneratedReportLog.__table__])
+    db = sessionmaker(bind=engine)()
+    log = GeneratedReportLog(report_name=ReportNameEnum.CBN_CRMS, reporting_period_start_date=date(2026, 10, 1), reporting_period_end_date=AS_OF)
+    db.add(log)
+    db.commit()
+    _feed(monkeypatch, [_loan(i) for i in range(1, 4)])
+    monkeypatch.setattr(LocalReportStore.__init__, "__defaults__", (str(tmp_path / "reports"),))
+
+    log = services.generate_report_file(db, log.id)
+
+    assert log.status == ReportStatusEnum.GENERATED
+    assert (log.file_format, log.row_count) == ("XML", 3)
+    with open(log.file_path_or_url, "rb") as fh:
+        assert log.checksum == hashlib.sha256(fh.read()).hexdigest()
+    db.close()
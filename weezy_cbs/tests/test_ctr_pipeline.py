@@ -0,0 +1,104 @@
+import csv
+import hashlib
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from weezy_cbs.accounts_ledger_management.models import Account # Mapped so the compliance relationships resolve
+from weezy_cbs.compliance_regulatory_reporting import services
+from weezy_cbs.compliance_regulatory_reporting.ctr_pipeline import generate_ctr_report
+from weezy_cbs.compliance_regulatory_reporting.models import GeneratedReportLog, ReportNameEnum, ReportStatusEnum
+from weezy_cbs.customer_identity_management.models import Customer, CustomerTypeEnum
+from weezy_cbs.database import Base
+from weezy_cbs.reports_analytics import models as report_models
+from weezy_cbs.reports_analytics.report_streaming import LocalReportStore
+from weezy_cbs.transaction_management.models import (
+    BulkPaymentBatch, CurrencyEnum, FinancialTransaction, StandingOrder, TransactionChannelEnum, TransactionStatusEnum,
+    TransactionTypeCategoryEnum,
+)
+
+DEPOSIT = TransactionTypeCategoryEnum.CASH_DEPOSIT
+WITHDRAWAL = TransactionTypeCategoryEnum.CASH_WITHDRAWAL
+TABLES = [Customer, FinancialTransaction, BulkPaymentBatch, StandingOrder, # The return's tables and everything they reference
+          GeneratedReportLog, report_models.GeneratedReportLog]
+
+
+@pytest.fixture()
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'ctr.db'}")
+    Base.metadata.create_all(bind=engine, tables=[model.__table__ for model in TABLES])
+    session = sessionmaker(bind=engine)()
+    session.add_all([
+        Customer(id=1, customer_type=CustomerTypeEnum.INDIVIDUAL, first_name="Ada", last_name="Obi", phone_number="08030000001", bvn="22200000001"),
+        Customer(id=2, customer_type=CustomerTypeEnum.CORPORATE, company_name="Obi Traders Ltd", phone_number="08030000002"),
+        Customer(id=3, customer_type=CustomerTypeEnum.INDIVIDUAL, first_name="Femi", last_name="Ade", phone_number="08030000003"),
+    ])
+    yield session
+    session.close()
+
+
+def _cash(db, ref, customer_id, account, amount, day, transaction_type=DEPOSIT, status=TransactionStatusEnum.SUCCESSFUL):
+    side = "credit" if transaction_type == DEPOSIT else "debit"
+    db.add(FinancialTransaction(
+        id=ref, transaction_type=transaction_type, channel=TransactionChannelEnum.AGENT_BANKING, status=status,
+        amount=Decimal(amount), currency=CurrencyEnum.NGN, narration="Cash", initiated_at=datetime(2026, 10, day, 10, 0),
+        **{f"{side}_customer_id": customer_id, f"{side}_account_number": account},
+    ))
+
+
+def test_ctr_aggregates_per_customer_day_and_direction(db, tmp_path):
+    # Individual: two deposits into two accounts on the 1st add up past 5m; the 2nd stays under it
+    _cash(db, "T1", 1, "1000000001", "3000000.00", 1)
+    _cash(db, "T2", 1, "1000000002", "2500000.00", 1)
+    _cash(db, "T3", 1, "1000000001", "6000000.00", 1, WITHDRAWAL) # Other direction, own record
+    _cash(db, "T4", 1, "1000000001", "4000000.00", 2)
+    # Corporate: 8m is under the corporate threshold, 6m + 5m on one day is over it
+    _cash(db, "T5", 2, "2000000001", "8000000.00", 1)
+    _cash(db, "T6", 2, "2000000001", "6000000.00", 2)
+    _cash(db, "T7", 2, "2000000001", "5000000.00", 2)
+    # Failed transactions do not count
+    _cash(db, "T8", 3, "3000000001", "9000000.00", 1, status=TransactionStatusEnum.FAILED)
+    db.commit()
+
+    report = generate_ctr_report(db, date(2026, 10, 1), date(2026, 10, 31), "CSV", store=LocalReportStore(str(tmp_path)))
+
+    with open(report.file_path, newline="") as fh:
+        rows = list(csv.DictReader(fh))
+    got = {(r["transaction_date"], r["customer_name"], r["transaction_type"]): (r["transaction_amount"], r["transaction_count"], r["accounts_involved"]) for r in rows}
+    assert got == {
+        ("2026-10-01", "Ada Obi", "CASH_DEPOSIT"): ("5500000.00", "2", "2"),
+        ("2026-10-01", "Ada Obi", "CASH_WITHDRAWAL"): ("6000000.00", "1", "1"),
+        ("2026-10-02", "Obi Traders Ltd", "CASH_DEPOSIT"): ("11000000.00", "2", "1"),
+    }
+    assert report.row_count == 3
+
+
+def test_ctr_checksum_matches_file(db, tmp_path):
+    _cash(db, "T1", 1, "1000000001", "7500000.00", 3)
+    db.commit()
+
+    for output_format in ("XML", "CSV"):
+        report = generate_ctr_report(db, date(2026, 10, 1), date(2026, 10, 31), output_format, store=LocalReportStore(str(tmp_path)))
+        with open(report.file_path, "rb") as fh:
+            content = fh.read()
+        assert report.file_format == output_format
+        assert report.bytes_written == len(content)
+        assert report.checksum == hashlib.sha256(content).hexdigest()
+
+
+def test_report_log_generation_records_the_file(db, tmp_path, monkeypatch):
+    _cash(db, "T1", 1, "1000000001", "7500000.00", 3)
+    log = GeneratedReportLog(report_name=ReportNameEnum.NFIU_CTR, reporting_period_start_date=date(2026, 10, 1), reporting_period_end_date=date(2026, 10, 31))
+    db.add(log)
+    db.commit()
+    monkeypatch.setattr(LocalReportStore.__init__, "__defaults__", (str(tmp_path / "reports"),))
+
+    log = services.generate_report_file(db, log.id)
+
+    assert log.status == ReportStatusEnum.GENERATED
+    assert log.row_count == 1
+    with open(log.file_path_or_url, "rb") as fh:
+        assert log.checksum == hashlib.sha256(fh.read()).hexdigest()
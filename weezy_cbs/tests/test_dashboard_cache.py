@@ -0,0 +1,186 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from weezy_cbs.core_infrastructure_config_engine import event_bus
+from weezy_cbs.digital_channels_modules.dashboard_cache import DashboardSnapshotCache, dashboard_snapshot_cache
+
+
+class CountingBuilder:
+    def __init__(self, delay=0.0, gate=None):
+        self.calls = 0
+        self.delay = delay
+        self.gate = gate
+        self.lock = threading.Lock()
+
+    def __call__(self, customer_id):
+        with self.lock:
+            self.calls += 1
+            version = self.calls
+        if self.gate is not None:
+            self.gate.wait(5)
+        time.sleep(self.delay)
+        return {"customer_id": customer_id, "version": version}
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+@pytest.fixture()
+def cache():
+    snapshot_cache = DashboardSnapshotCache(fresh_seconds=60, max_stale_seconds=900, refresh_workers=2)
+    yield snapshot_cache
+    snapshot_cache._executor.shutdown(wait=True)
+
+
+def test_fresh_snapshot_is_served_without_rebuilding(cache):
+    builder = CountingBuilder()
+    assert cache.get(1, builder) == {"customer_id": 1, "version": 1}
+    assert cache.get(1, builder) == {"customer_id": 1, "version": 1}
+    assert builder.calls == 1
+    assert (cache.stats["misses"], cache.stats["fresh_hits"]) == (1, 1)
+
+
+def test_invalidated_snapshot_is_served_stale_while_one_refresh_runs(cache):
+    builder, background = CountingBuilder(), CountingBuilder(gate=threading.Event())
+    cache.get(1, builder)
+    cache.invalidate(1)
+
+    # Served at once from the old snapshot; repeated stale hits share one background refresh
+    assert [cache.get(1, builder, background_builder=background)["version"] for _ in range(3)] == [1, 1, 1]
+    assert (builder.calls, cache.stats["refreshes"], cache.stats["stale_hits"]) == (1, 1, 3)
+
+    background.gate.set()
+    _wait_for(lambda: not cache._builds)
+    assert cache.get(1, builder, background_builder=background)["version"] == 1 # The refreshed snapshot, now fresh
+    assert cache.stats["fresh_hits"] == 1 and background.calls == 1
+
+
+def test_invalidation_during_a_refresh_keeps_the_result_stale(cache):
+    gate = threading.Event()
+    background = CountingBuilder(gate=gate)
+    cache.get(1, CountingBuilder())
+    cache.invalidate(1)
+    cache.get(1, CountingBuilder(), background_builder=background) # Starts a refresh that blocks on the gate
+    _wait_for(lambda: background.calls == 1)
+
+    cache.invalidate(1) # A posting lands while the refresh is reading
+    gate.set()
+    _wait_for(lambda: not cache._builds)
+
+    cache.get(1, CountingBuilder(), background_builder=background)
+    assert cache.stats["refreshes"] == 2 # The pre-posting result was not trusted as fresh
+    _wait_for(lambda: not cache._builds)
+
+
+def test_snapshot_past_max_staleness_is_rebuilt_inline():
+    cache = DashboardSnapshotCache(fresh_seconds=0, max_stale_seconds=0)
+    builder = CountingBuilder()
+    cache.get(1, builder)
+    time.sleep(0.01)
+    assert cache.get(1, builder)["version"] == 2
+    assert (cache.stats["misses"], cache.stats["refreshes"]) == (2, 0)
+
+
+def test_concurrent_misses_share_one_build(cache):
+    builder = CountingBuilder(delay=0.1)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(7, builder))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert builder.calls == 1
+    assert results == [{"customer_id": 7, "version": 1}] * 8
+
+
+def test_failed_refresh_keeps_serving_the_stale_snapshot(cache):
+    def failing(customer_id):
+        raise RuntimeError("database unavailable")
+    cache.get(1, CountingBuilder())
+    cache.invalidate(1)
+    assert cache.get(1, CountingBuilder(), background_builder=failing)["version"] == 1
+    _wait_for(lambda: not cache._builds)
+    assert cache.get(1, CountingBuilder(), background_builder=failing)["version"] == 1
+    assert cache.stats["refreshes"] == 2 # Each request after a failure retries
+
+
+def test_failed_inline_build_lets_the_next_request_retry(cache):
+    def failing(customer_id):
+        raise RuntimeError("database unavailable")
+    with pytest.raises(RuntimeError):
+        cache.get(1, failing)
+    assert cache.get(1, CountingBuilder())["version"] == 1
+
+
+def test_lru_evicts_the_least_recently_used_customer():
+    cache = DashboardSnapshotCache(max_entries=2)
+    builder = CountingBuilder()
+    cache.get(1, builder)
+    cache.get(2, builder)
+    cache.get(1, builder)
+    cache.get(3, builder)
+    assert list(cache._entries) == [1, 3]
+
+
+@pytest.fixture()
+def received():
+    events = []
+    handler = events.append
+    event_bus.subscribe(event_bus.LEDGER_ENTRY_POSTED, handler)
+    yield events
+    event_bus.unsubscribe(event_bus.LEDGER_ENTRY_POSTED, handler)
+
+
+def _session():
+    db = Session(bind=create_engine("sqlite://"))
+    db.execute(text("SELECT 1")) # Begin a transaction
+    return db
+
+
+def test_publish_after_commit_delivers_on_commit_only(received):
+    db = _session()
+    event_bus.publish_after_commit(db, event_bus.LEDGER_ENTRY_POSTED, customer_id=1, account_id=10)
+    event_bus.publish_after_commit(db, event_bus.LEDGER_ENTRY_POSTED, customer_id=1, account_id=11)
+    assert received == []
+    db.commit()
+    assert [e["account_id"] for e in received] == [10, 11]
+
+    db.execute(text("SELECT 1"))
+    event_bus.publish_after_commit(db, event_bus.LEDGER_ENTRY_POSTED, customer_id=2, account_id=20)
+    db.rollback()
+    db.execute(text("SELECT 1"))
+    db.commit()
+    assert [e["account_id"] for e in received] == [10, 11] # Dropped with the rollback, not replayed by the next commit
+    db.close()
+
+
+def test_failing_handler_does_not_break_the_publisher(received):
+    def broken(event):
+        raise ValueError("boom")
+    event_bus.subscribe(event_bus.LEDGER_ENTRY_POSTED, broken)
+    try:
+        event_bus.publish(event_bus.LEDGER_ENTRY_POSTED, customer_id=1)
+    finally:
+        event_bus.unsubscribe(event_bus.LEDGER_ENTRY_POSTED, broken)
+    assert len(received) == 1
+
+
+def test_committed_posting_invalidates_the_dashboard_snapshot():
+    customer_id = 987_654 # Not used elsewhere in the process-wide cache
+    dashboard_snapshot_cache.get(customer_id, CountingBuilder())
+    entry = dashboard_snapshot_cache._entries[customer_id]
+
+    db = _session()
+    event_bus.publish_after_commit(db, event_bus.LEDGER_ENTRY_POSTED, customer_id=customer_id, account_id=1)
+    assert entry.built_generation == entry.generation
+    db.commit()
+    db.close()
+    assert entry.built_generation < entry.generation
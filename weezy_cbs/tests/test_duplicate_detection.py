@@ -0,0 +1,89 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from weezy_cbs.accounts_ledger_management.models import Account # Mapped so the customer relationships resolve
+from weezy_cbs.customer_identity_management.duplicate_detection import (
+    KEY_DOB_NAME, KEY_NAME_PHONETIC, KEY_NAME_PREFIX, KEY_PHONE, build_duplicate_index, compute_blocking_keys,
+    find_probable_duplicates, index_customer, normalize_phone,
+)
+from weezy_cbs.customer_identity_management.models import Customer, CustomerDuplicateBlockingKey, CustomerTypeEnum
+from weezy_cbs.database import Base
+
+TABLES = [Customer, CustomerDuplicateBlockingKey]
+
+
+@pytest.fixture()
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'dedupe.db'}")
+    Base.metadata.create_all(bind=engine, tables=[model.__table__ for model in TABLES])
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    for customer in (
+        Customer(id=1, first_name="Oluwaseun", last_name="Adebayo", date_of_birth=date(1990, 4, 12), phone_number="08031112222"),
+        Customer(id=2, first_name="Chinedu", last_name="Okafor", date_of_birth=date(1985, 1, 30), phone_number="+2348059998888"),
+        Customer(id=3, customer_type=CustomerTypeEnum.SME, company_name="Kola Adeyemi Ventures Ltd", date_of_incorporation=date(2015, 3, 1),
+                 phone_number="08060001111", rc_number="RC100"),
+    ):
+        db.add(customer)
+        index_customer(db, customer)
+    db.commit()
+    db.close()
+    return factory
+
+
+def _keys(db, customer_id):
+    return {(k.key_type, k.key_value) for k in db.query(CustomerDuplicateBlockingKey).filter(CustomerDuplicateBlockingKey.customer_id == customer_id)}
+
+
+def test_blocking_keys_tolerate_swapped_names_titles_and_phone_formats():
+    keys = compute_blocking_keys("Chief Oluwaseun", "Adebayo", None, date(1990, 4, 12), "+234 803 111 2222")
+    assert keys == compute_blocking_keys("Adebayo", "Oluwaseun", None, date(1990, 4, 12), "08031112222")
+    assert (KEY_NAME_PREFIX, "ade|olu") in keys
+    assert (KEY_NAME_PHONETIC, "A310|O425") in keys
+    assert {(KEY_DOB_NAME, "1990-04-12|A310"), (KEY_DOB_NAME, "1990-04-12|O425"), (KEY_PHONE, "8031112222")} <= keys
+    assert compute_blocking_keys(None, None, None, None, None) == set()
+    assert normalize_phone("0") is None
+
+
+def test_individual_variants_are_found_and_ranked(session_factory):
+    db = session_factory()
+    applicant = {"first_name": "Adebayo", "last_name": "Oluwaseyi", "date_of_birth": date(1990, 4, 12), "phone_number": "2348031112222"}
+    matches = find_probable_duplicates(db, applicant)
+    assert [m["customer_id"] for m in matches] == [1]
+    assert "Same phone number" in matches[0]["reasons"] and "Same date of birth" in matches[0]["reasons"]
+
+    assert find_probable_duplicates(db, applicant, exclude_customer_id=1) == []
+    assert find_probable_duplicates(db, {"first_name": "Ngozi", "last_name": "Eze", "phone_number": "08039990000"}) == []
+    db.close()
+
+
+def test_business_is_indexed_and_probed_with_its_incorporation_date(session_factory):
+    db = session_factory()
+    assert {(KEY_DOB_NAME, "2015-03-01|A350"), (KEY_DOB_NAME, "2015-03-01|K400")} <= _keys(db, 3)
+
+    # First letter differs, so only the incorporation-date key links the two
+    applicant = {"company_name": "Cola Adeyemi Ventures", "date_of_incorporation": date(2015, 3, 1), "phone_number": "08060002222"}
+    assert not ({k for k in _keys(db, 3) if k[0] != KEY_DOB_NAME} & compute_blocking_keys(None, None, "Cola Adeyemi Ventures", None, None))
+    matches = find_probable_duplicates(db, applicant, threshold=0.5)
+    assert [m["customer_id"] for m in matches] == [3]
+    assert "Same incorporation date" in matches[0]["reasons"]
+    db.close()
+
+
+def test_index_rebuild_matches_incremental_indexing(session_factory):
+    db = session_factory()
+    incremental = {cid: _keys(db, cid) for cid in (1, 2, 3)}
+    db.query(Customer).update({"phone_number_normalized": None})
+    db.commit()
+    db.close()
+
+    stats = build_duplicate_index(session_factory, batch_size=2, max_workers=1)
+
+    db = session_factory()
+    assert stats == {"customers_indexed": 3, "keys_written": sum(len(keys) for keys in incremental.values())}
+    assert {cid: _keys(db, cid) for cid in (1, 2, 3)} == incremental
+    assert [c.phone_number_normalized for c in db.query(Customer).order_by(Customer.id)] == ["8031112222", "8059998888", "8060001111"]
+    db.close()
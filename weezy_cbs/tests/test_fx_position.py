@@ -0,0 +1,112 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from weezy_cbs.accounts_ledger_management.models import Account, GeneralLedgerAccount
+from weezy_cbs.core_infrastructure_config_engine.models import ProductConfig
+from weezy_cbs.customer_identity_management.models import Customer
+from weezy_cbs.database import Base
+from weezy_cbs.treasury_liquidity_management import models
+from weezy_cbs.treasury_liquidity_management.fx_position import FXPositionCache, load_deal_totals, run_fx_revaluation
+
+TABLES = [models.FXTransaction, models.BankCashPosition, models.FXRateSnapshot, models.FXSnapshotRate, models.FXRevaluationRun,
+          models.FXRevaluationLine, models.FXRevaluationJournalLine, GeneralLedgerAccount, Account,
+          Customer, ProductConfig] # Referenced by accounts
+
+
+@pytest.fixture()
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fx.db'}")
+    Base.metadata.create_all(bind=engine, tables=[model.__table__ for model in TABLES])
+    session = sessionmaker(bind=engine)()
+    # 1,000 USD in the vault, which is where the settled deal's dollars went
+    session.add(models.BankCashPosition(position_date=date(2026, 10, 16), currency="USD", total_cash_at_vault=Decimal("1000.00"),
+                                        total_cash_at_cbn=Decimal("0.00"), total_cash_at_correspondent_banks=Decimal("0.00")))
+    _deal(session, 1, "1000.00", "1500000.00", "SETTLED")
+    _deal(session, 2, "500.00", "750000.00", "PENDING_SETTLEMENT")
+    _deal(session, 3, "200.00", "300000.00", "CANCELLED")
+    session.commit()
+    yield session
+    session.close()
+
+
+def _deal(db, deal_id, usd_bought, ngn_sold, status):
+    deal = models.FXTransaction(
+        id=deal_id, deal_reference=f"FX{deal_id:04d}", transaction_type=models.FXTransactionTypeEnum.SPOT,
+        trade_date=date(2026, 10, 16), value_date=date(2026, 10, 18), currency_pair="USD/NGN", rate=Decimal("1500"),
+        buy_currency="USD", buy_amount=Decimal(usd_bought), sell_currency="NGN", sell_amount=Decimal(ngn_sold),
+        counterparty_name="Interbank", status=status,
+    )
+    db.add(deal)
+    return deal
+
+def _gl(db, gl_code, currency="NGN"):
+    db.add(GeneralLedgerAccount(gl_code=gl_code, name=gl_code, currency=currency, current_balance=Decimal("0.00")))
+
+def _snapshot(db, usd_rate):
+    snapshot = models.FXRateSnapshot(base_currency="NGN", taken_at=datetime(2026, 10, 17, 16, 0))
+    snapshot.rates.append(models.FXSnapshotRate(currency="USD", rate=Decimal(usd_rate)))
+    db.add(snapshot)
+    db.commit()
+    return snapshot
+
+
+def test_settled_deal_is_counted_once_through_the_holding(db):
+    totals, watermark = load_deal_totals(db)
+    assert totals == {("USD/NGN", "USD", "NGN"): [Decimal("500.00"), Decimal("750000.00"), 1]}
+    assert watermark == 3
+
+    cache = FXPositionCache()
+    cache.load(db)
+    usd = cache.positions()["currencies"]["USD"]
+    assert usd == {"deal_position": Decimal("500.00"), "balance_position": Decimal("1000.00"), "net_open_position": Decimal("1500.00")}
+
+
+def test_cache_drops_deals_as_they_settle(db):
+    cache = FXPositionCache()
+    cache.load(db)
+
+    deal = db.get(models.FXTransaction, 2)
+    deal.status = "SETTLED"
+    cache.record_status_change(deal, "PENDING_SETTLEMENT")
+    assert cache.positions()["currencies"]["USD"]["deal_position"] == Decimal("0.00")
+
+    _deal(db, 4, "300.00", "450000.00", "PENDING_SETTLEMENT")
+    _deal(db, 5, "900.00", "1350000.00", "SETTLED") # Booked and settled elsewhere before catch-up
+    db.commit()
+    assert cache.catch_up(db) == 1
+    assert cache.positions()["currencies"]["USD"]["deal_position"] == Decimal("300.00")
+
+
+def test_revaluation_posts_base_currency_pnl_on_unsettled_deals(db):
+    for gl_code in ("FX_REVAL_PNL", "FX_REVAL_ADJ_USD"):
+        _gl(db, gl_code)
+    snapshot = _snapshot(db, "1600")
+
+    run = run_fx_revaluation(db, snapshot.id)
+
+    [line] = run.lines
+    assert line.deal_position == Decimal("500.00") # Not the settled deal
+    assert line.balance_position == Decimal("1000.00")
+    assert line.revaluation_pnl == Decimal("50000.00") # 500 x 1600 - 750,000
+    balances = {gl.gl_code: gl.current_balance for gl in db.query(GeneralLedgerAccount)}
+    assert balances == {"FX_REVAL_PNL": Decimal("-50000.00"), "FX_REVAL_ADJ_USD": Decimal("50000.00")}
+
+
+def test_revaluation_refuses_foreign_currency_gl(db):
+    _gl(db, "FX_REVAL_PNL")
+    _gl(db, "FX_REVAL_ADJ_USD", currency="USD")
+    snapshot = _snapshot(db, "1600")
+
+    with pytest.raises(ValueError, match="FX_REVAL_ADJ_USD"):
+        run_fx_revaluation(db, snapshot.id)
+    assert db.query(models.FXRevaluationRun).count() == 0
+
+
+def test_revaluation_needs_the_pnl_gl_to_lock_on(db):
+    snapshot = _snapshot(db, "1600")
+    with pytest.raises(ValueError, match="FX_REVAL_PNL"):
+        run_fx_revaluation(db, snapshot.id)
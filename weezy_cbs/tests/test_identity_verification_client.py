@@ -0,0 +1,105 @@
+import threading
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from weezy_cbs.accounts_ledger_management.models import Account # Mapped so the customer relationships resolve
+from weezy_cbs.core_infrastructure_config_engine.models import Agent, Branch, Role, User, UserRole
+from weezy_cbs.customer_identity_management import api, services
+from weezy_cbs.customer_identity_management.verification_client import (
+    IdentityVerificationClient,
+    StubIdentityVerificationProvider,
+    SERVICE_NIBSS_BVN,
+    SERVICE_NIMC_NIN,
+)
+from weezy_cbs.database import Base
+
+
+def test_repeat_lookup_is_served_from_cache():
+    provider = StubIdentityVerificationProvider()
+    client = IdentityVerificationClient(provider=provider)
+
+    first = client.verify_bvn("12345678901")
+    second = client.verify_bvn("12345678901")
+
+    assert first["is_valid"] is True
+    assert second == first
+    assert provider.call_count == 1
+    assert client.stats["local_hits"] == 1
+
+
+def test_not_found_results_are_cached_and_force_refresh_bypasses_cache():
+    provider = StubIdentityVerificationProvider()
+    client = IdentityVerificationClient(provider=provider)
+
+    assert client.verify_nin("INVALID0001")["is_valid"] is False
+    assert client.verify_nin("INVALID0001")["is_valid"] is False
+    assert provider.call_count == 1
+
+    client.verify_nin("INVALID0001", force_refresh=True)
+    assert provider.call_count == 2
+
+
+def test_concurrent_lookups_for_same_identifier_are_coalesced():
+    provider = StubIdentityVerificationProvider(latency_seconds=0.2)
+    client = IdentityVerificationClient(provider=provider)
+    results = []
+
+    def worker():
+        results.append(client.verify_bvn("22222222222"))
+
+    threads = [threading.Thread(target=worker) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(results) == 10
+    assert all(r["is_valid"] for r in results)
+    assert provider.call_count == 1
+
+
+def test_bulk_lookup_preserves_order():
+    provider = StubIdentityVerificationProvider(latency_seconds=0.01)
+    client = IdentityVerificationClient(provider=provider)
+    items = [(SERVICE_NIBSS_BVN, f"1000000000{i}") for i in range(5)] + [(SERVICE_NIMC_NIN, "INVALID0002")]
+
+    results = client.bulk_lookup(items, max_concurrency=3)
+
+    assert [r["is_valid"] for r in results] == [True] * 5 + [False]
+    assert results[0]["data"]["bvn"] == "10000000000"
+    assert provider.call_count == 6
+
+
+def test_bulk_reverify_endpoint_requires_a_superuser(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'staff.db'}")
+    Base.metadata.create_all(bind=engine, tables=[model.__table__ for model in (Branch, Agent, User, Role, UserRole)])
+    session_factory = sessionmaker(bind=engine)
+    calls = []
+    monkeypatch.setattr(services, "bulk_reverify_customers",
+                        lambda session_factory, customer_ids, max_concurrency, verified_by_user_id: calls.append(verified_by_user_id) or [])
+
+    def get_test_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+    app = FastAPI()
+    app.include_router(api.router)
+    app.dependency_overrides[api.get_db] = get_test_db
+    client = TestClient(app)
+
+    db = session_factory()
+    db.add(User(username="admin", email="admin@bank.ng", hashed_password="x", is_superuser=False))
+    db.commit()
+    assert client.post("/customer-identity/customers/reverify", json={"customer_ids": [1]}).status_code == 403
+    assert calls == []
+
+    db.query(User).update({"is_superuser": True})
+    db.commit()
+    db.close()
+    assert client.post("/customer-identity/customers/reverify", json={"customer_ids": [1]}).status_code == 200
+    assert calls == ["admin"] # Re-verifications are logged against the staff user
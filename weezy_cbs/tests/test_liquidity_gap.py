@@ -0,0 +1,136 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from weezy_cbs.accounts_ledger_management.models import Account, AccountTypeEnum
+from weezy_cbs.core_infrastructure_config_engine.models import ProductConfig
+from weezy_cbs.customer_identity_management.models import Customer
+from weezy_cbs.database import Base
+from weezy_cbs.loan_management_module.models import LoanAccount, LoanAccountStatusEnum, LoanApplication, LoanProduct, LoanRepaymentSchedule
+from weezy_cbs.transaction_management.models import FinancialTransaction # Mapped so the loan relationships resolve
+from weezy_cbs.treasury_liquidity_management import liquidity_gap
+from weezy_cbs.treasury_liquidity_management.liquidity_gap import CashFlowColumns, compute_liquidity_gap, load_cash_flows
+from weezy_cbs.treasury_liquidity_management.models import FXTransaction, FXTransactionTypeEnum, InterbankPlacement, TreasuryBillInvestment
+
+AS_OF = date(2026, 10, 1)
+BUCKETS = (1, 7, 30) # Overnight, 2D-7D, 8D-30D, Over 30D
+RUNOFF = {"CURRENT": [[1, 0.10], [7, 0.10], [30, 0.15]]} # 35% runs off inside 30 days, 65% is core
+TABLES = [Customer, ProductConfig, Account, LoanProduct, LoanApplication, LoanAccount, LoanRepaymentSchedule,
+          TreasuryBillInvestment, InterbankPlacement, FXTransaction]
+
+
+@pytest.fixture(params=["numpy", "python"])
+def bucketing(request, monkeypatch):
+    if request.param == "numpy" and liquidity_gap.np is None:
+        pytest.skip("numpy is not installed")
+    if request.param == "python":
+        monkeypatch.setattr(liquidity_gap, "np", None)
+    return request.param
+
+
+def _day(offset):
+    return AS_OF + timedelta(days=offset)
+
+def _tbill(db, ref, offset, face_value, status="ACTIVE"):
+    db.add(TreasuryBillInvestment(investment_reference=ref, issue_date=_day(-90), maturity_date=_day(offset), tenor_days=91,
+                                  face_value=Decimal(face_value), discount_rate_pa=Decimal("18"), purchase_price=Decimal(face_value),
+                                  currency="NGN", status=status))
+
+def _placement(db, ref, placement_type, principal, rate, tenor_days):
+    db.add(InterbankPlacement(deal_reference=ref, placement_type=placement_type, counterparty_bank_code="044", counterparty_bank_name="Bank",
+                              principal_amount=Decimal(principal), currency="NGN", interest_rate_pa=Decimal(rate),
+                              placement_date=AS_OF, maturity_date=_day(tenor_days), tenor_days=tenor_days))
+
+def _fx(db, ref, status):
+    db.add(FXTransaction(deal_reference=ref, transaction_type=FXTransactionTypeEnum.SPOT, trade_date=AS_OF, value_date=_day(2),
+                         currency_pair="USD/NGN", rate=Decimal("1500"), buy_currency="USD", buy_amount=Decimal("1000.00"),
+                         sell_currency="NGN", sell_amount=Decimal("1500000.00"), counterparty_name="Interbank", status=status))
+
+def _account(db, number, account_type, balance, fd_maturity_date=None):
+    db.add(Account(account_number=number, customer_id=1, product_code="P1", account_type=account_type, currency="NGN",
+                   ledger_balance=Decimal(balance), available_balance=Decimal(balance), fd_maturity_date=fd_maturity_date))
+
+
+@pytest.fixture()
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'gap.db'}")
+    Base.metadata.create_all(bind=engine, tables=[model.__table__ for model in TABLES])
+    session = sessionmaker(bind=engine)()
+    session.add(Customer(id=1, first_name="Ada", last_name="Obi", phone_number="08030000001"))
+    _tbill(session, "TB1", 5, "1000000.00")
+    _tbill(session, "TB2", -2, "200000.00") # Past maturity but not yet marked: first bucket
+    _tbill(session, "TB3", 5, "9000000.00", status="MATURED")
+    _placement(session, "IP1", "LENDING", "1000000.00", "36.5", 10) # Repays 1,010,000
+    _placement(session, "IP2", "BORROWING", "500000.00", "0", 1)
+    _fx(session, "FX1", "PENDING_SETTLEMENT")
+    _fx(session, "FX2", "SETTLED")
+    session.add(LoanAccount(id=1, loan_account_number="LN1", application_id=1, customer_id=1, disbursement_account_number="0000000001",
+                            principal_disbursed=Decimal("300000.00"), currency="NGN", interest_rate_pa=Decimal("20"), tenor_months=3,
+                            status=LoanAccountStatusEnum.ACTIVE, disbursement_date=_day(-40), first_repayment_date=_day(-10), maturity_date=_day(50)))
+    for number, offset, paid, is_paid in ((1, -10, "0.00", False), (2, 20, "20000.00", False), (3, 50, "120000.00", True)):
+        session.add(LoanRepaymentSchedule(loan_account_id=1, installment_number=number, due_date=_day(offset), principal_due=Decimal("100000.00"),
+                                          interest_due=Decimal("20000.00"), total_due=Decimal("120000.00"), principal_paid=Decimal(paid), is_paid=is_paid))
+    _account(session, "0000000001", AccountTypeEnum.CURRENT, "1000000.00")
+    _account(session, "0000000002", AccountTypeEnum.FIXED_DEPOSIT, "2000000.00", fd_maturity_date=_day(45))
+    session.commit()
+    yield session
+    session.close()
+
+
+def test_flows_land_in_their_buckets_with_signs(db, bucketing):
+    result = compute_liquidity_gap(load_cash_flows(db, AS_OF, RUNOFF), BUCKETS)
+
+    assert [label for label, _, _ in result.buckets] == ["Overnight", "2D-7D", "8D-30D", "Over 30D"]
+    ngn = {key: [Decimal(v).scaleb(-2) for v in values] for key, values in result.by_currency["NGN"].items()}
+    # Overnight: matured T-bill in; borrowing repaid and the first NMD run-off out
+    # 2D-7D: T-bill in; NGN leg of the FX deal and the second run-off out
+    # 8D-30D: placement and the unpaid part of the loan installment in (arrears and paid installments are not); third run-off out
+    # Over 30D: fixed deposit and the core NMD balance out
+    assert ngn["inflows"] == [Decimal("200000"), Decimal("1000000"), Decimal("1110000"), Decimal("0")]
+    assert ngn["outflows"] == [Decimal("600000"), Decimal("1600000"), Decimal("150000"), Decimal("2650000")]
+    assert ngn["net_gap"] == [Decimal("-400000"), Decimal("-600000"), Decimal("960000"), Decimal("-2650000")]
+    assert ngn["cumulative_gap"] == [Decimal("-400000"), Decimal("-1000000"), Decimal("-40000"), Decimal("-2690000")]
+    assert result.by_currency["USD"]["inflows"] == [0, 100000, 0, 0] # Bought leg, in cents
+
+    rows = list(result.rows("NGN"))
+    assert rows[2] == {"tenor_bucket": "8D-30D", "from_day": 8, "to_day": 30, "inflows": Decimal("1110000.00"),
+                       "outflows": Decimal("150000.00"), "net_gap": Decimal("960000.00"), "cumulative_gap": Decimal("-40000.00")}
+
+
+def test_nmd_runoff_leaves_the_rest_as_core(db):
+    flows = load_cash_flows(db, AS_OF, RUNOFF)
+    nmd = liquidity_gap.FLOW_SOURCES.index("NON_MATURITY_DEPOSIT")
+    runoff = [(day, amount) for day, amount, source in zip(flows.days, flows.amount, flows.source) if source == nmd]
+    assert runoff == [(1, -10000000), (7, -10000000), (30, -15000000), (liquidity_gap.LIQUIDITY_NMD_CORE_DAYS, -65000000)]
+
+    with pytest.raises(ValueError, match="at most 1"):
+        load_cash_flows(db, AS_OF, {"CURRENT": [[1, 0.6], [7, 0.6]]})
+    with pytest.raises(ValueError, match="Unknown account type"):
+        load_cash_flows(db, AS_OF, {"CHEQUE": [[1, 0.1]]})
+
+
+def test_horizon_cuts_the_ladder(db, bucketing):
+    result = compute_liquidity_gap(load_cash_flows(db, AS_OF, RUNOFF), BUCKETS, horizon_days=7)
+    assert [label for label, _, _ in result.buckets] == ["Overnight", "2D-7D"]
+    assert result.by_currency["NGN"]["cumulative_gap"] == [-40000000, -100000000]
+
+
+def test_loaded_ladder_recut_is_fast_and_paths_agree(bucketing, monkeypatch):
+    # The engine's claim: once loaded, re-cutting a large ladder takes milliseconds, so it can be run per request
+    rng = random.Random(7)
+    flows = CashFlowColumns(AS_OF)
+    for _ in range(200000):
+        flows.add(_day(rng.randrange(0, 2000)), rng.choice(("NGN", "USD", "GBP")), rng.randrange(-10**9, 10**9), "LOAN_REPAYMENT")
+
+    result = compute_liquidity_gap(flows)
+    for index, code in enumerate(flows.currencies):
+        expected_net = sum(a for a, c in zip(flows.amount, flows.currency) if c == index)
+        assert result.by_currency[code]["cumulative_gap"][-1] == expected_net
+    if bucketing == "numpy":
+        assert result.elapsed_ms < 250
+    else:
+        assert result.elapsed_ms < 5000 # Row-by-row fallback: slower, still interactive
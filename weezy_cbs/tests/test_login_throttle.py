@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from weezy_cbs.accounts_ledger_management.models import Account # Mapped so the customer relationships resolve
+from weezy_cbs.core_infrastructure_config_engine.models import AuditLog
+from weezy_cbs.core_infrastructure_config_engine.password_hashing import PasswordHashingService
+from weezy_cbs.customer_identity_management.models import Customer
+from weezy_cbs.database import Base
+from weezy_cbs.digital_channels_modules import otp_store, schemas, services
+from weezy_cbs.digital_channels_modules.login_throttle import (
+    DIMENSION_DEVICE, DIMENSION_IP, DIMENSION_USERNAME, InMemoryLoginThrottleStore, LoginThrottle,
+)
+from weezy_cbs.digital_channels_modules.models import DigitalUserProfile
+from weezy_cbs.digital_channels_modules.otp_store import InMemoryOTPStore
+
+START = 1_700_000_400.0 # On a 60-second bucket boundary
+TABLES = [Customer, DigitalUserProfile, AuditLog]
+
+
+def _throttle(username_limit=(3, 60, 300), device_limit=(5, 60, 60), ip_limit=(10, 60, 60)):
+    return LoginThrottle(InMemoryLoginThrottleStore(sweep_interval_seconds=None), username_limit=username_limit,
+                         device_limit=device_limit, ip_limit=ip_limit)
+
+
+def test_failures_outside_the_window_do_not_count():
+    throttle = _throttle()
+    throttle.record_failure("ada", now=START)
+    throttle.record_failure("ada", now=START + 1)
+    # Two windows later both buckets have rolled off
+    assert throttle.record_failure("ada", now=START + 125).username_failures == 1
+    # Half a window after a bucket with two failures, they still count at half weight
+    throttle.record_failure("ada", now=START + 130)
+    decision = throttle.record_failure("ada", now=START + 210)
+    assert (decision.allowed, decision.username_failures) == (True, 2) # 1 + 2 * 0.5
+    assert throttle.check("ada", now=START + 210).allowed
+
+
+def test_lockout_blocks_for_the_block_period_and_is_reported_once():
+    throttle = _throttle()
+    decisions = [throttle.record_failure("Ada", now=START + i) for i in range(4)]
+
+    assert [d.allowed for d in decisions] == [True, True, False, False]
+    assert [d.newly_locked for d in decisions] == [False, False, True, False] # Persist the lock once
+    assert decisions[2].username_failures == 3
+
+    blocked = throttle.check("ada", now=START + 10) # Usernames are case-insensitive
+    assert (blocked.allowed, blocked.blocked_dimension, blocked.retry_after_seconds) == (False, DIMENSION_USERNAME, 292)
+    assert throttle.check("ada", now=START + 2 + 300).allowed
+
+
+def test_device_and_ip_limits_block_across_usernames():
+    throttle = _throttle()
+    for i in range(5):
+        throttle.record_failure(f"user{i}", device_id="dev-1", ip_address="10.0.0.1", now=START + i)
+    assert throttle.check("someone-else", device_id="dev-1", now=START + 6).blocked_dimension == DIMENSION_DEVICE
+    assert throttle.check("someone-else", device_id="dev-2", ip_address="10.0.0.1", now=START + 6).allowed
+
+    for i in range(5, 10):
+        throttle.record_failure(f"user{i}", ip_address="10.0.0.1", now=START + i)
+    assert throttle.check("someone-else", ip_address="10.0.0.1", now=START + 11).blocked_dimension == DIMENSION_IP
+
+
+def test_unlock_clears_the_block_and_the_counter():
+    throttle = _throttle()
+    for i in range(3):
+        throttle.record_failure("ada", now=START + i)
+    throttle.unlock_username("ADA")
+
+    assert throttle.check("ada", now=START + 5).allowed
+    assert throttle.record_failure("ada", now=START + 5).username_failures == 1
+
+
+# --- Profile unlock and password reset ---
+@pytest.fixture()
+def db(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'throttle.db'}")
+    Base.metadata.create_all(bind=engine, tables=[model.__table__ for model in TABLES])
+    hashing = PasswordHashingService(rounds=4)
+    monkeypatch.setattr(services, "password_hashing_service", hashing)
+    monkeypatch.setattr(services, "login_throttle", _throttle())
+    monkeypatch.setattr(otp_store, "_otp_store", InMemoryOTPStore(sweep_interval_seconds=None))
+
+    session = sessionmaker(bind=engine)()
+    session.add(Customer(id=1, first_name="Ada", last_name="Obi", phone_number="08030000001"))
+    session.add(DigitalUserProfile(id=1, customer_id=1, username="ada", hashed_password=hashing.hash_sync("old-password"), is_active=True))
+    session.commit()
+    yield session
+    session.close()
+
+
+def _lock(db):
+    profile = db.get(DigitalUserProfile, 1)
+    for _ in range(3):
+        services.digital_user_profile_service.record_failed_login_attempt(db, profile)
+    assert profile.locked_until is not None and not services.login_throttle.check("ada").allowed
+    return profile
+
+
+def test_profile_unlock_clears_the_throttle(db):
+    _lock(db)
+    services.digital_user_profile_service.update_digital_user_profile(
+        db, 1, schemas.DigitalUserProfileUpdate(locked_until=None), performing_username="ops")
+
+    profile = db.get(DigitalUserProfile, 1)
+    assert (profile.locked_until, profile.failed_login_attempts) == (None, 0)
+    assert services.login_throttle.check("ada").allowed
+
+
+def test_profile_update_without_locked_until_keeps_the_lock(db):
+    _lock(db)
+    services.digital_user_profile_service.update_digital_user_profile(
+        db, 1, schemas.DigitalUserProfileUpdate(is_verified_email=True), performing_username="ops")
+    assert not services.login_throttle.check("ada").allowed
+
+
+def test_password_reset_sets_the_password_and_unlocks(db):
+    _lock(db)
+    services.store_otp("0803", services.PASSWORD_RESET_OTP_PURPOSE, "123456")
+    reset = schemas.DigitalUserPasswordResetSchema(identifier="ada", otp_code="654321", new_password="new-password")
+
+    with pytest.raises(HTTPException) as wrong_otp:
+        asyncio.run(services.digital_user_profile_service.reset_password(db, reset, recipient_identifier="0803"))
+    assert wrong_otp.value.status_code == 400
+    assert not services.login_throttle.check("ada").allowed
+
+    reset.otp_code = "123456"
+    assert asyncio.run(services.digital_user_profile_service.reset_password(db, reset, recipient_identifier="0803"))
+    profile = db.get(DigitalUserProfile, 1)
+    assert services.verify_digital_password("new-password", profile.hashed_password)
+    assert (profile.locked_until, profile.failed_login_attempts) == (None, 0)
+    assert services.login_throttle.check("ada").allowed
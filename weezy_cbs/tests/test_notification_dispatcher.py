@@ -0,0 +1,165 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from weezy_cbs.accounts_ledger_management.models import Account # Mapped so the customer relationships resolve
+from weezy_cbs.customer_identity_management.models import Customer
+from weezy_cbs.database import Base
+from weezy_cbs.digital_channels_modules.models import ChannelTypeEnum, DigitalUserProfile, NotificationLog
+from weezy_cbs.digital_channels_modules.notification_dispatcher import (
+    PROVIDER_EMAIL, PROVIDER_SMS, NotificationDispatcher, NotificationProvider, resolve_provider_kind,
+)
+
+TABLES = [Customer, DigitalUserProfile, NotificationLog]
+
+
+class ScriptedProvider(NotificationProvider):
+    """Records each batch; `script` maps a recipient to the results of its successive attempts (default: success)."""
+    def __init__(self, kind, max_batch_size=3, script=None, raise_on_call=None, rate_per_second=10_000.0, burst=10_000):
+        self.kind = kind
+        self.name = f"scripted_{kind.lower()}"
+        self.max_batch_size = max_batch_size
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.script = {recipient: list(results) for recipient, results in (script or {}).items()}
+        self.raise_on_call = raise_on_call
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def send_batch(self, messages):
+        with self.lock:
+            self.batches.append([m["recipient"] for m in messages])
+            if self.raise_on_call == len(self.batches):
+                raise ConnectionError("gateway timeout")
+            results = []
+            for m in messages:
+                scripted = self.script.get(m["recipient"])
+                results.append(scripted.pop(0) if scripted else {"success": True, "external_id": f"ext-{m['log_id']}"})
+            return results
+
+
+def _sms(i):
+    return {"channel_type": "SMS_BANKING", "message_type": "TRANSACTION_ALERT", "recipient_identifier": f"0803000{i:04d}", "direct_content": "Credit alert"}
+
+
+def _dispatcher(providers, session_factory=None, **kwargs):
+    return NotificationDispatcher(providers, session_factory=session_factory, retry_base_seconds=0.01, retry_max_seconds=0.05, **kwargs)
+
+
+def test_provider_routing():
+    assert resolve_provider_kind(ChannelTypeEnum.USSD, "RECEIPT") == PROVIDER_SMS
+    assert resolve_provider_kind("INTERNET_BANKING", "email_statement") == PROVIDER_EMAIL
+    assert resolve_provider_kind("INTERNET_BANKING", "PUSH_ALERT") is None
+
+
+def test_messages_are_sent_in_provider_sized_batches():
+    provider = ScriptedProvider(PROVIDER_SMS, max_batch_size=3)
+    dispatcher = _dispatcher([provider])
+    log_ids = dispatcher.enqueue([_sms(i) for i in range(8)])
+
+    assert dispatcher.wait_until_idle(timeout=5)
+    dispatcher.shutdown(drain_timeout=0)
+    assert log_ids == list(range(1, 9))
+    assert max(len(batch) for batch in provider.batches) <= 3
+    assert sorted(r for batch in provider.batches for r in batch) == [_sms(i)["recipient_identifier"] for i in range(8)]
+    assert (dispatcher.stats["sent"], dispatcher.stats["provider_calls"]) == (8, len(provider.batches))
+
+
+def test_enqueue_rejects_missing_content_and_fails_unroutable_messages():
+    dispatcher = _dispatcher([ScriptedProvider(PROVIDER_SMS)])
+    with pytest.raises(ValueError):
+        dispatcher.enqueue([dict(_sms(1), direct_content=None)])
+
+    dispatcher.enqueue([{"channel_type": "INTERNET_BANKING", "message_type": "EMAIL_STATEMENT", "recipient_identifier": "ada@example.com",
+                         "direct_content": "Statement"}]) # No EMAIL provider configured
+    assert (dispatcher.stats["failed"], dispatcher.pending()) == (1, 0)
+    dispatcher.shutdown(drain_timeout=0)
+
+
+@pytest.fixture()
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'notifications.db'}")
+    Base.metadata.create_all(bind=engine, tables=[model.__table__ for model in TABLES])
+    return sessionmaker(bind=engine)
+
+
+def _statuses(session_factory):
+    db = session_factory()
+    try:
+        return {row.recipient_identifier: (row.status, row.failure_reason) for row in db.query(NotificationLog)}
+    finally:
+        db.close()
+
+
+def test_retryable_failures_are_retried_until_sent_or_out_of_attempts(session_factory):
+    transient = {"success": False, "error": "throttled", "retryable": True}
+    provider = ScriptedProvider(PROVIDER_SMS, script={
+        "08030000001": [transient], # Succeeds on the second attempt
+        "08030000002": [{"success": False, "error": "Invalid recipient", "retryable": False}],
+        "08030000003": [transient] * 3, # Exhausts max_attempts
+    })
+    dispatcher = _dispatcher([provider], session_factory=session_factory, max_attempts=3)
+    dispatcher.enqueue([_sms(i) for i in range(4)])
+
+    assert dispatcher.wait_until_idle(timeout=5)
+    dispatcher.shutdown(drain_timeout=0)
+    assert _statuses(session_factory) == {
+        "08030000000": ("SENT", None), "08030000001": ("SENT", None),
+        "08030000002": ("FAILED", "Invalid recipient"), "08030000003": ("FAILED", "throttled"),
+    }
+    assert (dispatcher.stats["sent"], dispatcher.stats["failed"], dispatcher.stats["retried"]) == (2, 2, 3)
+
+
+def test_provider_exception_retries_the_whole_batch(session_factory):
+    provider = ScriptedProvider(PROVIDER_SMS, max_batch_size=10, raise_on_call=1)
+    dispatcher = _dispatcher([provider], session_factory=session_factory)
+    dispatcher.enqueue([_sms(i) for i in range(3)])
+
+    assert dispatcher.wait_until_idle(timeout=5)
+    dispatcher.shutdown(drain_timeout=0)
+    assert dispatcher.stats["retried"] == 3
+    assert {status for status, _ in _statuses(session_factory).values()} == {"SENT"}
+    db = session_factory()
+    assert all(row.external_message_id == f"ext-{row.id}" for row in db.query(NotificationLog))
+    db.close()
+
+
+def test_rows_left_undelivered_are_recovered_on_startup(session_factory):
+    db = session_factory()
+    for recipient, channel, status in (("08030000001", ChannelTypeEnum.SMS_BANKING, "QUEUED"), ("08030000002", ChannelTypeEnum.USSD, "RETRYING"),
+                                       ("08030000003", ChannelTypeEnum.SMS_BANKING, "SENT"), ("08030000004", ChannelTypeEnum.KIOSK, "QUEUED")):
+        db.add(NotificationLog(channel_type=channel, recipient_identifier=recipient, message_type="TRANSACTION_ALERT", content="Alert", status=status))
+    db.commit()
+    db.close()
+
+    provider = ScriptedProvider(PROVIDER_SMS)
+    dispatcher = _dispatcher([provider], session_factory=session_factory)
+    assert dispatcher.recover_pending(batch_size=1) == 2
+    assert dispatcher.wait_until_idle(timeout=5)
+    dispatcher.shutdown(drain_timeout=0)
+
+    assert sorted(r for batch in provider.batches for r in batch) == ["08030000001", "08030000002"] # The SENT row is not resent
+    statuses = _statuses(session_factory)
+    assert [statuses[r][0] for r in ("08030000001", "08030000002", "08030000003")] == ["SENT"] * 3
+    assert statuses["08030000004"] == ("FAILED", "Unsupported notification channel.")
+
+
+def test_shutdown_leaves_unsent_rows_queued_for_the_next_startup(session_factory):
+    provider = ScriptedProvider(PROVIDER_SMS, max_batch_size=1, rate_per_second=0.001, burst=1) # One message, then stalled
+    dispatcher = _dispatcher([provider], session_factory=session_factory)
+    dispatcher.enqueue([_sms(i) for i in range(3)])
+    time.sleep(0.2)
+    dispatcher.shutdown(drain_timeout=0)
+
+    left = [r for r, (status, _) in _statuses(session_factory).items() if status == "QUEUED"]
+    assert len(provider.batches) == 1 and len(left) == 2
+
+    restarted = ScriptedProvider(PROVIDER_SMS)
+    dispatcher = _dispatcher([restarted], session_factory=session_factory)
+    assert dispatcher.recover_pending() == len(left)
+    assert dispatcher.wait_until_idle(timeout=5)
+    dispatcher.shutdown(drain_timeout=0)
+    assert {status for status, _ in _statuses(session_factory).values()} == {"SENT"}
@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+from weezy_cbs.digital_channels_modules.otp_store import InMemoryOTPStore, RedisOTPStore, _digest
+
+
+class FakeRedis:
+    """Just enough of redis-py for RedisOTPStore: SET EX, GET, EXISTS, DEL and a script emulating the Lua check."""
+    def __init__(self):
+        self.now = 0.0
+        self.data = {}
+        self.lock = threading.Lock() # Redis runs each command/script atomically
+        self.scripts = []
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry and entry[1] is not None and entry[1] <= self.now:
+            del self.data[key]
+            return None
+        return entry
+
+    def set(self, key, value, ex=None):
+        with self.lock:
+            self.data[key] = (value, self.now + ex if ex else None)
+        return True
+
+    def get(self, key):
+        with self.lock:
+            entry = self._live(key)
+            return entry[0] if entry else None
+
+    def exists(self, key):
+        with self.lock:
+            return int(self._live(key) is not None)
+
+    def delete(self, *keys):
+        with self.lock:
+            return sum(1 for key in keys if self.data.pop(key, None))
+
+    def register_script(self, source):
+        self.scripts.append(source)
+        def check_and_consume(keys, args):
+            with self.lock:
+                entry = self._live(keys[0])
+                if entry and entry[0] == args[0]:
+                    del self.data[keys[0]]
+                    return 1
+                return 0
+        return check_and_consume
+
+
+@pytest.fixture()
+def store():
+    memory_store = InMemoryOTPStore(sweep_interval_seconds=None)
+    yield memory_store
+    memory_store.close()
+
+
+def test_code_is_consumed_once(store):
+    store.put("LOGIN_2FA:0803", "123456", ttl_seconds=60)
+    assert store.exists("LOGIN_2FA:0803")
+    assert not store.check_and_consume("LOGIN_2FA:0803", "000000") # A wrong code leaves the entry in place
+    assert store.check_and_consume("LOGIN_2FA:0803", "123456")
+    assert not store.check_and_consume("LOGIN_2FA:0803", "123456")
+    assert not store.exists("LOGIN_2FA:0803")
+
+
+def test_expired_code_is_rejected_and_removed(store):
+    store.put("LOGIN_2FA:0803", "123456", ttl_seconds=0)
+    assert not store.exists("LOGIN_2FA:0803")
+    assert not store.check_and_consume("LOGIN_2FA:0803", "123456")
+    assert len(store) == 0
+
+
+def test_sweeper_removes_only_expired_codes(store):
+    for i in range(5):
+        store.put(f"SHORT:{i}", "1111", ttl_seconds=10)
+        store.put(f"LONG:{i}", "2222", ttl_seconds=1000)
+    store.check_and_consume("SHORT:0", "1111") # Consumed entries leave stale heap items behind
+
+    assert store.sweep_expired(now=time.monotonic() + 60) == 4
+    assert len(store) == 5
+    assert all(store.exists(f"LONG:{i}") for i in range(5))
+
+
+def test_reissued_code_replaces_the_old_one_and_survives_its_expiry(store):
+    store.put("REG:0803", "111111", ttl_seconds=10)
+    store.put("REG:0803", "222222", ttl_seconds=1000)
+
+    assert store.sweep_expired(now=time.monotonic() + 60) == 0 # The first code's heap item is stale
+    assert not store.check_and_consume("REG:0803", "111111")
+    assert store.check_and_consume("REG:0803", "222222")
+
+
+def _race(store, key, code, threads=16):
+    wins = []
+    barrier = threading.Barrier(threads)
+    def attempt():
+        barrier.wait()
+        if store.check_and_consume(key, code):
+            wins.append(1)
+    workers = [threading.Thread(target=attempt) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return len(wins)
+
+
+def test_concurrent_check_and_consume_has_a_single_winner(store):
+    for round_number in range(20):
+        store.put(f"CARDLESS_WITHDRAWAL:{round_number}", "4321", ttl_seconds=60)
+        assert _race(store, f"CARDLESS_WITHDRAWAL:{round_number}", "4321") == 1
+
+
+def test_redis_store_uses_digests_ttls_and_the_lua_check():
+    client = FakeRedis()
+    store = RedisOTPStore(redis_client=client, key_prefix="test:otp:")
+    assert "redis.call('DEL', KEYS[1])" in client.scripts[0]
+
+    store.put("LOGIN_2FA:0803", "123456", ttl_seconds=300)
+    assert client.data["test:otp:LOGIN_2FA:0803"] == (_digest("LOGIN_2FA:0803", "123456"), 300.0) # Never stored in clear
+    assert not store.check_and_consume("LOGIN_2FA:0803", "654321")
+    assert store.check_and_consume("LOGIN_2FA:0803", "123456")
+    assert not store.exists("LOGIN_2FA:0803")
+
+    store.put("LOGIN_2FA:0803", "123456", ttl_seconds=300)
+    client.now = 301
+    assert not store.check_and_consume("LOGIN_2FA:0803", "123456")
+
+    store.put("CARDLESS_WITHDRAWAL:1", "4321", ttl_seconds=60)
+    assert _race(store, "CARDLESS_WITHDRAWAL:1", "4321") == 1
+    store.put("CARDLESS_WITHDRAWAL:2", "4321", ttl_seconds=60)
+    store.delete("CARDLESS_WITHDRAWAL:2")
+    assert not store.exists("CARDLESS_WITHDRAWAL:2")
@@ -0,0 +1,111 @@
+import asyncio
+import base64
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from weezy_cbs.accounts_ledger_management.models import Account # Mapped so the customer relationships resolve
+from weezy_cbs.core_infrastructure_config_engine.models import AuditLog
+from weezy_cbs.core_infrastructure_config_engine.password_hashing import (
+    HashingBackpressureError, PasswordHashingService, issue_pin_session_token, validate_pin_session_token,
+)
+from weezy_cbs.customer_identity_management.models import Customer
+from weezy_cbs.database import Base
+from weezy_cbs.digital_channels_modules import schemas, services
+from weezy_cbs.digital_channels_modules.login_throttle import InMemoryLoginThrottleStore, LoginThrottle
+from weezy_cbs.digital_channels_modules.models import ChannelTypeEnum, DigitalUserProfile, RegisteredDevice, SessionLog
+
+TABLES = [Customer, DigitalUserProfile, RegisteredDevice, SessionLog, AuditLog]
+
+
+def test_full_queue_is_rejected_and_the_slot_is_released():
+    service = PasswordHashingService(rounds=4, max_workers=1, max_queued=1)
+    started, release = threading.Event(), threading.Event()
+
+    def blocking(rounds):
+        started.set()
+        release.wait(5)
+        return rounds
+
+    async def scenario():
+        in_flight = asyncio.ensure_future(service._run(blocking))
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        with pytest.raises(HashingBackpressureError):
+            await service.hash("password1") # Rejected at once instead of queueing behind the slow call
+        release.set()
+        assert await in_flight == 4
+        return await service.hash("password1") # The slot came back
+
+    hashed = asyncio.run(scenario())
+    assert service.verify_and_update_sync("password1", hashed) == (True, None)
+    service.shutdown()
+
+
+def test_outdated_cost_is_reported_for_rehash():
+    old_hash = PasswordHashingService(rounds=4).hash_sync("password1")
+    service = PasswordHashingService(rounds=5)
+
+    is_valid, new_hash = asyncio.run(service.verify_and_update("password1", old_hash))
+    assert is_valid and new_hash.startswith("$2b$05$")
+    assert asyncio.run(service.verify_and_update("password1", new_hash)) == (True, None)
+    assert asyncio.run(service.verify_and_update("wrong", old_hash)) == (False, None)
+    assert service.verify_and_update_sync("password1", "not-a-bcrypt-hash") == (False, None)
+    assert service.verify_and_update_sync("", old_hash) == (False, None)
+    service.shutdown()
+
+
+def test_pin_session_token_is_bound_to_profile_pin_and_expiry():
+    token = issue_pin_session_token(7, "pin-hash-1")
+    assert validate_pin_session_token(token, 7, "pin-hash-1")
+    assert not validate_pin_session_token(token, 8, "pin-hash-1")
+    assert not validate_pin_session_token(token, 7, "pin-hash-2") # PIN changed since the token was issued
+    assert not validate_pin_session_token(issue_pin_session_token(7, "pin-hash-1", ttl_seconds=-1), 7, "pin-hash-1")
+
+    profile_id, expires_at, signature = base64.urlsafe_b64decode(token).decode().split(":")
+    extended = base64.urlsafe_b64encode(f"{profile_id}:{int(expires_at) + 3600}:{signature}".encode()).decode()
+    assert not validate_pin_session_token(extended, 7, "pin-hash-1")
+    assert not validate_pin_session_token("not-base64!", 7, "pin-hash-1")
+    assert not validate_pin_session_token(None, 7, "pin-hash-1")
+
+
+@pytest.fixture()
+def db(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'hashing.db'}")
+    Base.metadata.create_all(bind=engine, tables=[model.__table__ for model in TABLES])
+    old_cost = PasswordHashingService(rounds=4)
+    monkeypatch.setattr(services, "password_hashing_service", PasswordHashingService(rounds=5))
+    monkeypatch.setattr(services, "login_throttle", LoginThrottle(InMemoryLoginThrottleStore(sweep_interval_seconds=None)))
+
+    session = sessionmaker(bind=engine)()
+    session.add(Customer(id=1, first_name="Ada", last_name="Obi", phone_number="08030000001"))
+    session.add(DigitalUserProfile(id=1, customer_id=1, username="ada", is_active=True, hashed_password=old_cost.hash_sync("password1"),
+                                   transaction_pin_hashed=old_cost.hash_sync("2468"), is_transaction_pin_set=True))
+    session.commit()
+    yield session
+    session.close()
+    services.password_hashing_service.shutdown()
+
+
+def test_login_replaces_a_hash_with_an_outdated_cost(db):
+    login = schemas.DigitalUserLoginSchema(username="ada", password="password1", channel=ChannelTypeEnum.MOBILE_BANKING_APP)
+    assert asyncio.run(services.digital_user_profile_service.authenticate_digital_user(db, login)) is not None
+
+    profile = db.get(DigitalUserProfile, 1)
+    assert profile.hashed_password.startswith("$2b$05$")
+    assert services.verify_digital_password("password1", profile.hashed_password)
+
+
+def test_transaction_pin_session_token_stands_in_for_the_pin(db):
+    profile_service = services.digital_user_profile_service
+    assert asyncio.run(profile_service.issue_pin_session(db, 1, pin="1357")) is None
+    token = asyncio.run(profile_service.issue_pin_session(db, 1, pin="2468"))
+
+    assert asyncio.run(profile_service.verify_transaction_pin(db, 1, pin_session_token=token))
+    assert not asyncio.run(profile_service.verify_transaction_pin(db, 1, pin_session_token="forged"))
+
+    asyncio.run(profile_service.set_transaction_pin(db, 1, schemas.DigitalUserTransactionPinSetSchema(new_pin="9999", password="password1")))
+    assert not asyncio.run(profile_service.verify_transaction_pin(db, 1, pin_session_token=token)) # Invalidated by the PIN change
+    assert asyncio.run(profile_service.verify_transaction_pin(db, 1, pin="9999"))
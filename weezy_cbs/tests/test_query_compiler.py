@@ -0,0 +1,132 @@
+import enum
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import Column, DateTime, Enum, Integer, MetaData, Numeric, String, Table, create_engine, insert
+
+from weezy_cbs.reports_analytics.query_compiler import (
+    DynamicFilterError, DynamicFilterQueryCompiler, ModelCatalogue, encode_cursor,
+)
+
+
+class TxnStatus(enum.Enum):
+    SUCCESSFUL = "SUCCESSFUL"
+    FAILED = "FAILED"
+
+
+metadata = MetaData()
+txns = Table(
+    "txns", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("account", String(10)),
+    Column("amount", Numeric(18, 2)),
+    Column("status", Enum(TxnStatus)),
+    Column("posted_at", DateTime),
+)
+START = datetime(2024, 1, 31, 9, 0)
+
+
+@pytest.fixture()
+def compiler():
+    catalogue = ModelCatalogue()
+    catalogue._defaults_loaded = True # Only the test table
+    catalogue.register("Txn", txns)
+    return DynamicFilterQueryCompiler(catalogue, cache_size=3)
+
+
+@pytest.fixture()
+def conn():
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine)
+    with engine.connect() as connection:
+        connection.execute(insert(txns), [
+            # Postings share timestamps in threes, so keyset pages must break ties on the primary key
+            {"id": i, "account": f"00000000{i % 3}", "amount": Decimal(i * 100), "status": TxnStatus.FAILED if i % 4 == 0 else TxnStatus.SUCCESSFUL,
+             "posted_at": START + timedelta(minutes=(i - 1) // 3)}
+            for i in range(1, 11)
+        ])
+        yield connection
+
+
+def _run(conn, compiler, filters=None, **kwargs):
+    limit, cursor = kwargs.get("limit"), kwargs.get("cursor")
+    plan = compiler.compile("Txn", filters, **kwargs)
+    return plan, conn.execute(plan.stmt, plan.params(filters, limit=limit, cursor=cursor)).all()
+
+
+def test_plans_are_cached_by_shape_not_values(compiler, conn):
+    plan, rows = _run(conn, compiler, {"amount": "gte:500", "account": "in_:000000001"}, select_fields=["id"])
+    same_plan, more_rows = _run(conn, compiler, {"account": "in_:000000001,000000002", "amount": "gte:100"}, select_fields=["id"])
+
+    assert same_plan is plan
+    assert [r.id for r in rows] == [7, 10]
+    assert [r.id for r in more_rows] == [1, 2, 4, 5, 7, 8, 10] # A longer IN list reuses the expanding bind
+    assert compiler.stats == {"hits": 1, "compiles": 1}
+
+    assert compiler.compile("Txn", {"amount": "lt:500", "account": "in_:x"}, select_fields=["id"]) is not plan # New operator, new shape
+    assert compiler.stats["compiles"] == 2
+
+
+def test_plan_cache_evicts_least_recently_used(compiler):
+    plans = [compiler.compile("Txn", {"id": f"{op}:1"}) for op in ("eq", "ne", "gt")]
+    compiler.compile("Txn", {"id": "eq:2"}) # Touch the first plan
+    compiler.compile("Txn", {"id": "lt:1"}) # Evicts "ne"
+    assert compiler.compile("Txn", {"id": "eq:3"}) is plans[0]
+    assert compiler.compile("Txn", {"id": "ne:3"}) is not plans[1]
+
+
+def test_values_are_coerced_to_column_types(compiler, conn):
+    _, rows = _run(conn, compiler, {"status": "eq:FAILED", "posted_at": "gte:2024-01-31T09:01:00"}, select_fields=["id", "status"])
+    assert [tuple(r) for r in rows] == [(4, TxnStatus.FAILED), (8, TxnStatus.FAILED)]
+    _, rows = _run(conn, compiler, {"account": "like:0001"})
+    assert len(rows) == 4 and rows[0]._fields == ("id", "account", "amount", "status", "posted_at")
+
+    plan = compiler.compile("Txn", {"amount": "gt:1"})
+    with pytest.raises(DynamicFilterError):
+        plan.params({"amount": "gt:lots"})
+
+
+def test_invalid_requests_are_rejected_and_not_cached(compiler):
+    for kwargs in ({"filters": {"balance": "gt:1"}}, {"filters": {"amount": "between:1"}}, {"select_fields": ["pin"]},
+                   {"sort_by": "balance:desc"}, {"filters": {"account": "eq:1"}, "allowed_filter_fields": ["amount"]}):
+        with pytest.raises(DynamicFilterError):
+            compiler.compile("Txn", **kwargs)
+    with pytest.raises(DynamicFilterError):
+        compiler.compile("Ledger")
+    assert compiler.stats["compiles"] == 0
+
+
+def _pages(conn, compiler, sort_by, limit=4):
+    seen, cursor, page_plans = [], None, set()
+    while True:
+        plan, rows = _run(conn, compiler, {"amount": "gt:0"}, select_fields=["amount"], sort_by=sort_by, limit=limit, keyset=True, cursor=cursor)
+        page_plans.add(id(plan))
+        seen.extend(r.id for r in rows)
+        cursor = plan.next_cursor(rows[-1]) if len(rows) == limit else None
+        if cursor is None:
+            return seen, page_plans
+
+
+def test_keyset_pages_cover_every_row_once_across_sort_ties(compiler, conn):
+    ascending, plans = _pages(conn, compiler, "posted_at")
+    assert ascending == list(range(1, 11))
+    assert len(plans) == 2 # First page and follow-up pages are separate cached plans
+
+    descending, _ = _pages(conn, compiler, "posted_at:desc")
+    assert descending == [10, 9, 8, 7, 6, 5, 4, 3, 2, 1]
+    by_pk, _ = _pages(conn, compiler, None, limit=3)
+    assert by_pk == list(range(1, 11))
+
+
+def test_keyset_plan_selects_its_cursor_columns_and_needs_a_cursor(compiler):
+    plan = compiler.compile("Txn", select_fields=["amount"], sort_by="posted_at", limit=5, keyset=True)
+    assert plan.column_names == ["amount", "posted_at", "id"]
+    assert plan.next_cursor((Decimal("1.00"), START, 3)) == encode_cursor(START, 3)
+
+    follow_up = compiler.compile("Txn", select_fields=["amount"], sort_by="posted_at", limit=5, keyset=True, cursor="x")
+    with pytest.raises(DynamicFilterError):
+        follow_up.params(limit=5)
+    with pytest.raises(DynamicFilterError):
+        follow_up.params(limit=5, cursor="not-a-cursor")
+    assert follow_up.params(limit=5, cursor=encode_cursor(START, 3)) == {"_limit": 5, "_after_sort": START, "_after_pk": 3}
@@ -0,0 +1,174 @@
+import json
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+
+from weezy_cbs.core_infrastructure_config_engine.models import Agent, AuditLog, Branch, Role, User, UserRole
+from weezy_cbs.database import Base
+from weezy_cbs.reports_analytics import query_guard, services
+from weezy_cbs.reports_analytics.models import GeneratedReportLog, ReportDefinition, ReportQueryLogicTypeEnum, ScheduledReport
+from weezy_cbs.reports_analytics.query_guard import (
+    CostEstimate, ReportCostExceededError, ReportExecutionGuard, ReportTimeoutError, _Explain, apply_statement_timeout,
+    estimate_cost,
+)
+from weezy_cbs.reports_analytics.report_streaming import LocalReportStore
+
+TABLES = [Branch, Agent, User, Role, UserRole, AuditLog, ReportDefinition, ScheduledReport, GeneratedReportLog]
+
+
+class FakeBackend:
+    """Session stand-in reporting a dialect name and answering EXPLAIN with a canned plan."""
+    def __init__(self, dialect_name, plan=None):
+        self.dialect = type("Dialect", (), {"name": dialect_name})()
+        self.plan = plan
+        self.executed = []
+
+    def get_bind(self):
+        return self
+
+    def execute(self, statement, params=None):
+        self.executed.append(str(statement))
+        plan = self.plan
+        return type("Result", (), {"scalar": lambda self: plan})()
+
+
+def _guard(**kwargs):
+    return ReportExecutionGuard(**{"max_cost": 1000, "heavy_cost": 100, "heavy_concurrency": 1, "queue_wait_seconds": 0.05,
+                                   "default_timeout_seconds": 30, **kwargs})
+
+
+def test_explain_compiles_the_statement_with_its_binds():
+    stmt = select(User.id).where(User.username.in_(["a", "b"]))
+    sql = str(_Explain(stmt, "EXPLAIN (FORMAT JSON)").compile(dialect=postgresql.dialect()))
+    assert sql.startswith("EXPLAIN (FORMAT JSON) SELECT users.id") and "IN (__[POSTCOMPILE_username_1])" in sql
+
+
+def test_estimate_cost_reads_the_planner_output():
+    pg = FakeBackend("postgresql", [{"Plan": {"Total Cost": 1234.5, "Plan Rows": 90}}])
+    estimate = estimate_cost(pg, select(User.id))
+    assert (estimate.total_cost, estimate.plan_rows) == (1234.5, 90)
+
+    assert estimate_cost(FakeBackend("mysql", json.dumps({"query_block": {"cost_info": {"query_cost": "42.10"}}})), select(User.id)).total_cost == 42.1
+    assert estimate_cost(FakeBackend("mysql", json.dumps({"query_block": {}})), select(User.id)) is None
+    sqlite = FakeBackend("sqlite")
+    assert estimate_cost(sqlite, select(User.id)) is None and sqlite.executed == [] # No EXPLAIN where there is no cost
+
+
+def test_statement_timeout_is_set_on_postgresql_only():
+    pg, sqlite = FakeBackend("postgresql"), FakeBackend("sqlite")
+    apply_statement_timeout(pg, 45)
+    apply_statement_timeout(sqlite, 45)
+    apply_statement_timeout(FakeBackend("postgresql"), None)
+    assert pg.executed == ["SET LOCAL statement_timeout = 45000"] and sqlite.executed == []
+
+
+def test_assess_classifies_by_estimated_cost(monkeypatch):
+    guard = _guard()
+    monkeypatch.setattr(query_guard, "estimate_cost", lambda db, stmt, params: CostEstimate(50, 10))
+    light = guard.assess(None, None, None)
+    assert (light.heavy, light.use_replica, light.timeout_seconds) == (False, False, 30)
+
+    monkeypatch.setattr(query_guard, "estimate_cost", lambda db, stmt, params: CostEstimate(500, 10_000))
+    assert guard.assess(None, None, None).execution_stats() == {"estimated_cost": 500, "estimated_rows": 10_000, "executed_on": "PRIMARY"}
+    monkeypatch.setattr(query_guard, "REPORT_READ_REPLICA_URL", "postgresql://reporter@replica/weezy")
+    heavy = guard.assess(None, None, None, timeout_seconds=600)
+    assert (heavy.heavy, heavy.execution_stats()["executed_on"], heavy.timeout_seconds) == (True, "REPLICA", 600)
+
+    with pytest.raises(ReportCostExceededError) as rejected:
+        guard.assess(None, None, None, max_cost=400) # The definition's own budget wins
+    assert rejected.value.estimate.total_cost == 500
+
+    monkeypatch.setattr(query_guard, "estimate_cost", lambda db, stmt, params: None)
+    assert not guard.assess(None, None, None, max_cost=1).heavy # No estimate, no cost checks
+
+
+def test_heavy_runs_queue_for_a_slot():
+    guard = _guard()
+    heavy = query_guard.GuardDecision(CostEstimate(500, None), True, False, 30)
+    light = query_guard.GuardDecision(CostEstimate(50, None), False, False, 30)
+    holding, release = threading.Event(), threading.Event()
+
+    def hold_slot():
+        with guard.slot(heavy):
+            holding.set()
+            release.wait(5)
+    holder = threading.Thread(target=hold_slot)
+    holder.start()
+    holding.wait(5)
+    try:
+        with pytest.raises(ReportTimeoutError):
+            with guard.slot(heavy):
+                pass
+        with guard.slot(light): # Light runs never wait
+            pass
+    finally:
+        release.set()
+        holder.join()
+    with guard.slot(heavy): # Freed by the first run
+        pass
+
+
+def test_timed_batches_counts_fetch_time_only_and_closes_the_cursor():
+    closed = []
+    def batches(delay):
+        try:
+            for i in range(3):
+                time.sleep(delay)
+                yield [(i,)]
+        finally:
+            closed.append(True)
+
+    stats = {}
+    for _ in _guard().timed_batches(batches(0), 1, stats):
+        time.sleep(0.05) # Writing output is not query time
+    assert stats["query_seconds"] < 0.05 and closed == [True]
+
+    with pytest.raises(ReportTimeoutError):
+        list(_guard().timed_batches(batches(0.04), 0.05, {}))
+    assert closed == [True, True]
+
+
+@pytest.fixture()
+def factory(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'reports.db'}")
+    Base.metadata.create_all(bind=engine, tables=[model.__table__ for model in TABLES])
+    session_factory = sessionmaker(bind=engine)
+    db = session_factory()
+    db.add(User(id=1, username="analyst", email="analyst@bank.ng", hashed_password="x"))
+    db.add(ReportDefinition(id=1, report_code="USERS", report_name="Users", query_logic_type=ReportQueryLogicTypeEnum.PREDEFINED_SQL,
+                            query_details_json=json.dumps({"sql_template": "SELECT id, username FROM users"}), max_estimated_cost=1000))
+    db.commit()
+    db.close()
+
+    store = LocalReportStore(str(tmp_path / "store"))
+    stream_report_to_store = services.stream_report_to_store
+    monkeypatch.setattr(services, "stream_report_to_store", lambda *args, **kwargs: stream_report_to_store(*args, store=store, **kwargs))
+    monkeypatch.setattr(services, "report_execution_guard", _guard(max_cost=50_000))
+    return session_factory
+
+
+def _generate(factory):
+    db = factory()
+    try:
+        generator = services.ReportGenerationService(db, services.GeneratedReportLogService(), services.ReportDefinitionService())
+        log = generator.generate_report_from_definition(1, {}, "CSV", generated_by_user_id=1, username="analyst")
+        return {c: getattr(log, c) for c in ("status", "error_message", "estimated_cost", "estimated_rows", "executed_on")}
+    finally:
+        db.close()
+
+
+def test_over_budget_report_is_rejected_and_recorded(factory, monkeypatch):
+    monkeypatch.setattr(query_guard, "estimate_cost", lambda db, stmt, params: CostEstimate(2500, 800_000))
+    log = _generate(factory)
+    assert log["status"].value == "FAILED" and "exceeds the limit of 1,000" in log["error_message"]
+    assert (log["estimated_cost"], log["estimated_rows"]) == (2500, 800_000)
+
+
+def test_heavy_report_runs_on_the_primary_without_a_replica(factory, monkeypatch):
+    monkeypatch.setattr(query_guard, "estimate_cost", lambda db, stmt, params: CostEstimate(500, 1))
+    log = _generate(factory)
+    assert (log["status"].value, log["estimated_cost"], log["executed_on"]) == ("SUCCESS", 500, "PRIMARY")
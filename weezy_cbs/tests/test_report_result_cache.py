@@ -0,0 +1,136 @@
+import json
+import os
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from weezy_cbs.core_infrastructure_config_engine.models import Agent, AuditLog, Branch, Role, User, UserRole
+from weezy_cbs.database import Base
+from weezy_cbs.reports_analytics import services
+from weezy_cbs.reports_analytics.models import (
+    GeneratedReportLog, ReportDefinition, ReportQueryLogicTypeEnum, ScheduledReport,
+)
+from weezy_cbs.reports_analytics.report_streaming import LocalReportStore
+from weezy_cbs.reports_analytics.result_cache import report_cache_key
+from weezy_cbs.reports_analytics.schemas import ReportDefinitionUpdate
+
+TABLES = [Branch, Agent, User, Role, UserRole, AuditLog, ReportDefinition, ScheduledReport, GeneratedReportLog]
+
+
+def test_cache_key_is_canonical_over_parameter_order_and_types():
+    report_def = ReportDefinition(id=1, version=1)
+    key = report_cache_key(report_def, {"branch": "B001", "from": date(2024, 1, 1), "min_amount": Decimal("100.0")}, "csv")
+    assert key == report_cache_key(report_def, {"min_amount": Decimal("100"), "from": "2024-01-01", "branch": "B001"}, "CSV")
+    assert key != report_cache_key(report_def, {"branch": "B001", "from": date(2024, 1, 1), "min_amount": Decimal("100")}, "JSONL")
+    assert key != report_cache_key(ReportDefinition(id=1, version=2), {"branch": "B001", "from": date(2024, 1, 1), "min_amount": Decimal("100")}, "CSV")
+    assert report_cache_key(report_def, None, "CSV") == report_cache_key(report_def, {}, "CSV")
+
+
+@pytest.fixture()
+def env(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'reports.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine, tables=[model.__table__ for model in TABLES])
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    db.add(User(id=1, username="analyst", email="analyst@bank.ng", hashed_password="x"))
+    db.add(ReportDefinition(id=1, report_code="USERS", report_name="Users", query_logic_type=ReportQueryLogicTypeEnum.PREDEFINED_SQL,
+                            query_details_json=json.dumps({"sql_template": "SELECT id, username FROM users WHERE id >= :min_id"}),
+                            result_cache_ttl_seconds=600))
+    db.commit()
+    db.close()
+
+    runs = []
+    store = LocalReportStore(str(tmp_path / "store"))
+    stream_report_to_store = services.stream_report_to_store
+    def counting_store(*args, **kwargs):
+        runs.append(args[3])
+        time.sleep(0.05) # Long enough for concurrent requests to overlap
+        return stream_report_to_store(*args, store=store, **kwargs)
+    monkeypatch.setattr(services, "stream_report_to_store", counting_store)
+    return factory, runs
+
+
+def _generate(factory, params, output_format="CSV"):
+    db = factory()
+    try:
+        generator = services.ReportGenerationService(db, services.GeneratedReportLogService(), services.ReportDefinitionService())
+        log = generator.generate_report_from_definition(1, params, output_format, generated_by_user_id=1, username="analyst")
+        return {c: getattr(log, c) for c in ("id", "status", "served_from_cache", "cached_from_log_id", "file_path_or_link", "error_message")}
+    finally:
+        db.close()
+
+
+def test_identical_run_is_served_from_the_cached_artifact(env):
+    factory, runs = env
+    first = _generate(factory, {"min_id": 1})
+    second = _generate(factory, {"min_id": 1})
+
+    assert first["status"].value == "SUCCESS" and not first["served_from_cache"]
+    assert (second["served_from_cache"], second["cached_from_log_id"], second["file_path_or_link"]) == (True, first["id"], first["file_path_or_link"])
+    assert len(runs) == 1
+
+    _generate(factory, {"min_id": 2}) # Different parameters
+    _generate(factory, {"min_id": 1}, output_format="JSONL") # Different format
+    assert len(runs) == 3
+
+
+def test_missing_artifact_or_disabled_ttl_regenerates(env):
+    factory, runs = env
+    first = _generate(factory, {"min_id": 1})
+    os.remove(first["file_path_or_link"]) # Storage cleaned up behind the cache's back
+    assert not _generate(factory, {"min_id": 1})["served_from_cache"]
+    assert len(runs) == 2
+
+    db = factory()
+    db.query(ReportDefinition).update({"result_cache_ttl_seconds": 0})
+    db.commit()
+    db.close()
+    _generate(factory, {"min_id": 1})
+    assert len(runs) == 3
+
+
+def test_definition_update_invalidates_cached_results(env):
+    factory, runs = env
+    _generate(factory, {"min_id": 1})
+
+    db = factory()
+    services.ReportDefinitionService().update_definition(db, 1, ReportDefinitionUpdate(report_name="All users"), username="admin")
+    assert db.query(GeneratedReportLog).filter(GeneratedReportLog.cache_key.isnot(None)).count() == 0
+    db.close()
+
+    assert not _generate(factory, {"min_id": 1})["served_from_cache"]
+    assert len(runs) == 2
+
+
+def test_concurrent_identical_requests_are_coalesced(env):
+    factory, runs = env
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(_generate(factory, {"min_id": 1}))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(runs) == 1
+    assert sorted(r["served_from_cache"] for r in results) == [False] + [True] * 4
+    assert len({r["file_path_or_link"] for r in results}) == 1
+
+
+def test_failed_runs_are_never_cache_sources(env):
+    factory, runs = env
+    db = factory()
+    db.query(ReportDefinition).update({"query_details_json": json.dumps({"sql_template": "SELECT missing_column FROM users"})})
+    db.commit()
+    db.close()
+
+    first = _generate(factory, {})
+    assert first["status"].value == "FAILED" and first["error_message"]
+    db = factory()
+    assert db.query(GeneratedReportLog).filter(GeneratedReportLog.cache_key.isnot(None)).count() == 0 # Failures are never cache sources
+    db.close()
+    assert _generate(factory, {})["status"].value == "FAILED"
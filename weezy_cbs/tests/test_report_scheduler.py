@@ -0,0 +1,154 @@
+from concurrent.futures import Future
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy import event as sa_event
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+
+from weezy_cbs.core_infrastructure_config_engine.models import Agent, Branch, Role, User, UserRole
+from weezy_cbs.database import Base
+from weezy_cbs.reports_analytics.models import (
+    GeneratedReportLog, ReportDefinition, ReportQueryLogicTypeEnum, ScheduledReport, ScheduledReportStatusEnum,
+)
+from weezy_cbs.reports_analytics.report_scheduler import ReportSchedulerDaemon
+
+TABLES = [Branch, Agent, User, Role, UserRole, ReportDefinition, ScheduledReport, GeneratedReportLog]
+NOW = datetime(2024, 1, 1, 8, 0, 30)
+
+
+class HeldExecutor:
+    """Records submissions; futures complete only when the test says so."""
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.submitted.append((args, future))
+        return future
+
+    def finish(self, index=0, status="SUCCESS"):
+        _, future = self.submitted[index]
+        future.set_result((status, 1.5, None))
+
+    def shutdown(self, wait=True):
+        pass
+
+
+@pytest.fixture()
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'scheduler.db'}")
+    Base.metadata.create_all(bind=engine, tables=[model.__table__ for model in TABLES])
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    db.add(User(id=1, username="ops", email="ops@bank.ng", hashed_password="x"))
+    for def_id in (1, 2):
+        db.add(ReportDefinition(id=def_id, report_code=f"R{def_id}", report_name=f"Report {def_id}",
+                                query_logic_type=ReportQueryLogicTypeEnum.PREDEFINED_SQL, query_details_json="{}"))
+    for sched_id, def_id in ((1, 1), (2, 1), (3, 2)):
+        db.add(ScheduledReport(id=sched_id, report_definition_id=def_id, cron_expression="0 * * * *", output_format="CSV",
+                               parameters_values_json='{"branch": "B001"}', next_run_at=datetime(2024, 1, 1, 8, 0), created_by_user_id=1))
+    db.commit()
+    db.close()
+    return factory
+
+
+def _daemon(session_factory, executor, **kwargs):
+    return ReportSchedulerDaemon(session_factory=session_factory, executor=executor, clock=lambda: NOW, **kwargs)
+
+
+def _next_runs(session_factory):
+    db = session_factory()
+    try:
+        return {s.id: s.next_run_at.replace(tzinfo=None) for s in db.query(ScheduledReport)}
+    finally:
+        db.close()
+
+
+def test_claim_advances_next_run_and_submits_the_run(session_factory):
+    executor = HeldExecutor()
+    daemon = _daemon(session_factory, executor, per_definition_limit=5)
+
+    assert daemon.run_once() == 3
+    assert _next_runs(session_factory) == {1: datetime(2024, 1, 1, 9, 0), 2: datetime(2024, 1, 1, 9, 0), 3: datetime(2024, 1, 1, 9, 0)}
+    assert sorted(args for args, _ in executor.submitted) == [(1, 1, {"branch": "B001"}, "CSV", 1), (2, 1, {"branch": "B001"}, "CSV", 1),
+                                                              (3, 2, {"branch": "B001"}, "CSV", 1)]
+    assert daemon.run_once() == 0 # Nothing is due any more
+    assert daemon.metrics()["queue_lag_max_seconds"] == 30.0
+
+
+def test_a_run_is_claimed_by_one_node_only(session_factory):
+    node_a, node_b = HeldExecutor(), HeldExecutor()
+    daemon_a = _daemon(session_factory, node_a, per_definition_limit=5)
+    daemon_b = _daemon(session_factory, node_b, per_definition_limit=5)
+    daemon_a.refresh()
+    daemon_b.refresh() # Both heaps hold all three schedules
+
+    assert daemon_a._dispatch_due() == 3
+    assert daemon_b._dispatch_due() == 0
+    assert daemon_b.stats["claim_conflicts"] == 3 and node_b.submitted == []
+
+
+def test_claim_locks_the_row_and_loses_to_a_concurrent_claim(session_factory):
+    daemon_a = _daemon(session_factory, HeldExecutor())
+    node_b = HeldExecutor()
+    daemon_b = _daemon(session_factory, node_b)
+    locking_selects = []
+
+    # Node B claims between node A's locking SELECT and its conditional UPDATE
+    interleaved_factory = sessionmaker(bind=session_factory.kw["bind"])
+    @sa_event.listens_for(interleaved_factory, "do_orm_execute")
+    def interleave(state):
+        if state.is_select and not locking_selects:
+            locking_selects.append(str(state.statement.compile(dialect=postgresql.dialect())))
+            rows = state.invoke_statement().freeze() # Fetch and close the cursor so SQLite lets node B commit
+            assert daemon_b._claim(1) is not None
+            return rows()
+    daemon_a._session_factory = interleaved_factory
+
+    assert daemon_a._claim(1) is None
+    assert "FOR UPDATE SKIP LOCKED" in locking_selects[0]
+    assert _next_runs(session_factory)[1] == datetime(2024, 1, 1, 9, 0) # Advanced once, by node B
+
+
+def test_paused_or_rescheduled_entries_are_not_claimed(session_factory):
+    daemon = _daemon(session_factory, HeldExecutor(), per_definition_limit=5)
+    daemon.refresh()
+    db = session_factory()
+    db.query(ScheduledReport).filter(ScheduledReport.id == 1).update({"status": ScheduledReportStatusEnum.PAUSED})
+    db.query(ScheduledReport).filter(ScheduledReport.id == 2).update({"next_run_at": datetime(2024, 1, 1, 12, 0)})
+    db.commit()
+    db.close()
+
+    assert daemon._dispatch_due() == 1
+    assert daemon.stats["claim_conflicts"] == 2
+
+
+def test_per_definition_limit_defers_until_a_run_finishes(session_factory):
+    executor = HeldExecutor()
+    daemon = _daemon(session_factory, executor, per_definition_limit=1)
+
+    assert daemon.run_once() == 2 # One run of definition 1, one of definition 2
+    assert daemon.stats["deferred_definition_limit"] == 1
+    deferred = next(s for s in (1, 2) if s not in {args[0] for args, _ in executor.submitted})
+    assert _next_runs(session_factory)[deferred] == datetime(2024, 1, 1, 8, 0) # Still due, not claimed
+
+    executor.finish(next(i for i, (args, _) in enumerate(executor.submitted) if args[1] == 1))
+    assert daemon._wake.is_set()
+    assert daemon._dispatch_due() == 1
+    assert executor.submitted[-1][0][0] == deferred
+    assert daemon.metrics()["succeeded"] == 1
+
+
+def test_full_pool_leaves_due_schedules_unclaimed(session_factory):
+    executor = HeldExecutor()
+    daemon = _daemon(session_factory, executor, max_workers=1, per_definition_limit=5)
+
+    assert daemon.run_once() == 1
+    assert sorted(_next_runs(session_factory).values()).count(datetime(2024, 1, 1, 8, 0)) == 2 # Left for another node
+
+    executor.finish(0, status="FAILED")
+    assert daemon._dispatch_due() == 1
+    metrics = daemon.metrics()
+    assert (metrics["failed"], metrics["inflight"], metrics["run_duration_max_seconds"]) == (1, 1, 1.5)
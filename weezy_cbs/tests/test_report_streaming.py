@@ -0,0 +1,92 @@
+import gzip
+import io
+import json
+import tracemalloc
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from weezy_cbs.reports_analytics.report_streaming import LocalReportStore, stream_report_to_store, write_report_stream
+
+COLUMNS = ["id", "account_number", "amount", "posted_at"]
+
+
+def _batches(total_rows, batch_size=1000):
+    # Rows are generated lazily, like a server-side cursor, so only one batch exists at a time
+    for start in range(0, total_rows, batch_size):
+        yield [
+            (i, f"{i:010d}", Decimal("1250.75"), datetime(2024, 1, 31, 12, 0))
+            for i in range(start, min(total_rows, start + batch_size))
+        ]
+
+
+class _DiscardingSink(io.RawIOBase):
+    def writable(self):
+        return True
+
+    def write(self, b):
+        return len(b)
+
+
+def _peak_memory(total_rows, output_format):
+    tracemalloc.start()
+    try:
+        write_report_stream(COLUMNS, _batches(total_rows), output_format, _DiscardingSink())
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_peak_memory_is_independent_of_result_size():
+    for output_format in ("CSV", "JSONL", "JSON"):
+        small = _peak_memory(5_000, output_format)
+        large = _peak_memory(100_000, output_format) # 20x the rows
+        assert large < small * 1.25, (output_format, small, large)
+
+
+def test_streamed_outputs_round_trip():
+    for output_format in ("CSV", "JSONL", "JSON"):
+        out = io.BytesIO()
+        rows, size = write_report_stream(COLUMNS, _batches(2500), output_format, out)
+        assert rows == 2500
+        assert size == len(out.getvalue())
+        text = gzip.decompress(out.getvalue()).decode("utf-8")
+        if output_format == "CSV":
+            lines = text.splitlines()
+            assert lines[0] == ",".join(COLUMNS) and len(lines) == 2501
+        elif output_format == "JSONL":
+            lines = text.splitlines()
+            assert len(lines) == 2500 and json.loads(lines[0])["amount"] == "1250.75"
+        else:
+            assert len(json.loads(text)) == 2500
+
+
+def test_store_writes_final_file(tmp_path):
+    report = stream_report_to_store(COLUMNS, _batches(1000, batch_size=100), "CSV", "daily_gl", store=LocalReportStore(str(tmp_path)))
+    assert report.file_name == "daily_gl.csv.gz"
+    assert report.rows_written == 1000
+    assert report.bytes_written == (tmp_path / "daily_gl.csv.gz").stat().st_size
+    assert [p.name for p in tmp_path.iterdir()] == ["daily_gl.csv.gz"] # No leftover .part file
+
+
+def test_columnar_outputs_are_typed(tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+    import sqlalchemy as sa
+    column_types = {"id": sa.Integer(), "account_number": sa.String(10), "amount": sa.Numeric(18, 2), "posted_at": sa.DateTime()}
+    store = LocalReportStore(str(tmp_path))
+
+    parquet = stream_report_to_store(COLUMNS, _batches(2500), "PARQUET", "gl", store=store, column_types=column_types,
+                                     dictionary_columns=["account_number"])
+    table = pq.read_table(parquet.file_path)
+    assert table.num_rows == parquet.rows_written == 2500
+    assert table.schema.field("amount").type == pa.decimal128(18, 2)
+    assert table.schema.field("posted_at").type == pa.timestamp("us")
+    assert table.column("amount")[0].as_py() == Decimal("1250.75")
+
+    arrow = stream_report_to_store(COLUMNS, _batches(2500), "ARROW", "gl", store=store) # Types inferred from the first batch
+    with pa.memory_map(arrow.file_path) as source:
+        table = pa.ipc.open_file(source).read_all()
+    assert table.num_rows == 2500
+    assert table.schema.field("amount").type == pa.decimal128(38, 2)
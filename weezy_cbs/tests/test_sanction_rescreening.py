@@ -0,0 +1,116 @@
+import json
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from weezy_cbs.accounts_ledger_management.models import Account # Mapped so the customer relationships resolve
+from weezy_cbs.compliance_regulatory_reporting import sanction_rescreening
+from weezy_cbs.compliance_regulatory_reporting.models import (
+    SanctionAlert, SanctionListEntry, SanctionListEntryChange, SanctionListVersion, SanctionScreeningLog, SanctionScreeningRun,
+)
+from weezy_cbs.compliance_regulatory_reporting.sanction_lists import load_sanction_list
+from weezy_cbs.compliance_regulatory_reporting.sanction_rescreening import get_customer_name_index, rescreen_list_version
+from weezy_cbs.compliance_regulatory_reporting.sanctions_index import SanctionEntry
+from weezy_cbs.customer_identity_management.models import Customer, CustomerTypeEnum
+from weezy_cbs.database import Base
+from weezy_cbs.transaction_management.models import FinancialTransaction # Mapped so the compliance relationships resolve
+
+TABLES = [Customer, SanctionScreeningRun, SanctionListVersion, SanctionListEntry, SanctionListEntryChange, SanctionScreeningLog, SanctionAlert]
+
+ROSTOV = SanctionEntry("OFAC_SDN", "100", "INDIVIDUAL", "Viktor Ivanovich ROSTOV", program="UKRAINE-EO13660")
+PETROV = SanctionEntry("OFAC_SDN", "200", "INDIVIDUAL", "PETROV, Ivan")
+ORLOV = SanctionEntry("OFAC_SDN", "100", "INDIVIDUAL", "Vladimir ORLOV") # Entry 100 renamed to someone else
+
+
+@pytest.fixture()
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(sanction_rescreening, "_customer_index", None)
+    engine = create_engine(f"sqlite:///{tmp_path / 'rescreen.db'}")
+    Base.metadata.create_all(bind=engine, tables=[model.__table__ for model in TABLES])
+    session = sessionmaker(bind=engine)()
+    session.add_all([
+        Customer(id=1, customer_type=CustomerTypeEnum.INDIVIDUAL, first_name="Viktor", last_name="Rostov", phone_number="08030000001", bvn="22200000001"),
+        Customer(id=2, customer_type=CustomerTypeEnum.CORPORATE, company_name="Rostov Shipping Co", phone_number="08030000002"),
+        Customer(id=3, customer_type=CustomerTypeEnum.INDIVIDUAL, first_name="Ada", last_name="Obi", phone_number="08030000003"),
+        Customer(id=4, customer_type=CustomerTypeEnum.INDIVIDUAL, first_name="Ivan", last_name="Petrov", phone_number="08030000004"),
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+
+def _load_and_rescreen(db, *entries):
+    version = load_sanction_list(db, "OFAC_SDN", entries)
+    return rescreen_list_version(db, version.id)
+
+def _alerts(db):
+    db.expire_all()
+    return {(a.customer_id, a.entry_uid): a.status for a in db.query(SanctionAlert)}
+
+def _set_alert(db, customer_id, status):
+    db.query(SanctionAlert).filter(SanctionAlert.customer_id == customer_id).update({"status": status})
+    db.commit()
+
+
+def test_added_entries_are_matched_against_customers(db):
+    result = _load_and_rescreen(db, ROSTOV)
+
+    assert (result.entries_screened, result.customers_matched, result.alerts_opened) == (1, 1, 1)
+    assert _alerts(db) == {(1, "100"): "OPEN"} # The company is not an individual match
+    [log] = db.query(SanctionScreeningLog).all()
+    [match] = json.loads(log.match_details_json)
+    assert (log.customer_id, log.bvn_screened, log.name_screened) == (1, "22200000001", "Viktor Rostov")
+    assert match["details"].endswith("list update version 1") and match["entry_uid"] == "100"
+
+
+def test_only_the_version_diff_is_screened(db):
+    _load_and_rescreen(db, ROSTOV)
+    result = _load_and_rescreen(db, ROSTOV, PETROV) # Unchanged entry 100 is not screened again
+
+    assert (result.entries_screened, result.customers_matched, result.alerts_opened) == (1, 1, 1)
+    assert _alerts(db) == {(1, "100"): "OPEN", (4, "200"): "OPEN"}
+    assert db.query(SanctionScreeningLog).count() == 2
+
+
+def test_removed_or_no_longer_matching_entries_retire_open_alerts(db):
+    _load_and_rescreen(db, ROSTOV, PETROV)
+    result = _load_and_rescreen(db, ORLOV) # 100 changed beyond recognition, 200 delisted
+
+    assert (result.entries_screened, result.alerts_retired, result.customers_matched) == (1, 2, 0)
+    assert _alerts(db) == {(1, "100"): "RETIRED", (4, "200"): "RETIRED"}
+    retired = db.query(SanctionAlert).filter(SanctionAlert.entry_uid == "200").one()
+    assert retired.status_reason == "Entry removed from OFAC_SDN (list version 2)" and retired.retired_at is not None
+
+
+def test_confirmed_alerts_are_never_retired(db):
+    _load_and_rescreen(db, ROSTOV, PETROV)
+    _set_alert(db, 4, "CONFIRMED")
+    assert _load_and_rescreen(db, ROSTOV).alerts_retired == 0
+    assert _alerts(db)[(4, "200")] == "CONFIRMED"
+
+
+def test_alerts_reopen_on_relisting_or_a_changed_entry(db):
+    _load_and_rescreen(db, ROSTOV, PETROV)
+    _set_alert(db, 1, "CLEARED")
+    _load_and_rescreen(db, ROSTOV) # PETROV delisted: retired
+
+    relisted = _load_and_rescreen(db, ROSTOV, PETROV)
+    assert relisted.alerts_opened == 1 and _alerts(db) == {(1, "100"): "CLEARED", (4, "200"): "OPEN"}
+
+    with_alias = SanctionEntry("OFAC_SDN", "100", "INDIVIDUAL", ROSTOV.primary_name, ["Viktor Rostoff"], program=ROSTOV.program)
+    changed = _load_and_rescreen(db, with_alias, PETROV) # Still matches: the cleared decision is revisited
+    assert (changed.alerts_opened, changed.alerts_retired) == (1, 0)
+    assert _alerts(db)[(1, "100")] == "OPEN"
+
+
+def test_customer_index_is_reused_until_customers_change(db):
+    index = get_customer_name_index(db)
+    assert get_customer_name_index(db) is index
+    assert sorted(e.primary_name for e in index.entries) == ["Ada Obi", "Ivan Petrov", "Rostov Shipping Co", "Viktor Rostov"]
+
+    db.add(Customer(id=5, customer_type=CustomerTypeEnum.INDIVIDUAL, first_name="Viktor", last_name="Rostov", phone_number="08030000005"))
+    db.commit()
+    rebuilt = get_customer_name_index(db)
+    assert rebuilt is not index and len(rebuilt) == 5
+    assert _load_and_rescreen(db, ROSTOV).customers_matched == 2
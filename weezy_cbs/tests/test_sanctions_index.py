@@ -0,0 +1,164 @@
+import json
+import pickle
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from weezy_cbs.accounts_ledger_management.models import Account # Mapped so the customer relationships resolve
+from weezy_cbs.compliance_regulatory_reporting import sanctions_index
+from weezy_cbs.compliance_regulatory_reporting.models import (
+    SanctionAlert, SanctionListEntry, SanctionListEntryChange, SanctionListVersion, SanctionScreeningLog, SanctionScreeningRun,
+)
+from weezy_cbs.compliance_regulatory_reporting.sanction_lists import (
+    load_sanction_list, parse_jsonl, parse_ofac_sdn_csv, parse_un_consolidated_xml,
+)
+from weezy_cbs.compliance_regulatory_reporting.sanctions_index import (
+    SanctionEntry, SanctionsIndex, build_sanctions_index, get_sanctions_index, normalize_name, phonetic_key, screen_customers,
+)
+from weezy_cbs.customer_identity_management.models import Customer, CustomerTypeEnum
+from weezy_cbs.database import Base
+from weezy_cbs.transaction_management.models import FinancialTransaction # Mapped so the compliance relationships resolve
+
+TABLES = [Customer, SanctionScreeningRun, SanctionListVersion, SanctionListEntry, SanctionListEntryChange, SanctionScreeningLog, SanctionAlert]
+
+ENTRIES = [
+    SanctionEntry("OFAC_SDN", "1", "INDIVIDUAL", "Muammar Mohammed Abu Minyar QADDAFI", ["Moammar Gadhafi", "Muammar al-Qadhafi"], "1942", "Libya", "LIBYA2"),
+    SanctionEntry("OFAC_SDN", "2", "ORGANIZATION", "Rostov Shipping Company Ltd"),
+    SanctionEntry("UN_CONSOLIDATED", "3", "INDIVIDUAL", "Viktor Ivanovich ROSTOV", date_of_birth="1961"),
+    SanctionEntry("UN_CONSOLIDATED", "4", "INDIVIDUAL", "Ali Hassan"),
+]
+
+
+@pytest.fixture()
+def index():
+    return SanctionsIndex(ENTRIES)
+
+
+def test_names_are_normalized_for_matching():
+    assert normalize_name("Alhaji Dr. Muhammad  Bello-Ümar") == "bello muhammad umar"
+    assert normalize_name("Petrova, Elena") == normalize_name("ELENA PETROVA")
+    assert normalize_name("The Company Ltd") == "company ltd the" # Only stop words: kept as is
+    assert phonetic_key("muhammad") == phonetic_key("mohammed")
+
+
+def test_transliterated_alias_matches_its_entry(index):
+    [match] = index.screen("Moamar Kadhafi")
+    assert (match["entry_uid"], match["matched_name"]) == ("1", "Moammar Gadhafi")
+    assert match["details"] == "Name match on OFAC_SDN (LIBYA2); alias of Muammar Mohammed Abu Minyar QADDAFI"
+
+
+def test_word_order_and_accents_do_not_matter(index):
+    assert [m["entry_uid"] for m in index.screen("Mr. Róstov Víktor", "INDIVIDUAL")] == ["3"]
+    assert index.screen("Rostov Viktor")[0]["score"] == index.screen("Viktor Rostov")[0]["score"]
+
+
+def test_entity_type_and_date_of_birth_narrow_matches(index):
+    assert [m["entry_uid"] for m in index.screen("Rostov Shipping", "ORGANIZATION")] == ["2"]
+    assert index.screen("Rostov Shipping", "INDIVIDUAL") == []
+
+    [conflict] = index.screen("Viktor Rostov", "INDIVIDUAL", "1990-02-01", threshold=0.5)
+    assert conflict["details"].endswith("listed date of birth 1961 differs")
+    assert conflict["score"] == pytest.approx(index.screen("Viktor Rostov", "INDIVIDUAL", "1961-05-05")[0]["score"] - 0.1, abs=1e-4)
+
+
+def test_partial_or_unrelated_names_stay_below_threshold(index):
+    assert index.screen("Ali") == [] # One shared token of a two-token name
+    assert index.screen("Chinedu Okafor", threshold=0.5) == []
+    assert index.screen("") == []
+
+
+def test_index_survives_pickling_for_worker_processes(index):
+    copy = pickle.loads(pickle.dumps(index))
+    assert copy.screen("Moamar Kadhafi") == index.screen("Moamar Kadhafi")
+    assert copy.list_names == ["OFAC_SDN", "UN_CONSOLIDATED"]
+
+
+def test_published_list_formats_are_parsed(tmp_path):
+    sdn, alt = tmp_path / "sdn.csv", tmp_path / "alt.csv"
+    sdn.write_text('36,"AEROCARIBBEAN AIRLINES",-0-,"CUBA",-0-,-0-,-0-,-0-,-0-,-0-,-0-,"Havana, Cuba."\n'
+                   '173,"HAQQANI, Jalaluddin","individual","SDGT",-0-,-0-,-0-,-0-,-0-,-0-,-0-,"DOB 1939; nationality Afghanistan; alt. DOB 1942."\n')
+    alt.write_text('173,21,"aka","HAQANI, Jalaluddin",-0-\n173,22,"aka","-0-",-0-\n')
+    airline, haqqani = parse_ofac_sdn_csv(str(sdn), str(alt))
+    assert (airline.entity_type, airline.date_of_birth, airline.program) == ("ORGANIZATION", None, "CUBA")
+    assert (haqqani.entity_type, haqqani.aliases, haqqani.date_of_birth, haqqani.nationality) == (
+        "INDIVIDUAL", ["HAQANI, Jalaluddin"], "1939", "Afghanistan")
+
+    un = tmp_path / "consolidated.xml"
+    un.write_text("""<CONSOLIDATED_LIST><INDIVIDUALS><INDIVIDUAL><DATAID>6908555</DATAID><FIRST_NAME>ABDUL</FIRST_NAME>
+        <SECOND_NAME>GHANI</SECOND_NAME><UN_LIST_TYPE>Taliban</UN_LIST_TYPE><NATIONALITY><VALUE>Afghanistan</VALUE></NATIONALITY>
+        <INDIVIDUAL_ALIAS><ALIAS_NAME>Abdul Ghani Baradar</ALIAS_NAME></INDIVIDUAL_ALIAS><INDIVIDUAL_ALIAS><ALIAS_NAME/></INDIVIDUAL_ALIAS>
+        <INDIVIDUAL_DATE_OF_BIRTH><YEAR>1968</YEAR></INDIVIDUAL_DATE_OF_BIRTH></INDIVIDUAL></INDIVIDUALS>
+        <ENTITIES><ENTITY><DATAID>110</DATAID><FIRST_NAME>AL RASHID TRUST</FIRST_NAME></ENTITY></ENTITIES></CONSOLIDATED_LIST>""")
+    person, trust = parse_un_consolidated_xml(str(un))
+    assert (person.entry_uid, person.primary_name, person.aliases, person.date_of_birth, person.nationality, person.program) == (
+        "6908555", "ABDUL GHANI", ["Abdul Ghani Baradar"], "1968", "Afghanistan", "Taliban")
+    assert (trust.entity_type, trust.date_of_birth) == ("ORGANIZATION", None)
+
+    local = tmp_path / "local.jsonl"
+    local.write_text('{"entry_uid": 9, "primary_name": "Bad Actor", "aliases": ["B. Actor"]}\n\n')
+    [entry] = parse_jsonl(str(local), "NFIU_LOCAL")
+    assert (entry.list_name, entry.entry_uid, entry.aliases) == ("NFIU_LOCAL", "9", ["B. Actor"])
+
+
+@pytest.fixture()
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sanctions.db'}")
+    Base.metadata.create_all(bind=engine, tables=[model.__table__ for model in TABLES])
+    session = sessionmaker(bind=engine)()
+    session.add_all([
+        Customer(id=1, customer_type=CustomerTypeEnum.INDIVIDUAL, first_name="Viktor", last_name="Rostov", phone_number="08030000001", bvn="22200000001"),
+        Customer(id=2, customer_type=CustomerTypeEnum.CORPORATE, company_name="Rostov Shipping Co", phone_number="08030000002"),
+        Customer(id=3, customer_type=CustomerTypeEnum.INDIVIDUAL, first_name="Ada", last_name="Obi", phone_number="08030000003"),
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+
+def _changes(db, version):
+    return sorted((c.entry_uid, c.change_type) for c in db.query(SanctionListEntryChange).filter(SanctionListEntryChange.version_id == version.id))
+
+
+def test_loading_a_list_records_its_diff(db):
+    first = load_sanction_list(db, "OFAC_SDN", ENTRIES[:2])
+    assert (first.entries_added, first.entries_total) == (2, 2)
+
+    reordered = SanctionEntry("OFAC_SDN", "1", "INDIVIDUAL", ENTRIES[0].primary_name, ENTRIES[0].aliases[::-1], "1942", "Libya", "LIBYA2")
+    added = SanctionEntry("OFAC_SDN", "5", "INDIVIDUAL", "Ivan Petrov")
+    second = load_sanction_list(db, "OFAC_SDN", [reordered, added, added]) # Alias order is not a change; duplicate uids are loaded once
+    assert _changes(db, second) == [("2", "REMOVED"), ("5", "ADDED")]
+
+    changed = SanctionEntry("OFAC_SDN", "5", "INDIVIDUAL", "Ivan Petrov", ["Ivan Petroff"])
+    third = load_sanction_list(db, "OFAC_SDN", [reordered, changed, ENTRIES[1]])
+    assert _changes(db, third) == [("2", "ADDED"), ("5", "CHANGED")] # Re-listed entries are new again
+    previous = db.query(SanctionListEntryChange).filter(SanctionListEntryChange.version_id == third.id,
+                                                        SanctionListEntryChange.entry_uid == "5").one()
+    assert json.loads(previous.previous_json)["aliases_json"] is None
+    assert (third.entries_added, third.entries_changed, third.entries_removed, third.entries_total) == (1, 1, 0, 3)
+
+
+def test_index_is_built_from_active_entries_and_rebuilt_after_a_load(db, monkeypatch):
+    monkeypatch.setattr(sanctions_index, "_index", None)
+    load_sanction_list(db, "OFAC_SDN", ENTRIES[:2])
+    index = get_sanctions_index(db)
+    assert len(index) == 2 and get_sanctions_index(db) is index
+
+    load_sanction_list(db, "OFAC_SDN", ENTRIES[1:2]) # Entry 1 is delisted; the load invalidates the cached index
+    rebuilt = get_sanctions_index(db)
+    assert rebuilt is not index and [e.entry_uid for e in rebuilt.entries] == ["2"]
+    assert len(build_sanctions_index(db)) == 1
+
+
+def test_customers_are_screened_in_batches_and_logged(db):
+    progress = []
+    result = screen_customers(db, SanctionsIndex(ENTRIES), workers=1, batch_size=2, on_progress=lambda r: progress.append(r.customers_screened))
+
+    assert (result.customers_screened, result.matches_found, result.alerts_opened) == (3, 2, 2)
+    assert progress == [2, 3]
+    logs = {log.customer_id: log for log in db.query(SanctionScreeningLog)}
+    assert (logs[1].match_found, logs[1].bvn_screened, logs[1].name_screened) == (True, "22200000001", "Viktor Rostov")
+    assert json.loads(logs[2].match_details_json)[0]["entry_uid"] == "2" # Companies screened by company name
+    assert not logs[3].match_found and logs[3].match_details_json is None
+    assert json.loads(logs[3].sanction_lists_checked) == ["OFAC_SDN", "UN_CONSOLIDATED"]
+    assert sorted((a.customer_id, a.entry_uid, a.status) for a in db.query(SanctionAlert)) == [(1, "3", "OPEN"), (2, "2", "OPEN")]
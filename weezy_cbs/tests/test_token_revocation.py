@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from jose import jwt
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from weezy_cbs.accounts_ledger_management.models import Account # Mapped so the customer relationships resolve
+from weezy_cbs.core_infrastructure_config_engine.models import AuditLog
+from weezy_cbs.core_infrastructure_config_engine.password_hashing import PasswordHashingService
+from weezy_cbs.customer_identity_management.models import Customer
+from weezy_cbs.database import Base
+from weezy_cbs.digital_channels_modules import api, services, token_revocation
+from weezy_cbs.digital_channels_modules.login_throttle import InMemoryLoginThrottleStore, LoginThrottle
+from weezy_cbs.digital_channels_modules.models import ChannelTypeEnum, DigitalUserProfile, RegisteredDevice, SessionLog
+from weezy_cbs.digital_channels_modules.token_revocation import TokenRevocationIndex, _to_epoch
+
+TABLES = [Customer, DigitalUserProfile, RegisteredDevice, SessionLog, AuditLog]
+LIFETIME = timedelta(minutes=30)
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    fake = FakeClock(1_700_000_000.0)
+    monkeypatch.setattr(token_revocation, "time", fake)
+    return fake
+
+
+def test_revoked_jti_is_rejected_until_its_token_expires(clock):
+    index = TokenRevocationIndex()
+    index.revoke("jti-1", clock.now + 60)
+    index.revoke("jti-2", clock.now + 600)
+    index.revoke("jti-old", clock.now - 1) # Already expired: JWT validation rejects it, nothing to keep
+    assert (index.is_revoked("jti-1"), index.is_revoked("jti-2"), index.is_revoked("jti-old"), index.is_revoked(None)) == (True, True, False, False)
+    assert len(index) == 2
+
+    clock.now += 61
+    assert not index.is_revoked("jti-1")
+    index.purge_expired()
+    assert len(index) == 1 and index.is_revoked("jti-2")
+
+
+def test_revoke_keeps_the_later_expiry_and_notifies_listeners(clock):
+    index = TokenRevocationIndex()
+    published = []
+    index.add_listener(lambda jti, exp: published.append((jti, exp)))
+    index.revoke("jti-1", clock.now + 600)
+    index.revoke("jti-1", clock.now + 60) # An earlier expiry does not shorten the revocation
+    index.revoke("jti-2", clock.now + 60, propagate=False) # Received from a peer: not re-published
+
+    clock.now += 120
+    assert index.is_revoked("jti-1")
+    assert published == [("jti-1", 1_700_000_600.0)]
+
+
+@pytest.fixture()
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sessions.db'}")
+    Base.metadata.create_all(bind=engine, tables=[model.__table__ for model in TABLES])
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    db.add(Customer(id=1, first_name="Ada", last_name="Obi", phone_number="08030000001"))
+    db.add(DigitalUserProfile(id=1, customer_id=1, username="ada", hashed_password=PasswordHashingService(rounds=4).hash_sync("password1"), is_active=True))
+    db.commit()
+    db.close()
+    return factory
+
+
+def test_rebuild_loads_only_ended_sessions_inside_the_token_lifetime(session_factory):
+    now = datetime.utcnow()
+    db = session_factory()
+    for jti, login_time, is_active in (("ended-recent", now - timedelta(minutes=10), False), ("still-active", now - timedelta(minutes=5), True),
+                                       ("ended-old", now - timedelta(minutes=45), False), (None, now - timedelta(minutes=1), False)):
+        db.add(SessionLog(digital_user_profile_id=1, channel=ChannelTypeEnum.MOBILE_BANKING_APP, session_token_jti=jti,
+                          login_time=login_time, is_active=is_active))
+    db.commit()
+
+    index = TokenRevocationIndex()
+    assert index.rebuild_from_session_logs(db, LIFETIME) == 1
+    assert index.is_revoked("ended-recent") and not index.is_revoked("still-active") and not index.is_revoked("ended-old")
+    assert index._revoked["ended-recent"] == pytest.approx(_to_epoch(now - timedelta(minutes=10) + LIFETIME), abs=1)
+    db.close()
+
+
+def test_each_token_carries_its_own_session_jti_and_logout_revokes_only_it(session_factory, monkeypatch):
+    index = TokenRevocationIndex()
+    monkeypatch.setattr(api, "token_revocation_index", index)
+    monkeypatch.setattr(services, "token_revocation_index", index)
+    monkeypatch.setattr(services, "password_hashing_service", PasswordHashingService(rounds=4))
+    monkeypatch.setattr(services, "login_throttle", LoginThrottle(InMemoryLoginThrottleStore(sweep_interval_seconds=None)))
+
+    def get_test_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+    app = FastAPI()
+    app.include_router(api.profiles_router)
+    app.dependency_overrides[api.get_db] = get_test_db
+    client = TestClient(app)
+
+    login = {"username": "ada", "password": "password1", "channel": "MOBILE_BANKING_APP"}
+    tokens = [client.post("/profiles/login", json=login).json()["access_token"] for _ in range(2)]
+    jtis = [jwt.get_unverified_claims(token)["jti"] for token in tokens]
+
+    db = session_factory()
+    assert sorted(jtis) == sorted(log.session_token_jti for log in db.query(SessionLog)) and jtis[0] != jtis[1]
+    db.close()
+
+    first, second = ({"Authorization": f"Bearer {token}"} for token in tokens)
+    assert client.post("/profiles/logout", headers=first).status_code == 200
+    assert index.is_revoked(jtis[0]) and not index.is_revoked(jtis[1])
+    assert client.get("/profiles/me", headers=first).status_code == 401
+    assert client.get("/profiles/me", headers=second).status_code == 200
@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from weezy_cbs.accounts_ledger_management.models import Account # Mapped so the customer relationships resolve
+from weezy_cbs.core_infrastructure_config_engine.models import AuditLog
+from weezy_cbs.core_infrastructure_config_engine.password_hashing import PasswordHashingService
+from weezy_cbs.customer_identity_management import duplicate_detection
+from weezy_cbs.customer_identity_management.models import Customer, CustomerDuplicateBlockingKey
+from weezy_cbs.database import Base
+from weezy_cbs.digital_channels_modules import services
+from weezy_cbs.digital_channels_modules.login_throttle import FailedLoginAuditWriter, InMemoryLoginThrottleStore, LoginThrottle
+from weezy_cbs.digital_channels_modules.models import DigitalUserProfile, USSDSession
+from weezy_cbs.digital_channels_modules.ussd_engine import InMemoryUSSDSessionStore, USSDSessionPersister
+
+TABLES = [Customer, CustomerDuplicateBlockingKey, DigitalUserProfile, USSDSession, AuditLog]
+PIN = "4321"
+
+
+@pytest.fixture()
+def session_factory(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'ussd.db'}")
+    Base.metadata.create_all(bind=engine, tables=[model.__table__ for model in TABLES])
+    factory = sessionmaker(bind=engine)
+
+    hashing = PasswordHashingService(rounds=4)
+    monkeypatch.setattr(services, "password_hashing_service", hashing)
+    monkeypatch.setattr(services, "login_throttle", LoginThrottle(InMemoryLoginThrottleStore(sweep_interval_seconds=None), username_limit=(3, 600, 600)))
+    monkeypatch.setattr(services, "failed_login_audit_writer", FailedLoginAuditWriter(session_factory=factory, flush_seconds=0.05))
+    monkeypatch.setattr(services.ussd_engine, "store", InMemoryUSSDSessionStore(sweep_interval_seconds=None))
+    monkeypatch.setattr(services.ussd_engine, "persister", USSDSessionPersister(session_factory=factory))
+
+    db = factory()
+    customer = Customer(id=1, first_name="Ada", last_name="Obi", phone_number="0803 000 0001")
+    db.add(customer)
+    duplicate_detection.index_customer(db, customer)
+    db.add(DigitalUserProfile(id=1, customer_id=1, username="ada", hashed_password="x", is_active=True,
+                              transaction_pin_hashed=hashing.hash_sync(PIN), is_transaction_pin_set=True))
+    db.commit()
+    db.close()
+    return factory
+
+
+def _login(factory, msisdn, pin, session_id):
+    db = factory()
+    try:
+        asyncio.run(services.ussd_engine.handle(session_id, msisdn, "", db=db))
+        asyncio.run(services.ussd_engine.handle(session_id, msisdn, "1", db=db))
+        return asyncio.run(services.ussd_engine.handle(session_id, msisdn, pin, db=db))
+    finally:
+        db.close()
+
+
+def test_profile_is_found_by_any_msisdn_format(session_factory):
+    db = session_factory()
+    assert db.query(Customer).one().phone_number_normalized == "8030000001"
+    db.query(CustomerDuplicateBlockingKey).delete() # The lookup does not depend on the duplicate-detection keys
+    for msisdn in ("2348030000001", "+2348030000001", "08030000001"):
+        assert services.ussd_service._get_profile_by_phone(db, msisdn).username == "ada"
+    assert services.ussd_service._get_profile_by_phone(db, "2348030000002") is None
+    db.close()
+
+
+def test_correct_pin_logs_in(session_factory):
+    assert _login(session_factory, "2348030000001", PIN, "s1").startswith("CON Welcome ada!")
+
+
+def test_wrong_pins_lock_the_msisdn_before_the_pin_is_checked(session_factory, monkeypatch):
+    responses = [_login(session_factory, "2348030000001", "0000", f"s{i}") for i in range(3)]
+    assert responses[:2] == ["END Invalid PIN. Please redial to try again."] * 2
+    assert responses[2].startswith("END Too many wrong PIN attempts")
+
+    async def must_not_verify(*args, **kwargs):
+        raise AssertionError("PIN checked while the MSISDN is locked")
+    monkeypatch.setattr(services.digital_user_profile_service, "verify_transaction_pin", must_not_verify)
+    # Same number in the customer's stored format shares the counter
+    assert _login(session_factory, "08030000001", PIN, "s4").startswith("END Too many wrong PIN attempts")
+
+    db = session_factory()
+    deadline = time.monotonic() + 5
+    while db.query(AuditLog).count() < 3 and time.monotonic() < deadline: # The writer thread may hold part of the queue
+        services.failed_login_audit_writer.drain()
+        time.sleep(0.05)
+    assert [(a.action_type, a.username_performing_action) for a in db.query(AuditLog)] == [("USSD_LOGIN_FAIL", "ada")] * 3
+    db.close()
+
+
+def test_unknown_numbers_are_throttled_too(session_factory):
+    responses = [_login(session_factory, "2348099999999", PIN, f"u{i}") for i in range(4)]
+    assert responses[-1].startswith("END Too many wrong PIN attempts")
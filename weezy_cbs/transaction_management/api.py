@@ -0,0 +1,45 @@
+# API Endpoints for Transaction Management
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from . import services, schemas
+# from weezy_cbs.database import get_db
+# from weezy_cbs.auth.dependencies import get_current_active_user, get_current_active_admin_user
+
+# Placeholder get_db and auth
+def get_db_placeholder(): yield None
+get_db = get_db_placeholder
+def get_current_active_admin_user_placeholder(): return {"id": "admin01", "role": "admin"}
+get_current_active_admin_user = get_current_active_admin_user_placeholder
+
+
+router = APIRouter(
+    prefix="/transactions",
+    tags=["Transaction Management"],
+    responses={404: {"description": "Not found"}},
+)
+
+@router.get("/{transaction_id}")
+def get_transaction(transaction_id: str, db: Session = Depends(get_db)):
+    """Look up a transaction by its reference."""
+    if db is None: raise HTTPException(status_code=503, detail="Database not configured for API.")
+    transaction = services.get_transaction_by_id(db, transaction_id)
+    if not transaction:
+        raise HTTPException(status_code=404, detail=f"Transaction {transaction_id} not found")
+    return services.transaction_event_payload(transaction)
+
+@router.post("/reversals", status_code=status.HTTP_201_CREATED)
+def reverse_transaction(
+    reversal_request: schemas.TransactionReversalRequest,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_active_admin_user)
+):
+    """Reverse a successful transaction. (Admin operation)"""
+    if db is None: raise HTTPException(status_code=503, detail="Database not configured for API.")
+    try:
+        reversal = services.reverse_transaction(db, reversal_request)
+    except services.NotFoundException as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except services.InvalidOperationException as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return services.transaction_event_payload(reversal)
@@ -2,6 +2,7 @@
 from sqlalchemy import Column, Integer, String, DateTime, Boolean, Numeric, ForeignKey, Enum as SQLAlchemyEnum, Text, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from weezy_cbs.database import Base # Use the shared Base
 
 import enum
 
@@ -96,10 +97,10 @@ class FinancialTransaction(Base):
     # related_internal_account_id = Column(Integer, ForeignKey("accounts.id"), nullable=True, index=True)
 
     # Timestamps
-    initiated_at = Column(DateTime(timezone=True), server_default=func.now())
+    initiated_at = Column(DateTime(timezone=True), server_default=func.now(), index=True) # Rollup bucket time
     processed_at = Column(DateTime(timezone=True), nullable=True)
     external_system_at = Column(DateTime(timezone=True), nullable=True)
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True) # Rollup watermark
 
     # External System References
     external_transaction_id = Column(String(100), unique=True, nullable=True, index=True)
@@ -155,6 +155,19 @@ class NIPFundsTransferAdviseResponse(BaseModel): # Renamed from NIPFundsTransfer
     response_code: str
     # Other fields from NIBSS response like fee, etc.
 
+class NIPIncomingCreditNotification(BaseModel): # Parsed NIBSS inward credit webhook
+    nibss_session_id: str
+    name_enquiry_ref: Optional[str] = None
+    channel_code: Optional[str] = None
+    originator_account_number: str
+    originator_account_name: str
+    originator_bank_code: str
+    beneficiary_account_number: str
+    beneficiary_account_name: Optional[str] = None
+    amount: decimal.Decimal = Field(..., gt=0, decimal_places=2)
+    currency: Optional[str] = "NGN"
+    narration: Optional[str] = None
+
 # --- Bulk Payment Schemas ---
 class BulkPaymentItem(BaseModel):
     credit_account_number: str = Field(..., max_length=20)
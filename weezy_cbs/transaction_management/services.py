@@ -3,9 +3,12 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func, and_, or_
 from . import models, schemas
 from .models import TransactionStatusEnum, TransactionChannelEnum, CurrencyEnum # Direct enum access
+from typing import List, Optional
+from dateutil.relativedelta import relativedelta
 import decimal
 import uuid # For generating unique transaction IDs
 from datetime import datetime, timedelta
+from weezy_cbs.core_infrastructure_config_engine import event_bus
 
 # Placeholder for other service integrations
 # from weezy_cbs.accounts_ledger_management.services import (
@@ -25,6 +28,22 @@ class ExternalServiceException(Exception): pass
 def _generate_transaction_id(prefix="WZYTXN"):
     return f"{prefix}{uuid.uuid4().hex[:16].upper()}"
 
+def transaction_event_payload(transaction: models.FinancialTransaction) -> dict:
+    # Plain values only: subscribers (e.g. the AML engine) handle the event on other threads, after the session is gone
+    return {
+        "id": transaction.id,
+        "transaction_type": getattr(transaction.transaction_type, "value", transaction.transaction_type),
+        "channel": getattr(transaction.channel, "value", transaction.channel),
+        "amount": transaction.amount,
+        "currency": getattr(transaction.currency, "value", transaction.currency),
+        "debit_account_number": transaction.debit_account_number,
+        "credit_account_number": transaction.credit_account_number,
+        "debit_customer_id": transaction.debit_customer_id,
+        "credit_customer_id": transaction.credit_customer_id,
+        "initiated_at": transaction.initiated_at,
+        "processed_at": transaction.processed_at,
+    }
+
 # --- Core Transaction Processing ---
 def initiate_transaction(db: Session, transaction_in: schemas.TransactionCreateRequest, initiated_by_customer_id: Optional[int] = None) -> models.FinancialTransaction:
     """
@@ -135,6 +154,9 @@ def update_transaction_status(
         if external_transaction_id: # If external system involved, use its timestamp if available
              transaction.external_system_at = datetime.utcnow() # Or parse from external system response
 
+    if new_status == TransactionStatusEnum.SUCCESSFUL: # Money moved: AML monitoring and other consumers
+        event_bus.publish_after_commit(db, event_bus.FINANCIAL_TRANSACTION_COMMITTED, transaction=transaction_event_payload(transaction))
+
     db.commit()
     db.refresh(transaction)
     return transaction
@@ -206,7 +228,7 @@ async def perform_nip_name_enquiry(
 async def process_outgoing_nip_funds_transfer(
     db: Session,
     transaction_id: str,
-    nip_request_details: schemas.NIPFundsTransferRequest # Contains all NIBSS required fields
+    nip_request_details: schemas.NIPFundsTransferRequestDetails # Contains all NIBSS required fields
 ) -> models.FinancialTransaction:
     """
     Processes an initiated NIP transaction by calling NIBSS.
@@ -493,7 +515,7 @@ def reverse_transaction(db: Session, reversal_request: schemas.TransactionRevers
 
 
 # --- Standing Order Services ---
-def create_standing_order(db: Session, so_in: schemas.StandingOrderCreate) -> models.StandingOrder:
+def create_standing_order(db: Session, so_in: schemas.StandingOrderCreateRequest) -> models.StandingOrder:
     # Validate accounts, frequency, dates etc.
     # debit_account = get_deposit_account(db, so_in.debit_account_number)
     # if not debit_account or debit_account.customer_id != so_in.customer_id:
@@ -576,7 +598,7 @@ def process_standing_order_execution(db: Session, standing_order_id: int) -> Opt
         # This is simplified; real processing depends on if it's intra or interbank
         if so.credit_bank_code and so.credit_bank_code != "OUR_BANK_CODE":
             # Simulate NIP processing for interbank SO
-            # nip_req = schemas.NIPFundsTransferRequest(...) # build from so and financial_txn
+            # nip_req = schemas.NIPFundsTransferRequestDetails(...) # build from so and financial_txn
             # process_nip_funds_transfer(db, financial_txn.id, nip_req)
             update_transaction_status(db, financial_txn.id, TransactionStatusEnum.SUCCESSFUL, "00", "SO Interbank Mock Success", system_remarks="Mock SO NIP")
         else:
@@ -613,7 +635,7 @@ def process_standing_order_execution(db: Session, standing_order_id: int) -> Opt
 
 
 # --- Bulk Payment Services (Simplified) ---
-def create_bulk_payment_batch(db: Session, batch_request: schemas.BulkPaymentBatchRequest) -> models.BulkPaymentBatch:
+def create_bulk_payment_batch(db: Session, batch_request: schemas.BulkPaymentBatchCreateRequest) -> models.BulkPaymentBatch:
     batch_id = "BULK_" + uuid.uuid4().hex[:10].upper()
     total_amount = sum(item.amount for item in batch_request.items)
 
@@ -656,7 +678,7 @@ def create_bulk_payment_batch(db: Session, batch_request: schemas.BulkPaymentBat
     return db_batch
 
 # --- Transaction Dispute Services ---
-def log_transaction_dispute(db: Session, dispute_in: schemas.TransactionDisputeCreate, customer_id: int) -> models.TransactionDispute:
+def log_transaction_dispute(db: Session, dispute_in: schemas.TransactionDisputeCreateRequest, customer_id: int) -> models.TransactionDispute:
     # Check if transaction exists
     txn = get_transaction_by_id(db, dispute_in.financial_transaction_id)
     if not txn:
@@ -1,7 +1,9 @@
 # API Endpoints for Treasury & Liquidity Management (mostly Admin/System/Trader)
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, File, UploadFile
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import io
+from datetime import date
 
 from . import services, schemas, models
 # from weezy_cbs.database import get_db
@@ -25,7 +27,7 @@ router = APIRouter(
 # --- Bank Cash Position Endpoints ---
 @router.post("/cash-positions", response_model=schemas.BankCashPositionResponse, status_code=status.HTTP_201_CREATED)
 def record_or_update_daily_cash_position(
-    position_data: schemas.BankCashPositionCreate,
+    position_data: schemas.BankCashPositionCreateRequest,
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_active_admin_user) # Or a specific treasury ops role
 ):
@@ -86,7 +88,7 @@ def get_fx_deal_by_reference(deal_reference: str, db: Session = Depends(get_db))
 @router.patch("/fx-deals/{deal_id}/status", response_model=schemas.FXTransactionResponse)
 def update_fx_deal_status(
     deal_id: int,
-    status_update: schemas.FXTransactionStatusUpdate,
+    status_update: schemas.FXTransactionStatusUpdateRequest,
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_active_treasury_user) # Or treasury ops role
 ):
@@ -159,9 +161,44 @@ def generate_bank_liquidity_forecast(
     if db is None: raise HTTPException(status_code=503, detail="Database not configured for API.")
     try:
         return services.generate_liquidity_forecast(db, forecast_request)
+    except services.CalculationException as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Calculation error: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to generate liquidity forecast: {str(e)}")
 
+# --- FX Position & Revaluation Endpoints (Treasury Role) ---
+@router.post("/fx-rate-snapshots", response_model=schemas.FXRateSnapshotResponse, status_code=status.HTTP_201_CREATED)
+def record_fx_rate_snapshot(
+    snapshot_in: schemas.FXRateSnapshotCreateRequest,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_active_treasury_user)
+):
+    """Record the rates used to revalue FX positions (units of base currency per foreign unit)."""
+    if db is None: raise HTTPException(status_code=503, detail="Database not configured for API.")
+    return services.record_fx_rate_snapshot(db, snapshot_in, user_id=current_user["id"])
+
+@router.get("/fx-positions", response_model=schemas.FXPositionResponse)
+def get_fx_open_positions(
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_active_treasury_user)
+):
+    """Net open FX position per currency and per currency pair (intraday, from the position cache)."""
+    if db is None: raise HTTPException(status_code=503, detail="Database not configured for API.")
+    return services.get_fx_positions(db)
+
+@router.post("/fx-revaluations", response_model=schemas.FXRevaluationRunResponse, status_code=status.HTTP_201_CREATED)
+def run_fx_revaluation(
+    revaluation_in: schemas.FXRevaluationRequest,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_active_treasury_user)
+):
+    """Revalue FX positions against a rate snapshot and post the P&L to GL as one journal."""
+    if db is None: raise HTTPException(status_code=503, detail="Database not configured for API.")
+    try:
+        return services.revalue_fx_positions(db, revaluation_in, user_id=current_user["id"])
+    except services.CalculationException as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Calculation error: {str(e)}")
+
 # Paginated listing endpoints for FX, T-Bills, Interbank Placements (similar structure)
 @router.get("/fx-deals", response_model=schemas.PaginatedFXTransactionResponse)
 def list_all_fx_deals(
@@ -180,7 +217,26 @@ def list_all_fx_deals(
 # - /cbn-repo-operations
 
 # TODO: Endpoints for CBN Repo Operations management.
-# TODO: Endpoints for managing reconciliation with CBN settlement accounts (if any manual triggers/overviews).
+
+# --- CBN Settlement Reconciliation Endpoints (Treasury Ops) ---
+@router.post("/cbn-reconciliation/runs", response_model=schemas.CBNReconciliationRunResponse, status_code=status.HTTP_201_CREATED)
+def reconcile_cbn_settlement_statement(
+    statement_date: date = Query(..., description="Date of the CBN settlement statement"),
+    replace: bool = Query(False, description="Supersede an earlier reconciliation of the same date"),
+    statement_file: UploadFile = File(..., description="CBN settlement statement (CSV)"),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_active_treasury_user)
+):
+    """Reconcile a day's CBN settlement statement against our RTGS and treasury settlement entries."""
+    if db is None: raise HTTPException(status_code=503, detail="Database not configured for API.")
+    text_stream = io.TextIOWrapper(statement_file.file, encoding="utf-8-sig", newline="")
+    try:
+        return services.reconcile_cbn_statement(db, text_stream, statement_date, source_file_name=statement_file.filename,
+                                                user_id=current_user["id"], replace_existing=replace)
+    except services.InvalidOperationException as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    finally:
+        text_stream.detach()
 
 # Import necessary modules if not already at top
 from datetime import date
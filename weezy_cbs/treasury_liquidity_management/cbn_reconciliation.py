@@ -0,0 +1,449 @@
+# CBN settlement statement reconciliation
+#
+# Matches a day's CBN settlement account statement (RTGS and CRR movements on our account at CBN) against
+# our books. On the book side are successful RTGS transactions and treasury settlement legs: interbank
+# placements, T-bill purchases/maturities and CBN repos, each at its start or maturity date.
+#
+#   1. Book entries for the statement date +/- CBN_RECON_DATE_TOLERANCE_DAYS are loaded once. Those on the
+#      statement date are hashed on (reference, direction, amount in kobo).
+#   2. The statement CSV is streamed row by row. Each row probes the hash index: an O(1) exact match. Rows
+#      are bulk-inserted as CBNSettlementStatementEntry in chunks, so the file is never held in memory.
+#   3. Leftover rows go through a tolerance pass. First by reference: the closest amount wins, and a
+#      difference beyond CBN_RECON_AMOUNT_TOLERANCE is an AMOUNT_MISMATCH. Then by amount: entries are
+#      bucketed by amount, and only neighbouring buckets within the date window are probed.
+#   4. Statement rows still unmatched are MISSING_INTERNAL. Book entries dated on the statement date that
+#      were not matched are MISSING_ON_STATEMENT. Discrepancies are bulk-inserted.
+# All of this is linear in the statement and book sizes. The run's rows are committed together.
+#
+# Statement CSV columns: cbn_reference, value_date (YYYY-MM-DD, defaults to the statement date),
+# narration, debit_amount, credit_amount, balance. Amounts may use thousands separators.
+#
+#   python -m weezy_cbs.treasury_liquidity_management.cbn_reconciliation reconcile --file stmt.csv --date 2026-10-16 [--replace]
+import argparse
+import csv
+import os
+import time
+from datetime import date, datetime, timedelta
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+CBN_RECON_BANK_CODE = os.getenv("CBN_RECON_BANK_CODE", os.getenv("CBN_BANK_CODE", "999")) # Our bank code on RTGS messages
+CBN_RECON_AMOUNT_TOLERANCE = Decimal(os.getenv("CBN_RECON_AMOUNT_TOLERANCE", "1.00")) # NGN, tolerance pass only
+CBN_RECON_DATE_TOLERANCE_DAYS = int(os.getenv("CBN_RECON_DATE_TOLERANCE_DAYS", "1"))
+CBN_RECON_INSERT_CHUNK = int(os.getenv("CBN_RECON_INSERT_CHUNK", "5000"))
+
+STATEMENT_COLUMNS = ("cbn_reference", "value_date", "narration", "debit_amount", "credit_amount", "balance")
+REQUIRED_STATEMENT_COLUMNS = ("cbn_reference", "debit_amount", "credit_amount")
+
+DEBIT = "DEBIT" # Money leaving our account at CBN
+CREDIT = "CREDIT"
+
+MATCHED = "MATCHED"
+MATCHED_TOLERANCE = "MATCHED_TOLERANCE"
+DISCREPANCY = "DISCREPANCY"
+UNRECONCILED = "UNRECONCILED"
+
+MISSING_INTERNAL = "MISSING_INTERNAL"
+MISSING_ON_STATEMENT = "MISSING_ON_STATEMENT"
+AMOUNT_MISMATCH = "AMOUNT_MISMATCH"
+
+
+class StatementFormatError(ValueError):
+    pass
+
+
+def _normalize_reference(value: Any) -> str:
+    return "".join(str(value or "").split()).upper()
+
+def _money(value: Any) -> Decimal:
+    value = value if isinstance(value, Decimal) else Decimal(str(value))
+    return value.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+def _minor_units(amount: Decimal) -> int:
+    return int(amount.scaleb(2).to_integral_value())
+
+def _as_date(value: Any) -> date:
+    if isinstance(value, str): # SQLite returns dates/datetimes as text
+        return date.fromisoformat(value[:10])
+    return value.date() if isinstance(value, datetime) else value
+
+
+class BookEntry:
+    """One movement our books expect on the CBN settlement account."""
+    __slots__ = ("source", "source_id", "reference", "direction", "amount", "amount_minor", "value_date", "matched")
+
+    def __init__(self, source: str, source_id: Any, reference: Any, direction: str, amount: Any, value_date: date):
+        self.source = source
+        self.source_id = source_id
+        self.reference = _normalize_reference(reference)
+        self.direction = direction
+        self.amount = _money(amount)
+        self.amount_minor = _minor_units(self.amount)
+        self.value_date = value_date
+        self.matched = False
+
+    @property
+    def internal_reference(self) -> str:
+        return f"{self.source}:{self.source_id}"[:50]
+
+    @property
+    def signed_amount(self) -> Decimal:
+        return self.amount if self.direction == CREDIT else -self.amount
+
+
+class StatementLine:
+    __slots__ = ("line_number", "cbn_reference", "reference", "direction", "amount", "amount_minor", "value_date")
+
+    def __init__(self, line_number: int, cbn_reference: str, direction: str, amount: Decimal, value_date: date):
+        self.line_number = line_number
+        self.cbn_reference = cbn_reference
+        self.reference = _normalize_reference(cbn_reference)
+        self.direction = direction
+        self.amount = amount
+        self.amount_minor = _minor_units(amount)
+        self.value_date = value_date
+
+    @property
+    def signed_amount(self) -> Decimal:
+        return self.amount if self.direction == CREDIT else -self.amount
+
+
+# --- Book side ---
+def _rtgs_entries(db, window_start: date, window_end: date) -> Iterator[BookEntry]:
+    from sqlalchemy import func, select
+    from weezy_cbs.transaction_management.models import (
+        CurrencyEnum, FinancialTransaction as FT, TransactionChannelEnum, TransactionStatusEnum,
+    )
+    booked_at = func.coalesce(FT.processed_at, FT.initiated_at)
+    stmt = (select(FT.id, FT.external_transaction_id, FT.amount, FT.credit_bank_code, booked_at)
+            .where(FT.channel == TransactionChannelEnum.RTGS, FT.status == TransactionStatusEnum.SUCCESSFUL,
+                   FT.currency == CurrencyEnum.NGN, FT.is_reversal.isnot(True),
+                   FT.initiated_at >= datetime.combine(window_start - timedelta(days=1), datetime.min.time()), # Range on the indexed column
+                   FT.initiated_at < datetime.combine(window_end + timedelta(days=1), datetime.min.time())))
+    for transaction_id, external_id, amount, credit_bank_code, booked in db.execute(stmt):
+        value_date = _as_date(booked)
+        if window_start <= value_date <= window_end:
+            outward = bool(credit_bank_code) and credit_bank_code != CBN_RECON_BANK_CODE
+            yield BookEntry("RTGS", transaction_id, external_id or transaction_id, DEBIT if outward else CREDIT, amount, value_date)
+
+def _treasury_entries(db, window_start: date, window_end: date) -> Iterator[BookEntry]:
+    """Start and maturity legs of NGN interbank placements, T-bills and CBN repos falling in the window."""
+    from sqlalchemy import or_, select
+    from .models import CBNRepoOperation as Repo, CurrencyEnum, InterbankPlacement as IP, TreasuryBillInvestment as TB
+
+    def in_window(*columns):
+        return or_(*(column.between(window_start, window_end) for column in columns))
+
+    def legs(source: str, source_id: Any, reference: str, start: Tuple[date, str, Any], maturity: Tuple[date, str, Any]):
+        for suffix, (leg_date, direction, amount) in (("", start), ("_MATURITY", maturity)):
+            if window_start <= _as_date(leg_date) <= window_end:
+                yield BookEntry(source + suffix, source_id, reference, direction, amount, _as_date(leg_date))
+
+    def repayment(principal, rate_pa, tenor_days) -> Decimal:
+        return Decimal(str(principal)) * (1 + Decimal(str(rate_pa)) * tenor_days / Decimal(36500))
+
+    placements = select(IP.id, IP.deal_reference, IP.placement_type, IP.principal_amount, IP.interest_rate_pa, IP.tenor_days,
+                        IP.placement_date, IP.maturity_date).where(
+        IP.currency == CurrencyEnum.NGN, IP.status != "CANCELLED", in_window(IP.placement_date, IP.maturity_date))
+    for pid, reference, placement_type, principal, rate, tenor, start_date, maturity_date in db.execute(placements):
+        lending = placement_type != "BORROWING"
+        yield from legs("INTERBANK", pid, reference, (start_date, DEBIT if lending else CREDIT, principal),
+                        (maturity_date, CREDIT if lending else DEBIT, repayment(principal, rate, tenor)))
+
+    tbills = select(TB.id, TB.investment_reference, TB.purchase_price, TB.face_value, TB.issue_date, TB.maturity_date).where(
+        TB.currency == CurrencyEnum.NGN, TB.status != "CANCELLED", in_window(TB.issue_date, TB.maturity_date))
+    for tid, reference, price, face_value, issue_date, maturity_date in db.execute(tbills):
+        yield from legs("TBILL", tid, reference, (issue_date, DEBIT, price), (maturity_date, CREDIT, face_value))
+
+    repos = select(Repo.id, Repo.operation_reference, Repo.operation_type, Repo.loan_amount, Repo.interest_rate_pa, Repo.tenor_days,
+                   Repo.start_date, Repo.end_date).where(
+        Repo.currency == CurrencyEnum.NGN, Repo.status != "CANCELLED", in_window(Repo.start_date, Repo.end_date))
+    for rid, reference, operation_type, amount, rate, tenor, start_date, end_date in db.execute(repos):
+        borrowing = operation_type != "REVERSE_REPO" # REPO: CBN lends to us against securities
+        yield from legs("REPO", rid, reference, (start_date, CREDIT if borrowing else DEBIT, amount),
+                        (end_date, DEBIT if borrowing else CREDIT, repayment(amount, rate, tenor)))
+
+def load_book_entries(db, statement_date: date, date_tolerance_days: int = CBN_RECON_DATE_TOLERANCE_DAYS) -> List[BookEntry]:
+    window_start = statement_date - timedelta(days=date_tolerance_days)
+    window_end = statement_date + timedelta(days=date_tolerance_days)
+    entries = list(_rtgs_entries(db, window_start, window_end))
+    entries.extend(_treasury_entries(db, window_start, window_end))
+    return entries
+
+
+# --- Statement side ---
+def _parse_amount(text: Any, column: str, line_number: int) -> Optional[Decimal]:
+    text = str(text or "").replace(",", "").strip()
+    if not text:
+        return None
+    try:
+        amount = _money(Decimal(text))
+    except InvalidOperation:
+        raise StatementFormatError(f"Line {line_number}: {column} is not an amount ({text!r}).")
+    if amount < 0:
+        raise StatementFormatError(f"Line {line_number}: {column} must not be negative.")
+    return amount
+
+def iter_statement_rows(source: TextIO, statement_date: date) -> Iterator[Tuple[StatementLine, Dict[str, Any]]]:
+    """
+    Streams a statement CSV, yielding each row as a StatementLine and its CBNSettlementStatementEntry values.
+    Raises StatementFormatError on a malformed or duplicate row.
+    """
+    reader = csv.DictReader(source)
+    missing = [c for c in REQUIRED_STATEMENT_COLUMNS if c not in (reader.fieldnames or ())]
+    if missing:
+        raise StatementFormatError(f"Statement is missing column(s): {', '.join(missing)}.")
+    seen = set()
+    for line_number, row in enumerate(reader, start=2):
+        cbn_reference = (row.get("cbn_reference") or "").strip()
+        if not cbn_reference:
+            raise StatementFormatError(f"Line {line_number}: cbn_reference is required.")
+        if len(cbn_reference) > 50:
+            raise StatementFormatError(f"Line {line_number}: cbn_reference exceeds 50 characters.")
+        if cbn_reference in seen:
+            raise StatementFormatError(f"Line {line_number}: duplicate cbn_reference {cbn_reference!r}.")
+        seen.add(cbn_reference)
+        debit = _parse_amount(row.get("debit_amount"), "debit_amount", line_number)
+        credit = _parse_amount(row.get("credit_amount"), "credit_amount", line_number)
+        if bool(debit) == bool(credit):
+            raise StatementFormatError(f"Line {line_number}: exactly one of debit_amount and credit_amount must be set.")
+        value_text = (row.get("value_date") or "").strip()
+        try:
+            value_date = date.fromisoformat(value_text) if value_text else statement_date
+        except ValueError:
+            raise StatementFormatError(f"Line {line_number}: value_date is not a date ({value_text!r}).")
+        line = StatementLine(line_number, cbn_reference, DEBIT if debit else CREDIT, debit or credit, value_date)
+        yield line, {
+            "statement_date": statement_date, "cbn_reference": cbn_reference, "narration": row.get("narration") or None,
+            "debit_amount": debit, "credit_amount": credit,
+            "balance": _parse_amount(row.get("balance"), "balance", line_number), "value_date": value_date,
+        }
+
+
+# --- Matching ---
+class SettlementMatcher:
+    """Hash index over book entries: exact (reference, direction, amount) probes, then a tolerance pass."""
+
+    def __init__(self, entries: List[BookEntry], statement_date: date,
+                 amount_tolerance: Decimal = CBN_RECON_AMOUNT_TOLERANCE, date_tolerance_days: int = CBN_RECON_DATE_TOLERANCE_DAYS):
+        self.entries = entries
+        self.statement_date = statement_date
+        self.tolerance_minor = _minor_units(_money(amount_tolerance))
+        self.date_tolerance_days = date_tolerance_days
+        self._exact: Dict[Tuple[str, str, int], List[BookEntry]] = {}
+        for entry in entries:
+            if entry.value_date == statement_date:
+                self._exact.setdefault((entry.reference, entry.direction, entry.amount_minor), []).append(entry)
+
+    def match_exact(self, line: StatementLine) -> Optional[BookEntry]:
+        bucket = self._exact.get((line.reference, line.direction, line.amount_minor))
+        while bucket:
+            entry = bucket.pop()
+            if not entry.matched:
+                entry.matched = True
+                return entry
+        return None
+
+    def match_leftovers(self, lines: List[StatementLine]) -> List[Tuple[StatementLine, Optional[BookEntry], str]]:
+        """(line, book entry or None, outcome) per leftover line; outcome is MATCHED_TOLERANCE, AMOUNT_MISMATCH or MISSING_INTERNAL."""
+        remaining = [e for e in self.entries if not e.matched]
+        by_reference: Dict[Tuple[str, str], List[BookEntry]] = {}
+        by_amount: Dict[Tuple[str, int], List[BookEntry]] = {}
+        step = self.tolerance_minor + 1
+        for entry in remaining:
+            by_reference.setdefault((entry.reference, entry.direction), []).append(entry)
+            by_amount.setdefault((entry.direction, entry.amount_minor // step), []).append(entry)
+
+        def distance(line: StatementLine, entry: BookEntry) -> Tuple[int, int]:
+            return abs(entry.amount_minor - line.amount_minor), abs((entry.value_date - line.value_date).days)
+
+        results = []
+        unreferenced = []
+        for line in lines:
+            candidates = [e for e in by_reference.get((line.reference, line.direction), ()) if not e.matched]
+            if not candidates:
+                unreferenced.append(line)
+                continue
+            entry = min(candidates, key=lambda e: distance(line, e))
+            entry.matched = True
+            results.append((line, entry, MATCHED_TOLERANCE if distance(line, entry)[0] <= self.tolerance_minor else AMOUNT_MISMATCH))
+
+        for line in unreferenced:
+            best, best_distance = None, None
+            bucket = line.amount_minor // step
+            for key in ((line.direction, bucket - 1), (line.direction, bucket), (line.direction, bucket + 1)):
+                for entry in by_amount.get(key, ()):
+                    if entry.matched:
+                        continue
+                    d = distance(line, entry)
+                    if d[0] <= self.tolerance_minor and d[1] <= self.date_tolerance_days and (best is None or d < best_distance):
+                        best, best_distance = entry, d
+            if best is None:
+                results.append((line, None, MISSING_INTERNAL))
+            else:
+                best.matched = True
+                results.append((line, best, MATCHED_TOLERANCE))
+        return results
+
+    def unmatched_on_statement_date(self) -> Iterator[BookEntry]:
+        return (e for e in self.entries if not e.matched and e.value_date == self.statement_date)
+
+
+def _discrepancy(run_id: int, statement_date: date, discrepancy_type: str, details: str,
+                 line: Optional[StatementLine] = None, entry: Optional[BookEntry] = None) -> Dict[str, Any]:
+    return {
+        "reconciliation_run_id": run_id, "statement_date": statement_date, "discrepancy_type": discrepancy_type,
+        "details": details, "status": "OPEN",
+        "cbn_reference": line.cbn_reference if line else None,
+        "internal_reference": entry.internal_reference if entry else None,
+        "statement_amount": line.signed_amount if line else None,
+        "internal_amount": entry.signed_amount if entry else None,
+    }
+
+def _insert_rows(db, model, rows: List[Dict[str, Any]]) -> None:
+    # One executemany per chunk. bulk_insert_mappings splits a chunk into many small batches when rows
+    # differ in which values are None (debit vs credit rows, matched vs unmatched).
+    db.connection().execute(model.__table__.insert(), rows)
+
+def _previous_runs(db, statement_date: date, exclude_run_id: Optional[int] = None):
+    from .models import CBNReconciliationRun
+    query = db.query(CBNReconciliationRun).filter(CBNReconciliationRun.statement_date == statement_date,
+                                                  CBNReconciliationRun.status.in_(["PROCESSING", "COMPLETED"]))
+    if exclude_run_id is not None:
+        query = query.filter(CBNReconciliationRun.id != exclude_run_id)
+    return query.all()
+
+def _supersede_runs(db, statement_date: date, runs) -> None:
+    """Removes the earlier runs' statement entries and open discrepancies; does not commit."""
+    from .models import CBNReconciliationDiscrepancy, CBNSettlementStatementEntry
+    run_ids = [run.id for run in runs]
+    db.query(CBNReconciliationDiscrepancy).filter(CBNReconciliationDiscrepancy.reconciliation_run_id.in_(run_ids),
+                                                  CBNReconciliationDiscrepancy.status == "OPEN").delete(synchronize_session=False)
+    db.query(CBNSettlementStatementEntry).filter(CBNSettlementStatementEntry.statement_date == statement_date).delete(synchronize_session=False)
+    for run in runs:
+        run.status = "SUPERSEDED"
+
+def reconcile_statement(db, source: TextIO, statement_date: date, source_file_name: Optional[str] = None,
+                        user_id: Optional[str] = None, replace_existing: bool = False,
+                        amount_tolerance: Decimal = CBN_RECON_AMOUNT_TOLERANCE,
+                        date_tolerance_days: int = CBN_RECON_DATE_TOLERANCE_DAYS):
+    """
+    Loads and reconciles one day's CBN settlement statement (CSV text stream). Returns the
+    CBNReconciliationRun. Raises ValueError (StatementFormatError for a malformed file) and records the run
+    as FAILED; nothing else from a failed run is kept, and a replaced run stays in place.
+    """
+    from sqlalchemy import bindparam, update
+    from .models import CBNReconciliationDiscrepancy, CBNReconciliationRun, CBNSettlementStatementEntry
+    previous = _previous_runs(db, statement_date)
+    if previous and not replace_existing:
+        raise ValueError(f"The CBN statement for {statement_date} has already been reconciled (run {previous[-1].id}).")
+    run = CBNReconciliationRun(statement_date=statement_date, source_file_name=source_file_name, status="PROCESSING",
+                               run_by_user_id=user_id)
+    db.add(run)
+    db.commit()
+    run_id = run.id
+    try:
+        previous = _previous_runs(db, statement_date, exclude_run_id=run_id)
+        if previous:
+            _supersede_runs(db, statement_date, previous) # Same transaction: a failed re-run keeps the earlier one
+        matcher = SettlementMatcher(load_book_entries(db, statement_date, date_tolerance_days), statement_date,
+                                    amount_tolerance, date_tolerance_days)
+        pending: List[Dict[str, Any]] = []
+        leftovers: List[StatementLine] = []
+        counts = {"statement": 0, "exact": 0}
+        totals = {DEBIT: Decimal("0"), CREDIT: Decimal("0")}
+        for line, values in iter_statement_rows(source, statement_date):
+            counts["statement"] += 1
+            totals[line.direction] += line.amount
+            entry = matcher.match_exact(line)
+            if entry is not None:
+                counts["exact"] += 1
+                values.update(reconciliation_status=MATCHED, matched_internal_reference=entry.internal_reference)
+            else:
+                leftovers.append(line)
+                values.update(reconciliation_status=UNRECONCILED, matched_internal_reference=None)
+            values["reconciliation_run_id"] = run_id
+            pending.append(values)
+            if len(pending) >= CBN_RECON_INSERT_CHUNK:
+                _insert_rows(db, CBNSettlementStatementEntry, pending)
+                pending = []
+        if pending:
+            _insert_rows(db, CBNSettlementStatementEntry, pending)
+
+        discrepancies = []
+        statuses = []
+        tolerance_matches = 0
+        for line, entry, outcome in matcher.match_leftovers(leftovers):
+            if outcome == MATCHED_TOLERANCE:
+                tolerance_matches += 1
+                status = MATCHED_TOLERANCE
+                if entry.amount_minor != line.amount_minor:
+                    discrepancies.append(_discrepancy(run_id, statement_date, AMOUNT_MISMATCH,
+                                                      f"Matched within tolerance: statement {line.amount}, books {entry.amount}.", line, entry))
+            elif outcome == AMOUNT_MISMATCH:
+                status = DISCREPANCY
+                discrepancies.append(_discrepancy(run_id, statement_date, AMOUNT_MISMATCH,
+                                                  f"Reference matches but amounts differ: statement {line.amount}, books {entry.amount}.", line, entry))
+            else:
+                status = DISCREPANCY
+                discrepancies.append(_discrepancy(run_id, statement_date, MISSING_INTERNAL,
+                                                  f"Statement {line.direction.lower()} of {line.amount} (line {line.line_number}) has no entry in our books.", line))
+            statuses.append({"b_reference": line.cbn_reference, "b_status": status,
+                             "b_internal": entry.internal_reference if entry else None})
+        for entry in matcher.unmatched_on_statement_date():
+            discrepancies.append(_discrepancy(run_id, statement_date, MISSING_ON_STATEMENT,
+                                              f"{entry.source} {entry.direction.lower()} of {entry.amount} is not on the CBN statement.", entry=entry))
+
+        if statuses:
+            table = CBNSettlementStatementEntry.__table__
+            db.connection().execute(
+                update(table).where(table.c.cbn_reference == bindparam("b_reference"))
+                .values(reconciliation_status=bindparam("b_status"), matched_internal_reference=bindparam("b_internal")),
+                statuses)
+        for start in range(0, len(discrepancies), CBN_RECON_INSERT_CHUNK):
+            _insert_rows(db, CBNReconciliationDiscrepancy, discrepancies[start:start + CBN_RECON_INSERT_CHUNK])
+
+        run = db.query(CBNReconciliationRun).filter(CBNReconciliationRun.id == run_id).one()
+        run.statement_entry_count = counts["statement"]
+        run.statement_debit_total = totals[DEBIT]
+        run.statement_credit_total = totals[CREDIT]
+        run.internal_entry_count = len(matcher.entries)
+        run.matched_exact_count = counts["exact"]
+        run.matched_tolerance_count = tolerance_matches
+        run.discrepancy_count = len(discrepancies)
+        run.status = "COMPLETED"
+        run.completed_at = datetime.utcnow()
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        run = db.query(CBNReconciliationRun).filter(CBNReconciliationRun.id == run_id).one()
+        run.status = "FAILED"
+        run.error_message = str(e)[:2000]
+        run.completed_at = datetime.utcnow()
+        db.commit()
+        raise
+    db.refresh(run)
+    return run
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile a CBN settlement statement against our books.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    reconcile_cmd = commands.add_parser("reconcile")
+    reconcile_cmd.add_argument("--file", required=True)
+    reconcile_cmd.add_argument("--date", type=date.fromisoformat, required=True, help="Statement date")
+    reconcile_cmd.add_argument("--replace", action="store_true", help="Supersede an earlier reconciliation of the same date")
+    args = parser.parse_args()
+
+    from weezy_cbs.database import SessionLocal
+    session = SessionLocal()
+    try:
+        started = time.perf_counter()
+        with open(args.file, newline="", encoding="utf-8-sig") as statement_file:
+            result = reconcile_statement(session, statement_file, args.date, source_file_name=os.path.basename(args.file),
+                                         replace_existing=args.replace)
+        print(f"Run {result.id}: {result.statement_entry_count} statement entries, {result.matched_exact_count} exact and "
+              f"{result.matched_tolerance_count} tolerance matches, {result.discrepancy_count} discrepancies "
+              f"in {time.perf_counter() - started:.2f}s")
+    finally:
+        session.close()
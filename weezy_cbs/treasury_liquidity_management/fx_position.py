@@ -0,0 +1,391 @@
+# FX net open position and revaluation engine
+#
+# Positions come from two sources. Each is aggregated in SQL with a GROUP BY, so the cost does not
+# depend on how many deals or accounts there are:
+#   - Unsettled FX deals (FXTransaction in FX_POSITION_OPEN_STATUSES), summed per (currency pair, bought
+#     currency, sold currency). A settled deal has moved into the holdings below, so it leaves the deal side;
+#     cancelled and rejected deals never count.
+#   - Balance-sheet holdings per currency: the latest BankCashPosition (vault + CBN + correspondent banks)
+#     less customer domiciliary deposits, which are owed back in the foreign currency.
+# The net open position per currency is the sum of both. Pairs are reported as base/quote amounts.
+#
+# Revaluation (run_fx_revaluation) marks the positions to a rate snapshot. Rates are units of the base
+# currency (NGN) per 1 foreign unit.
+#   - Deals carry a book value in the base currency: the NGN leg of the deal, or, for cross pairs, the
+#     sold leg at the snapshot rate. Unrealised P&L = position x rate - book value, kept per currency on
+#     each run; a run posts its change since the previous run.
+#   - Holdings have no book value; a run posts the previous position x (rate - previous rate).
+# A run's P&L is posted as one batched journal. The amounts are in the base currency, so per currency it
+# debits the base-currency revaluation adjustment GL FX_REVAL_ADJ_<CCY> (a contra to the foreign-currency
+# position GLs) and credits FX_REVALUATION_PNL_GL for a gain, the other way round for a loss. Every GL
+# posted to must be in the base currency. The run, its lines and the journal are written, and
+# gl_accounts.current_balance updated, in a single transaction. Runs are serialised by locking the
+# FX_REVALUATION_PNL_GL row (FOR UPDATE), which exists before the first run.
+#
+# FXPositionCache keeps the positions in memory for intraday queries. Deals booked and status changes
+# made through this process are applied as they happen. Deals booked by other processes are picked up by
+# a catch-up on FXTransaction.id, and the cache is reloaded in full periodically.
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+FX_BASE_CURRENCY = os.getenv("FX_BASE_CURRENCY", "NGN")
+FX_POSITION_OPEN_STATUSES = tuple(s.strip() for s in os.getenv("FX_POSITION_OPEN_STATUSES", "PENDING_SETTLEMENT").split(",") if s.strip())
+FX_REVALUATION_PNL_GL = os.getenv("FX_REVALUATION_PNL_GL", "FX_REVAL_PNL")
+FX_REVALUATION_ADJUSTMENT_GL_PREFIX = os.getenv("FX_REVALUATION_ADJUSTMENT_GL_PREFIX", "FX_REVAL_ADJ_") # + currency code, e.g. FX_REVAL_ADJ_USD (a base-currency GL)
+FX_POSITION_CACHE_SYNC_SECONDS = float(os.getenv("FX_POSITION_CACHE_SYNC_SECONDS", "5")) # Catch-up on deals booked elsewhere
+FX_POSITION_CACHE_RELOAD_SECONDS = float(os.getenv("FX_POSITION_CACHE_RELOAD_SECONDS", "300")) # Full reload (status changes made elsewhere)
+FX_POSITION_BALANCE_REFRESH_SECONDS = float(os.getenv("FX_POSITION_BALANCE_REFRESH_SECONDS", "60"))
+
+_CENT = Decimal("0.01")
+
+DealKey = Tuple[str, str, str] # (currency pair, bought currency, sold currency)
+
+
+def _code(value: Any) -> str:
+    return getattr(value, "value", value)
+
+def _decimal(value: Any) -> Decimal:
+    if value is None:
+        return Decimal("0")
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+def _money(value: Decimal) -> Decimal:
+    return value.quantize(_CENT, rounding=ROUND_HALF_UP)
+
+def counts_toward_position(status: Optional[str]) -> bool:
+    return status in FX_POSITION_OPEN_STATUSES
+
+
+# --- Aggregation ---
+def load_deal_totals(db) -> Tuple[Dict[DealKey, List[Any]], Optional[int]]:
+    """
+    Bought and sold totals of unsettled deals per (pair, bought currency, sold currency): key -> [bought, sold, deal count].
+    Also returns the highest deal id included. Deals are aggregated up to that id, so later bookings
+    are left for catch-up.
+    """
+    from sqlalchemy import func, select
+    from .models import FXTransaction as FX
+    watermark = db.execute(select(func.max(FX.id))).scalar()
+    totals: Dict[DealKey, List[Any]] = {}
+    if watermark is None:
+        return totals, None
+    stmt = (select(FX.currency_pair, FX.buy_currency, FX.sell_currency,
+                   func.sum(FX.buy_amount), func.sum(FX.sell_amount), func.count(FX.id))
+            .where(FX.id <= watermark, FX.status.in_(FX_POSITION_OPEN_STATUSES))
+            .group_by(FX.currency_pair, FX.buy_currency, FX.sell_currency))
+    for pair, buy_currency, sell_currency, bought, sold, count in db.execute(stmt):
+        totals[(pair, _code(buy_currency), _code(sell_currency))] = [_decimal(bought), _decimal(sold), count]
+    return totals, watermark
+
+def load_balance_positions(db, base_currency: str = FX_BASE_CURRENCY) -> Dict[str, Decimal]:
+    """Foreign-currency holdings (latest cash position) less domiciliary deposits, per currency."""
+    from sqlalchemy import func, select
+    from weezy_cbs.accounts_ledger_management.models import Account, AccountStatusEnum, AccountTypeEnum
+    from .models import BankCashPosition as P
+    positions: Dict[str, Decimal] = {}
+    latest = (select(P.currency, func.max(P.position_date).label("position_date"))
+              .group_by(P.currency).subquery("latest_cash_position"))
+    holdings = (select(P.currency, P.total_cash_at_vault + P.total_cash_at_cbn + P.total_cash_at_correspondent_banks)
+                .join(latest, (latest.c.currency == P.currency) & (latest.c.position_date == P.position_date)))
+    for currency, amount in db.execute(holdings):
+        positions[_code(currency)] = positions.get(_code(currency), Decimal("0")) + _decimal(amount)
+    deposits = (select(Account.currency, func.sum(Account.ledger_balance))
+                .where(Account.account_type == AccountTypeEnum.DOMICILIARY, Account.status != AccountStatusEnum.CLOSED)
+                .group_by(Account.currency))
+    for currency, balance in db.execute(deposits):
+        positions[_code(currency)] = positions.get(_code(currency), Decimal("0")) - _decimal(balance)
+    positions.pop(base_currency, None)
+    return positions
+
+def _apply_deal(pairs: Dict[str, List[Any]], currencies: Dict[str, Decimal], pair: str, buy_currency: str,
+                sell_currency: str, bought: Decimal, sold: Decimal, count: int) -> None:
+    """Adds (or, with negative amounts and count, removes) deals to per-pair and per-currency positions."""
+    entry = pairs.setdefault(pair, [Decimal("0"), Decimal("0"), 0]) # [base amount, quote amount, deal count]
+    pair_base = pair.split("/")[0]
+    for currency, amount in ((buy_currency, bought), (sell_currency, -sold)):
+        entry[0 if currency == pair_base else 1] += amount
+        currencies[currency] = currencies.get(currency, Decimal("0")) + amount
+    entry[2] += count
+
+def deal_positions(deal_totals: Dict[DealKey, List[Any]]) -> Tuple[Dict[str, List[Any]], Dict[str, Decimal]]:
+    pairs: Dict[str, List[Any]] = {}
+    currencies: Dict[str, Decimal] = {}
+    for (pair, buy_currency, sell_currency), (bought, sold, count) in deal_totals.items():
+        _apply_deal(pairs, currencies, pair, buy_currency, sell_currency, bought, sold, count)
+    return pairs, currencies
+
+def deal_book_values(deal_totals: Dict[DealKey, List[Any]], rates: Dict[str, Decimal],
+                     base_currency: str = FX_BASE_CURRENCY) -> Dict[str, Decimal]:
+    """
+    Base-currency cost of each currency's deal position. A leg against the base currency is booked at the
+    base amount paid or received. For cross pairs, the sold leg at its snapshot rate moves to the bought
+    currency, so the pair's total P&L is unaffected.
+    """
+    book: Dict[str, Decimal] = {}
+    for (_, buy_currency, sell_currency), (bought, sold, _) in deal_totals.items():
+        if sell_currency == base_currency:
+            book[buy_currency] = book.get(buy_currency, Decimal("0")) + sold
+        elif buy_currency == base_currency:
+            book[sell_currency] = book.get(sell_currency, Decimal("0")) - bought
+        else:
+            value = sold * rates[sell_currency]
+            book[buy_currency] = book.get(buy_currency, Decimal("0")) + value
+            book[sell_currency] = book.get(sell_currency, Decimal("0")) - value
+    return book
+
+
+# --- Revaluation ---
+def compute_revaluation(deal_totals: Dict[DealKey, List[Any]], balances: Dict[str, Decimal], rates: Dict[str, Decimal],
+                        previous_lines: Dict[str, Any], base_currency: str = FX_BASE_CURRENCY) -> List[Dict[str, Any]]:
+    """
+    One line per foreign currency with a position (or a line in the previous run), as FXRevaluationLine
+    values. `previous_lines` maps currency -> the previous run's line. Raises ValueError for a missing rate.
+    """
+    _, positions = deal_positions(deal_totals)
+    currencies = (set(positions) | set(balances) | set(previous_lines)) - {base_currency}
+    needed = {c for c in currencies if positions.get(c) or balances.get(c)
+              or (c in previous_lines and _decimal(previous_lines[c].balance_position))}
+    needed |= {c for key in deal_totals for c in key[1:] if base_currency not in key[1:]} # Cross pairs are booked at the rate
+    missing = sorted(needed - set(rates) - {base_currency})
+    if missing:
+        raise ValueError(f"Rate snapshot has no rate for {', '.join(missing)}.")
+    book = deal_book_values(deal_totals, {base_currency: Decimal("1"), **rates}, base_currency)
+
+    lines = []
+    for currency in sorted(currencies):
+        previous = previous_lines.get(currency)
+        rate = rates.get(currency)
+        if rate is None: # No position left to mark; carry the previous rate
+            rate = _decimal(previous.rate)
+        deal_position = positions.get(currency, Decimal("0"))
+        book_value = _money(book.get(currency, Decimal("0")))
+        balance_position = balances.get(currency, Decimal("0"))
+        unrealised = _money(deal_position * rate - book_value)
+        pnl = unrealised
+        if previous is not None:
+            pnl += -_decimal(previous.deal_unrealised_pnl) + _money(_decimal(previous.balance_position) * (rate - _decimal(previous.rate)))
+        if not (deal_position or balance_position or unrealised or pnl):
+            continue
+        lines.append({
+            "currency": currency, "deal_position": deal_position, "deal_book_value": book_value,
+            "balance_position": balance_position, "rate": rate, "deal_unrealised_pnl": unrealised, "revaluation_pnl": pnl,
+        })
+    return lines
+
+def revaluation_journal(lines: Iterable[Dict[str, Any]], journal_reference: str) -> List[Dict[str, Any]]:
+    """Balanced DEBIT/CREDIT pairs for each line with non-zero P&L (FXRevaluationJournalLine values)."""
+    journal = []
+    for line in lines:
+        pnl = line["revaluation_pnl"]
+        if not pnl:
+            continue
+        adjustment_gl = f"{FX_REVALUATION_ADJUSTMENT_GL_PREFIX}{line['currency']}"
+        debit_gl, credit_gl = (adjustment_gl, FX_REVALUATION_PNL_GL) if pnl > 0 else (FX_REVALUATION_PNL_GL, adjustment_gl)
+        narration = f"FX revaluation {line['currency']} @ {line['rate'].normalize():f} ({journal_reference})"
+        for gl_code, entry_type in ((debit_gl, "DEBIT"), (credit_gl, "CREDIT")):
+            journal.append({"gl_code": gl_code, "entry_type": entry_type, "amount": abs(pnl),
+                            "currency": line["currency"], "narration": narration})
+    return journal
+
+def _post_journal(db, journal: List[Dict[str, Any]], base_currency: str = FX_BASE_CURRENCY) -> None:
+    """
+    Moves gl_accounts.current_balance by each GL's net debit (debits add, credits subtract), in one executemany.
+    Raises ValueError if a GL is missing or not in the base currency (the amounts are base-currency P&L).
+    """
+    from sqlalchemy import bindparam, update
+    from weezy_cbs.accounts_ledger_management.models import GeneralLedgerAccount as GL
+    net: Dict[str, Decimal] = {}
+    for entry in journal:
+        signed = entry["amount"] if entry["entry_type"] == "DEBIT" else -entry["amount"]
+        net[entry["gl_code"]] = net.get(entry["gl_code"], Decimal("0")) + signed
+    if not net:
+        return
+    found = {code: _code(currency) for code, currency in db.query(GL.gl_code, GL.currency).filter(GL.gl_code.in_(list(net)))}
+    missing = sorted(set(net) - set(found))
+    if missing:
+        raise ValueError(f"GL accounts not set up for FX revaluation: {', '.join(missing)}.")
+    foreign = sorted(code for code, currency in found.items() if currency != base_currency)
+    if foreign:
+        raise ValueError(f"FX revaluation posts {base_currency} amounts; these GL accounts are not in {base_currency}: {', '.join(foreign)}.")
+    stmt = (update(GL.__table__).where(GL.__table__.c.gl_code == bindparam("b_gl_code"))
+            .values(current_balance=GL.__table__.c.current_balance + bindparam("b_delta"), updated_at=datetime.utcnow()))
+    db.connection().execute(stmt, [{"b_gl_code": code, "b_delta": delta} for code, delta in net.items()])
+
+def latest_rate_snapshot(db):
+    from .models import FXRateSnapshot
+    return db.query(FXRateSnapshot).order_by(FXRateSnapshot.taken_at.desc(), FXRateSnapshot.id.desc()).first()
+
+def _lock_revaluation(db) -> None:
+    """
+    Serialises revaluation runs on the FX_REVALUATION_PNL_GL row. Locking the latest run would not do: before
+    the first run there is no row to lock, and concurrent first runs (previous_run_id NULL) would both post.
+    """
+    from weezy_cbs.accounts_ledger_management.models import GeneralLedgerAccount as GL
+    if db.query(GL.id).filter(GL.gl_code == FX_REVALUATION_PNL_GL).with_for_update().first() is None:
+        db.rollback()
+        raise ValueError(f"GL account {FX_REVALUATION_PNL_GL} is not set up for FX revaluation.")
+
+def run_fx_revaluation(db, rate_snapshot_id: Optional[int] = None, user_id: Optional[str] = None):
+    """
+    Revalues the current positions at a rate snapshot (the latest if not given) and posts the P&L since the
+    previous run as one journal. Returns the FXRevaluationRun. Raises ValueError if a rate or GL account
+    is missing.
+    """
+    from .models import FXRateSnapshot, FXRevaluationJournalLine, FXRevaluationLine, FXRevaluationRun
+    if rate_snapshot_id is None:
+        snapshot = latest_rate_snapshot(db)
+    else:
+        snapshot = db.query(FXRateSnapshot).filter(FXRateSnapshot.id == rate_snapshot_id).first()
+    if snapshot is None:
+        raise ValueError("No FX rate snapshot to revalue against.")
+    base_currency = _code(snapshot.base_currency)
+    rates = {_code(r.currency): _decimal(r.rate) for r in snapshot.rates}
+
+    _lock_revaluation(db)
+    previous_run = db.query(FXRevaluationRun).order_by(FXRevaluationRun.id.desc()).first()
+    previous_lines = {}
+    if previous_run is not None:
+        previous_lines = {_code(line.currency): line for line in
+                          db.query(FXRevaluationLine).filter(FXRevaluationLine.run_id == previous_run.id)}
+    deal_totals, watermark = load_deal_totals(db)
+    balances = load_balance_positions(db, base_currency)
+    lines = compute_revaluation(deal_totals, balances, rates, previous_lines, base_currency)
+
+    journal_reference = f"FXREVAL-{datetime.utcnow():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:6].upper()}"
+    journal = revaluation_journal(lines, journal_reference)
+    try:
+        _post_journal(db, journal, base_currency)
+        run = FXRevaluationRun(
+            journal_reference=journal_reference, previous_run_id=previous_run.id if previous_run else None,
+            rate_snapshot_id=snapshot.id, base_currency=snapshot.base_currency, deal_watermark=watermark,
+            total_revaluation_pnl=sum((line["revaluation_pnl"] for line in lines), Decimal("0")),
+            status="POSTED", run_by_user_id=user_id,
+        )
+        db.add(run)
+        db.flush()
+        db.bulk_insert_mappings(FXRevaluationLine, [{"run_id": run.id, **line} for line in lines])
+        db.bulk_insert_mappings(FXRevaluationJournalLine, [{"run_id": run.id, **entry} for entry in journal])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    db.refresh(run)
+    fx_position_cache.replace(deal_totals, watermark, balances)
+    return run
+
+
+# --- Intraday position cache ---
+class FXPositionCache:
+    """
+    Per-pair and per-currency positions kept in memory. Reads are dictionary copies and do not touch the
+    database. Deals and status changes reported by record_deal / record_status_change are applied
+    incrementally.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pairs: Dict[str, List[Any]] = {}
+        self._deal_positions: Dict[str, Decimal] = {}
+        self._balances: Dict[str, Decimal] = {}
+        self._watermark = 0
+        self._applied_above_watermark = set() # Deals recorded here but not yet passed by catch-up
+        self.loaded = False
+        self._loaded_at = self._synced_at = self._balances_at = 0.0
+        self.as_of: Optional[datetime] = None
+
+    def replace(self, deal_totals: Dict[DealKey, List[Any]], watermark: Optional[int], balances: Dict[str, Decimal]) -> None:
+        pairs, positions = deal_positions(deal_totals)
+        now = time.monotonic()
+        with self._lock:
+            self._pairs, self._deal_positions, self._balances = pairs, positions, dict(balances)
+            self._watermark = watermark or 0
+            self._applied_above_watermark = set() # Deals above the new watermark are re-read by catch-up
+            self.loaded = True
+            self._loaded_at = self._synced_at = self._balances_at = now
+            self.as_of = datetime.utcnow()
+
+    def load(self, db) -> None:
+        deal_totals, watermark = load_deal_totals(db)
+        self.replace(deal_totals, watermark, load_balance_positions(db))
+
+    def _apply(self, pair: str, buy_currency: Any, sell_currency: Any, bought: Any, sold: Any, sign: int) -> None:
+        _apply_deal(self._pairs, self._deal_positions, pair, _code(buy_currency), _code(sell_currency),
+                    sign * _decimal(bought), sign * _decimal(sold), sign)
+        self.as_of = datetime.utcnow()
+
+    def record_deal(self, deal) -> None:
+        """Applies a newly booked FXTransaction (call after commit)."""
+        with self._lock:
+            if not self.loaded or deal.id <= self._watermark or deal.id in self._applied_above_watermark:
+                return
+            self._applied_above_watermark.add(deal.id)
+            if counts_toward_position(deal.status):
+                self._apply(deal.currency_pair, deal.buy_currency, deal.sell_currency, deal.buy_amount, deal.sell_amount, 1)
+
+    def record_status_change(self, deal, old_status: Optional[str]) -> None:
+        """Adds or removes a deal whose status moved into or out of FX_POSITION_OPEN_STATUSES (e.g. to SETTLED)."""
+        with self._lock:
+            if not self.loaded or (deal.id > self._watermark and deal.id not in self._applied_above_watermark):
+                return # Not seen yet; catch-up will read its current status
+            was, now = counts_toward_position(old_status), counts_toward_position(deal.status)
+            if was != now:
+                self._apply(deal.currency_pair, deal.buy_currency, deal.sell_currency, deal.buy_amount, deal.sell_amount, 1 if now else -1)
+
+    def catch_up(self, db) -> int:
+        """Applies deals booked since the watermark that were not recorded here. Returns how many."""
+        from sqlalchemy import select
+        from .models import FXTransaction as FX
+        with self._lock:
+            watermark = self._watermark
+        rows = db.execute(select(FX.id, FX.currency_pair, FX.buy_currency, FX.sell_currency, FX.buy_amount, FX.sell_amount, FX.status)
+                          .where(FX.id > watermark).order_by(FX.id)).all()
+        applied = 0
+        with self._lock:
+            for deal_id, pair, buy_currency, sell_currency, bought, sold, status in rows:
+                if deal_id <= self._watermark or deal_id in self._applied_above_watermark:
+                    continue
+                if counts_toward_position(status):
+                    self._apply(pair, buy_currency, sell_currency, bought, sold, 1)
+                    applied += 1
+            if rows:
+                self._watermark = max(self._watermark, rows[-1][0])
+                self._applied_above_watermark = {i for i in self._applied_above_watermark if i > self._watermark}
+            self._synced_at = time.monotonic()
+        return applied
+
+    def refresh(self, db) -> None:
+        """Reloads, catches up or refreshes balances when their intervals have passed."""
+        now = time.monotonic()
+        if not self.loaded or now - self._loaded_at >= FX_POSITION_CACHE_RELOAD_SECONDS:
+            self.load(db)
+            return
+        if now - self._synced_at >= FX_POSITION_CACHE_SYNC_SECONDS:
+            self.catch_up(db)
+        if now - self._balances_at >= FX_POSITION_BALANCE_REFRESH_SECONDS:
+            balances = load_balance_positions(db)
+            with self._lock:
+                self._balances, self._balances_at = balances, time.monotonic()
+
+    def positions(self, db=None, base_currency: str = FX_BASE_CURRENCY) -> Dict[str, Any]:
+        """Current positions; pass `db` to let the cache refresh first if due."""
+        if db is not None:
+            self.refresh(db)
+        with self._lock:
+            currencies = {}
+            for currency in sorted((set(self._deal_positions) | set(self._balances)) - {base_currency}):
+                deal_position = self._deal_positions.get(currency, Decimal("0"))
+                balance_position = self._balances.get(currency, Decimal("0"))
+                currencies[currency] = {"deal_position": deal_position, "balance_position": balance_position,
+                                        "net_open_position": deal_position + balance_position}
+            pairs = {pair: {"base_amount": base_amount, "quote_amount": quote_amount, "deal_count": count}
+                     for pair, (base_amount, quote_amount, count) in sorted(self._pairs.items()) if count}
+            return {"as_of": self.as_of, "base_currency": base_currency, "deal_watermark": self._watermark or None,
+                    "currencies": currencies, "pairs": pairs}
+
+
+fx_position_cache = FXPositionCache()
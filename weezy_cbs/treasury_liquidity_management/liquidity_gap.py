@@ -0,0 +1,267 @@
+# Maturity-bucket liquidity gap engine
+#
+# Contractual cash flows are loaded from T-bills, interbank placements, unsettled FX deals, loan
+# repayment schedules and fixed-deposit maturities. Each source is aggregated in SQL by (date, currency),
+# so even a large loan book comes back as a few thousand rows. The flows are held as columnar arrays:
+# day offset from the as-of date, currency index, and signed amount in kobo/cents (int64, so sums are
+# exact). Balances of non-maturity deposits (current, savings, domiciliary) have no contractual date.
+# They are turned into dated outflows by behavioural run-off assumptions (LIQUIDITY_NMD_RUNOFF_JSON).
+#
+# Bucketing is one vectorized searchsorted over the day offsets against the bucket bounds, followed by
+# an indexed add per (currency, bucket) and a running sum over the buckets. On a loaded ladder that takes
+# milliseconds, so treasury can re-cut the same flows with different buckets or horizons. numpy is
+# optional; without it the same computation runs row by row with bisect.
+import json
+import os
+import time
+from array import array
+from bisect import bisect_left
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np # Optional: vectorized bucketing
+except ImportError:
+    np = None
+
+LIQUIDITY_GAP_BUCKET_DAYS = tuple(int(d) for d in os.getenv("LIQUIDITY_GAP_BUCKET_DAYS", "1,7,30,90,180,365,1095,1825").split(","))
+LIQUIDITY_NMD_CORE_DAYS = int(os.getenv("LIQUIDITY_NMD_CORE_DAYS", "1826")) # Where the stable ("core") remainder of non-maturity deposits falls
+
+# Account type -> [[day, fraction of the balance that runs off on that day], ...]; the rest is core
+DEFAULT_NMD_RUNOFF = {
+    "CURRENT": [[1, 0.10], [7, 0.10], [30, 0.15], [90, 0.15]],
+    "SAVINGS": [[1, 0.05], [7, 0.05], [30, 0.10], [90, 0.10]],
+    "DOMICILIARY": [[1, 0.10], [7, 0.10], [30, 0.20], [90, 0.20]],
+}
+LIQUIDITY_NMD_RUNOFF = json.loads(os.getenv("LIQUIDITY_NMD_RUNOFF_JSON", "null") or "null") or DEFAULT_NMD_RUNOFF
+
+FLOW_SOURCES = ("TREASURY_BILL", "INTERBANK", "FX_SETTLEMENT", "LOAN_REPAYMENT", "FIXED_DEPOSIT", "NON_MATURITY_DEPOSIT")
+_LOAN_STATUSES_EXPECTED_TO_PAY = ("ACTIVE", "OVERDUE", "RESTRUCTURED")
+_FX_OPEN_STATUS = "PENDING_SETTLEMENT"
+_INTERBANK_BORROWING = "BORROWING"
+
+
+def _minor_units(value: Any) -> int:
+    if value is None:
+        return 0
+    return int((value if isinstance(value, Decimal) else Decimal(str(value))).scaleb(2).to_integral_value())
+
+def _as_date(value: Any) -> date:
+    if isinstance(value, str): # SQLite returns grouped dates as text
+        return date.fromisoformat(value[:10])
+    return value
+
+def _currency_code(value: Any) -> str:
+    return getattr(value, "value", value)
+
+
+class CashFlowColumns:
+    """Signed cash flows as parallel int64 columns; amounts in minor units (+ inflow, - outflow)."""
+    __slots__ = ("as_of", "currencies", "days", "currency", "amount", "source")
+
+    def __init__(self, as_of: date):
+        self.as_of = as_of
+        self.currencies: List[str] = []
+        self.days = array("q")
+        self.currency = array("q")
+        self.amount = array("q")
+        self.source = array("q")
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def add(self, flow_date: date, currency: Any, amount_minor: int, source: str) -> None:
+        if not amount_minor:
+            return
+        code = _currency_code(currency)
+        if code not in self.currencies:
+            self.currencies.append(code)
+        self.days.append(max((_as_date(flow_date) - self.as_of).days, 0)) # Already due: first bucket
+        self.currency.append(self.currencies.index(code))
+        self.amount.append(amount_minor)
+        self.source.append(FLOW_SOURCES.index(source))
+
+
+# --- Loading ---
+def _contractual_flow_queries(as_of: date):
+    """(source, sign, statement) per contractual source; each statement yields (flow_date, currency, amount)."""
+    from sqlalchemy import func, select
+    from weezy_cbs.accounts_ledger_management.models import Account, AccountStatusEnum, AccountTypeEnum
+    from weezy_cbs.loan_management_module.models import LoanAccount, LoanAccountStatusEnum, LoanRepaymentSchedule as S
+    from .models import FXTransaction, InterbankPlacement, TreasuryBillInvestment
+
+    tbills = (select(TreasuryBillInvestment.maturity_date, TreasuryBillInvestment.currency, func.sum(TreasuryBillInvestment.face_value))
+              .where(TreasuryBillInvestment.status == "ACTIVE")
+              .group_by(TreasuryBillInvestment.maturity_date, TreasuryBillInvestment.currency))
+    placement_repayment = InterbankPlacement.principal_amount * (1 + InterbankPlacement.interest_rate_pa * InterbankPlacement.tenor_days / 36500)
+
+    def placements(borrowing: bool):
+        direction = InterbankPlacement.placement_type == _INTERBANK_BORROWING if borrowing else InterbankPlacement.placement_type != _INTERBANK_BORROWING
+        return (select(InterbankPlacement.maturity_date, InterbankPlacement.currency, func.sum(placement_repayment))
+                .where(InterbankPlacement.status == "ACTIVE", direction)
+                .group_by(InterbankPlacement.maturity_date, InterbankPlacement.currency))
+
+    fx_bought = (select(FXTransaction.value_date, FXTransaction.buy_currency, func.sum(FXTransaction.buy_amount))
+                 .where(FXTransaction.status == _FX_OPEN_STATUS).group_by(FXTransaction.value_date, FXTransaction.buy_currency))
+    fx_sold = (select(FXTransaction.value_date, FXTransaction.sell_currency, func.sum(FXTransaction.sell_amount))
+               .where(FXTransaction.status == _FX_OPEN_STATUS).group_by(FXTransaction.value_date, FXTransaction.sell_currency))
+    unpaid = S.total_due - func.coalesce(S.principal_paid, 0) - func.coalesce(S.interest_paid, 0) - func.coalesce(S.fees_paid, 0)
+    repayments = (select(S.due_date, LoanAccount.currency, func.sum(unpaid))
+                  .join(LoanAccount, LoanAccount.id == S.loan_account_id)
+                  .where(S.is_paid.isnot(True), S.due_date >= as_of, # Arrears are not counted on as inflows
+                         LoanAccount.status.in_([LoanAccountStatusEnum(s) for s in _LOAN_STATUSES_EXPECTED_TO_PAY]))
+                  .group_by(S.due_date, LoanAccount.currency))
+    fixed_deposits = (select(Account.fd_maturity_date, Account.currency,
+                             func.sum(Account.ledger_balance + func.coalesce(Account.accrued_interest_payable, 0)))
+                      .where(Account.account_type == AccountTypeEnum.FIXED_DEPOSIT, Account.status != AccountStatusEnum.CLOSED,
+                             Account.fd_maturity_date.isnot(None))
+                      .group_by(Account.fd_maturity_date, Account.currency))
+    return (
+        ("TREASURY_BILL", 1, tbills),
+        ("INTERBANK", 1, placements(False)),
+        ("INTERBANK", -1, placements(True)),
+        ("FX_SETTLEMENT", 1, fx_bought),
+        ("FX_SETTLEMENT", -1, fx_sold),
+        ("LOAN_REPAYMENT", 1, repayments),
+        ("FIXED_DEPOSIT", -1, fixed_deposits),
+    )
+
+def validate_nmd_runoff(runoff: Dict[str, Sequence[Sequence[float]]]) -> Dict[str, List[Tuple[int, float]]]:
+    """Checks run-off assumptions: known account types, non-negative days and fractions summing to at most 1."""
+    from weezy_cbs.accounts_ledger_management.models import AccountTypeEnum
+    validated = {}
+    for account_type, steps in runoff.items():
+        if account_type not in AccountTypeEnum.__members__:
+            raise ValueError(f"Unknown account type in run-off assumptions: {account_type}")
+        parsed = [(int(day), float(fraction)) for day, fraction in steps]
+        if any(day < 0 or fraction < 0 for day, fraction in parsed) or sum(f for _, f in parsed) > 1.0 + 1e-9:
+            raise ValueError(f"Run-off for {account_type} must use non-negative days and fractions that sum to at most 1.")
+        validated[account_type] = parsed
+    return validated
+
+def _add_non_maturity_deposits(db, flows: CashFlowColumns, runoff: Dict[str, List[Tuple[int, float]]]) -> None:
+    from datetime import timedelta
+    from sqlalchemy import func, select
+    from weezy_cbs.accounts_ledger_management.models import Account, AccountStatusEnum, AccountTypeEnum
+    if not runoff:
+        return
+    balances = (select(Account.account_type, Account.currency, func.sum(Account.ledger_balance))
+                .where(Account.account_type.in_([AccountTypeEnum[t] for t in runoff]), Account.status != AccountStatusEnum.CLOSED)
+                .group_by(Account.account_type, Account.currency))
+    for account_type, currency, balance in db.execute(balances):
+        total = _minor_units(balance)
+        if total <= 0:
+            continue
+        remaining = total
+        for day, fraction in runoff[_currency_code(account_type)]:
+            outflow = min(int(round(total * fraction)), remaining)
+            flows.add(flows.as_of + timedelta(days=day), currency, -outflow, "NON_MATURITY_DEPOSIT")
+            remaining -= outflow
+        flows.add(flows.as_of + timedelta(days=LIQUIDITY_NMD_CORE_DAYS), currency, -remaining, "NON_MATURITY_DEPOSIT")
+
+def load_cash_flows(db, as_of: date, nmd_runoff: Optional[Dict[str, Sequence[Sequence[float]]]] = None) -> CashFlowColumns:
+    """Loads every contractual and behavioural cash flow from `as_of` onwards into CashFlowColumns."""
+    runoff = validate_nmd_runoff(LIQUIDITY_NMD_RUNOFF if nmd_runoff is None else nmd_runoff)
+    flows = CashFlowColumns(as_of)
+    for source, sign, stmt in _contractual_flow_queries(as_of):
+        for flow_date, currency, amount in db.execute(stmt):
+            if flow_date is not None:
+                flows.add(flow_date, currency, sign * _minor_units(amount), source)
+    _add_non_maturity_deposits(db, flows, runoff)
+    return flows
+
+
+# --- Gap computation ---
+def bucket_labels(bucket_days: Sequence[int]) -> List[Tuple[str, int, Optional[int]]]:
+    """(label, first day, last day) per bucket; a final open-ended bucket follows the last bound."""
+    buckets = []
+    lower = 0
+    for upper in bucket_days:
+        label = "Overnight" if upper == 1 and lower == 0 else f"{max(lower, 1)}D-{upper}D"
+        buckets.append((label, lower, upper))
+        lower = upper + 1
+    buckets.append((f"Over {bucket_days[-1]}D", lower, None))
+    return buckets
+
+
+class LiquidityGapResult:
+    """Per currency: inflows, outflows, net and cumulative gap per bucket, in minor units."""
+    __slots__ = ("as_of", "buckets", "by_currency", "elapsed_ms")
+
+    def __init__(self, as_of: date, buckets: List[Tuple[str, int, Optional[int]]], by_currency: Dict[str, Dict[str, List[int]]], elapsed_ms: float):
+        self.as_of = as_of
+        self.buckets = buckets
+        self.by_currency = by_currency
+        self.elapsed_ms = elapsed_ms
+
+    def rows(self, currency: str) -> Iterable[Dict[str, Any]]:
+        """Bucket rows for one currency with Decimal amounts."""
+        totals = self.by_currency.get(currency)
+        for i, (label, first_day, last_day) in enumerate(self.buckets):
+            yield {
+                "tenor_bucket": label, "from_day": first_day, "to_day": last_day,
+                **{key: Decimal(totals[key][i] if totals else 0).scaleb(-2) for key in ("inflows", "outflows", "net_gap", "cumulative_gap")},
+            }
+
+
+def _bucket_totals_numpy(flows: CashFlowColumns, bounds: Sequence[int], horizon_days: Optional[int]) -> Tuple[Any, Any]:
+    days = np.frombuffer(flows.days, dtype=np.int64)
+    currency = np.frombuffer(flows.currency, dtype=np.int64)
+    amount = np.frombuffer(flows.amount, dtype=np.int64)
+    if horizon_days is not None:
+        keep = days <= horizon_days
+        days, currency, amount = days[keep], currency[keep], amount[keep]
+    bucket_count = len(bounds) + 1
+    key = currency * bucket_count + np.searchsorted(np.asarray(bounds, dtype=np.int64), days, side="left")
+    size = len(flows.currencies) * bucket_count
+    inflows = np.zeros(size, dtype=np.int64)
+    outflows = np.zeros(size, dtype=np.int64)
+    positive = amount > 0
+    np.add.at(inflows, key[positive], amount[positive]) # int64 indexed add: exact, unlike bincount's float weights
+    np.add.at(outflows, key[~positive], -amount[~positive])
+    return inflows.reshape(-1, bucket_count), outflows.reshape(-1, bucket_count)
+
+def _bucket_totals_python(flows: CashFlowColumns, bounds: Sequence[int], horizon_days: Optional[int]) -> Tuple[List[List[int]], List[List[int]]]:
+    bucket_count = len(bounds) + 1
+    inflows = [[0] * bucket_count for _ in flows.currencies]
+    outflows = [[0] * bucket_count for _ in flows.currencies]
+    for day, currency, amount in zip(flows.days, flows.currency, flows.amount):
+        if horizon_days is not None and day > horizon_days:
+            continue
+        bucket = bisect_left(bounds, day)
+        if amount > 0:
+            inflows[currency][bucket] += amount
+        else:
+            outflows[currency][bucket] -= amount
+    return inflows, outflows
+
+def compute_liquidity_gap(flows: CashFlowColumns, bucket_days: Sequence[int] = LIQUIDITY_GAP_BUCKET_DAYS,
+                          horizon_days: Optional[int] = None) -> LiquidityGapResult:
+    """
+    Buckets the flows by day offset and returns the gap ladder per currency. With `horizon_days`, flows
+    after the horizon are left out and the ladder stops at the bucket containing it.
+    """
+    bounds = [int(d) for d in bucket_days]
+    if not bounds or bounds[0] < 1 or any(b <= a for a, b in zip(bounds, bounds[1:])):
+        raise ValueError("Bucket bounds must be increasing whole days, starting from 1 or more.")
+    started = time.perf_counter()
+    if np is not None:
+        inflows, outflows = _bucket_totals_numpy(flows, bounds, horizon_days)
+        inflows, outflows = inflows.tolist(), outflows.tolist()
+    else:
+        inflows, outflows = _bucket_totals_python(flows, bounds, horizon_days)
+
+    buckets = bucket_labels(bounds)
+    if horizon_days is not None:
+        buckets = [b for b in buckets if b[1] <= horizon_days]
+    by_currency: Dict[str, Dict[str, List[int]]] = {}
+    for index, code in enumerate(flows.currencies):
+        ins, outs = inflows[index][:len(buckets)], outflows[index][:len(buckets)]
+        net = [i - o for i, o in zip(ins, outs)]
+        cumulative, running = [], 0
+        for value in net:
+            running += value
+            cumulative.append(running)
+        by_currency[code] = {"inflows": ins, "outflows": outs, "net_gap": net, "cumulative_gap": cumulative}
+    return LiquidityGapResult(flows.as_of, buckets, by_currency, (time.perf_counter() - started) * 1000)
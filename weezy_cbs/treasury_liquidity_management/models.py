@@ -115,7 +115,9 @@ class CBNSettlementStatementEntry(Base):
     balance = Column(Numeric(precision=20, scale=2), nullable=True)
     value_date = Column(Date, nullable=True)
     # internal_financial_transaction_id = Column(String(40), ForeignKey("financial_transactions.id"), nullable=True, index=True)
-    # reconciliation_status = Column(String(20), default="UNRECONCILED", index=True)
+    reconciliation_status = Column(String(20), default="UNRECONCILED", index=True) # UNRECONCILED, MATCHED, MATCHED_TOLERANCE, DISCREPANCY
+    matched_internal_reference = Column(String(50), nullable=True) # "<source>:<id>" of the matched book entry
+    reconciliation_run_id = Column(Integer, ForeignKey("cbn_reconciliation_runs.id"), nullable=True, index=True)
     processed_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class CBNReconciliationDiscrepancy(Base):
@@ -123,9 +125,97 @@ class CBNReconciliationDiscrepancy(Base):
     id = Column(Integer, primary_key=True, index=True)
     # settlement_entry_id = Column(Integer, ForeignKey("cbn_settlement_statement_entries.id"), nullable=True)
     # internal_financial_transaction_id = Column(String(40), ForeignKey("financial_transactions.id"), nullable=True)
+    reconciliation_run_id = Column(Integer, ForeignKey("cbn_reconciliation_runs.id"), nullable=True, index=True)
+    statement_date = Column(Date, nullable=True, index=True)
+    cbn_reference = Column(String(50), nullable=True, index=True) # Statement side, if any
+    internal_reference = Column(String(50), nullable=True, index=True) # Book side, "<source>:<id>", if any
+    statement_amount = Column(Numeric(precision=20, scale=2), nullable=True) # Signed: + credit / - debit to our CBN account
+    internal_amount = Column(Numeric(precision=20, scale=2), nullable=True)
     discrepancy_type = Column(String(50), nullable=False)
     details = Column(Text)
     status = Column(String(20), default="OPEN", index=True)
     reported_at = Column(DateTime(timezone=True), server_default=func.now())
     resolved_at = Column(DateTime(timezone=True), nullable=True)
     # resolved_by_user_id = Column(String(50), nullable=True)
+
+class CBNReconciliationRun(Base): # One per CBN settlement statement reconciled (see cbn_reconciliation.py)
+    __tablename__ = "cbn_reconciliation_runs"
+    id = Column(Integer, primary_key=True, index=True)
+    statement_date = Column(Date, nullable=False, index=True)
+    source_file_name = Column(String(255), nullable=True)
+    status = Column(String(30), default="PROCESSING", index=True) # PROCESSING, COMPLETED, FAILED, SUPERSEDED
+    statement_entry_count = Column(Integer, default=0)
+    statement_debit_total = Column(Numeric(precision=20, scale=2), default=0.00)
+    statement_credit_total = Column(Numeric(precision=20, scale=2), default=0.00)
+    internal_entry_count = Column(Integer, default=0)
+    matched_exact_count = Column(Integer, default=0)
+    matched_tolerance_count = Column(Integer, default=0)
+    discrepancy_count = Column(Integer, default=0)
+    error_message = Column(Text, nullable=True)
+    run_by_user_id = Column(String(50), nullable=True)
+    started_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+
+# --- FX Revaluation (see fx_position.py) ---
+class FXRateSnapshot(Base): # Closing/intraday mid rates used to revalue FX positions
+    __tablename__ = "fx_rate_snapshots"
+    id = Column(Integer, primary_key=True, index=True)
+    base_currency = Column(SQLAlchemyEnum(CurrencyEnum), nullable=False, default=CurrencyEnum.NGN)
+    taken_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    source = Column(String(50), nullable=True) # e.g. "CBN_NAFEM", "REUTERS", "MANUAL"
+    created_by_user_id = Column(String(50), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    rates = relationship("FXSnapshotRate", back_populates="snapshot")
+
+class FXSnapshotRate(Base):
+    __tablename__ = "fx_snapshot_rates"
+    id = Column(Integer, primary_key=True, index=True)
+    snapshot_id = Column(Integer, ForeignKey("fx_rate_snapshots.id"), nullable=False, index=True)
+    currency = Column(SQLAlchemyEnum(CurrencyEnum), nullable=False)
+    rate = Column(Numeric(precision=18, scale=8), nullable=False) # Units of base currency per 1 unit of `currency`
+
+    snapshot = relationship("FXRateSnapshot", back_populates="rates")
+    __table_args__ = (UniqueConstraint('snapshot_id', 'currency', name='uq_fx_snapshot_rate_currency'),)
+
+class FXRevaluationRun(Base): # One batched GL journal per run
+    __tablename__ = "fx_revaluation_runs"
+    id = Column(Integer, primary_key=True, index=True)
+    journal_reference = Column(String(40), unique=True, nullable=False, index=True)
+    previous_run_id = Column(Integer, ForeignKey("fx_revaluation_runs.id"), nullable=True, unique=True) # Unique: runs form a chain, so two concurrent runs cannot both post
+    rate_snapshot_id = Column(Integer, ForeignKey("fx_rate_snapshots.id"), nullable=False)
+    base_currency = Column(SQLAlchemyEnum(CurrencyEnum), nullable=False)
+    deal_watermark = Column(Integer, nullable=True) # Highest FXTransaction.id included
+    total_revaluation_pnl = Column(Numeric(precision=20, scale=2), nullable=False) # In base currency; + gain / - loss
+    status = Column(String(20), default="POSTED", nullable=False)
+    run_by_user_id = Column(String(50), nullable=True)
+    run_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+    lines = relationship("FXRevaluationLine", back_populates="run")
+    journal_lines = relationship("FXRevaluationJournalLine", back_populates="run")
+
+class FXRevaluationLine(Base): # Position and P&L per currency for a run
+    __tablename__ = "fx_revaluation_lines"
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, ForeignKey("fx_revaluation_runs.id"), nullable=False, index=True)
+    currency = Column(SQLAlchemyEnum(CurrencyEnum), nullable=False)
+    deal_position = Column(Numeric(precision=24, scale=2), nullable=False) # Net of FX deals, in `currency`
+    deal_book_value = Column(Numeric(precision=24, scale=2), nullable=False) # Base-currency cost of deal_position
+    balance_position = Column(Numeric(precision=24, scale=2), nullable=False) # Cash holdings less domiciliary deposits, in `currency`
+    rate = Column(Numeric(precision=18, scale=8), nullable=False)
+    deal_unrealised_pnl = Column(Numeric(precision=20, scale=2), nullable=False) # Cumulative, base currency
+    revaluation_pnl = Column(Numeric(precision=20, scale=2), nullable=False) # Posted by this run, base currency
+
+    run = relationship("FXRevaluationRun", back_populates="lines")
+
+class FXRevaluationJournalLine(Base):
+    __tablename__ = "fx_revaluation_journal_lines"
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, ForeignKey("fx_revaluation_runs.id"), nullable=False, index=True)
+    gl_code = Column(String(20), ForeignKey("gl_accounts.gl_code"), nullable=False, index=True)
+    entry_type = Column(String(6), nullable=False) # DEBIT or CREDIT
+    amount = Column(Numeric(precision=20, scale=2), nullable=False) # Base currency
+    currency = Column(SQLAlchemyEnum(CurrencyEnum), nullable=False) # Currency revalued
+    narration = Column(String(255), nullable=False)
+
+    run = relationship("FXRevaluationRun", back_populates="journal_lines")
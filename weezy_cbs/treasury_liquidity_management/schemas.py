@@ -156,10 +156,21 @@ class CBNRepoOperationResponse(CBNRepoOperationBase):
 # --- Liquidity Forecast/Monitoring Schemas ---
 class LiquidityForecastRequest(BaseModel):
     forecast_date: date
-    projection_days: int = Field(7, gt=0, le=90)
+    projection_days: int = Field(7, gt=0, le=3650)
+    currency: CurrencySchema = CurrencySchema.NGN # Currency reported in `gaps`; all currencies are in `gaps_by_currency`
+    bucket_days: Optional[List[int]] = Field(None, description="Upper bound in days of each tenor bucket, e.g. [1, 7, 30, 90]")
+    nmd_runoff: Optional[Dict[str, List[List[float]]]] = Field(None, description="Run-off per account type: [[day, fraction], ...]")
+
+    @validator("bucket_days")
+    def bucket_days_increasing(cls, v):
+        if v is not None and (not v or v[0] < 1 or any(b <= a for a, b in zip(v, v[1:]))):
+            raise ValueError("bucket_days must be increasing whole days, starting from 1 or more")
+        return v
 
 class LiquidityGap(BaseModel):
     tenor_bucket: str
+    from_day: Optional[int] = None
+    to_day: Optional[int] = None # None for the open-ended last bucket
     inflows: decimal.Decimal = Field(..., decimal_places=2)
     outflows: decimal.Decimal = Field(..., decimal_places=2)
     net_gap: decimal.Decimal = Field(..., decimal_places=2)
@@ -169,10 +180,93 @@ class LiquidityGap(BaseModel):
 
 class LiquidityForecastResponse(BaseModel):
     forecast_as_of_date: date
+    currency: Optional[CurrencySchema] = None
     gaps: List[LiquidityGap]
+    gaps_by_currency: Dict[str, List[LiquidityGap]] = {}
     # lcr_ratio: Optional[decimal.Decimal] = Field(None, decimal_places=4)
     class Config: json_encoders = {decimal.Decimal: str}
 
+# --- FX Position & Revaluation Schemas ---
+class FXRateSnapshotCreateRequest(BaseModel):
+    rates: Dict[CurrencySchema, decimal.Decimal] = Field(..., description="Units of base currency per 1 unit of each currency")
+    base_currency: CurrencySchema = CurrencySchema.NGN
+    taken_at: Optional[datetime] = None # Defaults to now
+    source: Optional[str] = Field(None, max_length=50)
+
+    @validator("rates")
+    def rates_positive(cls, v):
+        if not v or any(rate <= 0 for rate in v.values()):
+            raise ValueError("rates must be a non-empty mapping of positive rates")
+        return v
+
+class FXSnapshotRateResponse(BaseModel):
+    currency: CurrencySchema
+    rate: decimal.Decimal
+    class Config: orm_mode = True; use_enum_values = True; json_encoders = {decimal.Decimal: str}
+
+class FXRateSnapshotResponse(BaseModel):
+    id: int
+    base_currency: CurrencySchema
+    taken_at: datetime
+    source: Optional[str] = None
+    rates: List[FXSnapshotRateResponse]
+    class Config: orm_mode = True; use_enum_values = True; json_encoders = {decimal.Decimal: str}
+
+class FXCurrencyPosition(BaseModel):
+    deal_position: decimal.Decimal
+    balance_position: decimal.Decimal # Cash holdings less domiciliary deposits
+    net_open_position: decimal.Decimal
+    class Config: json_encoders = {decimal.Decimal: str}
+
+class FXPairPosition(BaseModel):
+    base_amount: decimal.Decimal # Net bought (+) / sold (-) of the pair's first currency
+    quote_amount: decimal.Decimal
+    deal_count: int
+    class Config: json_encoders = {decimal.Decimal: str}
+
+class FXPositionResponse(BaseModel):
+    as_of: Optional[datetime] = None
+    base_currency: CurrencySchema
+    deal_watermark: Optional[int] = None
+    currencies: Dict[str, FXCurrencyPosition]
+    pairs: Dict[str, FXPairPosition]
+    class Config: json_encoders = {decimal.Decimal: str}
+
+class FXRevaluationRequest(BaseModel):
+    rate_snapshot_id: Optional[int] = None # Latest snapshot if not given
+
+class FXRevaluationLineResponse(BaseModel):
+    currency: CurrencySchema
+    deal_position: decimal.Decimal
+    deal_book_value: decimal.Decimal
+    balance_position: decimal.Decimal
+    rate: decimal.Decimal
+    deal_unrealised_pnl: decimal.Decimal
+    revaluation_pnl: decimal.Decimal
+    class Config: orm_mode = True; use_enum_values = True; json_encoders = {decimal.Decimal: str}
+
+class FXRevaluationJournalLineResponse(BaseModel):
+    gl_code: str
+    entry_type: str
+    amount: decimal.Decimal
+    currency: CurrencySchema
+    narration: str
+    class Config: orm_mode = True; use_enum_values = True; json_encoders = {decimal.Decimal: str}
+
+class FXRevaluationRunResponse(BaseModel):
+    id: int
+    journal_reference: str
+    previous_run_id: Optional[int] = None
+    rate_snapshot_id: int
+    base_currency: CurrencySchema
+    deal_watermark: Optional[int] = None
+    total_revaluation_pnl: decimal.Decimal
+    status: str
+    run_at: Optional[datetime] = None
+    lines: List[FXRevaluationLineResponse] = []
+    journal_lines: List[FXRevaluationJournalLineResponse] = []
+    class Config: orm_mode = True; use_enum_values = True; json_encoders = {decimal.Decimal: str}
+
 # --- Paginated Responses ---
 class PaginatedFXTransactionResponse(BaseModel):
     items: List[FXTransactionResponse]; total: int; page: int; size: int
@@ -196,15 +290,40 @@ class CBNSettlementStatementEntrySchema(BaseModel):
     balance: Optional[decimal.Decimal] = Field(None, decimal_places=2)
     value_date: Optional[date] = None
     # internal_financial_transaction_id: Optional[str] = Field(None, max_length=40)
-    # reconciliation_status: str = Field("UNRECONCILED", max_length=20)
+    reconciliation_status: str = Field("UNRECONCILED", max_length=20)
+    matched_internal_reference: Optional[str] = Field(None, max_length=50)
+    reconciliation_run_id: Optional[int] = None
     class Config: orm_mode = True; json_encoders = {decimal.Decimal: str}
 
 class CBNReconciliationDiscrepancySchema(BaseModel):
     # settlement_entry_id: Optional[int] = None
     # internal_financial_transaction_id: Optional[str] = None
+    reconciliation_run_id: Optional[int] = None
+    statement_date: Optional[date] = None
+    cbn_reference: Optional[str] = Field(None, max_length=50)
+    internal_reference: Optional[str] = Field(None, max_length=50)
+    statement_amount: Optional[decimal.Decimal] = Field(None, decimal_places=2)
+    internal_amount: Optional[decimal.Decimal] = Field(None, decimal_places=2)
     discrepancy_type: str = Field(..., max_length=50)
     details: Optional[str] = None
     status: str = Field("OPEN", max_length=20)
     reported_at: datetime
     resolved_at: Optional[datetime] = None
-    class Config: orm_mode = True
+    class Config: orm_mode = True; json_encoders = {decimal.Decimal: str}
+
+class CBNReconciliationRunResponse(BaseModel):
+    id: int
+    statement_date: date
+    source_file_name: Optional[str] = None
+    status: str
+    statement_entry_count: int = 0
+    statement_debit_total: decimal.Decimal = decimal.Decimal("0")
+    statement_credit_total: decimal.Decimal = decimal.Decimal("0")
+    internal_entry_count: int = 0
+    matched_exact_count: int = 0
+    matched_tolerance_count: int = 0
+    discrepancy_count: int = 0
+    error_message: Optional[str] = None
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    class Config: orm_mode = True; json_encoders = {decimal.Decimal: str}
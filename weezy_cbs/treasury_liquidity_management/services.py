@@ -5,9 +5,12 @@ from . import models, schemas
 from .models import CurrencyEnum, FXTransactionTypeEnum # Direct enum access
 import decimal
 import uuid
+from typing import Optional
 from datetime import datetime, date, timedelta
 from math import pow
 
+from .fx_position import fx_position_cache, run_fx_revaluation
+
 # Placeholder for other service integrations & data sources
 # from weezy_cbs.accounts_ledger_management.services import get_total_balance_for_gl_code, post_double_entry_transaction
 # from weezy_cbs.accounts_ledger_management.schemas import PostTransactionRequest as LedgerPostRequest
@@ -21,7 +24,7 @@ def _generate_deal_reference(prefix="TRSYDEAL"):
     return f"{prefix}-{uuid.uuid4().hex[:10].upper()}"
 
 # --- Bank Cash Position Services ---
-def record_daily_cash_position(db: Session, position_data: schemas.BankCashPositionCreate) -> models.BankCashPosition:
+def record_daily_cash_position(db: Session, position_data: schemas.BankCashPositionCreateRequest) -> models.BankCashPosition:
     existing_position = db.query(models.BankCashPosition).filter(
         models.BankCashPosition.position_date == position_data.position_date,
         models.BankCashPosition.currency == position_data.currency
@@ -76,6 +79,7 @@ def create_fx_transaction(db: Session, fx_deal_in: schemas.FXTransactionCreateRe
     db.add(db_fx_deal)
     db.commit()
     db.refresh(db_fx_deal)
+    fx_position_cache.record_deal(db_fx_deal)
 
     # TODO: Trigger settlement process (ledger postings for value_date)
     # This might involve creating pending ledger entries or notifications.
@@ -88,11 +92,12 @@ def get_fx_transaction(db: Session, deal_id: Optional[int] = None, deal_referenc
         return db.query(models.FXTransaction).filter(models.FXTransaction.deal_reference == deal_reference).first()
     return None
 
-def update_fx_transaction_status(db: Session, deal_id: int, update_data: schemas.FXTransactionStatusUpdate) -> models.FXTransaction:
+def update_fx_transaction_status(db: Session, deal_id: int, update_data: schemas.FXTransactionStatusUpdateRequest) -> models.FXTransaction:
     deal = db.query(models.FXTransaction).filter(models.FXTransaction.id == deal_id).with_for_update().first()
     if not deal:
         raise NotFoundException(f"FX Deal with ID {deal_id} not found.")
 
+    old_status = deal.status
     deal.status = update_data.new_status
     if update_data.new_status == "SETTLED":
         deal.settled_at = datetime.utcnow()
@@ -101,8 +106,34 @@ def update_fx_transaction_status(db: Session, deal_id: int, update_data: schemas
 
     db.commit()
     db.refresh(deal)
+    fx_position_cache.record_status_change(deal, old_status)
     return deal
 
+# --- FX Position & Revaluation (see fx_position.py) ---
+def record_fx_rate_snapshot(db: Session, snapshot_in: schemas.FXRateSnapshotCreateRequest, user_id: Optional[str] = None) -> models.FXRateSnapshot:
+    snapshot = models.FXRateSnapshot(
+        base_currency=CurrencyEnum(snapshot_in.base_currency.value),
+        taken_at=snapshot_in.taken_at or datetime.utcnow(),
+        source=snapshot_in.source,
+        created_by_user_id=user_id,
+    )
+    snapshot.rates = [models.FXSnapshotRate(currency=CurrencyEnum(currency.value), rate=rate)
+                      for currency, rate in snapshot_in.rates.items() if currency != snapshot_in.base_currency]
+    db.add(snapshot)
+    db.commit()
+    db.refresh(snapshot)
+    return snapshot
+
+def get_fx_positions(db: Session) -> schemas.FXPositionResponse:
+    """Net open position per currency and per pair, from the in-memory position cache."""
+    return schemas.FXPositionResponse(**fx_position_cache.positions(db))
+
+def revalue_fx_positions(db: Session, revaluation_in: schemas.FXRevaluationRequest, user_id: Optional[str] = None) -> models.FXRevaluationRun:
+    try:
+        return run_fx_revaluation(db, revaluation_in.rate_snapshot_id, user_id)
+    except ValueError as e:
+        raise CalculationException(str(e))
+
 # --- Treasury Bill Investment Services ---
 def _calculate_tbill_purchase_price(face_value: decimal.Decimal, discount_rate_pa: decimal.Decimal, tenor_days: int) -> decimal.Decimal:
     # Purchase Price = FaceValue / (1 + (DiscountRate * (TenorDays / 365))) -- if discount is like simple interest for period
@@ -204,57 +235,41 @@ def create_interbank_placement(db: Session, placement_in: schemas.InterbankPlace
     db.refresh(db_placement)
     return db_placement
 
-# --- Liquidity Forecasting (Conceptual) ---
+# --- Liquidity Forecasting ---
 def generate_liquidity_forecast(db: Session, forecast_request: schemas.LiquidityForecastRequest) -> schemas.LiquidityForecastResponse:
     """
-    Generates a simplified liquidity gap forecast.
-    This is highly conceptual and would involve complex data gathering in a real system.
+    Maturity-bucket liquidity gap from contractual flows (T-bills, interbank, FX settlements, loan
+    repayments, fixed deposits) and behavioural run-off of non-maturity deposits. See liquidity_gap.py.
     """
-    gaps = []
-    # Example tenor buckets
-    tenor_buckets_days = {"Overnight": 1, "2D-7D": 7, "8D-1M": 30, "1M-3M": 90}
-
-    cumulative_gap = decimal.Decimal("0.0")
-
-    for bucket_name, max_days in tenor_buckets_days.items():
-        if max_days > forecast_request.projection_days and bucket_name != "Overnight": # Adjust if projection is shorter
-            if forecast_request.projection_days <= 1 and bucket_name != "Overnight": continue # Skip if projection is only overnight
-            # max_days = forecast_request.projection_days # This logic needs refinement for ranges
-
-        start_date_bucket = forecast_request.forecast_date
-        if bucket_name != "Overnight": # For > overnight, start from day after previous bucket
-            # This logic is too simple for actual gap analysis which uses specific maturity dates of items
-            # For a real system, you'd query all assets/liabilities maturing in each bucket's date range.
-            pass
-
-        # Mock inflows/outflows for the bucket
-        # Inflows: maturing T-Bills, maturing interbank lending, expected loan repayments, new deposits (projected)
-        # Outflows: maturing interbank borrowing, maturing repos, expected loan disbursements, deposit withdrawals (projected)
-        mock_inflows = decimal.Decimal(random.uniform(1000000, 50000000))
-        mock_outflows = decimal.Decimal(random.uniform(1000000, 45000000))
-
-        net_gap_bucket = mock_inflows - mock_outflows
-        cumulative_gap += net_gap_bucket
-
-        gaps.append(schemas.LiquidityGap(
-            tenor_bucket=bucket_name,
-            inflows=mock_inflows,
-            outflows=mock_outflows,
-            net_gap=net_gap_bucket,
-            cumulative_gap=cumulative_gap
-        ))
-
-        if max_days >= forecast_request.projection_days: # Stop if we've covered the projection period
-            break
-
+    from .liquidity_gap import LIQUIDITY_GAP_BUCKET_DAYS, compute_liquidity_gap, load_cash_flows
+    try:
+        flows = load_cash_flows(db, forecast_request.forecast_date, nmd_runoff=forecast_request.nmd_runoff)
+        result = compute_liquidity_gap(flows, forecast_request.bucket_days or LIQUIDITY_GAP_BUCKET_DAYS,
+                                       horizon_days=forecast_request.projection_days)
+    except ValueError as e:
+        raise CalculationException(str(e))
+
+    gaps_by_currency = {code: [schemas.LiquidityGap(**row) for row in result.rows(code)] for code in result.by_currency}
+    currency = forecast_request.currency.value
     return schemas.LiquidityForecastResponse(
         forecast_as_of_date=forecast_request.forecast_date,
-        gaps=gaps
+        currency=currency,
+        gaps=gaps_by_currency.get(currency) or [schemas.LiquidityGap(**row) for row in result.rows(currency)],
+        gaps_by_currency=gaps_by_currency,
     )
 
+# --- CBN Settlement Reconciliation (see cbn_reconciliation.py) ---
+def reconcile_cbn_statement(db: Session, statement_file, statement_date: date, source_file_name: Optional[str] = None,
+                            user_id: Optional[str] = None, replace_existing: bool = False) -> models.CBNReconciliationRun:
+    """Reconciles a CBN settlement statement (CSV text stream) against our RTGS and treasury settlement entries."""
+    from .cbn_reconciliation import reconcile_statement
+    try:
+        return reconcile_statement(db, statement_file, statement_date, source_file_name=source_file_name,
+                                   user_id=user_id, replace_existing=replace_existing)
+    except ValueError as e:
+        raise InvalidOperationException(str(e))
+
 # Other services:
 # - CBN Repo operations management
-# - Reconciliation with CBN statements (RTGS, CRR) - this is a batch process.
 # - Managing limits with correspondent banks.
-# - FX position monitoring and revaluation.
 # - Interest rate risk / ALM reporting data feeds.